@@ -0,0 +1,119 @@
+"""Trade-replay benchmark: `compute_portfolio_history_from_trades` time
+against ledger size.
+
+Builds a throwaway store with `--tickers` synthetic price series over
+`--days` business days, writes a ledger of N random BUY/SELL trades
+(a quarter of them dated on weekends, some before the first price) plus a
+legacy holding with no trades, then times the ledger → calendar step
+(`_trade_ledger` + `_quantities_on_calendar`) and the full replay.
+
+    PYTHONPATH=. python scripts/bench_trade_replay.py
+    PYTHONPATH=. python scripts/bench_trade_replay.py --sizes 10 1000 100000 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.attribution import AttributionEngine
+from src.database.database import Database
+from src.models import Asset, AssetType, Portfolio, Position
+
+PORTFOLIO = "Bench"
+
+
+def _seed_prices(db: Database, tickers: list[str], dates: pd.DatetimeIndex, rng) -> None:
+    rets = rng.normal(0.0003, 0.015, size=(len(dates), len(tickers)))
+    px = 100 * np.cumprod(1 + rets, axis=0)
+    for i, t in enumerate(tickers):
+        db.save_prices(t, pd.DataFrame({"Close": px[:, i]}, index=dates))
+
+
+def _seed_ledger(db: Database, tickers: list[str], dates: pd.DatetimeIndex, n: int, rng) -> None:
+    # Calendar days (weekends included) from a month before the first price.
+    days = pd.date_range(dates[0] - pd.Timedelta(days=30), dates[-1])
+    trade_date = days[rng.integers(0, len(days), n)]
+    side = np.where(rng.random(n) < 0.6, "BUY", "SELL")
+    trades = pd.DataFrame({
+        "trade_id":       np.arange(1, n + 1),
+        "portfolio_name": PORTFOLIO,
+        "ticker":         np.asarray(tickers)[rng.integers(0, len(tickers), n)],
+        "side":           side,
+        "quantity":       rng.integers(1, 50, n).astype(float),
+        "trade_price":    100.0,
+        "trade_date":     trade_date.strftime("%Y-%m-%d"),
+    })
+    # Written directly — `record_trade` re-reads the ledger per call.
+    trades.to_parquet(db._trades_path(), index=False)
+
+    net = trades.assign(
+        q=trades["quantity"].where(trades["side"] == "BUY", -trades["quantity"])
+    ).groupby("ticker")["q"].sum().clip(lower=0)
+    positions = [
+        Position(asset=Asset(ticker=t, name=t, asset_type=AssetType.STOCK, currency="USD"),
+                 quantity=float(q) + 10.0, cost_basis=100.0)
+        for t, q in net.items()
+    ]
+    # One legacy holding with no trade history at all.
+    positions.append(Position(
+        asset=Asset(ticker=tickers[-1], name=tickers[-1], asset_type=AssetType.STOCK, currency="USD"),
+        quantity=25.0, cost_basis=100.0,
+    ))
+    db.save_portfolio(Portfolio(name=PORTFOLIO, positions=positions))
+
+
+def _best_of(fn, repeat: int, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(sizes: list[int], n_tickers: int, n_days: int, repeat: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2015-01-02", periods=n_days)
+    tickers = [f"T{i:03d}" for i in range(n_tickers)]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(tmp)
+        _seed_prices(db, tickers, dates, rng)
+        engine = AttributionEngine(db)
+        for n in sizes:
+            # The last ticker is the legacy holding — keep it out of the ledger.
+            _seed_ledger(db, tickers[:-1], dates, n, rng)
+            trades = db.list_trades(portfolio_name=PORTFOLIO)
+            current_qty = {
+                p.asset.ticker: float(p.quantity) for p in db.get_portfolio(PORTFOLIO).positions
+            }
+
+            def _snap(trades, current_qty):
+                qty_changes, legacy = engine._trade_ledger(trades, current_qty)
+                engine._quantities_on_calendar(qty_changes, legacy, dates)
+
+            rows.append({
+                "trades":    n,
+                "snap_ms":   1e3 * _best_of(_snap, repeat, trades, current_qty),
+                "replay_ms": 1e3 * _best_of(engine.compute_portfolio_history_from_trades, repeat, PORTFOLIO),
+            })
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1_000, 10_000, 100_000])
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=2_500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    result = run(args.sizes, args.tickers, args.days, args.repeat)
+    print(result.to_string(index=False, float_format=lambda v: f"{v:,.1f}"))
+
+
+if __name__ == "__main__":
+    main()
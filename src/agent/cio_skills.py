@@ -117,7 +117,7 @@ def create_cio_skills(db: Database, engine: ReportingEngine) -> List:
             var = float(metrics["Historical VaR (95%)"]) * 100
             risk_line = (
                 f"Annualised vol {vol:.2f}%, 95% historical VaR {var:.2f}% "
-                f"(daily, weighted by cost-basis)."
+                f"(daily, weighted by market value)."
             )
         except Exception:
             pass
@@ -189,15 +189,18 @@ def create_research_skills(db: Database, engine: ReportingEngine) -> List:
         results = {}
         collector = Collector(db)
 
+        # Fetch and store prices for every ticker concurrently.
+        fetched = collector.collect_prices(tickers, period=period)
+
         for ticker in tickers:
+            res = fetched.get(ticker, {"status": "empty"})
+            if res["status"] != "ok":
+                results[ticker] = {
+                    "status": "error",
+                    "message": res.get("message") or "No price data returned",
+                }
+                continue
             try:
-                # Fetch and store prices
-                data = yf.download(ticker, period=period, progress=False, auto_adjust=True)
-                if data.empty:
-                    results[ticker] = {"status": "error", "message": "No price data returned"}
-                    continue
-                db.save_prices(ticker, data)
-
                 # Fetch and store asset metadata
                 info = yf.Ticker(ticker).info or {}
                 quote_type = info.get("quoteType", "EQUITY")
@@ -213,7 +216,7 @@ def create_research_skills(db: Database, engine: ReportingEngine) -> List:
 
                 results[ticker] = {
                     "status": "ok",
-                    "rows_stored": len(data),
+                    "rows_stored": res["rows"],
                     "name": asset.name,
                     "sector": asset.sector,
                     "asset_type": asset.asset_type.value,
@@ -12,8 +12,11 @@ from typing import List
 import numpy as np
 from anthropic import beta_tool
 
+from src.covariance import CovarianceEngine
 from src.database import Database
 from src.reporting import ReportingEngine
+from src.scenarios import SECTOR_KEYS, normalize_sector
+from src.stress import NO_PROFILE_SOURCE, NON_EQUITY_TYPES, StressEngine, scenario_matrix
 
 
 def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
@@ -66,7 +69,10 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
     @beta_tool
     def get_risk_metrics(portfolio_name: str) -> str:
         """Calculate key risk metrics for a portfolio: annualized volatility,
-        historical VaR (95%), and Monte Carlo VaR (95%). Requires price data
+        historical VaR (95%), parametric VaR (95%) and CVaR (95%), weighting
+        positions by market value, plus each position's marginal VaR,
+        component VaR and % contribution to risk (parametric and historical,
+        most risk-adding first). Requires price data
         — run 'collect' first if metrics are unavailable.
 
         Args:
@@ -88,6 +94,14 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
             col: {idx: round(float(val), 6) for idx, val in row.items()}
             for col, row in cov_matrix.to_dict().items()
         }
+        try:
+            decomposition = engine.get_var_decomposition(portfolio)
+            result["var_decomposition"] = [
+                {"ticker": ticker, **{k: round(float(v), 6) for k, v in row.items()}}
+                for ticker, row in decomposition.sort_values("component_var").iterrows()
+            ]
+        except Exception:
+            pass
         return json.dumps(result, indent=2)
 
     @beta_tool
@@ -155,8 +169,8 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
 
     @beta_tool
     def get_correlation_matrix(portfolio_name: str) -> str:
-        """Compute pairwise return correlations between all assets in a portfolio.
-        High correlations (>0.7) indicate diversification is limited between those assets.
+        """Compute pairwise return correlations (EWMA, λ = 0.94) between all assets
+        in a portfolio. High correlations (>0.7) indicate diversification is limited between those assets.
         Requires price history.
 
         Args:
@@ -168,16 +182,14 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
             return str(e)
 
         tickers = [pos.asset.ticker for pos in portfolio.positions]
+        priced = set(db.list_price_tickers())
+        if not any(t in priced for t in tickers):
+            return "No price data available. Run 'invest-monitor collect' first."
         try:
-            returns = engine.calculate_returns(tickers)
+            corr = CovarianceEngine(db).correlation(tickers).round(4)
         except Exception as e:
             return f"Could not compute correlations: {e}."
 
-        if returns.empty:
-            return "No price data available. Run 'invest-monitor collect' first."
-
-        corr = returns.corr().round(4)
-
         # Flag high-correlation pairs
         high_corr_pairs = []
         cols = corr.columns.tolist()
@@ -379,73 +391,99 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
             rows.append({"scenario_id": key, "description": info["description"]})
         return json.dumps(rows, indent=2)
 
+    def _shock_set(info: dict) -> tuple[dict, dict]:
+        """Agent scenario (% shocks by free-form sector / asset type) →
+        StressEngine shock set (fractions by sector key / non-equity type).
+        Sectors the scenario doesn't name take its Stock shock."""
+        type_shocks = info["asset_type_shocks"]
+        sector = {k: type_shocks.get("Stock", 0) / 100 for k in SECTOR_KEYS}
+        for name, shock in info["sector_shocks"].items():
+            key = normalize_sector(name)
+            if key:
+                sector[key] = shock / 100
+        other = {t: type_shocks.get(t, 0) / 100 for t in NON_EQUITY_TYPES}
+        return sector, other
+
     @beta_tool
     def run_stress_test(portfolio_name: str, scenario_name: str) -> str:
         """Apply a named historical or macro stress scenario to a portfolio and show
         the estimated P&L impact per position and for the overall portfolio.
 
-        Sector shocks override asset-type shocks when a position's sector matches.
+        Stocks take their sector's shock; ETFs / Funds blend sector shocks by
+        their lookthrough sector weights, or take the scenario's ETF / Fund
+        shock when they have no lookthrough data; other types take their
+        asset-type shock. Pass scenario_name='all' to compare every scenario
+        in one pass.
         Use list_stress_scenarios to see available scenario IDs.
 
         Args:
             portfolio_name: Name of the portfolio to stress-test.
-            scenario_name: Scenario ID (e.g. '2008_financial_crisis', 'rate_hike_shock').
+            scenario_name: Scenario ID (e.g. '2008_financial_crisis', 'rate_hike_shock'), or 'all'.
         """
-        scenario = _SCENARIOS.get(scenario_name)
-        if scenario is None:
+        if scenario_name != "all" and scenario_name not in _SCENARIOS:
             available = ", ".join(_SCENARIOS.keys())
-            return f"Unknown scenario '{scenario_name}'. Available: {available}"
+            return f"Unknown scenario '{scenario_name}'. Available: {available}, all"
 
         try:
             portfolio = db.get_portfolio(portfolio_name)
         except ValueError as e:
             return str(e)
 
-        type_shocks = scenario["asset_type_shocks"]
-        sector_shocks = scenario["sector_shocks"]
-
-        total_value = portfolio.total_cost()
-        position_results = []
-        total_pnl = 0.0
-
-        for pos in portfolio.positions:
-            value = pos.quantity * pos.cost_basis
-            asset_type = pos.asset.asset_type.value
-            sector = pos.asset.sector or ""
-
-            # Sector shock takes priority if it matches, else fall back to asset type
-            if sector and sector in sector_shocks:
-                shock_pct = sector_shocks[sector]
-                shock_source = f"sector ({sector})"
-            elif asset_type in type_shocks:
-                shock_pct = type_shocks[asset_type]
-                shock_source = f"asset type ({asset_type})"
-            else:
-                shock_pct = 0.0
-                shock_source = "no matching shock (0%)"
+        names = list(_SCENARIOS) if scenario_name == "all" else [scenario_name]
+        stress = StressEngine(db)
+        exposures = stress.exposures(portfolio)
+        shocks = stress.shocks(exposures, scenario_matrix({n: _shock_set(_SCENARIOS[n]) for n in names}))
+        # Funds with no lookthrough data take the scenario's ETF / Fund shock
+        # instead of the average sector shock.
+        sources = exposures.positions["Source"].copy()
+        types = exposures.positions["Type"]
+        for r in np.flatnonzero((sources == NO_PROFILE_SOURCE).to_numpy()):
+            fallback = [_SCENARIOS[n]["asset_type_shocks"].get(types.iat[r]) for n in names]
+            if None not in fallback:
+                shocks.iloc[r] = np.asarray(fallback, dtype=float) / 100
+                sources.iat[r] = f"asset type ({types.iat[r]}, no profile)"
+        base = exposures.positions["Base Value"].to_numpy()
+        pnl = shocks.to_numpy() * base[:, None]                 # positions × scenarios
+        total_value = float(base.sum())
+
+        def _summary(k: int, name: str) -> dict:
+            total_pnl = float(pnl[:, k].sum())
+            return {
+                "scenario": name,
+                "description": _SCENARIOS[name]["description"],
+                "estimated_total_pnl": round(total_pnl, 2),
+                "stressed_total_value": round(total_value + total_pnl, 2),
+                "portfolio_return_pct": round(total_pnl / total_value * 100, 2) if total_value else 0,
+            }
 
-            pnl = value * shock_pct / 100
-            total_pnl += pnl
-            position_results.append({
+        if scenario_name == "all":
+            return json.dumps({
+                "portfolio": portfolio_name,
+                "current_total_value": round(total_value, 2),
+                "scenarios": sorted(
+                    (_summary(k, n) for k, n in enumerate(names)),
+                    key=lambda x: x["estimated_total_pnl"],
+                ),
+            }, indent=2)
+
+        position_results = [
+            {
                 "ticker": pos.asset.ticker,
                 "name": pos.asset.name,
-                "current_value": round(value, 2),
-                "shock_pct": shock_pct,
-                "shock_source": shock_source,
-                "estimated_pnl": round(pnl, 2),
-                "stressed_value": round(value + pnl, 2),
-            })
-
+                "current_value": round(float(base[r]), 2),
+                "shock_pct": round(float(shocks.iat[r, 0]) * 100, 2),
+                "shock_source": sources.iat[r],
+                "estimated_pnl": round(float(pnl[r, 0]), 2),
+                "stressed_value": round(float(base[r] + pnl[r, 0]), 2),
+            }
+            for r, pos in enumerate(portfolio.positions)
+        ]
         position_results.sort(key=lambda x: x["estimated_pnl"])
 
         return json.dumps({
-            "scenario": scenario_name,
-            "description": scenario["description"],
+            **_summary(0, scenario_name),
             "portfolio": portfolio_name,
             "current_total_value": round(total_value, 2),
-            "estimated_total_pnl": round(total_pnl, 2),
-            "stressed_total_value": round(total_value + total_pnl, 2),
-            "portfolio_return_pct": round(total_pnl / total_value * 100, 2) if total_value else 0,
             "positions": position_results,
         }, indent=2)
 
@@ -562,6 +600,97 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
 
         return json.dumps(results, indent=2)
 
+    @beta_tool
+    def replay_historical_windows(portfolio_name: str, window_days: int = 21, top_n: int = 5) -> str:
+        """Replay every actual N-trading-day window in the stored price history on the
+        portfolio's current holdings and report the worst non-overlapping windows:
+        their dates, portfolio P&L and the position-level losses. Positions without
+        enough history use their sector's SPDR ETF as a proxy.
+
+        Args:
+            portfolio_name: Name of the portfolio to replay.
+            window_days: Window length in trading days (default: 21 ≈ 1 month).
+            top_n: Number of worst windows to report (default: 5).
+        """
+        try:
+            portfolio = db.get_portfolio(portfolio_name)
+        except ValueError as e:
+            return str(e)
+
+        result = StressEngine(db).historical_replay(portfolio, window=window_days, top=top_n)
+        if result["windows"].empty:
+            return "No price history available. Run 'invest-monitor collect' first."
+
+        positions = result["positions"]
+        windows = []
+        for w in result["windows"].itertuples(index=False):
+            rows = positions[positions["rank"] == w.rank]
+            windows.append({
+                "rank": int(w.rank),
+                "start_date": str(w.start_date.date()),
+                "end_date": str(w.end_date.date()),
+                "portfolio_pnl": round(float(w.pnl), 2),
+                "portfolio_return_pct": round(float(w.return_pct), 2),
+                "coverage_pct": round(float(w.coverage) * 100, 1),
+                "worst_positions": [
+                    {"ticker": r.ticker, "return_pct": round(float(r.window_return) * 100, 2),
+                     "pnl": round(float(r.pnl), 2)}
+                    for r in rows.head(5).itertuples(index=False)
+                ],
+            })
+        return json.dumps({
+            "portfolio": portfolio_name,
+            "window_days": window_days,
+            "worst_windows": windows,
+            "return_sources": result["sources"].assign(
+                history_from=result["sources"]["history_from"].astype(str),
+            ).to_dict(orient="records"),
+        }, indent=2)
+
+    @beta_tool
+    def reverse_stress_test(portfolio_name: str, loss_pct: float = 10.0, horizon_days: int = 1,
+                            include_group: bool = False) -> str:
+        """Find the most plausible sector-shock combination that would cost the
+        portfolio loss_pct of its value: the smallest shock in Mahalanobis distance
+        under the sector ETF covariance. Reports the shock per sector, its distance
+        in standard deviations and the Gaussian probability of a loss at least that
+        large. Non-equity positions are left unshocked.
+
+        Args:
+            portfolio_name: Portfolio to solve for.
+            loss_pct: Target loss as a % of portfolio value (default: 10).
+            horizon_days: Horizon in trading days the covariance is scaled to (default: 1).
+            include_group: Also solve every other portfolio in the same group(s).
+        """
+        try:
+            portfolios = [db.get_portfolio(portfolio_name)]
+        except ValueError as e:
+            return str(e)
+        if include_group:
+            others = {m for g in db.get_groups_for_portfolio(portfolio_name)
+                      for m in db.get_group_members(g)} - {portfolio_name}
+            portfolios += [db.get_portfolio(m) for m in sorted(others)]
+
+        try:
+            result = StressEngine(db).reverse_stress(portfolios, loss=loss_pct / 100, horizon_days=horizon_days)
+        except ValueError as e:
+            return str(e)
+
+        out = []
+        for name, row in result.iterrows():
+            if np.isnan(row["distance"]):
+                out.append({"portfolio": name, "note": "No sector exposure — equity shocks cannot produce this loss."})
+                continue
+            shocks = row[SECTOR_KEYS].astype(float).sort_values()
+            out.append({
+                "portfolio": name,
+                "target_pnl": round(float(row["target_pnl"]), 2),
+                "distance_sigma": round(float(row["distance"]), 2),
+                "probability": float(f"{row['probability']:.3g}"),
+                "sector_shocks_pct": {k: round(float(v) * 100, 2) for k, v in shocks.items()},
+            })
+        return json.dumps({"loss_pct": loss_pct, "horizon_days": horizon_days, "portfolios": out}, indent=2)
+
     @beta_tool
     def simulate_forward(
         portfolio_name: str,
@@ -569,7 +698,7 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
         num_simulations: int = 5000,
     ) -> str:
         """Run a Monte Carlo simulation of portfolio value over a future time horizon
-        using the covariance structure of historical returns. Reports percentile outcomes
+        using the (Ledoit-Wolf shrunk) covariance structure of historical returns. Reports percentile outcomes
         (P5, P25, P50, P75, P95) and the probability of loss.
 
         Requires historical price data — run 'invest-monitor collect' first.
@@ -605,17 +734,12 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
         w = np.array([weights_map.get(t, 0) / total_value for t in available])
 
         mu = returns.mean().values          # daily mean returns per asset
-        cov = returns.cov().values          # daily covariance matrix
-
-        # Cholesky decomposition for correlated multivariate normal draws
+        # Ledoit-Wolf shrinkage covariance: positive definite by construction,
+        # Cholesky factor cached per (ticker set, snapshot date).
         try:
-            L = np.linalg.cholesky(cov)
-        except np.linalg.LinAlgError:
-            # Fall back to nearest PSD matrix if cov is ill-conditioned
-            eigvals, eigvecs = np.linalg.eigh(cov)
-            eigvals = np.maximum(eigvals, 0)
-            cov = eigvecs @ np.diag(eigvals) @ eigvecs.T
-            L = np.linalg.cholesky(cov + np.eye(len(cov)) * 1e-8)
+            L = CovarianceEngine(db).shrunk(available).cholesky
+        except ValueError as e:
+            return str(e)
 
         rng = np.random.default_rng(seed=42)
         # Shape: (num_simulations, days, n_assets)
@@ -666,6 +790,8 @@ def create_risk_skills(db: Database, engine: ReportingEngine) -> List:
         get_cumulative_returns,
         list_stress_scenarios,
         run_stress_test,
+        replay_historical_windows,
+        reverse_stress_test,
         apply_custom_shock,
         simulate_forward,
     ]
@@ -9,13 +9,16 @@ import json
 from typing import List
 
 import numpy as np
+import pandas as pd
 from anthropic import beta_tool
 from scipy.optimize import minimize
 
 from src.agent.report_export import make_export_report_skill
+from src.covariance import CovarianceEngine
 from src.database import Database
 from src.reporting import ReportingEngine
 from src.scenarios import SCENARIOS, CROSS_ASSET_BETAS
+from src.taxlots import TaxLotEngine
 
 
 def create_wealth_skills(db: Database, engine: ReportingEngine) -> List:
@@ -247,14 +250,13 @@ def create_wealth_skills(db: Database, engine: ReportingEngine) -> List:
         corr_score = 50.0  # default when no price data
         avg_corr = None
         try:
-            rets = engine.calculate_returns(tickers)
-            if not rets.empty:
-                available = [t for t in tickers if t in rets.columns]
-                if len(available) > 1:
-                    corr_matrix = rets[available].corr()
-                    upper = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)]
-                    avg_corr = float(np.mean(upper))
-                    corr_score = max(0, (1 - avg_corr) * 100)
+            priced = set(db.list_price_tickers())
+            available = list(dict.fromkeys(t for t in tickers if t in priced))
+            if len(available) > 1:
+                corr_matrix = CovarianceEngine(db).correlation(available)
+                upper = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)]
+                avg_corr = float(np.nanmean(upper))
+                corr_score = max(0, (1 - avg_corr) * 100)
         except Exception:
             pass
 
@@ -489,7 +491,10 @@ def create_wealth_skills(db: Database, engine: ReportingEngine) -> List:
 
         rets = rets[available].dropna()
         mu = rets.mean().values * 252          # annualised expected returns
-        cov = rets.cov().values * 252           # annualised covariance
+        try:
+            cov = CovarianceEngine(db).shrunk(available).covariance.values * 252  # annualised, Ledoit-Wolf
+        except ValueError as e:
+            return str(e)
         n = len(available)
         rf = 0.045
 
@@ -545,9 +550,11 @@ def create_wealth_skills(db: Database, engine: ReportingEngine) -> List:
 
     @beta_tool
     def find_tax_loss_opportunities(portfolio_name: str, min_loss_pct: float = 5.0) -> str:
-        """Identify positions with unrealised losses that exceed a minimum threshold,
-        which could be candidates for tax-loss harvesting.  Also flags positions
+        """Identify tax lots with unrealised losses that exceed a minimum threshold,
+        which could be candidates for tax-loss harvesting.  Also flags lots
         with large unrealised gains that may have tax implications if sold.
+        Lots are matched FIFO from the trade ledger (or by specific ID) and
+        labelled short- or long-term; year-to-date realised gains are included.
 
         Args:
             portfolio_name: Name of the portfolio.
@@ -558,42 +565,55 @@ def create_wealth_skills(db: Database, engine: ReportingEngine) -> List:
         except ValueError as e:
             return str(e)
 
+        lot_engine = TaxLotEngine(db)
+        lot_engine.refresh(portfolio_name)
         tickers = [pos.asset.ticker for pos in portfolio.positions]
-        latest = _latest_prices(tickers)
+        lots = lot_engine.open_lots(portfolio_name, prices=_latest_prices(tickers))
+        names = {pos.asset.ticker: pos.asset.name for pos in portfolio.positions}
 
         loss_candidates = []
         gain_positions = []
 
-        for pos in portfolio.positions:
-            cost = pos.quantity * pos.cost_basis
-            price = latest.get(pos.asset.ticker, pos.cost_basis)
-            market = pos.quantity * price
-            pnl = market - cost
+        for lot in lots.itertuples():
+            cost = lot.cost_basis
+            pnl = lot.unrealized_pnl
             pnl_pct = pnl / cost * 100 if cost else 0
 
             entry = {
-                "ticker": pos.asset.ticker,
-                "name": pos.asset.name,
+                "ticker": lot.ticker,
+                "name": names.get(lot.ticker, lot.ticker),
+                "lot_id": int(lot.lot_id),
+                "opened": lot.open_date.date().isoformat() if not pd.isna(lot.open_date) else None,
+                "quantity": round(float(lot.remaining_quantity), 6),
+                "term": lot.term,
                 "unrealised_pnl": round(pnl, 2),
                 "return_pct": round(pnl_pct, 2),
                 "cost_basis_total": round(cost, 2),
-                "market_value": round(market, 2),
+                "market_value": round(lot.market_value, 2),
             }
 
             if pnl_pct <= -min_loss_pct:
                 entry["harvest_note"] = (
-                    f"Selling realises a ${abs(pnl):.2f} loss that can offset capital gains."
+                    f"Selling this lot (SELL with lot_id={int(lot.lot_id)}) realises a "
+                    f"${abs(pnl):.2f} {lot.term}-term loss that can offset capital gains."
                 )
                 loss_candidates.append(entry)
             elif pnl_pct > 20:
                 entry["gain_note"] = (
-                    f"Unrealised gain of ${pnl:.2f} — consider tax implications before selling."
+                    f"Unrealised {lot.term}-term gain of ${pnl:.2f} — consider tax implications before selling."
                 )
                 gain_positions.append(entry)
 
         loss_candidates.sort(key=lambda x: x["return_pct"])
         gain_positions.sort(key=lambda x: x["return_pct"], reverse=True)
 
+        year_start = pd.Timestamp.today().normalize().replace(month=1, day=1)
+        realised = db.get_realized_gains(portfolio_name, start_date=year_start.strftime("%Y-%m-%d"))
+        realised_ytd = (
+            realised.groupby("term")["realized_gain"].sum().round(2).to_dict()
+            if not realised.empty else {}
+        )
+
         total_harvestable = sum(abs(p["unrealised_pnl"]) for p in loss_candidates)
         return json.dumps({
             "portfolio": portfolio_name,
@@ -601,6 +621,7 @@ def create_wealth_skills(db: Database, engine: ReportingEngine) -> List:
             "tax_loss_candidates": loss_candidates,
             "total_harvestable_loss": round(total_harvestable, 2),
             "large_gain_positions": gain_positions,
+            "realised_gains_ytd_by_term": realised_ytd,
             "disclaimer": (
                 "This is not tax advice. Consult a qualified tax advisor. "
                 "Wash-sale rules may apply."
@@ -14,6 +14,8 @@ from src.data.ingestion import Ingester
 from src.database.database import Database
 from src.models import Asset, AssetType, Portfolio, Position
 from src.reporting import ReportingEngine
+from src.covariance import CovarianceEngine
+from src.risk import RiskEngine
 from src.agent import (
     CIOAgent,
     PortfolioManagerAgent,
@@ -83,6 +85,49 @@ def latest_prices(tickers: list[str]) -> dict[str, float]:
     return df.iloc[-1].to_dict()
 
 
+def _render_price_fetch_status() -> None:
+    """Progress for a background `Collector.start_background_fetch` handle
+    stored in session state, or the last fetch's outcome. Only an active
+    fetch starts the one-second polling fragment."""
+    fetch = st.session_state.get("price_fetch")
+    if fetch is None:
+        msg = st.session_state.get("price_fetch_msg")
+        if msg:
+            getattr(st, msg[0])(msg[1])
+        return
+    _poll_price_fetch()
+
+
+@st.fragment(run_every=1)
+def _poll_price_fetch() -> None:
+    """Re-runs itself every second until the fetch in session state ends,
+    then records its outcome and reruns the whole app."""
+    fetch = st.session_state.get("price_fetch")
+    if fetch is None:
+        return
+    if not fetch.done:
+        st.progress(
+            fetch.progress,
+            text=f"Fetching prices… {fetch.completed}/{fetch.total}"
+                 + (f" (last: {fetch.last_ticker})" if fetch.last_ticker else ""),
+        )
+        if st.button("Cancel fetch", key="cancel_price_fetch_btn"):
+            fetch.cancel()
+        return
+
+    if fetch.cancelled:
+        msg = ("warning", f"Price fetch cancelled after {fetch.completed}/{fetch.total} tickers.")
+    elif fetch.error is not None:
+        msg = ("error", f"Price fetch failed: {fetch.error}")
+    else:
+        failed = [t for t, r in (fetch.result or {}).items() if r.get("status") != "ok"]
+        msg = ("success", "Prices updated!" + (f" No data for: {', '.join(failed)}" if failed else ""))
+    st.session_state["price_fetch_msg"] = msg
+    st.session_state.pop("price_fetch", None)
+    _fetch_prices_cached.clear()
+    st.rerun(scope="app")  # every view picks up the new prices; the timer stops
+
+
 def fmt_usd(v) -> str:
     if v is None or (isinstance(v, float) and np.isnan(v)):
         return "N/A"
@@ -95,169 +140,6 @@ def fmt_pct(v) -> str:
     return f"{v:.2f}%"
 
 
-def expand_lookthrough_rows(
-    portfolio: "Portfolio",
-    db: "Database",
-    latest_prices_map: dict[str, float],
-    enabled: bool = True,
-    yfinance_fallback: bool = True,
-) -> list[dict]:
-    """Expand a portfolio's positions into display rows, optionally replacing
-    ETF/Fund positions with their constituents.
-
-    Resolution order per fund (highest fidelity first):
-      1. `fund_holdings.parquet` — vendor-uploaded ticker-level rows.
-      2. `fund_profiles.parquet` — yfinance asset_classes + sector_weightings
-         (no constituent tickers, only sector and asset-class aggregates).
-      3. Keep the fund as a single native row.
-
-    Dollar totals (Current Value / Total Cost / P&L) are invariant under
-    lookthrough — they're redistributed across constituent rows. Share-level
-    fields (Quantity, Cost Basis, Current Price) are None for synthetic rows.
-    """
-    from src.scenarios import SECTOR_DISPLAY  # local import to avoid circulars
-
-    rows: list[dict] = []
-    for pos in portfolio.positions:
-        ticker = pos.asset.ticker
-        cp = latest_prices_map.get(ticker)
-        if cp is None or (isinstance(cp, float) and np.isnan(cp)):
-            cur_val = pos.quantity * pos.cost_basis
-            cp_for_display = None
-        else:
-            cur_val = pos.quantity * float(cp)
-            cp_for_display = float(cp)
-        total_cost = pos.quantity * pos.cost_basis
-        pnl = cur_val - total_cost
-
-        is_fund = pos.asset.asset_type.value in ("ETF", "Fund")
-        holdings = db.get_fund_holdings(ticker) if (enabled and is_fund) else pd.DataFrame()
-
-        # ── 1) Vendor holdings (highest fidelity) ─────────────────────────────
-        if not holdings.empty:
-            for _, h in holdings.iterrows():
-                w = float(h["weight"]) if pd.notna(h.get("weight")) else 0.0
-                holding_ticker = str(h.get("holding_ticker") or "").strip() or "—"
-                rows.append({
-                    "Ticker":        holding_ticker,
-                    "Name":          (str(h.get("holding_name") or "").strip()) or holding_ticker,
-                    "Type":          (str(h.get("asset_type") or "").strip()) or "Stock",
-                    "Sector":        (str(h.get("sector")     or "").strip()) or "Unknown",
-                    "Quantity":      None,
-                    "Cost Basis":    None,
-                    "Current Price": None,
-                    "Total Cost":    total_cost * w,
-                    "Current Value": cur_val   * w,
-                    "P&L":           pnl       * w,
-                    "P&L %":         (pnl / total_cost * 100) if total_cost else None,
-                    "Via":           ticker,
-                    "Source":        "vendor",
-                    "_synthetic":    True,
-                })
-            continue
-
-        # ── 2) yfinance fund_profile (sector-level fallback) ──────────────────
-        if enabled and is_fund and yfinance_fallback:
-            profile = db.get_fund_profile(ticker)
-            asset_classes = profile.get("asset_classes") or {}
-            sector_weights = profile.get("sector_weightings") or {}
-            if asset_classes or sector_weights:
-                # Raw asset-class weights as reported by yfinance.
-                raw_stock = float(asset_classes.get("stockPosition", 0.0) or 0.0)
-                raw_bond  = float(asset_classes.get("bondPosition",  0.0) or 0.0)
-                raw_cash  = float(asset_classes.get("cashPosition",  0.0) or 0.0)
-                raw_pref  = float(asset_classes.get("preferredPosition",   0.0) or 0.0)
-                raw_conv  = float(asset_classes.get("convertiblePosition", 0.0) or 0.0)
-                raw_other = float(asset_classes.get("otherPosition",       0.0) or 0.0)
-                # Inverse / leveraged funds report negative positions (e.g. SH
-                # has stockPosition=-1.0, cashPosition=1.82). Clip negatives to
-                # 0 and renormalise so the components sum to 1.0 — this loses
-                # the "short equity" signal but keeps the total dollar value
-                # invariant under lookthrough.
-                clipped = {
-                    "stock":  max(0.0, raw_stock),
-                    "bond":   max(0.0, raw_bond),
-                    "cash":   max(0.0, raw_cash),
-                    "pref":   max(0.0, raw_pref),
-                    "conv":   max(0.0, raw_conv),
-                    "other":  max(0.0, raw_other),
-                }
-                total = sum(clipped.values())
-                if total > 0:
-                    stock_w = clipped["stock"] / total
-                    bond_w  = clipped["bond"]  / total
-                    cash_w  = clipped["cash"]  / total
-                    pref_w  = clipped["pref"]  / total
-                    conv_w  = clipped["conv"]  / total
-                    other_w = clipped["other"] / total
-
-                    def _emit(weight: float, name: str, atype: str, sector: str,
-                              via_label: str | None = None):
-                        if weight <= 0:
-                            return
-                        rows.append({
-                            "Ticker":        f"{ticker} → {via_label or sector}",
-                            "Name":          name,
-                            "Type":          atype,
-                            "Sector":        sector,
-                            "Quantity":      None,
-                            "Cost Basis":    None,
-                            "Current Price": None,
-                            "Total Cost":    total_cost * weight,
-                            "Current Value": cur_val   * weight,
-                            "P&L":           pnl       * weight,
-                            "P&L %":         (pnl / total_cost * 100) if total_cost else None,
-                            "Via":           ticker,
-                            "Source":        "yfinance",
-                            "_synthetic":    True,
-                        })
-
-                    # Equity portion → spread across sector_weightings if present.
-                    equity_w = stock_w + pref_w + conv_w + other_w
-                    if equity_w > 0:
-                        if sector_weights:
-                            sw_total = sum(sector_weights.values()) or 1.0
-                            for sec_key, sw in sector_weights.items():
-                                if sw <= 0:
-                                    continue
-                                sec_label = SECTOR_DISPLAY.get(sec_key, sec_key.replace("_", " ").title())
-                                _emit(
-                                    equity_w * (sw / sw_total),
-                                    name=f"{sec_label} (via {ticker})",
-                                    atype="Stock",
-                                    sector=sec_label,
-                                )
-                        else:
-                            _emit(equity_w, name=f"Equity (via {ticker})",
-                                  atype="Stock", sector="Unknown", via_label="Equity")
-                    if bond_w > 0:
-                        _emit(bond_w, name=f"Bond portion (via {ticker})",
-                              atype="Bond", sector="Fixed Income", via_label="Bond")
-                    if cash_w > 0:
-                        _emit(cash_w, name=f"Cash portion (via {ticker})",
-                              atype="Cash", sector="Cash", via_label="Cash")
-                    continue  # done with this position via yfinance fallback
-
-        # ── 3) Native row (no lookthrough or no data) ─────────────────────────
-        rows.append({
-            "Ticker":        ticker,
-            "Name":          pos.asset.name or "",
-            "Type":          pos.asset.asset_type.value,
-            "Sector":        pos.asset.sector or "—",
-            "Quantity":      pos.quantity,
-            "Cost Basis":    pos.cost_basis,
-            "Current Price": cp_for_display,
-            "Total Cost":    total_cost,
-            "Current Value": cur_val,
-            "P&L":           pnl,
-            "P&L %":         (pnl / total_cost * 100) if total_cost else None,
-            "Via":           "",
-            "Source":        "native",
-            "_synthetic":    False,
-        })
-    return rows
-
-
 def _fmt_income_rate(row) -> str:
     """Format an income-rate row with the unit suffix from its 'Income Rate Unit'.
     Stock/ETF/Fund → "$X.XXXX/share"; Bond/CD/Cash → "X.XX%".
@@ -544,11 +426,15 @@ with st.sidebar:
         st.markdown("---")
 
         period = st.selectbox("Price history period", ["1mo", "3mo", "6mo", "1y", "2y", "5y"], index=3)
-        if st.button("Collect Prices"):
-            with st.spinner("Fetching from yfinance…"):
-                Collector(get_db()).update_all_assets(period=period)
-                _fetch_prices_cached.clear()
-            st.success("Prices updated!")
+        _fetch = st.session_state.get("price_fetch")
+        if st.button("Collect Prices", disabled=_fetch is not None and not _fetch.done):
+            # Runs on a background event loop so the rest of the app stays
+            # responsive; the fragment below polls it until it finishes.
+            st.session_state.pop("price_fetch_msg", None)
+            st.session_state["price_fetch"] = Collector(get_db()).start_background_fetch(
+                get_db().get_all_tickers(), period=period,
+            )
+        _render_price_fetch_status()
 
         st.markdown("---")
         if st.button("Delete portfolio", type="secondary"):
@@ -724,23 +610,13 @@ if view == "Multi-Portfolio Dashboard":
     st.markdown("---")
 
     # ── Aggregate Exposure (with optional lookthrough) ────────────────────────
-    _dash_db = get_db()
-    # Find funds across all portfolios with either source of lookthrough data.
-    vendor_set: set[str] = set()
-    yfinance_set: set[str] = set()
-    for p in portfolios_by_name.values():
-        for pos in p.positions:
-            if pos.asset.asset_type.value not in ("ETF", "Fund"):
-                continue
-            t = pos.asset.ticker
-            if t in vendor_set or t in yfinance_set:
-                continue
-            if not _dash_db.get_fund_holdings(t).empty:
-                vendor_set.add(t)
-                continue
-            prof = _dash_db.get_fund_profile(t)
-            if (prof.get("asset_classes") or {}) or (prof.get("sector_weightings") or {}):
-                yfinance_set.add(t)
+    from src.lookthrough import LookthroughEngine
+
+    _lookthrough = LookthroughEngine(get_db())
+    # Funds across all portfolios with either source of lookthrough data.
+    _dash_sources = _lookthrough.sources(portfolios_by_name.values())
+    vendor_set = set(_dash_sources["vendor"] + _dash_sources["constituents"])
+    yfinance_set = set(_dash_sources["yfinance"])
 
     st.subheader("Aggregate Exposure")
     if vendor_set or yfinance_set:
@@ -764,14 +640,9 @@ if view == "Multi-Portfolio Dashboard":
             "**🔍 Lookthrough** tab to enable decomposition here."
         )
 
-    all_rows: list[dict] = []
-    for pname, p in portfolios_by_name.items():
-        for r in expand_lookthrough_rows(p, _dash_db, latest, enabled=dash_lookthrough):
-            r["Portfolio"] = pname
-            all_rows.append(r)
+    agg_df = _lookthrough.expand(portfolios_by_name.values(), latest, lookthrough=dash_lookthrough)
 
-    if all_rows:
-        agg_df = pd.DataFrame(all_rows)
+    if not agg_df.empty:
         type_agg = agg_df.groupby("Type")["Current Value"].sum().reset_index()
         type_agg = type_agg[type_agg["Current Value"] > 0]
         sector_agg = (
@@ -952,18 +823,14 @@ if view == "Multi-Portfolio Dashboard":
         "(Stock/ETF/Fund). Driven by **income_rate** in the Security Master."
     )
 
-    _reporting = get_reporting()
-    all_income_rows = []
-    income_by_portfolio = {}
-    for pname, p in portfolios_by_name.items():
-        df_inc = _reporting.compute_portfolio_income(p, latest_prices=latest)
-        if not df_inc.empty:
-            df_inc.insert(0, "Portfolio", pname)
-            all_income_rows.append(df_inc)
-            income_by_portfolio[pname] = float(df_inc["Annual Income"].sum())
-
-    if all_income_rows:
-        income_df = pd.concat(all_income_rows, ignore_index=True)
+    from src.income import portfolio_income
+
+    # Every portfolio (or the group's combined portfolio) in one pass.
+    income_proj = portfolio_income(portfolios_by_name.values(), latest_prices=latest)
+    income_by_portfolio = income_proj.annual.to_dict()
+
+    if not income_proj.positions.empty:
+        income_df = income_proj.positions
         total_annual    = float(income_df["Annual Income"].sum())
         total_monthly   = total_annual / 12.0
         total_yield_pct = (total_annual / total_value_all * 100.0) if total_value_all else 0.0
@@ -1012,23 +879,13 @@ if view == "Multi-Portfolio Dashboard":
 
         # Monthly schedule — payment_frequency-aware
         with col_ap:
-            months = list(range(1, 13))
-            schedule = {m: 0.0 for m in months}
-            for _, r in income_df.iterrows():
-                ann = float(r["Annual Income"])
-                if ann <= 0:
-                    continue
-                freq = int(r["Payment Frequency"]) or 1
-                per_payment = ann / freq
-                step = max(1, 12 // freq)
-                for m in range(step, 13, step):
-                    schedule[m] += per_payment
-            sched_df = pd.DataFrame({
-                "Month": [pd.Timestamp(2026, m, 1).strftime("%b") for m in months],
-                "Income": [schedule[m] for m in months],
-            })
+            sched_df = income_proj.calendar.rename(
+                columns=lambda m: pd.Timestamp(2026, m, 1).strftime("%b"),
+            ).rename_axis("Portfolio").reset_index().melt(
+                id_vars="Portfolio", var_name="Month", value_name="Income",
+            )
             fig_sched = px.bar(
-                sched_df, x="Month", y="Income",
+                sched_df, x="Month", y="Income", color="Portfolio",
                 title="Income by Calendar Month (next 12)",
                 labels={"Income": "Income (USD)"},
             )
@@ -1107,19 +964,20 @@ if view == "Multi-Portfolio Dashboard":
         port_metrics_all["date"] = pd.to_datetime(port_metrics_all["date"])
 
         # Period filter
+        # Same windows the contributor tables are precomputed for.
+        from src.attribution import ATTRIBUTION_PERIODS
         latest_dt = port_metrics_all["date"].max()
         period_label = st.radio(
             "Period",
-            ["1M", "3M", "6M", "1Y", "YTD", "All"],
+            list(ATTRIBUTION_PERIODS),
             horizontal=True, index=2, key="attr_period",
         )
-        period_days = {"1M": 30, "3M": 90, "6M": 180, "1Y": 365}
         if period_label == "All":
             cutoff = port_metrics_all["date"].min()
         elif period_label == "YTD":
             cutoff = pd.Timestamp(latest_dt.year, 1, 1)
         else:
-            cutoff = latest_dt - pd.Timedelta(days=period_days[period_label])
+            cutoff = latest_dt - pd.Timedelta(days=ATTRIBUTION_PERIODS[period_label])
 
         pm = port_metrics_all[port_metrics_all["date"] >= cutoff].copy()
 
@@ -1182,14 +1040,18 @@ if view == "Multi-Portfolio Dashboard":
             fig_dd.update_layout(yaxis_tickformat=".1%", hovermode="x unified")
             st.plotly_chart(fig_dd, use_container_width=True)
 
-        # End-of-period KPI strip per portfolio
+        # End-of-period KPI strip per portfolio. Stored portfolios read the
+        # period return off the cumulative log-return index (two lookups);
+        # the synthetic combined series falls back to its re-compounded path.
+        stored_returns = _attr_db.window_returns(cutoff, latest_dt)
         end_kpi_rows = []
         for name, grp in pm.groupby("portfolio_name"):
             grp = grp.sort_values("date")
             last = grp.iloc[-1]
+            period_return = stored_returns.get(name, last["window_cum"])
             end_kpi_rows.append({
                 "Portfolio": name,
-                "Period Return": f"{last['window_cum']:+.2%}",
+                "Period Return": f"{period_return:+.2%}",
                 "Annualised Vol (21d)": f"{(last['rolling_vol_21d'] or 0)*100:.2f}%",
                 "Current Drawdown": f"{(last['drawdown'] or 0)*100:.2f}%",
                 "Max Drawdown (since inception)": f"{(last['max_drawdown'] or 0)*100:.2f}%",
@@ -1234,26 +1096,30 @@ if view == "Multi-Portfolio Dashboard":
                 st.markdown(f"**vs {primary_bench} (period return delta)**")
                 st.dataframe(pd.DataFrame(delta_rows), use_container_width=True, hide_index=True)
 
-        # Attribution: top contributors / detractors in the window.
-        # Scope to the active portfolio set, and in combined view re-label
-        # every member row so the table aggregates across them.
-        attr_all = _attr_db.get_daily_attribution(start_date=cutoff.strftime("%Y-%m-%d"))
-        if not attr_all.empty:
-            if combined_view and combined_members and combined_name:
-                attr_all = attr_all[attr_all["portfolio_name"].isin(combined_members)].copy()
-                attr_all["portfolio_name"] = combined_name
-            else:
-                attr_all = attr_all[attr_all["portfolio_name"].isin(portfolio_names)]
-        if not attr_all.empty:
-            attr_all["date"] = pd.to_datetime(attr_all["date"])
+        # Attribution: top contributors / detractors in the window, read from
+        # the per-period totals `refresh_all` precomputes. Scope to the active
+        # portfolio set; in combined view re-label every member row so the
+        # table aggregates across them.
+        contrib = _attr_db.get_attribution_contributors(period=period_label)
+        by_at = _attr_db.get_attribution_rollup(
+            "asset_type", start_date=cutoff.strftime("%Y-%m-%d"),
+        )
+        if combined_view and combined_members and combined_name:
+            contrib = contrib[contrib["portfolio_name"].isin(combined_members)].copy()
+            contrib["portfolio_name"] = combined_name
+            by_at = by_at[by_at["portfolio_name"].isin(combined_members)]
+        else:
+            contrib = contrib[contrib["portfolio_name"].isin(portfolio_names)]
+            by_at = by_at[by_at["portfolio_name"].isin(portfolio_names)]
+        if not contrib.empty:
             sum_contrib = (
-                attr_all.groupby(["portfolio_name", "ticker", "asset_type", "sector"])
+                contrib.groupby(["portfolio_name", "ticker", "asset_type", "sector"])
                 ["contribution_to_return"].sum()
                 .reset_index()
                 .sort_values("contribution_to_return", ascending=False)
             )
 
-            st.markdown(f"**Top 10 contributors over {period_label} (Σ daily contributions)**")
+            st.markdown(f"**Top 10 contributors over {period_label} (linked to the period return)**")
             top = sum_contrib.head(10).copy()
             top["contribution_to_return"] = top["contribution_to_return"].map(lambda v: f"{v*100:+.2f}%")
             st.dataframe(top, use_container_width=True, hide_index=True)
@@ -1263,9 +1129,16 @@ if view == "Multi-Portfolio Dashboard":
             bot["contribution_to_return"] = bot["contribution_to_return"].map(lambda v: f"{v*100:+.2f}%")
             st.dataframe(bot, use_container_width=True, hide_index=True)
 
-            # Cumulative contribution by asset type, stacked over time
+        if not by_at.empty:
+            # Cumulative contribution by asset type, stacked over time. Each
+            # day is grown by its portfolio's return earlier in the window
+            # (Frongello), so the stack tops out at the compounded return.
+            from src.linking import frongello_contributions
+            by_at = by_at.copy()
+            by_at["date"] = pd.to_datetime(by_at["date"])
+            by_at["contribution_to_return"] = frongello_contributions(by_at)
             by_at = (
-                attr_all.groupby(["date", "asset_type"])["contribution_to_return"]
+                by_at.groupby(["date", "asset_type"])["contribution_to_return"]
                 .sum().reset_index()
             )
             by_at = by_at.sort_values(["asset_type", "date"])
@@ -2322,19 +2195,12 @@ with tab_overview:
         # Detect which positions can actually be looked through. A fund counts
         # as lookthroughable if EITHER vendor holdings OR a yfinance fund_profile
         # is available; the helper falls back from one to the other automatically.
-        _db = get_db()
-        vendor_funds: list[str] = []
-        yfinance_funds: list[str] = []
-        for pos in portfolio.positions:
-            if pos.asset.asset_type.value not in ("ETF", "Fund"):
-                continue
-            t = pos.asset.ticker
-            if not _db.get_fund_holdings(t).empty:
-                vendor_funds.append(t)
-                continue
-            prof = _db.get_fund_profile(t)
-            if (prof.get("asset_classes") or {}) or (prof.get("sector_weightings") or {}):
-                yfinance_funds.append(t)
+        from src.lookthrough import LookthroughEngine
+
+        _lookthrough = LookthroughEngine(get_db())
+        _sources = _lookthrough.sources([portfolio])
+        vendor_funds = _sources["vendor"] + _sources["constituents"]
+        yfinance_funds = _sources["yfinance"]
 
         if vendor_funds or yfinance_funds:
             lookthrough = st.toggle(
@@ -2356,8 +2222,7 @@ with tab_overview:
                 "**🔍 Lookthrough** tab to enable lookthrough."
             )
 
-        rows = expand_lookthrough_rows(portfolio, _db, cur_prices, enabled=lookthrough)
-        df = pd.DataFrame(rows)
+        df = _lookthrough.expand([portfolio], cur_prices, lookthrough=lookthrough).drop(columns="Portfolio")
 
         total_cost  = df["Total Cost"].sum()
         total_value = df["Current Value"].sum() if df["Current Value"].notna().any() else None
@@ -2481,18 +2346,12 @@ with tab_exposure:
         st.info("No positions yet. Add some via the **📋 Trades** tab.")
     else:
         # Categorise funds by which lookthrough source they have.
-        vendor_funds: list[str] = []
-        yfinance_funds: list[str] = []
-        for pos in portfolio.positions:
-            if pos.asset.asset_type.value not in ("ETF", "Fund"):
-                continue
-            t = pos.asset.ticker
-            if not db.get_fund_holdings(t).empty:
-                vendor_funds.append(t)
-                continue
-            prof = db.get_fund_profile(t)
-            if (prof.get("asset_classes") or {}) or (prof.get("sector_weightings") or {}):
-                yfinance_funds.append(t)
+        from src.lookthrough import LookthroughEngine
+
+        _lookthrough = LookthroughEngine(db)
+        _sources = _lookthrough.sources([portfolio])
+        vendor_funds = _sources["vendor"] + _sources["constituents"]
+        yfinance_funds = _sources["yfinance"]
 
         if vendor_funds or yfinance_funds:
             lookthrough = st.toggle(
@@ -2517,20 +2376,12 @@ with tab_exposure:
             )
 
         try:
-            # Use the shared lookthrough helper (handles vendor → yfinance →
-            # native fallback automatically) and groupby (Type, Sector) for
-            # the Exposure breakdown.
-            exp_rows = expand_lookthrough_rows(
-                portfolio, db, cur_prices or {}, enabled=lookthrough,
+            # (Type, Sector) totals straight from the shared lookthrough
+            # operator (vendor → constituents → yfinance → native).
+            exposure_df = (
+                _lookthrough.exposure([portfolio], cur_prices or {}, lookthrough=lookthrough)
+                .iloc[:, 0].rename("Value").reset_index()
             )
-            exp_df_raw = pd.DataFrame(exp_rows)
-            if not exp_df_raw.empty:
-                exposure_df = (
-                    exp_df_raw.groupby(["Type", "Sector"])["Current Value"]
-                    .sum().reset_index().rename(columns={"Current Value": "Value"})
-                )
-            else:
-                exposure_df = pd.DataFrame(columns=["Type", "Sector", "Value"])
 
             total_exp = exposure_df["Value"].sum()
             exposure_df["Weight %"] = exposure_df["Value"] / total_exp * 100
@@ -2578,10 +2429,11 @@ with tab_risk:
             metrics = reporting.get_portfolio_risk_metrics(portfolio)
             cov_matrix: pd.DataFrame = metrics.pop("Covariance Matrix")
 
-            m1, m2, m3 = st.columns(3)
+            m1, m2, m3, m4 = st.columns(4)
             m1.metric("Annualised Volatility", fmt_pct(metrics["Volatility"] * 100))
             m2.metric("Historical VaR (95%, 1d)", fmt_pct(metrics["Historical VaR (95%)"] * 100))
-            m3.metric("Monte Carlo VaR (95%, 1d)", fmt_pct(metrics["Monte Carlo VaR (95%)"] * 100))
+            m3.metric("Parametric VaR (95%, 1d)", fmt_pct(metrics["Parametric VaR (95%)"] * 100))
+            m4.metric("CVaR (95%, 1d)", fmt_pct(metrics["CVaR (95%)"] * 100))
 
             st.markdown("---")
 
@@ -2590,8 +2442,7 @@ with tab_risk:
             # Correlation heatmap
             with col_left:
                 st.subheader("Correlation Matrix")
-                returns = reporting.calculate_returns(tickers)
-                corr = returns.corr()
+                corr = CovarianceEngine(db).correlation(tickers)
                 fig_corr = go.Figure(go.Heatmap(
                     z=corr.values,
                     x=corr.columns.tolist(),
@@ -2607,9 +2458,10 @@ with tab_risk:
             # Portfolio return distribution
             with col_right:
                 st.subheader("Portfolio Return Distribution")
-                weights = np.array([p.quantity * p.cost_basis for p in portfolio.positions])
-                weights /= weights.sum()
-                port_returns = reporting.calculate_returns(tickers).dot(weights)
+                risk = RiskEngine(db)
+                risk_returns, risk_latest = risk.load_returns(tickers)
+                weights = risk.weight_matrix(risk.holdings([portfolio]), risk_latest)
+                port_returns = risk.portfolio_returns(weights, risk_returns)[portfolio.name].dropna()
 
                 hist_var = metrics["Historical VaR (95%)"]
                 fig_dist = go.Figure()
@@ -2635,6 +2487,31 @@ with tab_risk:
                 )
                 st.plotly_chart(fig_dist, use_container_width=True)
 
+            # VaR decomposition — same returns load as the distribution above.
+            st.subheader("Contribution to VaR (95%, 1d)")
+            decomposition = risk.var_contributions(
+                [portfolio], returns=risk_returns, latest=risk_latest,
+            ).sort_values("component_var")
+            fig_contrib = go.Figure()
+            fig_contrib.add_trace(go.Bar(
+                x=decomposition["ticker"], y=decomposition["pct_contribution"],
+                name="Parametric", marker_color="steelblue",
+            ))
+            fig_contrib.add_trace(go.Bar(
+                x=decomposition["ticker"], y=decomposition["hist_pct_contribution"],
+                name="Historical", marker_color="indianred",
+            ))
+            fig_contrib.update_layout(
+                barmode="group", yaxis_title="% of portfolio VaR", yaxis_tickformat=".0%",
+            )
+            st.plotly_chart(fig_contrib, use_container_width=True)
+            disp = decomposition.drop(columns="portfolio_name")
+            for col in ["weight", "pct_contribution", "hist_pct_contribution"]:
+                disp[col] = disp[col].map(lambda x: f"{x:.1%}")
+            for col in ["marginal_var", "component_var", "hist_component_var"]:
+                disp[col] = disp[col].map(lambda x: f"{x:.2%}")
+            st.dataframe(disp, use_container_width=True, hide_index=True)
+
             # Covariance matrix
             st.subheader("Annualised Covariance Matrix")
             fig_cov = go.Figure(go.Heatmap(
@@ -2682,31 +2559,38 @@ with tab_risk:
             betas_df = get_db().get_sector_betas()
             beta_dates = get_db().list_sector_beta_dates()
 
-            col_drv, col_sh, col_re = st.columns([2, 1, 1])
+            col_drv, col_re = st.columns([3, 1])
             with col_drv:
-                driver = st.selectbox(
-                    "Driver sector",
+                drivers = st.multiselect(
+                    "Driver sector(s)",
                     SECTOR_KEYS,
+                    default=SECTOR_KEYS[:1],
                     format_func=lambda k: SECTOR_DISPLAY[k],
-                    key="implied_driver",
-                )
-            with col_sh:
-                driver_shock_pct = st.number_input(
-                    "Shock %", value=-20.0, step=1.0,
-                    min_value=-99.0, max_value=200.0,
-                    key="implied_shock_pct",
+                    key="implied_drivers",
                 )
             with col_re:
                 st.write("")  # vertical alignment with the inputs above
                 if st.button("Refresh betas", key="refresh_sector_betas_btn"):
                     try:
-                        with st.spinner("Fetching 20y of SPDR sector ETFs from yfinance…"):
-                            new_betas = Collector.fetch_sector_betas(years=20)
-                            get_db().save_sector_betas(new_betas)
-                        st.success(f"Computed {len(new_betas)} pairwise betas (20y window).")
+                        with st.spinner("Updating SPDR sector ETF prices from yfinance…"):
+                            from src.betas import SectorBetaEngine
+                            res = SectorBetaEngine(get_db()).refresh(years=20)
+                        st.success(
+                            f"Computed {res['betas_rows']} pairwise betas (20y window, "
+                            f"{res['mode']}: +{res['new_days']} / −{res['expired_days']} days)."
+                        )
                         st.rerun()
                     except Exception as exc:
                         st.error(f"Could not refresh betas: {exc}")
+            driver_shocks: dict[str, float] = {}
+            drv_cols = st.columns(max(len(drivers), 1))
+            for i, drv in enumerate(drivers):
+                with drv_cols[i]:
+                    driver_shocks[drv] = st.number_input(
+                        f"{SECTOR_DISPLAY[drv]} shock %", value=-20.0, step=1.0,
+                        min_value=-99.0, max_value=200.0,
+                        key=f"implied_shock_pct_{drv}",
+                    ) / 100.0
 
             if betas_df.empty:
                 st.warning(
@@ -2714,31 +2598,55 @@ with tab_risk:
                     "SPDR sector ETF prices and compute the matrix."
                 )
                 base_sector = {k: 0.0 for k in SECTOR_KEYS}
+            elif not drivers:
+                st.info("Pick at least one driver sector.")
+                base_sector = {k: 0.0 for k in SECTOR_KEYS}
             else:
+                from src.stress import StressEngine
+
+                implied_engine = StressEngine(get_db())
+                operator = implied_engine.implied_operator()
+                driver_labels = ", ".join(SECTOR_DISPLAY[d] for d in drivers)
                 st.caption(
                     f"Betas as of **{beta_dates[0]}** "
                     f"({int(betas_df['sector_a'].nunique())} × "
                     f"{int(betas_df['sector_b'].nunique())} pairs). "
-                    f"Implied shock for sector S = β(S, {SECTOR_DISPLAY[driver]}) × "
-                    f"{driver_shock_pct:+.1f}%."
+                    f"Implied shock for sector S = E[S | drivers] = Σ_SD Σ_DD⁻¹ × driver shocks "
+                    f"over {driver_labels} (the drivers regressed jointly, so correlated "
+                    f"drivers aren't double-counted); drivers keep their own shock."
                 )
-                driver_shock = driver_shock_pct / 100.0
-                base_sector = {}
-                beta_lookup = betas_df.set_index(["sector_a", "sector_b"])["beta"].to_dict()
-                for sec in SECTOR_KEYS:
-                    beta = float(beta_lookup.get((sec, driver), 0.0))
-                    base_sector[sec] = beta * driver_shock
+                base_sector = operator.implied(driver_shocks).to_dict()
+                coefficients = operator.coefficients(drivers)
 
                 with st.expander("Implied shocks (read-only preview)", expanded=False):
-                    preview = pd.DataFrame([
-                        {
-                            "Sector": SECTOR_DISPLAY[sec],
-                            "β vs driver": f"{beta_lookup.get((sec, driver), 0.0):+.3f}",
-                            "Implied shock": f"{base_sector[sec] * 100:+.2f}%",
-                        }
-                        for sec in SECTOR_KEYS
-                    ])
+                    preview = pd.DataFrame({
+                        "Sector": [SECTOR_DISPLAY[sec] for sec in SECTOR_KEYS],
+                        **{
+                            f"Coef. vs {SECTOR_DISPLAY[d]}": [
+                                f"{coefficients[i, j]:+.3f}" for i in range(len(SECTOR_KEYS))
+                            ]
+                            for j, d in enumerate(drivers)
+                        },
+                        "Implied shock": [f"{base_sector[sec] * 100:+.2f}%" for sec in SECTOR_KEYS],
+                    })
                     st.dataframe(preview, use_container_width=True, hide_index=True)
+
+                with st.expander("Sweep driver shock size", expanded=False):
+                    st.caption(
+                        "Sector-exposure P&L with the driver shocks above scaled from −2× to +2× "
+                        "(non-equity positions excluded)."
+                    )
+                    projection = implied_engine.implied_projection(portfolio, latest_prices=cur_prices)
+                    scales = np.linspace(-2.0, 2.0, 81)
+                    sweep = projection.sweep(driver_shocks, scales)
+                    lead = drivers[0]
+                    fig_sweep = px.line(
+                        x=scales * driver_shocks[lead] * 100, y=sweep.sum(axis=1),
+                        labels={"x": f"{SECTOR_DISPLAY[lead]} shock %", "y": "Portfolio P&L"},
+                        title="Implied P&L vs driver shock",
+                    )
+                    fig_sweep.update_layout(yaxis_tickformat="$,.0f")
+                    st.plotly_chart(fig_sweep, use_container_width=True)
         else:
             base_sector = SECTOR_STRESS_SCENARIOS[scenario_name]
             base_other  = NON_EQUITY_SHOCKS.get(
@@ -2806,6 +2714,118 @@ with tab_risk:
             fig_stress.update_layout(xaxis_tickformat="$,.0f", yaxis_title="")
             st.plotly_chart(fig_stress, use_container_width=True)
 
+        with st.expander("Compare all scenarios", expanded=False):
+            from src.stress import StressEngine, named_scenarios, shock_grid
+
+            st.caption(
+                "Every named scenario, the shocks above, and an optional uniform "
+                "equity-shock grid — evaluated together in one matrix product."
+            )
+            grid_on = st.checkbox("Add uniform equity grid (−40% … +20%)", key="stress_grid_on")
+            scenarios = {**named_scenarios(), "Current shocks": (sector_shocks, non_equity_shocks)}
+            if grid_on:
+                scenarios.update(shock_grid([-0.40, -0.30, -0.20, -0.10, 0.10, 0.20]))
+            pnl_table = StressEngine(get_db()).scenario_pnl(
+                portfolio, scenarios, latest_prices=cur_prices,
+            )
+            if not pnl_table.empty:
+                totals = pnl_table.sum().sort_values()
+                fig_all = px.bar(
+                    x=totals.values, y=totals.index, orientation="h",
+                    labels={"x": "Portfolio P&L", "y": ""},
+                    title="Portfolio P&L by Scenario",
+                )
+                fig_all.update_layout(xaxis_tickformat="$,.0f")
+                st.plotly_chart(fig_all, use_container_width=True)
+                st.dataframe(
+                    pnl_table.T.map(fmt_usd), use_container_width=True,
+                )
+
+        with st.expander("Historical replay — worst N-day windows", expanded=False):
+            from src.stress import StressEngine
+
+            st.caption(
+                "Every actual window in the stored price history, applied to today's "
+                "holdings. Positions without enough history use their sector's SPDR ETF."
+            )
+            replay_days = st.number_input(
+                "Window (trading days)", min_value=1, max_value=252, value=21, step=1,
+                key="replay_window_days",
+            )
+            replay = StressEngine(get_db()).historical_replay(
+                portfolio, window=int(replay_days), top=5, latest_prices=cur_prices,
+            )
+            if replay["windows"].empty:
+                st.info("No price history yet. Use **Collect Prices** in the sidebar first.")
+            else:
+                win_disp = replay["windows"].copy()
+                win_disp["start_date"] = win_disp["start_date"].dt.date
+                win_disp["end_date"] = win_disp["end_date"].dt.date
+                win_disp["pnl"] = win_disp["pnl"].map(fmt_usd)
+                win_disp["return_pct"] = win_disp["return_pct"].map(lambda v: f"{v:+.2f}%")
+                win_disp["coverage"] = win_disp["coverage"].map(lambda v: f"{v:.0%}")
+                st.dataframe(win_disp, use_container_width=True, hide_index=True)
+
+                rank = st.selectbox("Positions in window", win_disp["rank"].tolist(), key="replay_rank")
+                pos_disp = replay["positions"][replay["positions"]["rank"] == rank].drop(columns="rank")
+                fig_replay = px.bar(
+                    pos_disp, x="pnl", y="ticker", orientation="h",
+                    title=f"Position P&L — window #{rank}",
+                    color="pnl", color_continuous_scale="RdYlGn",
+                )
+                fig_replay.update_layout(xaxis_tickformat="$,.0f", yaxis_title="")
+                st.plotly_chart(fig_replay, use_container_width=True)
+                st.dataframe(replay["sources"], use_container_width=True, hide_index=True)
+
+        with st.expander("Reverse stress — smallest sector shock that breaches a loss limit", expanded=False):
+            from src.stress import StressEngine
+
+            st.caption(
+                "The most plausible sector-shock vector (smallest Mahalanobis distance under "
+                "the sector ETF covariance) that loses the target. Non-equity positions take "
+                "the non-equity shocks above."
+            )
+            col_loss, col_hz, col_scope = st.columns([1, 1, 2])
+            with col_loss:
+                rs_loss = st.number_input("Loss limit %", min_value=0.5, max_value=90.0,
+                                          value=10.0, step=0.5, key="reverse_loss_pct")
+            with col_hz:
+                rs_horizon = st.number_input("Horizon (days)", min_value=1, max_value=252,
+                                             value=21, step=1, key="reverse_horizon_days")
+            rs_groups = get_db().get_groups_for_portfolio(portfolio.name)
+            with col_scope:
+                rs_scope = st.selectbox(
+                    "Solve for", ["This portfolio"] + [f"Group: {g}" for g in rs_groups],
+                    key="reverse_scope",
+                )
+            if rs_scope == "This portfolio":
+                rs_portfolios = [portfolio]
+            else:
+                members = get_db().get_group_members(rs_scope.removeprefix("Group: "))
+                rs_portfolios = [portfolio] + [get_db().get_portfolio(m) for m in members if m != portfolio.name]
+            rs_tickers = sorted({p.asset.ticker for pf in rs_portfolios for p in pf.positions})
+            try:
+                reverse = StressEngine(get_db()).reverse_stress(
+                    rs_portfolios, loss=rs_loss / 100, horizon_days=int(rs_horizon),
+                    non_equity=non_equity_shocks, latest_prices=latest_prices(rs_tickers),
+                )
+            except ValueError:
+                st.info("No sector betas saved yet. Click **Refresh betas** under the Implied scenario.")
+            else:
+                rs_disp = reverse[["target_pnl", "distance", "probability"]].copy()
+                rs_disp["target_pnl"] = rs_disp["target_pnl"].map(fmt_usd)
+                rs_disp["distance"] = rs_disp["distance"].map(lambda v: f"{v:.2f}σ")
+                rs_disp["probability"] = rs_disp["probability"].map(lambda v: f"{v:.2%}")
+                st.dataframe(rs_disp, use_container_width=True)
+
+                shock_table = reverse[SECTOR_KEYS].T.rename(index=SECTOR_DISPLAY) * 100
+                fig_rev = px.bar(
+                    shock_table, orientation="h", barmode="group",
+                    labels={"value": "Shock %", "index": "", "variable": "Portfolio"},
+                    title="Sector shocks at the loss limit",
+                )
+                st.plotly_chart(fig_rev, use_container_width=True)
+
 # ── Income ───────────────────────────────────────────────────────────────────
 
 with tab_income:
@@ -2818,7 +2838,10 @@ with tab_income:
     if not portfolio.positions:
         st.info("No positions yet. Add some via the **📋 Trades** tab.")
     else:
-        inc_df = reporting.compute_portfolio_income(portfolio, latest_prices=cur_prices)
+        from src.income import portfolio_income
+
+        inc_proj = portfolio_income([portfolio], latest_prices=cur_prices)
+        inc_df = inc_proj.positions.drop(columns="Portfolio")
         base_total   = float(inc_df["Base Value"].sum()) if not inc_df.empty else 0.0
         annual_total = float(inc_df["Annual Income"].sum()) if not inc_df.empty else 0.0
         yield_pct    = (annual_total / base_total * 100.0) if base_total else 0.0
@@ -2853,20 +2876,10 @@ with tab_income:
                     st.plotly_chart(fig_inc, use_container_width=True)
 
             with col_b:
-                months = list(range(1, 13))
-                schedule = {m: 0.0 for m in months}
-                for _, r in inc_df.iterrows():
-                    ann = float(r["Annual Income"])
-                    if ann <= 0:
-                        continue
-                    freq = int(r["Payment Frequency"]) or 1
-                    per_payment = ann / freq
-                    step = max(1, 12 // freq)
-                    for m in range(step, 13, step):
-                        schedule[m] += per_payment
+                schedule = inc_proj.calendar.iloc[0]
                 sched_df = pd.DataFrame({
-                    "Month":  [pd.Timestamp(2026, m, 1).strftime("%b") for m in months],
-                    "Income": [schedule[m] for m in months],
+                    "Month":  [pd.Timestamp(2026, m, 1).strftime("%b") for m in schedule.index],
+                    "Income": schedule.to_numpy(),
                 })
                 fig_sched = px.bar(
                     sched_df, x="Month", y="Income",
@@ -17,14 +17,315 @@ Two reconstruction modes (chosen automatically per portfolio):
 """
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from src.database import Database
+from src.linking import link_contributions, log_contributions
 from src.models import Portfolio
 
+_VOL_WINDOW = 21
+# Returns carried between refreshes so the 21d vol window continues exactly.
+_TAIL_LEN = _VOL_WINDOW - 1
+
+# Name this engine's cursor is stored under in the change journal.
+JOURNAL_CONSUMER = "attribution"
+
+# Look-back windows for the precomputed contributor tables, in calendar days
+# before each portfolio's latest date. "YTD" and "All" are handled specially.
+ATTRIBUTION_PERIODS = {"1M": 30, "3M": 90, "6M": 180, "1Y": 365, "YTD": None, "All": None}
+
+
+def _encode_tail(values) -> str:
+    arr = np.asarray(values, dtype=float)[-_TAIL_LEN:]
+    return json.dumps([None if not np.isfinite(v) else float(v) for v in arr])
+
+
+def _decode_tail(text) -> np.ndarray:
+    if not isinstance(text, str) or not text:
+        return np.array([], dtype=float)
+    return np.array(json.loads(text), dtype=float)
+
+
+def _rolling_vol(rets, tail=None):
+    """Annualised 21d rolling vol of `rets` (Series or DataFrame). `tail`
+    holds the returns immediately before `rets` (same columns), so a
+    continued window matches a full-history computation."""
+    if tail is None or len(tail) == 0:
+        return rets.rolling(_VOL_WINDOW).std() * np.sqrt(252.0)
+    if isinstance(rets, pd.DataFrame):
+        head = pd.DataFrame(np.asarray(tail, dtype=float), columns=rets.columns)
+    else:
+        head = pd.Series(np.asarray(tail, dtype=float))
+    combined = pd.concat([head, rets.reset_index(drop=True)], ignore_index=True)
+    vol = combined.rolling(_VOL_WINDOW).std().iloc[len(head):] * np.sqrt(252.0)
+    vol.index = rets.index
+    return vol
+
+
+def _melt(dates: pd.DatetimeIndex, keep: np.ndarray, columns: dict) -> pd.DataFrame:
+    """Flatten dates × N matrices into long rows in one pass.
+
+    Rows come out column-major (all dates for the first column, then the
+    next …) and only where `keep` (dates × N) is True; "date" is always the
+    first output column. Each entry in `columns` is a dates × N array, a
+    length-N sequence of per-column labels (gathered by index take, so
+    strings aren't materialised row by row), or a scalar.
+    """
+    n_dates, n_cols = keep.shape
+    mask = keep.ravel(order="F")
+    col_idx = np.repeat(np.arange(n_cols), n_dates)[mask]
+    out: dict = {"date": np.tile(dates.to_numpy(), n_cols)[mask]}
+    for name, values in columns.items():
+        if isinstance(values, np.ndarray) and values.ndim == 2:
+            out[name] = values.ravel(order="F")[mask]
+        elif isinstance(values, (list, tuple, np.ndarray, pd.Index)):
+            out[name] = pd.Index(values).take(col_idx)
+        else:
+            out[name] = values
+    df = pd.DataFrame(out)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def _with_log_index(
+    df: pd.DataFrame, key: str, stored: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """Add `cum_log_return` = log(growth of $1 since inception).
+
+    Default and carried refreshes already produce `cum_return` from
+    inception, so this is just log1p. A windowed recompute (`stored` given)
+    anchors `cum_return` at its own first row; each series is shifted by
+    the stored index at that row so the column keeps running from inception
+    and window lookups spanning the recompute boundary stay exact."""
+    df = df.copy()
+    df["cum_log_return"] = np.log1p(df["cum_return"].astype(float))
+    if stored is None or stored.empty or df.empty:
+        return df
+
+    # Each series' first row with a value, and the stored index on that day.
+    first = df.dropna(subset=["cum_log_return"])[[key, "date", "cum_log_return"]]
+    first["date"] = pd.to_datetime(first["date"])
+    first = first.sort_values("date").groupby(key).head(1)
+    prior = pd.DataFrame({
+        key:     stored[key],
+        "date":  pd.to_datetime(stored["date"]),
+        "level": pd.to_numeric(stored["cum_log_return"], errors="coerce").astype(float).fillna(
+            np.log1p(pd.to_numeric(stored["cum_return"], errors="coerce").astype(float))
+        ),
+    }).dropna(subset=["level"]).sort_values("date")
+    anchors = pd.merge_asof(first, prior, on="date", by=key)
+    offset = (anchors["level"] - anchors["cum_log_return"]).fillna(0.0)
+    df["cum_log_return"] += df[key].map(dict(zip(anchors[key], offset))).fillna(0.0)
+    return df
+
+
+def _attribution_rollup(attr_df: pd.DataFrame, by: str) -> pd.DataFrame:
+    """Sum daily weight and contribution per (date, portfolio_name, `by`)."""
+    cols = ["date", "portfolio_name", by, "weight", "contribution_to_return", "log_contribution"]
+    if attr_df.empty:
+        return pd.DataFrame(columns=cols)
+    return (
+        attr_df.groupby(["date", "portfolio_name", by], sort=False)
+        [["weight", "contribution_to_return", "log_contribution"]].sum()
+        .reset_index()[cols]
+    )
+
+
+def _period_contributors(attr_df: pd.DataFrame) -> pd.DataFrame:
+    """Carino-linked contribution per (portfolio, ticker) over every window
+    in ATTRIBUTION_PERIODS, each ending at that portfolio's latest date.
+    Per portfolio and period the values add up to its compounded return."""
+    cols = [
+        "portfolio_name", "period", "start_date", "end_date", "ticker",
+        "asset_type", "sector", "contribution_to_return", "rank",
+    ]
+    if attr_df.empty:
+        return pd.DataFrame(columns=cols)
+    dates = pd.to_datetime(attr_df["date"])
+    end = dates.groupby(attr_df["portfolio_name"]).transform("max")
+    first = dates.groupby(attr_df["portfolio_name"]).transform("min")
+
+    frames = []
+    for period, days in ATTRIBUTION_PERIODS.items():
+        if period == "All":
+            start = first
+        elif period == "YTD":
+            start = pd.to_datetime(end.dt.year.astype(str) + "-01-01")
+        else:
+            start = end - pd.Timedelta(days=days)
+        in_window = (dates >= start).to_numpy()
+        window = attr_df.loc[in_window]
+        linked = link_contributions(window, by="ticker")
+        meta = window.groupby(["portfolio_name", "ticker"])[["asset_type", "sector"]].last()
+        linked = linked.merge(meta.reset_index(), on=["portfolio_name", "ticker"], how="left")
+        bounds = pd.DataFrame({
+            "portfolio_name": attr_df["portfolio_name"].to_numpy()[in_window],
+            "start_date":     start.to_numpy()[in_window],
+            "end_date":       end.to_numpy()[in_window],
+        }).drop_duplicates("portfolio_name")
+        linked = linked.merge(bounds, on="portfolio_name", how="left")
+        linked["period"] = period
+        frames.append(linked)
+
+    out = pd.concat(frames, ignore_index=True)
+    out = out.sort_values(
+        ["portfolio_name", "period", "contribution_to_return"], ascending=[True, True, False],
+    )
+    out["rank"] = out.groupby(["portfolio_name", "period"]).cumcount() + 1
+    return out[cols].reset_index(drop=True)
+
+
+def _portfolio_path(
+    port_return: pd.Series,
+    funded_from: Optional[pd.Timestamp],
+    carry: Optional[dict] = None,
+) -> dict:
+    """Cumulative return, drawdown, max drawdown and 21d vol for a daily
+    portfolio return series. With `carry` (the state stored after the
+    previous refresh) the series continues from that cumulative index,
+    running peak, max drawdown and return tail instead of re-anchoring."""
+    growth = (1.0 + port_return.fillna(0.0)).cumprod()
+    if carry is None:
+        cumulative = growth
+        # Mask cumulative-return before the first date the portfolio had value.
+        if funded_from is not None:
+            cumulative = cumulative.where(cumulative.index >= funded_from)
+        cummax = cumulative.cummax()
+    else:
+        cumulative = growth * carry["cum_index"]
+        cummax = cumulative.cummax().clip(lower=carry["peak"])
+    drawdown = (cumulative - cummax) / cummax
+    max_drawdown = drawdown.cummin()
+    if carry is not None:
+        max_drawdown = max_drawdown.clip(upper=carry["max_drawdown"])
+    return {
+        "cum_return":   cumulative - 1.0,
+        "drawdown":     drawdown,
+        "max_drawdown": max_drawdown,
+        "rolling_vol":  _rolling_vol(port_return, None if carry is None else carry["tail"]),
+    }
+
+
+def _journal_dirty(journal: pd.DataFrame) -> Tuple[dict[str, pd.Timestamp], set[str]]:
+    """(ticker → earliest changed price date, portfolios with position or
+    trade changes) from change-journal rows."""
+    if journal.empty:
+        return {}, set()
+    tickers = journal[journal["entity"] == "ticker"]
+    # A ticker change with no date affects its whole history.
+    changed_from = tickers["changed_from"].fillna(pd.Timestamp.min)
+    dirty = changed_from.groupby(tickers["key"]).min().to_dict() if not tickers.empty else {}
+    portfolios = set(journal.loc[journal["entity"] == "portfolio", "key"])
+    return dirty, portfolios
+
+
+def _rewind_security_state(
+    stored: pd.DataFrame,
+    state: pd.DataFrame,
+    changed_from: pd.Series,
+    calendar: pd.DatetimeIndex,
+) -> pd.DataFrame:
+    """Security carry-state rows as of the last stored row before each
+    ticker's `changed_from`, rebuilt from `daily_security_metrics`. Tickers
+    with no stored row before the change are left out (rebuild them)."""
+    if stored.empty:
+        return state.iloc[0:0]
+    stored = stored.assign(date=pd.to_datetime(stored["date"]))
+    by_ticker = dict(tuple(stored.groupby("ticker")))
+    rows = []
+    for key, before in zip(state["key"], changed_from):
+        hist = by_ticker.get(key)
+        if hist is None:
+            continue
+        hist = hist[hist["date"] < before].sort_values("date")
+        cum_index = 1.0 + float(hist["cum_return"].iloc[-1]) if not hist.empty else np.nan
+        if not np.isfinite(cum_index):
+            continue
+        last_date = hist["date"].iloc[-1]
+        # The tail runs over the shared calendar: days this ticker had no
+        # price are NaN, exactly as in a whole-universe computation.
+        tail = hist.set_index("date")["daily_return"].astype(float).reindex(
+            calendar[calendar <= last_date].union(pd.DatetimeIndex([last_date]))
+        )
+        rows.append({
+            "scope":        "security",
+            "key":          key,
+            "last_date":    last_date,
+            "cum_index":    cum_index,
+            "peak":         np.nan,
+            "max_drawdown": np.nan,
+            "return_tail":  _encode_tail(tail.to_numpy()),
+            "fingerprint":  "",
+        })
+    return pd.DataFrame(rows, columns=state.columns)
+
+
+def _rewind_portfolio_carry(
+    stored: pd.DataFrame, before: pd.Timestamp, mode: str,
+) -> Optional[dict]:
+    """Portfolio carry as of its last stored row before `before`, rebuilt
+    from its `daily_portfolio_metrics` rows; None if there is no such row."""
+    hist = stored[pd.to_datetime(stored["date"]) < before].sort_values("date")
+    if hist.empty:
+        return None
+    cum = 1.0 + hist["cum_return"].astype(float).to_numpy()
+    if not np.isfinite(cum[-1]):
+        return None
+    return {
+        "mode":         mode,
+        "last_date":    pd.Timestamp(hist["date"].iloc[-1]),
+        "cum_index":    float(cum[-1]),
+        "peak":         float(np.nanmax(cum)),
+        "max_drawdown": float(hist["max_drawdown"].iloc[-1]),
+        "tail":         hist["daily_return"].astype(float).to_numpy()[-_TAIL_LEN:],
+    }
+
+
+def _write_price_snapshot(prices: pd.DataFrame, directory: str) -> None:
+    """Dump a dates × tickers price frame as raw .npy arrays that worker
+    processes can memory-map instead of re-reading every parquet file."""
+    np.save(os.path.join(directory, "prices.npy"), prices.to_numpy(dtype=float))
+    np.save(os.path.join(directory, "dates.npy"), prices.index.to_numpy())
+    with open(os.path.join(directory, "tickers.json"), "w") as f:
+        json.dump([str(c) for c in prices.columns], f)
+
+
+def _read_price_snapshot(directory: str) -> pd.DataFrame:
+    values = np.load(os.path.join(directory, "prices.npy"), mmap_mode="r")
+    dates = np.load(os.path.join(directory, "dates.npy"))
+    with open(os.path.join(directory, "tickers.json")) as f:
+        tickers = json.load(f)
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates), columns=tickers, copy=False)
+
+
+def _refresh_shard(
+    data_dir: str,
+    snapshot_dir: str,
+    portfolios: list[Portfolio],
+    start_date: Optional[str],
+    carries: dict[str, dict],
+    trades: pd.DataFrame,
+    batched: bool,
+) -> Tuple[pd.DataFrame, pd.DataFrame, dict[str, str]]:
+    """Process-pool worker: compute one shard of portfolios. Nothing is
+    written here — the parent merges every shard and upserts once."""
+    engine = AttributionEngine(Database(data_dir))
+    if batched:
+        return engine.compute_portfolio_histories(
+            portfolios, start_date=start_date, carries=carries, trades=trades,
+            prices=_read_price_snapshot(snapshot_dir),
+        )
+    trades_by_name = dict(tuple(trades.groupby("portfolio_name"))) if not trades.empty else {}
+    return engine._portfolio_histories_serial(portfolios, start_date, carries, trades_by_name)
+
 
 class AttributionEngine:
     def __init__(self, db: Database):
@@ -42,48 +343,99 @@ class AttributionEngine:
         Cumulative return is anchored at the first valid date in the fetched
         window — recomputed on every refresh so the series stays self-consistent.
         """
+        return self._security_metrics(tickers, start_date=start_date)[0]
+
+    def _security_metrics(
+        self,
+        tickers: Optional[list[str]] = None,
+        start_date: Optional[str] = None,
+        carry: Optional[pd.DataFrame] = None,
+        prices: Optional[pd.DataFrame] = None,
+        calendar: Optional[pd.DatetimeIndex] = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """(long metrics, carry state). With `carry` (security state rows
+        sharing one `last_date`) only dates after it are returned, continued
+        from the stored cumulative index and return tail.
+
+        `prices` (already loaded, covering the window) skips the store read.
+        `calendar` adds the dates other tickers traded on, so returns and
+        vol windows line up with a computation over the whole universe even
+        when only a few tickers are recomputed."""
+        empty = pd.DataFrame(columns=[
+            "date", "ticker", "price", "daily_return", "cum_return", "rolling_vol_21d",
+        ])
         if tickers is None:
             tickers = self.db.get_all_tickers()
         if not tickers:
-            return pd.DataFrame(columns=[
-                "date", "ticker", "price", "daily_return", "cum_return", "rolling_vol_21d",
-            ])
+            return empty, pd.DataFrame()
 
-        prices = self.db.get_historical_prices(tickers, start_date=start_date)
+        if carry is not None:
+            last_date = pd.Timestamp(carry["last_date"].iloc[0])
+            start_date = last_date.strftime("%Y-%m-%d")
+        if prices is None:
+            prices = self.db.get_historical_prices(tickers, start_date=start_date)
+        else:
+            prices = prices.reindex(columns=[t for t in tickers if t in prices.columns])
+            if start_date is not None:
+                prices = prices[prices.index >= pd.Timestamp(start_date)]
+            prices = prices.dropna(how="all")
         if prices.empty:
-            return pd.DataFrame(columns=[
-                "date", "ticker", "price", "daily_return", "cum_return", "rolling_vol_21d",
-            ])
+            return empty, pd.DataFrame()
 
         prices = prices.sort_index()
-        rets = prices.pct_change()
-        cum  = (1.0 + rets.fillna(0.0)).cumprod() - 1.0
-        # Mask cumulative-return values before each ticker's first valid price
-        # so we don't pretend the position existed on those dates.
-        first_valid = prices.apply(lambda col: col.first_valid_index())
-        for ticker in prices.columns:
-            fv = first_valid[ticker]
-            if fv is not None:
-                cum.loc[cum.index < fv, ticker] = np.nan
-        vol21 = rets.rolling(21).std() * np.sqrt(252.0)
-
-        frames = []
-        for ticker in prices.columns:
-            df = pd.DataFrame({
-                "date":            prices.index,
-                "ticker":          ticker,
-                "price":           prices[ticker].values,
-                "daily_return":    rets[ticker].values,
-                "cum_return":      cum[ticker].values,
-                "rolling_vol_21d": vol21[ticker].values,
-            })
-            # Drop rows where the ticker has no price on that date.
-            df = df.dropna(subset=["price"]).reset_index(drop=True)
-            frames.append(df)
-
-        result = pd.concat(frames, ignore_index=True)
-        result["date"] = pd.to_datetime(result["date"])
-        return result
+        if calendar is not None:
+            lo = pd.Timestamp(start_date) if start_date is not None else prices.index.min()
+            prices = prices.reindex(prices.index.union(calendar[calendar >= lo]))
+        rets = prices.pct_change(fill_method=None)
+        if carry is None:
+            cum  = (1.0 + rets.fillna(0.0)).cumprod() - 1.0
+            # Mask cumulative-return values before each ticker's first valid price
+            # so we don't pretend the position existed on those dates.
+            cum = cum.where(prices.notna().cummax())
+            tail = None
+        else:
+            # The window's first row is `last_date` itself — only needed as
+            # the base for the first new return.
+            keep = prices.index > last_date
+            prices, rets = prices[keep], rets[keep]
+            if prices.empty:
+                return empty, pd.DataFrame()
+            by_ticker = carry.set_index("key").reindex(prices.columns)
+            cum = (1.0 + rets.fillna(0.0)).cumprod() * by_ticker["cum_index"].to_numpy() - 1.0
+            tail_cols = [_decode_tail(t) for t in by_ticker["return_tail"]]
+            n = max((len(c) for c in tail_cols), default=0)
+            tail = np.full((n, len(prices.columns)), np.nan)
+            for j, col in enumerate(tail_cols):
+                if len(col):
+                    tail[n - len(col):, j] = col
+        vol21 = _rolling_vol(rets, tail)
+
+        P = prices.to_numpy(dtype=float)
+        # One row per (ticker, date) where the ticker has a price.
+        result = _melt(prices.index, np.isfinite(P), {
+            "ticker":          prices.columns,
+            "price":           P,
+            "daily_return":    rets.to_numpy(dtype=float),
+            "cum_return":      cum.to_numpy(dtype=float),
+            "rolling_vol_21d": vol21.to_numpy(dtype=float),
+        })
+
+        # Carry state at the last calendar row, for the next incremental run.
+        prev_tail = tail if tail is not None else np.empty((0, len(prices.columns)))
+        full_tail = np.vstack([prev_tail, rets.to_numpy(dtype=float)])[-_TAIL_LEN:]
+        cum_index = 1.0 + cum.iloc[-1]
+        ok = np.isfinite(cum_index.to_numpy(dtype=float))
+        state = pd.DataFrame({
+            "scope":        "security",
+            "key":          prices.columns[ok],
+            "last_date":    prices.index[-1],
+            "cum_index":    cum_index.to_numpy(dtype=float)[ok],
+            "peak":         np.nan,
+            "max_drawdown": np.nan,
+            "return_tail":  [_encode_tail(full_tail[:, j]) for j in np.flatnonzero(ok)],
+            "fingerprint":  "",
+        })
+        return result, state
 
     # ── Portfolio-level + attribution (uses current static positions) ─────────
 
@@ -91,12 +443,17 @@ class AttributionEngine:
         self,
         portfolio: Portfolio,
         start_date: Optional[str] = None,
+        carry: Optional[dict] = None,
     ) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """Return (daily_portfolio_metrics_df, daily_attribution_df) for one portfolio.
 
         Daily return at t = Σᵢ (wᵢ at t-1) × (return of i at t), so the sum of
         per-position contributions equals the portfolio return on each day —
         the standard Brinson decomposition.
+
+        `carry` is the portfolio's stored state (see `_load_portfolio_carry`):
+        only dates after `carry["last_date"]` are returned, continuing its
+        cumulative / drawdown / vol path.
         """
         empty_port = pd.DataFrame(columns=[
             "date", "portfolio_name", "total_value", "daily_return",
@@ -113,6 +470,8 @@ class AttributionEngine:
         tickers = [pos.asset.ticker for pos in portfolio.positions]
         pos_by_t = {pos.asset.ticker: pos for pos in portfolio.positions}
 
+        if carry is not None:
+            start_date = carry["last_date"].strftime("%Y-%m-%d")
         prices = self.db.get_historical_prices(tickers, start_date=start_date)
         if prices.empty:
             return empty_port, empty_attr
@@ -130,68 +489,124 @@ class AttributionEngine:
         weights = position_values.div(total_value, axis=0)
         # Yesterday's weights × today's returns = today's attribution.
         prev_weights = weights.shift(1)
-        rets = prices[position_values.columns].pct_change()
+        rets = prices[position_values.columns].pct_change(fill_method=None)
         contributions = prev_weights * rets
         port_return = contributions.sum(axis=1, min_count=1)
+        if carry is not None:
+            keep = position_values.index > carry["last_date"]
+            position_values, total_value, weights = position_values[keep], total_value[keep], weights[keep]
+            rets, contributions, port_return = rets[keep], contributions[keep], port_return[keep]
+            if position_values.empty:
+                return empty_port, empty_attr
 
-        cumulative = (1.0 + port_return.fillna(0.0)).cumprod()
-        # Mask cumulative-return before the first date the portfolio had any value.
-        first_valid_total = total_value.first_valid_index()
-        if first_valid_total is not None:
-            cumulative.loc[cumulative.index < first_valid_total] = np.nan
-        cum_return = cumulative - 1.0
-        cummax = cumulative.cummax()
-        drawdown = (cumulative - cummax) / cummax
-        max_drawdown = drawdown.cummin()
-        rolling_vol = port_return.rolling(21).std() * np.sqrt(252.0)
+        path = _portfolio_path(port_return, total_value.first_valid_index(), carry)
 
         port_df = pd.DataFrame({
             "date":            position_values.index,
             "portfolio_name":  portfolio.name,
             "total_value":     total_value.values,
             "daily_return":    port_return.reindex(position_values.index).values,
-            "cum_return":      cum_return.reindex(position_values.index).values,
-            "rolling_vol_21d": rolling_vol.reindex(position_values.index).values,
-            "drawdown":        drawdown.reindex(position_values.index).values,
-            "max_drawdown":    max_drawdown.reindex(position_values.index).values,
+            "cum_return":      path["cum_return"].reindex(position_values.index).values,
+            "rolling_vol_21d": path["rolling_vol"].reindex(position_values.index).values,
+            "drawdown":        path["drawdown"].reindex(position_values.index).values,
+            "max_drawdown":    path["max_drawdown"].reindex(position_values.index).values,
         }).dropna(subset=["total_value"]).reset_index(drop=True)
         port_df["date"] = pd.to_datetime(port_df["date"])
 
-        # Long-format attribution: one row per (date, ticker)
-        attr_frames = []
-        for t in position_values.columns:
-            asset = pos_by_t[t].asset
-            df = pd.DataFrame({
-                "date":   position_values.index,
-                "portfolio_name": portfolio.name,
-                "ticker": t,
-                "weight":          weights[t].values,
-                "position_return": rets[t].values,
-                "contribution_to_return": contributions[t].values,
-                "asset_type": asset.asset_type.value,
-                "sector":     asset.sector or "Unknown",
-            })
-            # Keep rows where we at least had a weight OR a contribution to record.
-            df = df.dropna(subset=["weight"], how="all").reset_index(drop=True)
-            attr_frames.append(df)
-        attr_df = pd.concat(attr_frames, ignore_index=True) if attr_frames else empty_attr
-        attr_df["date"] = pd.to_datetime(attr_df["date"])
+        # Long-format attribution: one row per (date, ticker) with a weight.
+        W = weights.to_numpy(dtype=float)
+        cols = position_values.columns
+        attr_df = _melt(position_values.index, np.isfinite(W), {
+            "portfolio_name":         portfolio.name,
+            "ticker":                 cols,
+            "weight":                 W,
+            "position_return":        rets.to_numpy(dtype=float),
+            "contribution_to_return": contributions.to_numpy(dtype=float),
+            "asset_type":             [pos_by_t[t].asset.asset_type.value for t in cols],
+            "sector":                 [pos_by_t[t].asset.sector or "Unknown" for t in cols],
+        })
 
         return port_df, attr_df
 
+    # ── Trade-ledger helpers (shared by v2 and the batched engine) ────────────
+
+    @staticmethod
+    def _trade_ledger(
+        trades: pd.DataFrame, current_qty: dict[str, float],
+    ) -> Tuple[pd.DataFrame, dict[str, float]]:
+        """(trade_date × ticker signed quantity deltas, legacy opening qty)."""
+        # Build per-trade signed quantity delta (BUY +, SELL −).
+        trade_date = pd.to_datetime(trades["trade_date"])
+        quantity = trades["quantity"].astype(float)
+        delta_qty = quantity.where(trades["side"].str.upper() == "BUY", -quantity)
+
+        # (date × ticker) deltas, summing multiple same-day trades.
+        qty_changes = (
+            delta_qty.groupby([trade_date.rename("trade_date"), trades["ticker"]]).sum()
+            .unstack("ticker", fill_value=0.0)
+            .sort_index()
+        )
+        qty_changes.columns.name = "ticker"
+
+        # Legacy quantity per ticker = current quantity − sum of all recorded
+        # trade deltas. If positive, that quantity was held *before* the first
+        # trade in the ledger and needs to be injected as an implicit opening
+        # position. Also pick up tickers that have no trade history at all.
+        current = pd.Series(current_qty, dtype=float)
+        legacy = current - qty_changes.sum().reindex(current.index, fill_value=0.0)
+        legacy = legacy[legacy > 1e-6]
+        extra = [t for t in legacy.index if t not in qty_changes.columns]
+        if extra:
+            # Add the columns so they survive the calendar cumsum.
+            qty_changes = qty_changes.reindex(
+                columns=qty_changes.columns.append(pd.Index(extra)), fill_value=0.0,
+            )
+        return qty_changes, {t: float(q) for t, q in legacy.items()}
+
+    @staticmethod
+    def _quantities_on_calendar(
+        qty_changes: pd.DataFrame,
+        legacy_qty: dict[str, float],
+        eligible_dates: pd.DatetimeIndex,
+    ) -> pd.DataFrame:
+        """Held quantity per (date, ticker) on `eligible_dates`."""
+        # Every trade date maps to the first eligible date on or after it, so
+        # trades on non-trading days (and before the window) snap forward;
+        # trades after the last eligible date fall off the end.
+        slot = eligible_dates.searchsorted(qty_changes.index, side="left")
+        on_calendar = slot < len(eligible_dates)
+        deltas = np.zeros((len(eligible_dates), qty_changes.shape[1]))
+        if on_calendar.any():
+            summed = qty_changes[on_calendar].groupby(slot[on_calendar]).sum()
+            deltas[summed.index.to_numpy()] = summed.to_numpy(dtype=float)
+
+        # Inject legacy openings at the first eligible date so the cumsum
+        # starts from the right baseline.
+        if legacy_qty and len(eligible_dates):
+            cols = qty_changes.columns.get_indexer(list(legacy_qty))
+            deltas[0, cols] += np.fromiter(legacy_qty.values(), dtype=float, count=len(legacy_qty))
+
+        # Floor at 0 — guards against shorting (we don't model it) and tiny
+        # negative residuals from SELLs that exceed the recorded BUYs.
+        held = np.maximum(np.cumsum(deltas, axis=0), 0.0)
+        return pd.DataFrame(held, index=eligible_dates, columns=qty_changes.columns)
+
     # ── v2: trade-replay reconstruction ──────────────────────────────────────
 
     def compute_portfolio_history_from_trades(
         self,
         portfolio_name: str,
         start_date: Optional[str] = None,
+        carry: Optional[dict] = None,
     ) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """v2: reconstruct historical positions by cumulative-summing the trade
         ledger, then compute the same daily portfolio + attribution metrics
         against those actual historical holdings.
 
         Returns empty DataFrames if no trades are recorded for the portfolio
-        (so the caller can fall back to v1).
+        (so the caller can fall back to v1). `carry` works as in
+        `compute_portfolio_history`; trades dated before the window snap onto
+        its first date, so holdings inside the window are unchanged.
         """
         empty_port = pd.DataFrame(columns=[
             "date", "portfolio_name", "total_value", "daily_return",
@@ -219,37 +634,11 @@ class AttributionEngine:
         except Exception:
             current_qty = {}
 
-        # Build per-trade signed quantity delta (BUY +, SELL −).
-        trades = trades.copy()
-        trades["trade_date"] = pd.to_datetime(trades["trade_date"])
-        trades["delta_qty"] = np.where(
-            trades["side"].str.upper() == "BUY",
-            trades["quantity"], -trades["quantity"],
-        )
-
-        # Pivot to (date × ticker) deltas, summing multiple same-day trades.
-        qty_changes = (
-            trades.pivot_table(
-                index="trade_date", columns="ticker",
-                values="delta_qty", aggfunc="sum", fill_value=0.0,
-            ).sort_index()
-        )
-
-        # Legacy quantity per ticker = current quantity − sum of all recorded
-        # trade deltas. If positive, that quantity was held *before* the first
-        # trade in the ledger and needs to be injected as an implicit opening
-        # position. Also pick up tickers that have no trade history at all.
-        legacy_qty: dict[str, float] = {}
-        for t, q in current_qty.items():
-            net_traded = float(qty_changes[t].sum()) if t in qty_changes.columns else 0.0
-            legacy = q - net_traded
-            if legacy > 1e-6:
-                legacy_qty[t] = legacy
-                # Add the column so it survives the reindex/cumsum below.
-                if t not in qty_changes.columns:
-                    qty_changes[t] = 0.0
+        qty_changes, legacy_qty = self._trade_ledger(trades, current_qty)
 
         tickers = qty_changes.columns.tolist()
+        if carry is not None:
+            start_date = carry["last_date"].strftime("%Y-%m-%d")
         prices = self.db.get_historical_prices(tickers, start_date=start_date)
         if prices.empty:
             return empty_port, empty_attr
@@ -266,30 +655,7 @@ class AttributionEngine:
         if len(eligible_dates) == 0:
             return empty_port, empty_attr
 
-        # Build a daily delta matrix on the price calendar.
-        deltas_on_calendar = qty_changes.reindex(eligible_dates, fill_value=0.0)
-        # For trades that landed on a non-trading day, snap to the next trading
-        # day so we don't lose any qty changes.
-        off_calendar = qty_changes.index.difference(eligible_dates)
-        if len(off_calendar) > 0:
-            snap_to = pd.Series(eligible_dates).searchsorted(off_calendar)
-            for src_d, idx in zip(off_calendar, snap_to):
-                if 0 <= idx < len(eligible_dates):
-                    deltas_on_calendar.loc[eligible_dates[idx]] += qty_changes.loc[src_d]
-
-        # Inject legacy openings at the first eligible date so the cumsum
-        # starts from the right baseline.
-        if legacy_qty:
-            first_d = eligible_dates[0]
-            for t, q in legacy_qty.items():
-                deltas_on_calendar.loc[first_d, t] = (
-                    float(deltas_on_calendar.loc[first_d, t]) + q
-                )
-
-        positions_qty = deltas_on_calendar.cumsum()
-        # Floor at 0 — guards against shorting (we don't model it) and tiny
-        # negative residuals from SELLs that exceed the recorded BUYs.
-        positions_qty = positions_qty.clip(lower=0.0)
+        positions_qty = self._quantities_on_calendar(qty_changes, legacy_qty, eligible_dates)
 
         # Position $ values per date, using whatever prices exist that day.
         priced_tickers = [t for t in tickers if t in prices.columns]
@@ -304,30 +670,29 @@ class AttributionEngine:
         total_value = position_values.sum(axis=1, min_count=1)
         weights = position_values.div(total_value, axis=0)
         prev_weights = weights.shift(1)
-        rets = prices[priced_tickers].reindex(position_values.index).pct_change()
+        rets = prices[priced_tickers].reindex(position_values.index).pct_change(fill_method=None)
         contributions = prev_weights * rets
         port_return = contributions.sum(axis=1, min_count=1)
+        if carry is not None:
+            keep = position_values.index > carry["last_date"]
+            position_values, total_value, weights = position_values[keep], total_value[keep], weights[keep]
+            rets, contributions, port_return = rets[keep], contributions[keep], port_return[keep]
+            if position_values.empty:
+                return empty_port, empty_attr
 
-        cumulative = (1.0 + port_return.fillna(0.0)).cumprod()
         # Anchor cum_return to the first date with non-zero portfolio value.
         first_funded = total_value[total_value > 0].first_valid_index()
-        if first_funded is not None:
-            cumulative.loc[cumulative.index < first_funded] = np.nan
-        cum_return = cumulative - 1.0
-        cummax = cumulative.cummax()
-        drawdown = (cumulative - cummax) / cummax
-        max_drawdown = drawdown.cummin()
-        rolling_vol = port_return.rolling(21).std() * np.sqrt(252.0)
+        path = _portfolio_path(port_return, first_funded, carry)
 
         port_df = pd.DataFrame({
             "date":            position_values.index,
             "portfolio_name":  portfolio_name,
             "total_value":     total_value.values,
             "daily_return":    port_return.reindex(position_values.index).values,
-            "cum_return":      cum_return.reindex(position_values.index).values,
-            "rolling_vol_21d": rolling_vol.reindex(position_values.index).values,
-            "drawdown":        drawdown.reindex(position_values.index).values,
-            "max_drawdown":    max_drawdown.reindex(position_values.index).values,
+            "cum_return":      path["cum_return"].reindex(position_values.index).values,
+            "rolling_vol_21d": path["rolling_vol"].reindex(position_values.index).values,
+            "drawdown":        path["drawdown"].reindex(position_values.index).values,
+            "max_drawdown":    path["max_drawdown"].reindex(position_values.index).values,
         }).dropna(subset=["total_value"]).reset_index(drop=True)
         port_df["date"] = pd.to_datetime(port_df["date"])
 
@@ -339,28 +704,424 @@ class AttributionEngine:
                 return str(row.get("asset_type") or "Unknown"), str(row.get("sector") or "Unknown")
             return "Unknown", "Unknown"
 
-        attr_frames = []
-        for t in priced_tickers:
-            at, sector = _meta(t)
-            df = pd.DataFrame({
-                "date":   position_values.index,
-                "portfolio_name": portfolio_name,
-                "ticker": t,
-                "weight":                 weights[t].values,
-                "position_return":        rets[t].values,
-                "contribution_to_return": contributions[t].values,
-                "asset_type":             at,
-                "sector":                 sector or "Unknown",
-            })
-            # Drop dates where this position had no weight AND no return —
-            # i.e. wasn't held that day. Keeps the table much smaller.
-            df = df[(df["weight"].fillna(0) > 0) | (df["position_return"].notna() & df["contribution_to_return"].notna())]
-            attr_frames.append(df.reset_index(drop=True))
+        W = weights[priced_tickers].to_numpy(dtype=float)
+        R = rets[priced_tickers].to_numpy(dtype=float)
+        C = contributions[priced_tickers].to_numpy(dtype=float)
+        meta = [_meta(t) for t in priced_tickers]
+        # Drop dates where this position had no weight AND no return —
+        # i.e. wasn't held that day. Keeps the table much smaller.
+        held = (np.nan_to_num(W) > 0) | (np.isfinite(R) & np.isfinite(C))
+        attr_df = _melt(position_values.index, held, {
+            "portfolio_name":         portfolio_name,
+            "ticker":                 priced_tickers,
+            "weight":                 W,
+            "position_return":        R,
+            "contribution_to_return": C,
+            "asset_type":             [m[0] for m in meta],
+            "sector":                 [m[1] or "Unknown" for m in meta],
+        })
+
+        return port_df, attr_df
+
+    # ── Batched: every portfolio on one shared price matrix ──────────────────
+
+    def compute_portfolio_histories(
+        self,
+        portfolios: list[Portfolio],
+        start_date: Optional[str] = None,
+        carries: Optional[dict[str, dict]] = None,
+        trades: Optional[pd.DataFrame] = None,
+        prices: Optional[pd.DataFrame] = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, dict[str, str]]:
+        """Batched equivalent of running `compute_portfolio_history_from_trades`
+        (falling back to `compute_portfolio_history`) for each portfolio.
+
+        Loads the union price matrix once and flattens every holding into a
+        (portfolio, ticker) pair column, so values, weights, contributions and
+        portfolio returns for the whole book are a handful of dates × pairs
+        array operations plus two pair → portfolio matrix products. Portfolios
+        are grouped by their own trading calendar (the dates any of their
+        tickers priced, from the first trade for v2) so returns are measured
+        exactly as the per-portfolio path measures them.
+
+        `carries` maps portfolio name → carry state (see `refresh_all`); the
+        stored mode decides v1 vs v2 for those. `prices` may be any dates ×
+        tickers frame covering the needed tickers and window (extra rows and
+        columns are ignored) — the process-pool refresh passes its shared
+        snapshot here. Returns (portfolio metrics, attribution, {name: mode}).
+        """
+        carries = carries or {}
+        empty_port = pd.DataFrame(columns=[
+            "date", "portfolio_name", "total_value", "daily_return",
+            "cum_return", "rolling_vol_21d", "drawdown", "max_drawdown",
+        ])
+        empty_attr = pd.DataFrame(columns=[
+            "date", "portfolio_name", "ticker", "weight",
+            "position_return", "contribution_to_return", "asset_type", "sector",
+        ])
+        if trades is None:
+            trades = self.db.list_trades()
+        trades_by_name = dict(tuple(trades.groupby("portfolio_name"))) if not trades.empty else {}
+        assets_df = self.db.get_all_assets().set_index("ticker")
+
+        def _v2_meta(t):
+            if t in assets_df.index:
+                row = assets_df.loc[t]
+                return str(row.get("asset_type") or "Unknown"), str(row.get("sector") or "Unknown")
+            return "Unknown", "Unknown"
+
+        # 1. One spec per portfolio: mode, tickers, quantity source, metadata.
+        specs: list[dict] = []
+        for p in portfolios:
+            carry = carries.get(p.name)
+            p_trades = trades_by_name.get(p.name, pd.DataFrame())
+            mode = carry["mode"] if carry is not None else (
+                "trade_replay" if not p_trades.empty else "static_current"
+            )
+            spec = {"name": p.name, "portfolio": p, "carry": carry, "mode": mode}
+            if mode == "trade_replay" and not p_trades.empty:
+                current_qty = {pos.asset.ticker: float(pos.quantity) for pos in p.positions}
+                qty_changes, legacy_qty = self._trade_ledger(p_trades, current_qty)
+                spec.update(
+                    tickers=qty_changes.columns.tolist(),
+                    qty_changes=qty_changes, legacy_qty=legacy_qty,
+                    eligible_from=None if legacy_qty else qty_changes.index.min(),
+                    meta={t: _v2_meta(t) for t in qty_changes.columns},
+                )
+            else:
+                spec.update(self._static_spec(p, mode))
+            if spec["tickers"]:
+                specs.append(spec)
+        if not specs:
+            return empty_port, empty_attr, {}
+
+        # 2. Union price matrix, loaded once (unless the caller passed a
+        #    snapshot covering these portfolios). Tickers with no price file
+        #    get get_historical_prices' constant 1.0 series on each calendar.
+        starts = [
+            sp["carry"]["last_date"] if sp["carry"] is not None
+            else (pd.Timestamp(start_date) if start_date else None)
+            for sp in specs
+        ]
+        if prices is None:
+            window_start = None if any(st is None for st in starts) else min(starts)
+            prices = self._union_prices({t for sp in specs for t in sp["tickers"]}, window_start)
+        col_of = {t: j for j, t in enumerate(prices.columns)}
+        P = prices.to_numpy(dtype=float) if not prices.empty else np.empty((0, 0))
+        valid = np.isfinite(P)
+        dates = prices.index
+
+        # 3. Each portfolio's calendar; specs sharing one are batched together.
+        def _calendar(sp: dict, start) -> np.ndarray:
+            cols = [col_of[t] for t in sp["tickers"] if t in col_of]
+            if not cols:
+                return np.zeros(len(dates), dtype=bool)
+            cal = valid[:, cols].any(axis=1)
+            if start is not None:
+                cal &= dates >= start
+            if sp.get("eligible_from") is not None:
+                cal &= dates >= sp["eligible_from"]
+            return cal
+
+        groups: dict[bytes, list[dict]] = {}
+        fallback: list[dict] = []
+        for sp, start in zip(specs, starts):
+            cal = _calendar(sp, start)
+            if not cal.any() and sp["mode"] == "trade_replay" and sp["carry"] is None:
+                # v2 produced nothing (e.g. trades exist but no prices yet);
+                # fall back to v1 so the user still gets something.
+                for key in ("qty_changes", "legacy_qty"):
+                    sp.pop(key, None)
+                sp.update(self._static_spec(sp["portfolio"], "static_current"))
+                sp["mode"] = "static_current"
+                cal = _calendar(sp, start)
+            if not cal.any():
+                fallback.append(sp)
+                continue
+            sp["calendar"] = cal
+            groups.setdefault(cal.tobytes(), []).append(sp)
+
+        modes = {sp["name"]: sp["mode"] for sp in specs}
+        port_frames, attr_frames = [], []
+        for group in groups.values():
+            pf, af = self._batch_group(group, prices, group[0]["calendar"])
+            port_frames.append(pf)
+            attr_frames.append(af)
+        for sp in fallback:
+            # No priced ticker at all (e.g. cash-only): the per-portfolio path
+            # owns the synthetic-calendar rules for that case.
+            if sp["carry"] is not None:
+                continue
+            pf, af = self.compute_portfolio_history(sp["portfolio"], start_date=start_date)
+            port_frames.append(pf)
+            attr_frames.append(af)
+
+        port_frames = [f for f in port_frames if not f.empty]
+        attr_frames = [f for f in attr_frames if not f.empty]
+        port_df = pd.concat(port_frames, ignore_index=True) if port_frames else empty_port
         attr_df = pd.concat(attr_frames, ignore_index=True) if attr_frames else empty_attr
-        attr_df["date"] = pd.to_datetime(attr_df["date"])
+        return port_df, attr_df, modes
+
+    def _union_prices(self, tickers, window_start: Optional[pd.Timestamp]) -> pd.DataFrame:
+        """Stored prices for `tickers` (those with a price file) from
+        `window_start` on, as one sorted dates × tickers frame."""
+        stored = set(self.db.list_price_tickers())
+        priced = sorted(t for t in tickers if t in stored)
+        if not priced:
+            return pd.DataFrame()
+        start = window_start.strftime("%Y-%m-%d") if window_start is not None else None
+        return self.db.get_historical_prices(priced, start_date=start).sort_index()
+
+    @staticmethod
+    def _static_spec(portfolio: Portfolio, mode: str) -> dict:
+        pos_by_t = {pos.asset.ticker: pos for pos in portfolio.positions}
+        return {
+            "tickers":       list(pos_by_t),
+            "qty":           {t: float(pos.quantity) for t, pos in pos_by_t.items()},
+            "eligible_from": None,
+            "meta":          {
+                t: (pos.asset.asset_type.value, pos.asset.sector or "Unknown")
+                for t, pos in pos_by_t.items()
+            },
+        }
+
+    def _batch_group(
+        self, group: list[dict], prices: pd.DataFrame, calendar: np.ndarray,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Metrics + attribution for portfolios sharing one calendar."""
+        dates = prices.index[calendar]
+        sub = prices[calendar]
+
+        # Pair columns: one per (portfolio, ticker) holding.
+        pair_port, pair_ticker = [], []
+        for i, sp in enumerate(group):
+            pair_port += [i] * len(sp["tickers"])
+            pair_ticker += sp["tickers"]
+        pair_port = np.asarray(pair_port)
+        tickers = list(dict.fromkeys(pair_ticker))
+        # Tickers without a price file are constant 1.0 on the calendar.
+        px = sub.reindex(columns=tickers)
+        unpriced = [t for t in tickers if t not in prices.columns]
+        if unpriced:
+            px[unpriced] = 1.0
+        rets = px.pct_change(fill_method=None)
+        tcol = {t: j for j, t in enumerate(tickers)}
+        pair_cols = np.array([tcol[t] for t in pair_ticker])
+        X = px.to_numpy(dtype=float)[:, pair_cols]
+        R = rets.to_numpy(dtype=float)[:, pair_cols]
+
+        # Quantities: constant per pair (v1) or replayed from trades (v2).
+        Q = np.empty_like(X)
+        k = 0
+        for sp in group:
+            n = len(sp["tickers"])
+            if "qty_changes" in sp:
+                held = self._quantities_on_calendar(sp["qty_changes"], sp["legacy_qty"], dates)
+                Q[:, k:k + n] = held[sp["tickers"]].to_numpy(dtype=float)
+            else:
+                Q[:, k:k + n] = np.array([sp["qty"][t] for t in sp["tickers"]])[None, :]
+            k += n
+
+        # pair → portfolio indicator; NaN-aware sums as matrix products.
+        S = np.zeros((len(pair_port), len(group)))
+        S[np.arange(len(pair_port)), pair_port] = 1.0
+        V = Q * X
+        total = np.where(np.isfinite(V) @ S > 0, np.nan_to_num(V) @ S, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            W = V / total[:, pair_port]
+        prev_W = np.vstack([np.full((1, W.shape[1]), np.nan), W[:-1]])
+        C = prev_W * R
+        port_ret = np.where(np.isfinite(C) @ S > 0, np.nan_to_num(C) @ S, np.nan)
+
+        # Per-portfolio path (cum / drawdown / vol), continuing any carry.
+        before_first = dates[0] - pd.Timedelta(days=1)
+        keep_from = pd.DatetimeIndex([
+            sp["carry"]["last_date"] if sp["carry"] is not None else before_first
+            for sp in group
+        ]).to_numpy()
+        keep = dates.to_numpy()[:, None] > keep_from[None, :]
+        port_frames = []
+        for i, sp in enumerate(group):
+            rows = keep[:, i]
+            if not rows.any():
+                continue
+            total_i = pd.Series(total[rows, i], index=dates[rows])
+            ret_i = pd.Series(port_ret[rows, i], index=dates[rows])
+            if sp["mode"] == "trade_replay":
+                funded = total_i[total_i > 0].first_valid_index()
+            else:
+                funded = total_i.first_valid_index()
+            path = _portfolio_path(ret_i, funded, sp["carry"])
+            port_frames.append(pd.DataFrame({
+                "date":            dates[rows],
+                "portfolio_name":  sp["name"],
+                "total_value":     total_i.values,
+                "daily_return":    ret_i.values,
+                "cum_return":      path["cum_return"].values,
+                "rolling_vol_21d": path["rolling_vol"].values,
+                "drawdown":        path["drawdown"].values,
+                "max_drawdown":    path["max_drawdown"].values,
+            }).dropna(subset=["total_value"]))
+        port_df = (
+            pd.concat(port_frames, ignore_index=True) if port_frames
+            else pd.DataFrame(columns=["date", "portfolio_name"])
+        )
 
+        # Long attribution: dates × pairs. v1 keeps rows with a weight; v2
+        # keeps rows held that day or with a recorded return + contribution.
+        is_v2 = np.array([("qty_changes" in group[i]) for i in pair_port], dtype=bool)
+        held = np.where(
+            is_v2[None, :],
+            (np.nan_to_num(W) > 0) | (np.isfinite(R) & np.isfinite(C)),
+            np.isfinite(W),
+        )
+        meta = [group[i]["meta"][t] for i, t in zip(pair_port, pair_ticker)]
+        attr_df = _melt(dates, held & keep[:, pair_port], {
+            "portfolio_name":         [group[i]["name"] for i in pair_port],
+            "ticker":                 pair_ticker,
+            "weight":                 W,
+            "position_return":        R,
+            "contribution_to_return": C,
+            "asset_type":             [m[0] for m in meta],
+            "sector":                 [m[1] for m in meta],
+        })
+        port_df["date"] = pd.to_datetime(port_df["date"])
         return port_df, attr_df
 
+    # ── Carry state (incremental refresh) ─────────────────────────────────────
+
+    def _portfolio_fingerprint(self, portfolio: Portfolio, trades: pd.DataFrame) -> str:
+        """Hash of everything the portfolio's history depends on besides
+        prices: current positions (v1, and v2's legacy openings) and the
+        trade ledger. A mismatch means stored history is stale → rebuild.
+        Stored as "<mode>:<hash>" so the refresh also knows which
+        reconstruction mode to continue in."""
+        parts = {
+            "positions": sorted((p.asset.ticker, float(p.quantity)) for p in portfolio.positions),
+            "trades": (
+                trades[["trade_id", "ticker", "side", "quantity", "trade_date"]]
+                .astype(str).sort_values("trade_id").values.tolist()
+                if not trades.empty else []
+            ),
+        }
+        return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _load_portfolio_carry(row: Optional[pd.Series]) -> Optional[dict]:
+        if row is None or not np.isfinite(row["cum_index"]):
+            return None
+        return {
+            "mode":         str(row["fingerprint"]).split(":", 1)[0],
+            "last_date":    pd.Timestamp(row["last_date"]),
+            "cum_index":    float(row["cum_index"]),
+            "peak":         float(row["peak"]),
+            "max_drawdown": float(row["max_drawdown"]),
+            "tail":         _decode_tail(row["return_tail"]),
+        }
+
+    @staticmethod
+    def _portfolio_state(
+        name: str, port_df: pd.DataFrame, carry: Optional[dict], fingerprint: str,
+    ) -> Optional[dict]:
+        """State after `port_df` (the rows just computed), or None if the
+        series never got a cumulative value."""
+        if port_df.empty:
+            return None
+        cum = 1.0 + port_df["cum_return"].astype(float)
+        if not np.isfinite(cum.iloc[-1]):
+            return None
+        prev_tail = carry["tail"] if carry is not None else np.array([], dtype=float)
+        peak = float(np.nanmax(cum.to_numpy()))
+        if carry is not None:
+            peak = max(peak, carry["peak"])
+        return {
+            "scope":        "portfolio",
+            "key":          name,
+            "last_date":    pd.Timestamp(port_df["date"].iloc[-1]),
+            "cum_index":    float(cum.iloc[-1]),
+            "peak":         peak,
+            "max_drawdown": float(port_df["max_drawdown"].iloc[-1]),
+            "return_tail":  _encode_tail(np.concatenate([
+                prev_tail, port_df["daily_return"].to_numpy(dtype=float),
+            ])),
+            "fingerprint":  fingerprint,
+        }
+
+    def _refresh_security_metrics(
+        self,
+        start_date: Optional[str],
+        full: bool,
+        dirty: Optional[dict[str, pd.Timestamp]] = None,
+    ) -> pd.DataFrame:
+        """Refresh per-ticker metrics. `dirty` (ticker → earliest changed
+        price date, from the change journal) limits the work to those
+        tickers plus any without stored state; None means every ticker
+        with state is continued."""
+        tickers = self.db.get_all_tickers()
+        if start_date is not None:
+            # Windowed recompute re-anchors cum_return at start_date, so the
+            # stored state no longer matches — next default run rebuilds.
+            sec_df, _ = self._security_metrics(tickers, start_date=start_date)
+            sec_df = _with_log_index(sec_df, "ticker", self.db.get_daily_security_metrics())
+            self.db.delete_attribution_state("security")
+            self.db.save_daily_security_metrics(sec_df)
+            return sec_df
+
+        state = pd.DataFrame() if full else self.db.get_attribution_state("security")
+        carried = state[state["key"].isin(tickers)] if not state.empty else state
+        fresh = [t for t in tickers if carried.empty or t not in set(carried["key"])]
+        calendar = pd.DatetimeIndex([]) if full else self.db.get_security_metric_dates()
+
+        if dirty is not None and not carried.empty:
+            # Untouched tickers keep their stored history. Tickers whose
+            # stored prices changed resume from the last row before the change.
+            carried = carried[carried["key"].isin(list(dirty))]
+            changed_from = pd.to_datetime(carried["key"].map(dirty))
+            rewind = (changed_from <= carried["last_date"]).to_numpy()
+            if not carried.empty and rewind.any():
+                rewound = _rewind_security_state(
+                    self.db.get_daily_security_metrics(), carried[rewind],
+                    changed_from[rewind], calendar,
+                )
+                fresh += sorted(set(carried.loc[rewind, "key"]) - set(rewound["key"]))
+                carried = pd.concat([carried[~rewind], rewound], ignore_index=True)
+
+        frames, states = [], []
+        if not carried.empty or fresh:
+            # One price read for every series being computed.
+            window = None if fresh else carried["last_date"].min()
+            prices = self.db.get_historical_prices(
+                list(carried["key"]) + fresh if not carried.empty else fresh,
+                start_date=window.strftime("%Y-%m-%d") if window is not None else None,
+            ).sort_index()
+            calendar = prices.index.union(calendar)
+            if window is not None:
+                calendar = calendar[calendar >= window]
+            if not carried.empty:
+                for _, group in carried.groupby("last_date"):
+                    df, st = self._security_metrics(
+                        group["key"].tolist(), carry=group, prices=prices, calendar=calendar,
+                    )
+                    frames.append(df)
+                    states.append(st)
+            if fresh:
+                df, st = self._security_metrics(fresh, prices=prices, calendar=calendar)
+                frames.append(df)
+                states.append(st)
+
+        frames = [f for f in frames if not f.empty]
+        sec_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[
+            "date", "ticker", "price", "daily_return", "cum_return", "rolling_vol_21d",
+        ])
+        sec_df = _with_log_index(sec_df, "ticker")
+        if full:
+            self.db.delete_attribution_state("security")
+        self.db.save_daily_security_metrics(sec_df)
+        states = [st for st in states if not st.empty]
+        if states:
+            self.db.save_attribution_state(pd.concat(states, ignore_index=True))
+        return sec_df
+
     # ── Orchestration ─────────────────────────────────────────────────────────
 
     def refresh_all(
@@ -368,63 +1129,270 @@ class AttributionEngine:
         start_date: Optional[str] = None,
         portfolio_name: Optional[str] = None,
         full: bool = False,
+        batched: bool = True,
+        workers: int = 1,
     ) -> dict:
         """Compute and persist daily metrics for all (or one) portfolio.
 
-        If `full` is False (default), only recomputes dates after the latest
-        already-stored date — strict incremental. `full=True` recomputes the
-        whole history (useful after schema changes or trade backfills).
+        By default the refresh is incremental: every series with stored carry
+        state (`attribution_state.parquet` — last cumulative index, running
+        peak, max drawdown, 21d return tail) is continued from the day after
+        its `last_date`, producing exactly what a full rebuild would. Series
+        with no state, or whose positions / trades changed since it was
+        written, are rebuilt from the start of history. `full=True` rebuilds
+        everything (useful after schema changes or price backfills). An
+        explicit `start_date` recomputes from that date with cum_return and
+        drawdown anchored there, and drops the carry state.
+
+        `batched=True` computes every portfolio at once on a shared price
+        matrix (`compute_portfolio_histories`); `False` walks them one by one.
+        `workers > 1` shards the portfolios across a process pool that reads
+        prices from one memory-mapped snapshot; results are merged here.
         """
-        # Decide start_date for security metrics
-        sec_start = start_date
-        if not full and sec_start is None:
-            last = self.db.latest_security_metric_date()
-            if last is not None:
-                sec_start = (last - pd.Timedelta(days=30)).strftime("%Y-%m-%d")
-
-        sec_df = self.compute_security_metrics(start_date=sec_start)
-        self.db.save_daily_security_metrics(sec_df)
+        # Changes journaled since the last refresh (None → first refresh that
+        # tracks the journal, or an explicit full / windowed recompute).
+        cursor = self.db.get_journal_cursor(JOURNAL_CONSUMER)
+        journal_head = self.db.latest_change_id()
+        dirty_tickers: Optional[dict[str, pd.Timestamp]] = None
+        dirty_portfolios: set[str] = set()
+        if cursor is not None and not full and start_date is None:
+            journal = self.db.get_change_journal(since_id=cursor)
+            journal = journal[journal["change_id"] <= journal_head]
+            dirty_tickers, dirty_portfolios = _journal_dirty(journal)
+
+        sec_df = self._refresh_security_metrics(start_date, full, dirty_tickers)
+
+        state = self.db.get_attribution_state("portfolio")
+        state_by_name = {r["key"]: r for _, r in state.iterrows()} if not state.empty else {}
+        all_trades = self.db.list_trades()
+        trades_by_name = (
+            dict(tuple(all_trades.groupby("portfolio_name"))) if not all_trades.empty else {}
+        )
 
-        port_total = 0
-        attr_total = 0
-        modes: dict[str, str] = {}
         names = [portfolio_name] if portfolio_name else self.db.list_portfolios()
+        portfolios: list[Portfolio] = []
+        fingerprints: dict[str, str] = {}
+        carries: dict[str, dict] = {}
+        skipped: dict[str, str] = {}
+        rewind_from: dict[str, pd.Timestamp] = {}
         for name in names:
             try:
                 p = self.db.get_portfolio(name)
             except Exception:
                 continue
+            trades = trades_by_name.get(name, all_trades.iloc[0:0])
+            fingerprints[name] = self._portfolio_fingerprint(p, trades)
+            carry = None
+            if not full and start_date is None:
+                row = state_by_name.get(name)
+                if row is not None and str(row["fingerprint"]).endswith(":" + fingerprints[name]):
+                    carry = self._load_portfolio_carry(row)
+            if carry is not None and dirty_tickers is not None:
+                held = {pos.asset.ticker for pos in p.positions} | set(trades["ticker"])
+                changed = [dirty_tickers[t] for t in held if t in dirty_tickers]
+                if not changed and name not in dirty_portfolios:
+                    skipped[name] = carry["mode"]
+                    continue
+                if changed and min(changed) <= carry["last_date"]:
+                    rewind_from[name] = min(changed)
+            portfolios.append(p)
+            if carry is not None:
+                carries[name] = carry
+
+        if rewind_from:
+            # A held ticker's stored prices changed: resume from the last
+            # stored row before the earliest change (or rebuild if none).
+            stored = self.db.get_daily_portfolio_metrics()
+            by_name_stored = dict(tuple(stored.groupby("portfolio_name"))) if not stored.empty else {}
+            for name, before in rewind_from.items():
+                hist = by_name_stored.get(name)
+                carry = (
+                    _rewind_portfolio_carry(hist, before, carries[name]["mode"])
+                    if hist is not None else None
+                )
+                if carry is None:
+                    carries.pop(name)
+                else:
+                    carries[name] = carry
 
-            port_start = start_date
-            if not full and port_start is None:
-                last = self.db.latest_portfolio_metric_date(name)
-                if last is not None:
-                    port_start = (last - pd.Timedelta(days=30)).strftime("%Y-%m-%d")
+        if workers > 1 and len(portfolios) > 1:
+            port_df, attr_df, modes = self._portfolio_histories_parallel(
+                portfolios, start_date, carries, all_trades, batched, workers,
+            )
+        elif batched:
+            port_df, attr_df, modes = self.compute_portfolio_histories(
+                portfolios, start_date=start_date, carries=carries, trades=all_trades,
+            )
+        else:
+            port_df, attr_df, modes = self._portfolio_histories_serial(
+                portfolios, start_date, carries, trades_by_name,
+            )
+
+        port_df = _with_log_index(
+            port_df, "portfolio_name",
+            self.db.get_daily_portfolio_metrics() if start_date is not None else None,
+        )
+        # Carino log contributions depend only on their own day, so they are
+        # computed once here and every window is linked from them later.
+        attr_df = attr_df.assign(log_contribution=log_contributions(attr_df))
+        # One write per table for the whole batch. Portfolios recomputed
+        # without a carry replace their rows (from `start_date`, or all of
+        # them) so positions they no longer hold don't linger.
+        starts = {p.name: start_date for p in portfolios if p.name not in carries}
+        self.db.save_daily_portfolio_metrics(port_df, starts)
+        self.db.save_daily_attribution(attr_df, starts)
+        self._refresh_attribution_rollups(attr_df, starts)
 
-            # Prefer trade-replay (v2) when trades exist; else fall back to v1.
-            has_trades = not self.db.list_trades(portfolio_name=name).empty
-            if has_trades:
+        by_name = dict(tuple(port_df.groupby("portfolio_name"))) if not port_df.empty else {}
+        new_states = []
+        for p in portfolios:
+            name = p.name
+            if start_date is not None:
+                self.db.delete_attribution_state("portfolio", [name])
+                continue
+            carry = carries.get(name)
+            rows = by_name.get(name, port_df.iloc[0:0]).sort_values("date")
+            new_state = self._portfolio_state(
+                name, rows, carry, f"{modes.get(name, 'static_current')}:{fingerprints[name]}",
+            )
+            if new_state is not None:
+                new_states.append(new_state)
+            elif carry is None:
+                self.db.delete_attribution_state("portfolio", [name])
+        if new_states:
+            self.db.save_attribution_state(pd.DataFrame(new_states))
+
+        if portfolio_name is None:
+            # A scoped run leaves other portfolios holding changed tickers
+            # untouched, so only a whole-book refresh consumes the journal.
+            self.db.advance_journal_cursor(JOURNAL_CONSUMER, journal_head)
+
+        return {
+            "security_rows":    len(sec_df),
+            "portfolio_rows":   len(port_df),
+            "attribution_rows": len(attr_df),
+            "portfolios":       names,
+            "modes":            {**modes, **skipped},
+            "incremental":      [p.name for p in portfolios if p.name in carries],
+            "skipped":          sorted(skipped),
+        }
+
+    def _refresh_attribution_rollups(self, attr_df: pd.DataFrame, starts: Optional[dict] = None) -> None:
+        """Persist the small tables the dashboard reads instead of raw
+        `daily_attribution`: per-day sector / asset-type rollups for the rows
+        just computed, and per-period contributor totals for every portfolio
+        that got new rows (recomputed over its full stored history).
+        Portfolios in `starts` have their rollups replaced, as in
+        `Database.save_daily_attribution`."""
+        if attr_df.empty and not starts:
+            return
+        for by in ("sector", "asset_type"):
+            self.db.save_attribution_rollup(by, _attribution_rollup(attr_df, by), starts)
+        refreshed = set(starts or ()) | (set(attr_df["portfolio_name"]) if not attr_df.empty else set())
+        refreshed = sorted(refreshed)
+        history = self.db.get_daily_attribution()
+        history = history[history["portfolio_name"].isin(refreshed)]
+        self.db.save_attribution_contributors(_period_contributors(history), refreshed)
+
+    def _portfolio_histories_parallel(
+        self,
+        portfolios: list[Portfolio],
+        start_date: Optional[str],
+        carries: dict[str, dict],
+        trades: pd.DataFrame,
+        batched: bool,
+        workers: int,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, dict[str, str]]:
+        """Shard `portfolios` across `workers` processes.
+
+        The parent loads the union price matrix once and writes it as a raw
+        .npy snapshot; every worker memory-maps that file instead of reading
+        the parquet store itself. Shards are balanced by holdings count.
+        """
+        tickers = {pos.asset.ticker for p in portfolios for pos in p.positions}
+        names = {p.name for p in portfolios}
+        if not trades.empty:
+            tickers |= set(trades.loc[trades["portfolio_name"].isin(names), "ticker"])
+        starts = [
+            carries[p.name]["last_date"] if p.name in carries
+            else (pd.Timestamp(start_date) if start_date else None)
+            for p in portfolios
+        ]
+        window_start = None if any(st is None for st in starts) else min(starts)
+        prices = self._union_prices(tickers, window_start)
+
+        n_shards = min(workers, len(portfolios))
+        shards: list[list[Portfolio]] = [[] for _ in range(n_shards)]
+        for i, p in enumerate(sorted(portfolios, key=lambda p: -len(p.positions))):
+            shards[i % n_shards].append(p)
+
+        with tempfile.TemporaryDirectory(prefix="attribution-prices-") as snapshot_dir:
+            _write_price_snapshot(prices, snapshot_dir)
+            with ProcessPoolExecutor(max_workers=n_shards) as pool:
+                futures = []
+                for shard in shards:
+                    shard_names = {p.name for p in shard}
+                    futures.append(pool.submit(
+                        _refresh_shard,
+                        self.db.data_dir, snapshot_dir, shard, start_date,
+                        {n: c for n, c in carries.items() if n in shard_names},
+                        trades[trades["portfolio_name"].isin(shard_names)] if not trades.empty else trades,
+                        batched,
+                    ))
+                results = [f.result() for f in futures]
+
+        modes: dict[str, str] = {}
+        for _, _, m in results:
+            modes.update(m)
+        port_frames = [r[0] for r in results if not r[0].empty]
+        attr_frames = [r[1] for r in results if not r[1].empty]
+        port_df = pd.concat(port_frames, ignore_index=True) if port_frames else results[0][0]
+        attr_df = pd.concat(attr_frames, ignore_index=True) if attr_frames else results[0][1]
+        return port_df, attr_df, modes
+
+    def _portfolio_histories_serial(
+        self,
+        portfolios: list[Portfolio],
+        start_date: Optional[str],
+        carries: dict[str, dict],
+        trades_by_name: dict[str, pd.DataFrame],
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, dict[str, str]]:
+        """One portfolio at a time — same output as `compute_portfolio_histories`."""
+        port_frames, attr_frames = [], []
+        modes: dict[str, str] = {}
+        for p in portfolios:
+            name = p.name
+            carry = carries.get(name)
+            if carry is not None:
+                # Continue in whichever mode produced the stored history.
+                modes[name] = carry["mode"]
+                if carry["mode"] == "trade_replay":
+                    port_df, attr_df = self.compute_portfolio_history_from_trades(name, carry=carry)
+                else:
+                    port_df, attr_df = self.compute_portfolio_history(p, carry=carry)
+            elif name in trades_by_name:
+                # Prefer trade-replay (v2) when trades exist; else fall back to v1.
                 port_df, attr_df = self.compute_portfolio_history_from_trades(
-                    name, start_date=port_start,
+                    name, start_date=start_date,
                 )
                 modes[name] = "trade_replay" if not port_df.empty else "static_current"
                 if port_df.empty:
                     # v2 produced nothing (e.g. trades exist but no prices yet);
                     # fall back to v1 so the user still gets something.
-                    port_df, attr_df = self.compute_portfolio_history(p, start_date=port_start)
+                    port_df, attr_df = self.compute_portfolio_history(p, start_date=start_date)
             else:
-                port_df, attr_df = self.compute_portfolio_history(p, start_date=port_start)
+                port_df, attr_df = self.compute_portfolio_history(p, start_date=start_date)
                 modes[name] = "static_current"
-
-            self.db.save_daily_portfolio_metrics(port_df)
-            self.db.save_daily_attribution(attr_df)
-            port_total += len(port_df)
-            attr_total += len(attr_df)
-
-        return {
-            "security_rows":    len(sec_df),
-            "portfolio_rows":   port_total,
-            "attribution_rows": attr_total,
-            "portfolios":       names,
-            "modes":            modes,
-        }
+            port_frames.append(port_df)
+            attr_frames.append(attr_df)
+        port_frames = [f for f in port_frames if not f.empty]
+        attr_frames = [f for f in attr_frames if not f.empty]
+        port_df = pd.concat(port_frames, ignore_index=True) if port_frames else pd.DataFrame(columns=[
+            "date", "portfolio_name", "total_value", "daily_return",
+            "cum_return", "rolling_vol_21d", "drawdown", "max_drawdown",
+        ])
+        attr_df = pd.concat(attr_frames, ignore_index=True) if attr_frames else pd.DataFrame(columns=[
+            "date", "portfolio_name", "ticker", "weight",
+            "position_return", "contribution_to_return", "asset_type", "sector",
+        ])
+        return port_df, attr_df, modes
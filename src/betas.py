@@ -0,0 +1,293 @@
+"""Vectorized pairwise-complete OLS betas.
+
+beta(A, B) = Cov(A, B) / Var(B) over the dates where *both* A and B have a
+valid return (the `pd.DataFrame.cov()` convention), so short-history series
+still get a beta on their overlap. The whole matrix comes out of five
+masked matrix products (overlap counts, Σx, Σy, Σxy, Σx²) over de-meaned
+returns, for any two ticker sets.
+
+`SectorBetaEngine` persists those sums per sector pair and keeps the
+sector-ETF snapshot current incrementally — folding in new return days and
+subtracting expired ones — and rebuilds them when the change journal shows
+a sector-ETF price rewrite inside the window or the window widens.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.database import Database
+from src.scenarios import SECTOR_ETF_TICKERS
+
+
+def pairwise_betas(
+    y_rets: pd.DataFrame,
+    x_rets: Optional[pd.DataFrame] = None,
+    min_obs: int = 2,
+) -> pd.DataFrame:
+    """Return a wide beta matrix: rows = `y_rets` columns, cols = `x_rets` columns.
+
+    Cell (a, b) is the OLS slope of a on b over their common valid dates.
+    If `x_rets` is None, betas are computed within `y_rets` (square matrix
+    with 1.0 on the diagonal). Pairs with fewer than `min_obs` overlapping
+    observations, or with zero variance in b, get beta 0.0.
+    """
+    square = x_rets is None
+    if square:
+        x_rets = y_rets
+    y_rets, x_rets = y_rets.align(x_rets, join="outer", axis=0)
+
+    n, sx, sy, sxy, sxx = pairwise_sums(y_rets, x_rets, demean=True)
+    beta = betas_from_sums(n, sx, sy, sxy, sxx, min_obs=min_obs)
+    if square:
+        np.fill_diagonal(beta, 1.0)
+    return pd.DataFrame(beta, index=y_rets.columns, columns=x_rets.columns)
+
+
+def pairwise_sums(
+    y_rets: pd.DataFrame,
+    x_rets: pd.DataFrame,
+    demean: bool = False,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Pairwise-complete sufficient statistics (n, Σx, Σy, Σxy, Σx²).
+
+    Each array is (len(y cols) × len(x cols)); cell (a, b) sums over the
+    dates where both y[a] and x[b] are valid. Frames must share an index.
+    `demean=True` shifts each column by its own mean first — better
+    conditioned for a one-shot estimate, but the sums are then not additive
+    across batches, so keep it False when accumulating running totals.
+    """
+    Y = y_rets.to_numpy(dtype=float)
+    X = x_rets.to_numpy(dtype=float)
+    My = np.isfinite(Y)
+    Mx = np.isfinite(X)
+    if demean:
+        Y0, X0 = _demean(Y, My), _demean(X, Mx)
+    else:
+        Y0, X0 = np.where(My, Y, 0.0), np.where(Mx, X, 0.0)
+    Myf = My.astype(float)
+    Mxf = Mx.astype(float)
+
+    n   = Myf.T @ Mxf
+    sy  = Y0.T @ Mxf
+    sx  = Myf.T @ X0
+    sxy = Y0.T @ X0
+    sxx = Myf.T @ (X0 * X0)
+    return n, sx, sy, sxy, sxx
+
+
+def _demean(A: np.ndarray, M: np.ndarray) -> np.ndarray:
+    """Subtract each column's mean over its valid cells; invalid cells → 0."""
+    A0 = np.where(M, A, 0.0)
+    counts = M.sum(axis=0)
+    means = A0.sum(axis=0) / np.maximum(counts, 1)
+    return np.where(M, A0 - means, 0.0)
+
+
+def betas_from_sums(
+    n: np.ndarray,
+    sx: np.ndarray,
+    sy: np.ndarray,
+    sxy: np.ndarray,
+    sxx: np.ndarray,
+    min_obs: int = 2,
+) -> np.ndarray:
+    """Slope of y on x from sufficient statistics (n, Σx, Σy, Σxy, Σx²).
+
+    Element-wise over arrays of any matching shape. Cells with n < `min_obs`
+    or non-positive x-variance come back as 0.0.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        safe_n = np.where(n > 0, n, 1.0)
+        cov = sxy - sx * sy / safe_n
+        var = sxx - sx * sx / safe_n
+        beta = cov / var
+    ok = (n >= min_obs) & (var > 0) & np.isfinite(beta)
+    return np.where(ok, beta, 0.0)
+
+
+def betas_to_long(betas: pd.DataFrame) -> pd.DataFrame:
+    """Wide beta matrix → long `sector_a, sector_b, beta` (the parquet layout)."""
+    long = betas.stack().reset_index()
+    long.columns = ["sector_a", "sector_b", "beta"]
+    long["beta"] = long["beta"].astype(float)
+    return long
+
+
+# ── Incremental sector-beta maintenance ──────────────────────────────────────
+
+# Calendar days of extra price history loaded ahead of a return slice so the
+# first return in the slice has its previous close (covers long weekends and
+# exchange holidays).
+_RETURN_BUFFER_DAYS = 10
+
+_STAT_FIELDS = ["n", "sum_x", "sum_y", "sum_xy", "sum_xx"]
+
+# Name this engine's cursor is stored under in the change journal.
+JOURNAL_CONSUMER = "sector_betas"
+
+
+class SectorBetaEngine:
+    """Keeps `sector_betas.parquet` current from stored running sums.
+
+    `sector_beta_stats.parquet` holds, per (sector_a, sector_b), the
+    pairwise-complete n, Σx, Σy, Σxy, Σx² over sector-ETF returns dated in
+    (window_start, last_date]. A refresh adds the days after `last_date`
+    and, when `rolling`, subtracts the days that slid out of the window —
+    so a weekly run touches ~5 rows of returns instead of 20 years.
+    Sector ETF prices live in the normal price store (`prices/XLK.parquet`,
+    …) so expired days can be re-read exactly as they were added.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.sectors = list(SECTOR_ETF_TICKERS.keys())
+
+    def refresh(
+        self,
+        years: float = 20,
+        rolling: bool = True,
+        full: bool = False,
+        fetch: bool = True,
+        as_of: Optional[pd.Timestamp] = None,
+    ) -> dict:
+        """Update the running sums, then write a dated beta snapshot.
+
+        `full=True` (or no stored stats yet, a wider window than the stored
+        one, or sector-ETF prices rewritten inside the folded window)
+        rebuilds the sums from the stored price history. `rolling=False` keeps the window start fixed
+        at the first build (expanding window). `fetch=False` skips the
+        yfinance pull and uses whatever is already in the price store.
+        `as_of` overrides "today" (window end + snapshot date).
+        """
+        today = pd.Timestamp(as_of or pd.Timestamp.today()).normalize()
+        window_start = today - pd.DateOffset(years=int(years))
+        stats = self.db.get_sector_beta_stats()
+        incremental = not full and not stats.empty and set(stats["sector_a"]) == set(self.sectors)
+
+        prev_last = pd.Timestamp(stats["last_date"].max()) if incremental else None
+        if fetch:
+            self._sync_prices(prev_last, today)
+        journal_head = self.db.latest_change_id()
+
+        if incremental:
+            prev_start = pd.Timestamp(stats["window_start"].max())
+            incremental = window_start >= prev_start and not self._repriced_since(prev_last)
+
+        if incremental:
+            sums = self._stats_to_arrays(stats)
+            new = self._returns(prev_last, today)
+            sums = [a + b for a, b in zip(sums, self._sums(new))]
+            expired = pd.DataFrame()
+            if rolling and window_start > prev_start:
+                expired = self._returns(prev_start, window_start)
+                sums = [a - b for a, b in zip(sums, self._sums(expired))]
+            else:
+                window_start = prev_start
+            last_date = max([prev_last] + ([new.index.max()] if not new.empty else []))
+            mode = "incremental"
+            new_days, expired_days = len(new), len(expired)
+        else:
+            rets = self._returns(window_start, today)
+            sums = list(self._sums(rets))
+            last_date = rets.index.max() if not rets.empty else window_start
+            mode = "full"
+            new_days, expired_days = len(rets), 0
+
+        n = sums[0]
+        if int((np.diag(n) > 0).sum()) < 2:
+            raise ValueError("Not enough sector ETF data to compute betas.")
+
+        self.db.save_sector_beta_stats(
+            self._arrays_to_stats(sums, window_start, last_date)
+        )
+        self.db.advance_journal_cursor(JOURNAL_CONSUMER, journal_head)
+        beta = betas_from_sums(*sums)
+        np.fill_diagonal(beta, 1.0)
+        as_of = today.date().isoformat()
+        long = betas_to_long(pd.DataFrame(beta, index=self.sectors, columns=self.sectors))
+        self.db.save_sector_betas(long, as_of_date=as_of)
+        return {
+            "mode":         mode,
+            "new_days":     new_days,
+            "expired_days": expired_days,
+            "window_start": window_start.date().isoformat(),
+            "last_date":    pd.Timestamp(last_date).date().isoformat(),
+            "betas_rows":   len(long),
+            "as_of":        as_of,
+        }
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _sync_prices(self, since: Optional[pd.Timestamp], today: pd.Timestamp) -> None:
+        """Pull sector ETF prices into the store — full history on first
+        build, otherwise just enough to cover the days since `since`."""
+        from src.collector import Collector  # local import to avoid circulars
+
+        if since is None:
+            period = "max"
+        else:
+            age_days = (today - since).days
+            period = "1mo" if age_days <= 25 else ("1y" if age_days <= 350 else "max")
+        Collector(self.db).collect_prices(list(SECTOR_ETF_TICKERS.values()), period=period)
+
+    def _repriced_since(self, last_date: pd.Timestamp) -> bool:
+        """True if the journal has a sector-ETF price change dated on or
+        before `last_date` that this consumer hasn't seen (or it never ran)."""
+        cursor = self.db.get_journal_cursor(JOURNAL_CONSUMER)
+        if cursor is None:
+            return True
+        journal = self.db.get_change_journal(since_id=cursor)
+        if journal.empty:
+            return False
+        prices = journal[(journal["entity"] == "ticker")
+                         & journal["key"].isin(list(SECTOR_ETF_TICKERS.values()))]
+        return bool((prices["changed_from"].fillna(pd.Timestamp.min) <= last_date).any())
+
+    def _returns(self, after: pd.Timestamp, through: pd.Timestamp) -> pd.DataFrame:
+        """Sector ETF daily returns dated in (after, through], one column per
+        sector key (all-NaN for sectors with no stored prices)."""
+        stored = set(self.db.list_price_tickers())
+        tickers = [t for t in SECTOR_ETF_TICKERS.values() if t in stored]
+        if not tickers:
+            return pd.DataFrame(columns=self.sectors, dtype=float)
+        load_from = (after - pd.Timedelta(days=_RETURN_BUFFER_DAYS)).strftime("%Y-%m-%d")
+        prices = self.db.get_historical_prices(tickers, start_date=load_from).sort_index()
+        prices = prices[prices.index <= through]
+        reverse = {v: k for k, v in SECTOR_ETF_TICKERS.items()}
+        rets = prices.rename(columns=reverse).pct_change(fill_method=None)
+        rets = rets[rets.index > after]
+        return rets.reindex(columns=self.sectors)
+
+    def _sums(self, rets: pd.DataFrame) -> tuple[np.ndarray, ...]:
+        # y = sector_a (rows), x = sector_b (cols) — beta(a, b) = Cov/Var(b).
+        return pairwise_sums(rets, rets, demean=False)
+
+    def _stats_to_arrays(self, stats: pd.DataFrame) -> list[np.ndarray]:
+        out = []
+        for field in _STAT_FIELDS:
+            wide = stats.pivot(index="sector_a", columns="sector_b", values=field)
+            out.append(
+                wide.reindex(index=self.sectors, columns=self.sectors)
+                .fillna(0.0).to_numpy(dtype=float)
+            )
+        return out
+
+    def _arrays_to_stats(
+        self,
+        sums: list[np.ndarray],
+        window_start: pd.Timestamp,
+        last_date: pd.Timestamp,
+    ) -> pd.DataFrame:
+        k = len(self.sectors)
+        df = pd.DataFrame({
+            "sector_a": np.repeat(self.sectors, k),
+            "sector_b": np.tile(self.sectors, k),
+        })
+        for field, arr in zip(_STAT_FIELDS, sums):
+            df[field] = arr.ravel()
+        df["window_start"] = pd.Timestamp(window_start).date().isoformat()
+        df["last_date"]    = pd.Timestamp(last_date).date().isoformat()
+        return df
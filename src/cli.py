@@ -411,12 +411,14 @@ def schedule_uninstall(job_name):
 @click.option("--from", "start_date", default=None,
               help="Recompute from this date onward (YYYY-MM-DD).")
 @click.option("--full", is_flag=True, help="Recompute the full history (ignore incremental).")
-def metrics_refresh(portfolio_name, start_date, full):
+@click.option("--workers", default=1, type=int,
+              help="Shard portfolios across N worker processes (default: 1).")
+def metrics_refresh(portfolio_name, start_date, full, workers):
     """Compute daily security / portfolio / attribution metrics and save to parquet."""
     from src.attribution import AttributionEngine
     db = Database()
     summary = AttributionEngine(db).refresh_all(
-        start_date=start_date, portfolio_name=portfolio_name, full=full,
+        start_date=start_date, portfolio_name=portfolio_name, full=full, workers=workers,
     )
     click.echo(
         f"Refreshed metrics — security: {summary['security_rows']} rows, "
@@ -426,6 +428,51 @@ def metrics_refresh(portfolio_name, start_date, full):
     )
 
 
+@metrics.command("tax-lots")
+@click.option("--portfolio", "portfolio_name", default=None,
+              help="Refresh only this portfolio (default: all).")
+@click.option("--full", is_flag=True, help="Re-match every trade (ignore incremental).")
+def metrics_tax_lots(portfolio_name, full):
+    """Match trades into tax lots and save realized / unrealized P&L to parquet."""
+    from src.taxlots import TaxLotEngine
+    db = Database()
+    summary = TaxLotEngine(db).refresh(portfolio_name=portfolio_name, full=full)
+    click.echo(
+        f"Refreshed tax lots — matched {summary['trades_matched']} trades, "
+        f"{summary['open_lots']} open lots, "
+        f"realized: {summary['realized_rows']} rows, "
+        f"daily P&L: {summary['pnl_rows']} rows "
+        f"(portfolios: {', '.join(summary['portfolios'])})"
+    )
+
+
+@metrics.command("risk")
+@click.option("--portfolio", "portfolio_names", multiple=True,
+              help="Portfolio to include (repeatable; default: all).")
+@click.option("--from", "start_date", default=None,
+              help="Use returns from this date onward (YYYY-MM-DD).")
+def metrics_risk(portfolio_names, start_date):
+    """Volatility, VaR and CVaR for many portfolios from one returns load."""
+    from src.risk import RiskEngine
+    db = Database()
+    names = list(portfolio_names) or db.list_portfolios()
+    table = RiskEngine(db).portfolio_risk([db.get_portfolio(n) for n in names], start_date=start_date)
+    click.echo(tabulate(table.round(4), headers="keys", tablefmt="grid"))
+
+
+@metrics.command("covariance")
+@click.option("--full", is_flag=True, help="Rebuild from the whole price history (ignore incremental).")
+def metrics_covariance(full):
+    """Fold new return days into the EWMA covariance and save a dated snapshot."""
+    from src.covariance import CovarianceEngine
+    db = Database()
+    summary = CovarianceEngine(db).refresh(full=full)
+    click.echo(
+        f"Refreshed EWMA covariance ({summary['mode']}) — {summary['new_days']} return days, "
+        f"{summary['tickers']} tickers, as of {summary['as_of']}"
+    )
+
+
 @cli.command()
 @click.argument("name")
 def report(name):
@@ -1,26 +1,108 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Coroutine, List, Optional
+
 import yfinance as yf
 import pandas as pd
+from src.betas import betas_to_long, pairwise_betas
 from src.database import Database
 from src.scenarios import SECTOR_ETF_TICKERS
-from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Simultaneous yfinance downloads. Each one is a blocking HTTP call run on a
+# worker thread; Yahoo starts throttling well above this.
+DEFAULT_FETCH_CONCURRENCY = 4
+
+ProgressCallback = Callable[[int, int, str], None]
+
+
+def _run_sync(coro: Coroutine):
+    """Run a coroutine to completion from synchronous code.
+
+    Uses `asyncio.run` normally; if the caller is already inside a running
+    event loop (e.g. an async agent host), runs it on a helper thread with
+    its own loop instead of failing with "loop is already running".
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
 
 class Collector:
     def __init__(self, db: Database):
         self.db = db
 
-    def collect_prices(self, tickers: List[str], period: str = "1y"):
-        """Fetches historical prices for the given tickers and saves them to the database."""
-        for ticker in tickers:
-            print(f"Fetching prices for {ticker}...")
-            try:
-                # yfinance returns a DataFrame with 'Close' column
-                data = yf.download(ticker, period=period, progress=False)
-                if not data.empty:
-                    self.db.save_prices(ticker, data)
-                else:
-                    print(f"No data found for {ticker}")
-            except Exception as e:
-                print(f"Error fetching data for {ticker}: {e}")
+    async def acollect_prices(
+        self,
+        tickers: List[str],
+        period: str = "1y",
+        concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> dict:
+        """Fetch historical prices for `tickers` concurrently and save them.
+
+        Returns {ticker: {'status': 'ok', 'rows': n} | {'status': 'empty'} |
+        {'status': 'error', 'message': str}}. `on_progress(done, total,
+        ticker)` fires after each ticker finishes. Cancelling the awaiting
+        task cancels every ticker that hasn't started yet; downloads already
+        in flight finish on their worker thread but are not awaited.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        sem = asyncio.Semaphore(max(1, concurrency))
+        results: dict[str, dict] = {}
+        done = 0
+
+        async def _one(ticker: str) -> None:
+            nonlocal done
+            async with sem:
+                logger.debug("Fetching prices for %s", ticker)
+                try:
+                    # The store holds split/dividend-adjusted closes; pass
+                    # auto_adjust explicitly so a yfinance default change
+                    # can't mix raw and adjusted prices in one file.
+                    data = await asyncio.to_thread(
+                        yf.download, ticker, period=period, progress=False, auto_adjust=True,
+                    )
+                    if not data.empty:
+                        await asyncio.to_thread(self.db.save_prices, ticker, data)
+                        results[ticker] = {"status": "ok", "rows": len(data)}
+                    else:
+                        logger.info("No price data found for %s", ticker)
+                        results[ticker] = {"status": "empty"}
+                except Exception as e:
+                    logger.warning("Error fetching prices for %s: %s", ticker, e)
+                    results[ticker] = {"status": "error", "message": str(e)}
+            done += 1
+            if on_progress is not None:
+                on_progress(done, len(tickers), ticker)
+
+        tasks = [asyncio.create_task(_one(t)) for t in tickers]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return {t: results[t] for t in tickers if t in results}
+
+    def collect_prices(self, tickers: List[str], period: str = "1y") -> dict:
+        """Fetches historical prices for the given tickers and saves them to the database.
+
+        Blocking wrapper around `acollect_prices`; returns its per-ticker results.
+        """
+        return _run_sync(self.acollect_prices(tickers, period=period))
+
+    def start_background_fetch(self, tickers: List[str], period: str = "1y") -> "BackgroundFetch":
+        """Start `acollect_prices` on a background thread and return a handle
+        the caller can poll (`progress`, `done`) or `cancel()`."""
+        return BackgroundFetch(self, tickers, period=period)
 
     def update_all_assets(self, period: str = "1mo"):
         """Updates prices for all assets currently in the database."""
@@ -28,6 +110,24 @@ class Collector:
         if tickers:
             self.collect_prices(tickers, period=period)
 
+    def fetch_price_range(self, ticker: str, start, end) -> int:
+        """Re-download `ticker` for [start, end] only and upsert it into the
+        price store (existing dates are overwritten). Returns rows saved."""
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        # yfinance's `end` is exclusive.
+        data = yf.download(
+            ticker,
+            start=start.strftime("%Y-%m-%d"),
+            end=(end + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+            progress=False,
+            auto_adjust=True,   # same basis as acollect_prices
+        )
+        if data is None or data.empty:
+            return 0
+        self.db.save_prices(ticker, data)
+        return len(data)
+
     def fetch_fund_profile(self, fund_ticker: str) -> dict:
         """Fetch asset_classes + sector_weightings from yfinance FundsData.
 
@@ -41,6 +141,46 @@ class Collector:
             raise ValueError(f"No fund profile data available for {fund_ticker}")
         return {"asset_classes": asset_classes, "sector_weightings": sectors}
 
+    @staticmethod
+    def _download_close(tickers: List[str], years: float) -> pd.DataFrame:
+        """Adjusted close for `tickers` over the last `years`, one column per
+        ticker. Tickers that returned nothing are dropped."""
+        end = pd.Timestamp.today().normalize()
+        start = end - pd.DateOffset(years=int(years))
+        data = yf.download(
+            tickers, start=start, end=end, progress=False, auto_adjust=True,
+        )
+        if isinstance(data.columns, pd.MultiIndex):
+            # When fetching >1 ticker, columns are (field, ticker); pick Close.
+            close = data["Close"] if "Close" in data.columns.get_level_values(0) else data.iloc[:, :len(tickers)]
+        elif "Close" in data.columns and len(tickers) == 1:
+            close = data[["Close"]].rename(columns={"Close": tickers[0]})
+        else:
+            close = data
+        # Drop any tickers that returned nothing (e.g. delisted/no history).
+        return close.dropna(axis=1, how="all")
+
+    @staticmethod
+    def fetch_betas(
+        tickers: List[str],
+        against: Optional[List[str]] = None,
+        years: float = 20,
+    ) -> pd.DataFrame:
+        """Fetch prices and compute OLS betas of every ticker in `tickers`
+        against every ticker in `against` (default: against each other).
+
+        Returns a wide DataFrame (rows = tickers, cols = against) — e.g. held
+        stocks × sector ETFs. Uses the pairwise-complete engine in
+        `src.betas`, so each cell is estimated on that pair's overlap.
+        """
+        universe = list(dict.fromkeys(list(tickers) + list(against or [])))
+        close = Collector._download_close(universe, years)
+        rets = close.pct_change()
+        y = rets[[t for t in tickers if t in rets.columns]]
+        if against is None:
+            return pairwise_betas(y)
+        return pairwise_betas(y, rets[[t for t in against if t in rets.columns]])
+
     @staticmethod
     def fetch_sector_betas(years: float = 20) -> pd.DataFrame:
         """Fetch SPDR sector ETF prices and compute pairwise OLS sector betas.
@@ -57,39 +197,82 @@ class Collector:
         Returns a long-format DataFrame: sector_a, sector_b, beta.
         """
         tickers = list(SECTOR_ETF_TICKERS.values())
-        end = pd.Timestamp.today().normalize()
-        start = end - pd.DateOffset(years=int(years))
-        data = yf.download(
-            tickers, start=start, end=end, progress=False, auto_adjust=True,
-        )
-        if isinstance(data.columns, pd.MultiIndex):
-            # When fetching >1 ticker, columns are (field, ticker); pick Close.
-            close = data["Close"] if "Close" in data.columns.get_level_values(0) else data.iloc[:, :len(tickers)]
-        else:
-            close = data
-
+        close = Collector._download_close(tickers, years)
         reverse = {v: k for k, v in SECTOR_ETF_TICKERS.items()}
         close = close.rename(columns=reverse)
-        # Drop any sector ETFs that returned nothing (e.g. delisted/no history).
-        close = close.dropna(axis=1, how="all")
         if close.empty or close.shape[1] < 2:
             raise ValueError("Not enough sector ETF data to compute betas.")
 
-        rets = close.pct_change()
-        rows = []
-        for a in rets.columns:
-            for b in rets.columns:
-                if a == b:
-                    beta = 1.0
-                else:
-                    # Use only dates where both sectors have a valid return so
-                    # short-history ETFs (XLC, XLRE) still get an honest beta
-                    # on their available window.
-                    pair = rets[[a, b]].dropna()
-                    if len(pair) < 2:
-                        beta = 0.0
-                    else:
-                        var_b = float(pair[b].var())
-                        beta = float(pair[a].cov(pair[b]) / var_b) if var_b > 0 else 0.0
-                rows.append({"sector_a": a, "sector_b": b, "beta": beta})
-        return pd.DataFrame(rows)
+        # Full matrix in one pass of masked matrix products (see src.betas).
+        return betas_to_long(pairwise_betas(close.pct_change()))
+
+
+class BackgroundFetch:
+    """A price fetch running on its own event-loop thread.
+
+    Lets a synchronous UI (Streamlit) kick off `acollect_prices` without
+    blocking the script run, then poll for progress on later reruns.
+    """
+
+    def __init__(self, collector: Collector, tickers: List[str], period: str = "1y"):
+        self.tickers = list(dict.fromkeys(tickers))
+        self.period = period
+        self.total = len(self.tickers)
+        self.completed = 0
+        self.last_ticker: Optional[str] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+
+        self._collector = collector
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._task: Optional[asyncio.Task] = None
+        self._cancel_requested = False
+        self._thread = threading.Thread(target=self._run, name="price-fetch", daemon=True)
+        self._thread.start()
+
+    def _on_progress(self, done: int, total: int, ticker: str) -> None:
+        self.completed = done
+        self.last_ticker = ticker
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        with self._lock:
+            self._task = self._loop.create_task(self._collector.acollect_prices(
+                self.tickers, period=self.period, on_progress=self._on_progress,
+            ))
+            if self._cancel_requested:
+                self._task.cancel()
+        try:
+            self.result = self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            self.cancelled = True
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self._loop.close()
+
+    @property
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
+    @property
+    def progress(self) -> float:
+        """Fraction of tickers finished, 0.0 – 1.0."""
+        return (self.completed / self.total) if self.total else 1.0
+
+    def cancel(self) -> None:
+        """Stop fetching tickers that haven't started yet."""
+        with self._lock:
+            self._cancel_requested = True
+            if self._task is not None and not self._task.done():
+                try:
+                    self._loop.call_soon_threadsafe(self._task.cancel)
+                except RuntimeError:
+                    pass  # loop already closed — the fetch just finished
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Block until the fetch finishes; returns the per-ticker results."""
+        self._thread.join(timeout)
+        return self.result
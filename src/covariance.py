@@ -0,0 +1,348 @@
+"""EWMA covariance over the whole price universe, maintained incrementally.
+
+One RiskMetrics-style covariance (λ = 0.94, zero mean) is kept for every
+ticker in the price store as pairwise decayed sums over the days both
+tickers had a return, so gaps and late listings don't blank a pair. New
+days fold in with one masked outer product; `CovarianceEngine.refresh()`
+persists the sums and a dated snapshot, and rebuilds when the universe,
+λ or a folded-in price changes.
+
+`CovarianceEngine.covariance()` is the read-only accessor risk code shares
+(cached per snapshot file). `CovarianceEngine.shrunk()` gives simulation
+and optimisation a Ledoit–Wolf constant-correlation estimate over a
+trailing window, with its Cholesky factor cached per ticker set.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.database import Database
+
+EWMA_DECAY = 0.94
+TRADING_DAYS = 252
+# Dated snapshots kept in ewma_covariance.parquet (~ one month of dailies).
+SNAPSHOTS_KEPT = 22
+JOURNAL_CONSUMER = "covariance"
+
+# Trailing window (trading days) for the shrinkage estimate, and the fewest
+# returns a priced ticker must have inside it.
+SHRINKAGE_WINDOW = 504
+MIN_SHRINKAGE_OBS = 60
+# Shrunk estimates kept in-process, oldest evicted first.
+SHRUNK_CACHE_SIZE = 64
+
+# snapshot path → (file mtime_ns, as_of_date, dense tickers × tickers matrix)
+_SNAPSHOT_CACHE: dict[str, tuple[int, str, pd.DataFrame]] = {}
+# (data_dir, tickers, window end, window) → ShrunkCovariance
+_SHRUNK_CACHE: dict[tuple, "ShrunkCovariance"] = {}
+
+
+@dataclass(frozen=True)
+class ShrunkCovariance:
+    """Daily shrinkage covariance for `tickers` (in that order) and its
+    lower Cholesky factor: draws are `z @ cholesky.T`."""
+    tickers: tuple[str, ...]
+    covariance: pd.DataFrame
+    cholesky: np.ndarray
+    shrinkage: float
+    n_obs: int
+    window_end: str
+
+
+def ewma_sums(
+    returns: pd.DataFrame,
+    decay: float = EWMA_DECAY,
+    prior: Optional[tuple[np.ndarray, np.ndarray]] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Decayed pairwise sums (S = Σ w·rᵢrⱼ, W = Σ w) after folding the rows
+    of `returns` (oldest first) into `prior`. NaN returns contribute nothing
+    to the pairs they belong to; every pair still decays by λ per row."""
+    R = returns.to_numpy(dtype=float)
+    M = np.isfinite(R)
+    R0 = np.where(M, R, 0.0)
+    k = len(R)
+    w = (1.0 - decay) * decay ** np.arange(k - 1, -1, -1, dtype=float)
+    S = (R0 * w[:, None]).T @ R0
+    W = (M * w[:, None]).T @ M.astype(float)
+    if prior is not None:
+        S = S + decay ** k * prior[0]
+        W = W + decay ** k * prior[1]
+    return S, W
+
+
+def ledoit_wolf_constant_correlation(
+    X: np.ndarray,
+    delta: Optional[float] = None,
+) -> tuple[np.ndarray, float]:
+    """(shrunk covariance, δ) for a complete T × N return sample.
+
+    Ledoit & Wolf, "Honey, I Shrunk the Sample Covariance Matrix" (2004):
+    Σ̂ = δ·F + (1 − δ)·S with S the (1/T) sample covariance and F the
+    constant-correlation target (sample variances, average correlation
+    r̄ off the diagonal). δ = clip(κ / T, 0, 1), κ = (π − ρ) / γ, with every
+    term a matrix product on the demeaned returns. Pass `delta` to
+    override the estimated intensity.
+    """
+    T, N = X.shape
+    X = X - X.mean(axis=0)
+    S = X.T @ X / T
+    if N < 2 or T < 2:
+        return S, 0.0
+    var = np.diag(S)
+    sd = np.sqrt(var)
+    corr = S / np.outer(sd, sd)
+    off = ~np.eye(N, dtype=bool)
+    r_bar = corr[off].mean()
+    F = r_bar * np.outer(sd, sd)
+    np.fill_diagonal(F, var)
+
+    if delta is not None:
+        return delta * F + (1 - delta) * S, float(delta)
+
+    X2 = X * X
+    pi = (X2.T @ X2 / T - S * S).sum()
+    theta = (X2 * X).T @ X / T - var[:, None] * S           # θ_ii,ij at [i, j]
+    ratio = np.sqrt(np.outer(1 / var, var))                 # √(s_jj / s_ii) at [i, j]
+    rho = np.trace(X2.T @ X2 / T - S * S) + r_bar / 2 * (ratio * theta + ratio.T * theta.T)[off].sum()
+    gamma = ((F - S) ** 2).sum()
+    delta = float(np.clip((pi - rho) / gamma / T, 0.0, 1.0)) if gamma > 0 else 0.0
+    return delta * F + (1 - delta) * S, delta
+
+
+def _upper_long(tickers: list[str], **arrays: np.ndarray) -> pd.DataFrame:
+    """Upper triangle (incl. diagonal) of square arrays as long rows."""
+    i, j = np.triu_indices(len(tickers))
+    names = np.asarray(tickers, dtype=object)
+    df = pd.DataFrame({"ticker_a": names[i], "ticker_b": names[j]})
+    for col, arr in arrays.items():
+        df[col] = arr[i, j]
+    return df
+
+
+def _dense(long: pd.DataFrame, value: str, tickers: list[str]) -> np.ndarray:
+    """Square symmetric array from upper-triangle long rows (0 where absent)."""
+    pos = pd.Index(tickers)
+    i = pos.get_indexer(long["ticker_a"])
+    j = pos.get_indexer(long["ticker_b"])
+    keep = (i >= 0) & (j >= 0)
+    out = np.zeros((len(tickers), len(tickers)))
+    v = long[value].to_numpy(dtype=float)[keep]
+    out[i[keep], j[keep]] = v
+    out[j[keep], i[keep]] = v
+    return out
+
+
+class CovarianceEngine:
+    def __init__(self, db: Database, decay: float = EWMA_DECAY):
+        self.db = db
+        self.decay = decay
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def refresh(self, full: bool = False) -> dict:
+        """Fold the return days since the last run into the EWMA sums and
+        write a snapshot dated at the last return day.
+
+        `full=True` (or no usable state) rebuilds from the whole price
+        history of every ticker in the store.
+        """
+        universe = sorted(self.db.list_price_tickers())
+        if not universe:
+            return {"mode": "full", "new_days": 0, "tickers": 0, "last_date": None, "as_of": None}
+        state = self.db.get_ewma_covariance_state()
+        journal_head = self.db.latest_change_id()
+
+        prev_last = None
+        incremental = not full and not state.empty
+        if incremental:
+            prev_last = pd.Timestamp(state["last_date"].max())
+            incremental = (
+                set(state["ticker_a"]) == set(universe)
+                and np.isclose(float(state["decay"].iloc[0]), self.decay)
+                and not self._repriced_since(prev_last)
+            )
+
+        if incremental:
+            prior = (_dense(state, "sum_rr", universe), _dense(state, "sum_w", universe))
+            new = self._returns(universe, after=prev_last)
+            S, W = ewma_sums(new, self.decay, prior) if not new.empty else prior
+            last_date = new.index.max() if not new.empty else prev_last
+            mode = "incremental"
+        else:
+            new = self._returns(universe)
+            S, W = ewma_sums(new, self.decay)
+            last_date = new.index.max() if not new.empty else pd.Timestamp.today().normalize()
+            mode = "full"
+
+        last_iso = pd.Timestamp(last_date).date().isoformat()
+        long = _upper_long(universe, sum_rr=S, sum_w=W)
+        long["decay"] = self.decay
+        long["last_date"] = last_iso
+        self.db.save_ewma_covariance_state(long)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            long["covariance"] = np.where(long["sum_w"] > 0, long["sum_rr"] / long["sum_w"], np.nan)
+        self.db.save_ewma_covariance(long, as_of_date=last_iso, keep=SNAPSHOTS_KEPT)
+        self.db.advance_journal_cursor(JOURNAL_CONSUMER, journal_head)
+        return {
+            "mode":      mode,
+            "new_days":  len(new),
+            "tickers":   len(universe),
+            "last_date": last_iso,
+            "as_of":     last_iso,
+        }
+
+    def _repriced_since(self, last_date: pd.Timestamp) -> bool:
+        """True if the journal has a price change dated on or before
+        `last_date` that this consumer hasn't seen (or it never ran)."""
+        cursor = self.db.get_journal_cursor(JOURNAL_CONSUMER)
+        if cursor is None:
+            return True
+        journal = self.db.get_change_journal(since_id=cursor)
+        if journal.empty:
+            return False
+        prices = journal[journal["entity"] == "ticker"]
+        return bool((prices["changed_from"].fillna(pd.Timestamp.min) <= last_date).any())
+
+    def _returns(self, tickers: list[str], after: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """Daily returns (NaN across gaps) dated after `after`, on the price
+        store's union calendar — the same rows a full build would see."""
+        start = after.strftime("%Y-%m-%d") if after is not None else None
+        prices = self.db.get_historical_prices(tickers, start_date=start).sort_index()
+        prices = prices[~prices.index.duplicated(keep="last")]
+        rets = prices.pct_change(fill_method=None).iloc[1:]
+        if after is not None:
+            rets = rets[rets.index > after]
+        return rets.reindex(columns=tickers)
+
+    # ── Access ────────────────────────────────────────────────────────────────
+
+    def _snapshot(self) -> tuple[str, pd.DataFrame]:
+        """(as_of_date, dense daily covariance) of the latest snapshot,
+        parsed once per snapshot file version; ("", empty) if none exists."""
+        path = self.db._ewma_covariance_path()
+        mtime = os.stat(path).st_mtime_ns
+        cached = _SNAPSHOT_CACHE.get(path)
+        if cached is None or cached[0] != mtime:
+            long = self.db.get_ewma_covariance()
+            if long.empty:
+                cached = (mtime, "", pd.DataFrame(dtype=float))
+            else:
+                tickers = sorted(set(long["ticker_a"]) | set(long["ticker_b"]))
+                dense = _dense(long.fillna({"covariance": 0.0}), "covariance", tickers)
+                cached = (mtime, long["as_of_date"].iloc[0], pd.DataFrame(dense, index=tickers, columns=tickers))
+            _SNAPSHOT_CACHE[path] = cached
+        return cached[1], cached[2]
+
+    def as_of(self) -> str:
+        """Date of the snapshot `covariance()` serves ("" if none)."""
+        return self._snapshot()[0]
+
+    def covariance(self, tickers: Optional[Iterable[str]] = None, annualize: bool = False) -> pd.DataFrame:
+        """EWMA covariance of daily returns for `tickers` (all if None), in
+        the order given. Tickers with no price history (cash) and pairs that
+        never overlapped get 0. `annualize` scales by 252.
+
+        With no snapshot yet (the refresh job hasn't run), the EWMA of just
+        these tickers is computed from their price history and not saved."""
+        _, cov = self._snapshot()
+        if cov.empty:
+            cov = self._unsaved_covariance(tickers)
+        if tickers is not None:
+            tickers = list(dict.fromkeys(tickers))
+            cov = cov.reindex(index=tickers, columns=tickers, fill_value=0.0)
+        return cov * TRADING_DAYS if annualize else cov.copy()
+
+    def _unsaved_covariance(self, tickers: Optional[Iterable[str]]) -> pd.DataFrame:
+        """Full-history EWMA covariance of the priced `tickers` on their own
+        trading calendar, without touching the stored state."""
+        priced = self.db.list_price_tickers()
+        cols = sorted(priced if tickers is None else set(tickers) & set(priced))
+        if not cols:
+            return pd.DataFrame(dtype=float)
+        S, W = ewma_sums(self._returns(cols), self.decay)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = np.where(W > 0, S / W, 0.0)
+        return pd.DataFrame(cov, index=cols, columns=cols)
+
+    def correlation(self, tickers: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Correlation implied by `covariance(tickers)`; NaN for zero-variance
+        tickers, 1 on the diagonal otherwise."""
+        cov = self.covariance(tickers)
+        sd = np.sqrt(np.diag(cov.to_numpy()))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = cov.to_numpy() / np.outer(sd, sd)
+        corr = np.where(np.outer(sd, sd) > 0, corr, np.nan)
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=cov.index, columns=cov.columns)
+
+    def shrunk(self, tickers: Iterable[str], window: int = SHRINKAGE_WINDOW) -> ShrunkCovariance:
+        """Ledoit–Wolf constant-correlation covariance of `tickers` over the
+        `window` return days ending at the covariance snapshot date, with its
+        Cholesky factor. Cached per (ticker set, window end).
+
+        Each ticker is demeaned over its own returns in the window and adds
+        nothing on days it has none, so a late listing doesn't cut the
+        others' history short. Zero-variance tickers (cash) get zero rows in
+        the factor. Raises ValueError if a priced ticker has fewer than
+        `MIN_SHRINKAGE_OBS` returns in the window."""
+        tickers = tuple(dict.fromkeys(tickers))
+        window_end = self.as_of()
+        key = (self.db.data_dir, tickers, window_end, window)
+        hit = _SHRUNK_CACHE.get(key)
+        if hit is not None:
+            return hit
+
+        priced = set(self.db.list_price_tickers())
+        cols = [t for t in tickers if t in priced]
+        X = np.empty((0, len(cols)))
+        if cols:
+            end = pd.Timestamp(window_end) if window_end else pd.Timestamp.today().normalize()
+            # ~1.5 calendar days per trading day, plus slack for holidays.
+            rets = self._returns(cols, after=end - pd.Timedelta(days=int(window * 1.5) + 30))
+            R = rets[rets.index <= end].tail(window).to_numpy(dtype=float)
+            valid = np.isfinite(R)
+            n = valid.sum(axis=0)
+            short = [f"{t} ({k})" for t, k in zip(cols, n) if k < MIN_SHRINKAGE_OBS]
+            if short:
+                raise ValueError(
+                    f"Not enough return history for a covariance estimate: {', '.join(short)} "
+                    f"— need {MIN_SHRINKAGE_OBS} daily returns in the last {window} days."
+                )
+            # Demean per ticker over its own days, zero elsewhere, and scale
+            # by √(T / (n − 1)) so each column's variance is its own sample
+            # variance over the days it has (and the matrix stays PSD).
+            mean = np.where(valid, R, 0.0).sum(axis=0) / n
+            X = np.where(valid, R - mean, 0.0) * np.sqrt(len(R) / (n - 1))
+
+        cov = np.zeros((len(tickers), len(tickers)))
+        L = np.zeros_like(cov)
+        delta = 0.0
+        if cols:
+            live = X.std(axis=0) > 0
+            idx = np.array([tickers.index(t) for t in cols])[live]
+            sub, delta = ledoit_wolf_constant_correlation(X[:, live])
+            try:
+                factor = np.linalg.cholesky(sub)
+            except np.linalg.LinAlgError:
+                # Far fewer days than tickers with δ ≈ 0 — use the target.
+                sub, delta = ledoit_wolf_constant_correlation(X[:, live], delta=1.0)
+                factor = np.linalg.cholesky(sub)
+            cov[np.ix_(idx, idx)] = sub
+            L[np.ix_(idx, idx)] = factor
+
+        result = ShrunkCovariance(
+            tickers=tickers,
+            covariance=pd.DataFrame(cov, index=list(tickers), columns=list(tickers)),
+            cholesky=L,
+            shrinkage=delta,
+            n_obs=len(X),
+            window_end=window_end,
+        )
+        _SHRUNK_CACHE[key] = result
+        while len(_SHRUNK_CACHE) > SHRUNK_CACHE_SIZE:
+            _SHRUNK_CACHE.pop(next(iter(_SHRUNK_CACHE)))
+        return result
@@ -1,4 +1,6 @@
 import os
+import threading
+import numpy as np
 import pandas as pd
 import duckdb
 from typing import List, Optional
@@ -12,15 +14,35 @@ TRADES_FILE = "trades.parquet"
 FUND_HOLDINGS_FILE = "fund_holdings.parquet"
 FUND_PROFILES_FILE = "fund_profiles.parquet"
 SECTOR_BETAS_FILE  = "sector_betas.parquet"
+SECTOR_BETA_STATS_FILE = "sector_beta_stats.parquet"
+EWMA_COVARIANCE_FILE   = "ewma_covariance.parquet"
+EWMA_COVARIANCE_STATE_FILE = "ewma_covariance_state.parquet"
 DAILY_SECURITY_METRICS_FILE   = "daily_security_metrics.parquet"
 DAILY_PORTFOLIO_METRICS_FILE  = "daily_portfolio_metrics.parquet"
 DAILY_ATTRIBUTION_FILE        = "daily_attribution.parquet"
+ATTRIBUTION_STATE_FILE        = "attribution_state.parquet"
+ATTRIBUTION_BY_SECTOR_FILE    = "daily_attribution_by_sector.parquet"
+ATTRIBUTION_BY_ASSET_TYPE_FILE = "daily_attribution_by_asset_type.parquet"
+ATTRIBUTION_CONTRIBUTORS_FILE = "attribution_contributors.parquet"
 PRODUCTION_JOBS_FILE          = "production_jobs.parquet"
 PRODUCTION_RUNS_FILE          = "production_runs.parquet"
+PRICE_ISSUES_FILE             = "price_issues.parquet"
+PRICE_REFETCH_QUEUE_FILE      = "price_refetch_queue.parquet"
+PRICE_ISSUE_RESOLUTIONS_FILE  = "price_issue_resolutions.parquet"
+TAX_LOTS_FILE                 = "tax_lots.parquet"
+REALIZED_GAINS_FILE           = "realized_gains.parquet"
+DAILY_PNL_FILE                = "daily_pnl.parquet"
+TAX_LOT_STATE_FILE            = "tax_lot_state.parquet"
+CHANGE_JOURNAL_FILE           = "change_journal.parquet"
+JOURNAL_CURSORS_FILE          = "change_journal_cursors.parquet"
 GROUPS_FILE                   = "groups.parquet"
 PORTFOLIO_GROUPS_FILE         = "portfolio_groups.parquet"
 PRICES_DIR = "prices"
 
+# Price saves run concurrently on collector worker threads; the journal is a
+# single shared file, so its read-modify-write is serialised.
+_JOURNAL_LOCK = threading.Lock()
+
 
 class Database:
     def __init__(self, data_dir: str = "data"):
@@ -38,20 +60,50 @@ class Database:
             self._constituents_path(): ["parent_ticker", "constituent_ticker", "weight"],
             self._portfolios_path(): ["name", "created_at"],
             self._positions_path(): ["portfolio_name", "ticker", "quantity", "cost_basis"],
-            self._trades_path(): ["trade_id", "portfolio_name", "ticker", "side", "quantity", "trade_price", "trade_date"],
+            self._trades_path(): [
+                "trade_id", "portfolio_name", "ticker", "side", "quantity", "trade_price", "trade_date",
+                "lot_id",
+            ],
             self._fund_holdings_path(): ["fund_ticker", "as_of_date", "holding_ticker", "holding_name", "weight", "sector", "asset_type"],
             self._fund_profiles_path(): ["fund_ticker", "as_of_date", "category", "key", "weight"],
             self._sector_betas_path(): ["sector_a", "sector_b", "beta", "as_of_date"],
+            self._sector_beta_stats_path(): [
+                "sector_a", "sector_b", "n", "sum_x", "sum_y", "sum_xy", "sum_xx",
+                "window_start", "last_date",
+            ],
+            self._ewma_covariance_path(): ["as_of_date", "ticker_a", "ticker_b", "covariance"],
+            self._ewma_covariance_state_path(): [
+                "ticker_a", "ticker_b", "sum_rr", "sum_w", "decay", "last_date",
+            ],
             self._daily_security_metrics_path(): [
                 "date", "ticker", "price", "daily_return", "cum_return", "rolling_vol_21d",
+                "cum_log_return",
             ],
             self._daily_portfolio_metrics_path(): [
                 "date", "portfolio_name", "total_value", "daily_return",
                 "cum_return", "rolling_vol_21d", "drawdown", "max_drawdown",
+                "cum_log_return",
             ],
             self._daily_attribution_path(): [
                 "date", "portfolio_name", "ticker", "weight",
                 "position_return", "contribution_to_return", "asset_type", "sector",
+                "log_contribution",
+            ],
+            self._attribution_state_path(): [
+                "scope", "key", "last_date", "cum_index", "peak", "max_drawdown",
+                "return_tail", "fingerprint",
+            ],
+            self._attribution_by_sector_path(): [
+                "date", "portfolio_name", "sector", "weight", "contribution_to_return",
+                "log_contribution",
+            ],
+            self._attribution_by_asset_type_path(): [
+                "date", "portfolio_name", "asset_type", "weight", "contribution_to_return",
+                "log_contribution",
+            ],
+            self._attribution_contributors_path(): [
+                "portfolio_name", "period", "start_date", "end_date", "ticker",
+                "asset_type", "sector", "contribution_to_return", "rank",
             ],
             self._production_jobs_path(): [
                 "job_name", "enabled", "interval_minutes", "last_run_at",
@@ -61,6 +113,36 @@ class Database:
                 "run_id", "job_name", "started_at", "ended_at",
                 "status", "error_message", "details", "duration_seconds",
             ],
+            self._price_issues_path(): [
+                "ticker", "issue_type", "start_date", "end_date", "n_days", "detail", "detected_at",
+            ],
+            self._price_refetch_queue_path(): [
+                "request_id", "ticker", "start_date", "end_date", "reason",
+                "status", "enqueued_at", "completed_at", "error",
+                "issue_type", "issue_date",
+            ],
+            self._price_issue_resolutions_path(): [
+                "ticker", "issue_type", "issue_date", "resolution", "resolved_at",
+            ],
+            self._tax_lots_path(): [
+                "portfolio_name", "ticker", "lot_id", "open_date", "quantity",
+                "cost_per_share", "remaining_quantity",
+            ],
+            self._realized_gains_path(): [
+                "portfolio_name", "ticker", "trade_id", "lot_id", "open_date", "close_date",
+                "quantity", "cost_basis", "proceeds", "realized_gain", "term",
+            ],
+            self._daily_pnl_path(): [
+                "date", "portfolio_name", "ticker", "quantity", "cost_basis", "market_value",
+                "unrealized_pnl", "realized_pnl", "cum_realized_pnl",
+            ],
+            self._tax_lot_state_path(): [
+                "portfolio_name", "last_trade_id", "last_trade_date", "fingerprint", "updated_at",
+            ],
+            self._change_journal_path(): [
+                "change_id", "entity", "key", "changed_from", "source", "recorded_at",
+            ],
+            self._journal_cursors_path(): ["consumer", "last_change_id", "updated_at"],
             self._groups_path():            ["name", "description", "created_at"],
             self._portfolio_groups_path():  ["group_name", "portfolio_name"],
         }
@@ -102,6 +184,15 @@ class Database:
     def _sector_betas_path(self) -> str:
         return os.path.join(self.data_dir, SECTOR_BETAS_FILE)
 
+    def _sector_beta_stats_path(self) -> str:
+        return os.path.join(self.data_dir, SECTOR_BETA_STATS_FILE)
+
+    def _ewma_covariance_path(self) -> str:
+        return os.path.join(self.data_dir, EWMA_COVARIANCE_FILE)
+
+    def _ewma_covariance_state_path(self) -> str:
+        return os.path.join(self.data_dir, EWMA_COVARIANCE_STATE_FILE)
+
     def _daily_security_metrics_path(self) -> str:
         return os.path.join(self.data_dir, DAILY_SECURITY_METRICS_FILE)
 
@@ -111,12 +202,51 @@ class Database:
     def _daily_attribution_path(self) -> str:
         return os.path.join(self.data_dir, DAILY_ATTRIBUTION_FILE)
 
+    def _attribution_state_path(self) -> str:
+        return os.path.join(self.data_dir, ATTRIBUTION_STATE_FILE)
+
+    def _attribution_by_sector_path(self) -> str:
+        return os.path.join(self.data_dir, ATTRIBUTION_BY_SECTOR_FILE)
+
+    def _attribution_by_asset_type_path(self) -> str:
+        return os.path.join(self.data_dir, ATTRIBUTION_BY_ASSET_TYPE_FILE)
+
+    def _attribution_contributors_path(self) -> str:
+        return os.path.join(self.data_dir, ATTRIBUTION_CONTRIBUTORS_FILE)
+
+    def _tax_lots_path(self) -> str:
+        return os.path.join(self.data_dir, TAX_LOTS_FILE)
+
+    def _realized_gains_path(self) -> str:
+        return os.path.join(self.data_dir, REALIZED_GAINS_FILE)
+
+    def _daily_pnl_path(self) -> str:
+        return os.path.join(self.data_dir, DAILY_PNL_FILE)
+
+    def _tax_lot_state_path(self) -> str:
+        return os.path.join(self.data_dir, TAX_LOT_STATE_FILE)
+
+    def _change_journal_path(self) -> str:
+        return os.path.join(self.data_dir, CHANGE_JOURNAL_FILE)
+
+    def _journal_cursors_path(self) -> str:
+        return os.path.join(self.data_dir, JOURNAL_CURSORS_FILE)
+
     def _production_jobs_path(self) -> str:
         return os.path.join(self.data_dir, PRODUCTION_JOBS_FILE)
 
     def _production_runs_path(self) -> str:
         return os.path.join(self.data_dir, PRODUCTION_RUNS_FILE)
 
+    def _price_issues_path(self) -> str:
+        return os.path.join(self.data_dir, PRICE_ISSUES_FILE)
+
+    def _price_refetch_queue_path(self) -> str:
+        return os.path.join(self.data_dir, PRICE_REFETCH_QUEUE_FILE)
+
+    def _price_issue_resolutions_path(self) -> str:
+        return os.path.join(self.data_dir, PRICE_ISSUE_RESOLUTIONS_FILE)
+
     def _groups_path(self) -> str:
         return os.path.join(self.data_dir, GROUPS_FILE)
 
@@ -183,6 +313,7 @@ class Database:
             } for pos in portfolio.positions])
             positions_df = pd.concat([positions_df, new_positions], ignore_index=True)
         positions_df.to_parquet(self._positions_path(), index=False)
+        self._journal_change("portfolio", portfolio.name, None, "save_portfolio")
 
     def list_portfolios(self) -> List[str]:
         """Return names of all saved portfolios."""
@@ -285,11 +416,14 @@ class Database:
         quantity: float,
         trade_price: float,
         trade_date: str,
+        lot_id: Optional[int] = None,
     ) -> None:
         """Append a trade to the ledger and apply it to positions.
 
         side must be 'BUY' or 'SELL'.  Buys use average-cost blending;
         sells reduce quantity (position removed if quantity reaches zero).
+        A SELL with `lot_id` (the trade_id of the opening BUY) closes that
+        tax lot first — specific identification; otherwise lots close FIFO.
         """
         trades_df = pd.read_parquet(self._trades_path())
         trade_id = int(trades_df["trade_id"].max()) + 1 if not trades_df.empty else 1
@@ -301,9 +435,11 @@ class Database:
             "quantity": quantity,
             "trade_price": trade_price,
             "trade_date": trade_date,
+            "lot_id": lot_id,
         }])
         pd.concat([trades_df, new_row], ignore_index=True).to_parquet(self._trades_path(), index=False)
         self._apply_trade_to_positions(portfolio_name, ticker, side, quantity, trade_price)
+        self._journal_change("portfolio", portfolio_name, trade_date, "record_trade")
 
     def list_trades(self, portfolio_name: Optional[str] = None) -> pd.DataFrame:
         """Return all trades sorted by date descending, optionally filtered by portfolio."""
@@ -367,6 +503,7 @@ class Database:
             } for r in rows])
             positions_df = pd.concat([positions_df, new_rows], ignore_index=True)
         positions_df.to_parquet(self._positions_path(), index=False)
+        self._journal_change("portfolio", portfolio_name, None, "update_positions_direct")
 
     def get_all_assets(self) -> pd.DataFrame:
         """Return the full assets table."""
@@ -402,6 +539,7 @@ class Database:
         prices_path = self._prices_path(ticker)
         if os.path.exists(prices_path):
             existing = pd.read_parquet(prices_path)
+            changed_from = self._first_changed_price(existing["price"], new_df["price"])
             combined = pd.concat([existing, new_df])
             combined = combined[~combined.index.duplicated(keep="last")]
             combined.sort_index(inplace=True)
@@ -409,6 +547,131 @@ class Database:
         else:
             new_df.sort_index(inplace=True)
             new_df.to_parquet(prices_path)
+            changed_from = new_df.index.min() if not new_df.empty else None
+        if changed_from is not None:
+            self._journal_change("ticker", ticker, changed_from, "save_prices")
+
+    @staticmethod
+    def _first_changed_price(existing: pd.Series, new: pd.Series) -> Optional[pd.Timestamp]:
+        """Earliest date in `new` that adds a price or changes a stored one.
+        Collectors re-download overlapping periods, so most saves only
+        append the latest day or two."""
+        new = new[~new.index.duplicated(keep="last")]
+        old = existing[~existing.index.duplicated(keep="last")].reindex(new.index)
+        a, b = old.to_numpy(dtype=float), new.to_numpy(dtype=float)
+        same = np.isclose(a, b, rtol=1e-9, atol=0.0) | (np.isnan(a) & np.isnan(b))
+        if same.all():
+            return None
+        return pd.Timestamp(new.index[~same].min())
+
+    def list_price_tickers(self) -> List[str]:
+        """Return every ticker with a stored price file, sorted."""
+        prices_dir = os.path.join(self.data_dir, PRICES_DIR)
+        return sorted(
+            f[: -len(".parquet")] for f in os.listdir(prices_dir) if f.endswith(".parquet")
+        )
+
+    # ── Price integrity (issues + targeted re-fetch queue) ─────────────────────
+
+    def save_price_issues(self, issues: pd.DataFrame) -> None:
+        """Replace the stored price-store issues with the latest scan.
+
+        The table is a snapshot of open issues rather than a log — issues
+        that were repaired or acknowledged simply drop out (their keys live
+        in `price_issue_resolutions.parquet`)."""
+        cols = ["ticker", "issue_type", "start_date", "end_date", "n_days", "detail"]
+        df = issues.reindex(columns=cols).copy()
+        df["detected_at"] = pd.Timestamp.now()
+        df.to_parquet(self._price_issues_path(), index=False)
+
+    def get_price_issues(self, issue_type: Optional[str] = None) -> pd.DataFrame:
+        df = pd.read_parquet(self._price_issues_path())
+        if issue_type is not None and not df.empty:
+            df = df[df["issue_type"] == issue_type]
+        return df.reset_index(drop=True)
+
+    def enqueue_price_refetch(self, ranges: pd.DataFrame) -> int:
+        """Append (ticker, start_date, end_date, reason[, issue_type,
+        issue_date]) rows as pending re-fetch requests. Ranges already
+        queued for the same ticker and dates are skipped unless that request
+        failed — a range that was re-fetched (or came back empty) is not
+        downloaded again. Returns the number of rows enqueued."""
+        if ranges is None or ranges.empty:
+            return 0
+        queue = pd.read_parquet(self._price_refetch_queue_path())
+        new = ranges.reindex(columns=["ticker", "start_date", "end_date", "reason",
+                                      "issue_type", "issue_date"]).copy()
+        new["start_date"] = pd.to_datetime(new["start_date"])
+        new["end_date"] = pd.to_datetime(new["end_date"])
+        new["issue_date"] = pd.to_datetime(new["issue_date"])
+        new = new.drop_duplicates(["ticker", "start_date", "end_date"])
+        if not queue.empty:
+            seen = queue[queue["status"] != "failed"]
+            key = ["ticker", "start_date", "end_date"]
+            seen_keys = pd.MultiIndex.from_frame(
+                seen[key].assign(
+                    start_date=pd.to_datetime(seen["start_date"]),
+                    end_date=pd.to_datetime(seen["end_date"]),
+                )
+            )
+            new = new[~pd.MultiIndex.from_frame(new[key]).isin(seen_keys)]
+        if new.empty:
+            return 0
+        next_id = 1 if queue.empty else int(queue["request_id"].max()) + 1
+        new = new.assign(
+            request_id=range(next_id, next_id + len(new)),
+            status="pending",
+            enqueued_at=pd.Timestamp.now(),
+            completed_at=pd.NaT,
+            error=None,
+        )
+        cols = ["request_id", "ticker", "start_date", "end_date", "reason",
+                "status", "enqueued_at", "completed_at", "error", "issue_type", "issue_date"]
+        frames = [f for f in (queue, new[cols]) if not f.empty]
+        pd.concat(frames, ignore_index=True).to_parquet(
+            self._price_refetch_queue_path(), index=False
+        )
+        return len(new)
+
+    def get_price_refetch_queue(self, status: Optional[str] = None) -> pd.DataFrame:
+        df = pd.read_parquet(self._price_refetch_queue_path())
+        if status is not None and not df.empty:
+            df = df[df["status"] == status]
+        return df.sort_values("request_id").reset_index(drop=True) if not df.empty else df
+
+    def mark_price_refetch(self, request_id: int, status: str, error: Optional[str] = None) -> None:
+        """Close out one queued re-fetch (status: done / empty / failed)."""
+        df = pd.read_parquet(self._price_refetch_queue_path())
+        mask = df["request_id"] == request_id
+        df.loc[mask, "status"] = status
+        df.loc[mask, "completed_at"] = pd.Timestamp.now()
+        df.loc[mask, "error"] = error
+        df.to_parquet(self._price_refetch_queue_path(), index=False)
+
+    def resolve_price_issues(self, issues: pd.DataFrame, resolution: str) -> None:
+        """Record issues as closed, keyed on (ticker, issue_type, issue_date).
+
+        `issues` needs ticker, issue_type and issue_date (or start_date).
+        `resolution` is "repaired" / "empty" (set by the re-fetch drain) or
+        "acknowledged" (a genuine move or a delisting the user has
+        confirmed). Later scans don't report resolved issues again."""
+        if issues is None or issues.empty:
+            return
+        df = issues.copy()
+        if "issue_date" not in df.columns:
+            df["issue_date"] = df["start_date"]
+        df = df[["ticker", "issue_type", "issue_date"]].dropna()
+        df["issue_date"] = pd.to_datetime(df["issue_date"])
+        df = df.drop_duplicates().assign(resolution=resolution, resolved_at=pd.Timestamp.now())
+        self._upsert_parquet(
+            self._price_issue_resolutions_path(), df, ["ticker", "issue_type", "issue_date"],
+        )
+
+    def get_resolved_price_issues(self) -> pd.DataFrame:
+        df = pd.read_parquet(self._price_issue_resolutions_path())
+        if not df.empty:
+            df["issue_date"] = pd.to_datetime(df["issue_date"])
+        return df.reset_index(drop=True)
 
     # ── Fund holdings (lookthrough) ────────────────────────────────────────────
 
@@ -470,25 +733,32 @@ class Database:
 
         Replaces any existing profile for the same (fund_ticker, as_of_date).
         """
+        self.save_fund_profiles(
+            {fund_ticker: {"asset_classes": asset_classes, "sector_weightings": sector_weightings}},
+            as_of_date,
+        )
+
+    def save_fund_profiles(self, profiles: dict, as_of_date: str) -> None:
+        """Bulk variant of `save_fund_profile`: one read + one write for many funds.
+
+        profiles: {fund_ticker: {'asset_classes': dict, 'sector_weightings': dict}}.
+        Replaces any existing profile for the same (fund_ticker, as_of_date).
+        """
+        if not profiles:
+            return
         df = pd.read_parquet(self._fund_profiles_path())
-        df = df[~((df["fund_ticker"] == fund_ticker) & (df["as_of_date"] == as_of_date))]
+        df = df[~(df["fund_ticker"].isin(list(profiles)) & (df["as_of_date"] == as_of_date))]
         rows = []
-        for k, v in (asset_classes or {}).items():
-            rows.append({
-                "fund_ticker": fund_ticker,
-                "as_of_date": as_of_date,
-                "category": "asset_class",
-                "key": k,
-                "weight": float(v) if v is not None else 0.0,
-            })
-        for k, v in (sector_weightings or {}).items():
-            rows.append({
-                "fund_ticker": fund_ticker,
-                "as_of_date": as_of_date,
-                "category": "sector",
-                "key": k,
-                "weight": float(v) if v is not None else 0.0,
-            })
+        for fund_ticker, prof in profiles.items():
+            for category, source in (("asset_class", "asset_classes"), ("sector", "sector_weightings")):
+                for k, v in (prof.get(source) or {}).items():
+                    rows.append({
+                        "fund_ticker": fund_ticker,
+                        "as_of_date": as_of_date,
+                        "category": category,
+                        "key": k,
+                        "weight": float(v) if v is not None else 0.0,
+                    })
         if rows:
             df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
         df.to_parquet(self._fund_profiles_path(), index=False)
@@ -515,12 +785,29 @@ class Database:
         ))
         return {"as_of_date": as_of_date, "asset_classes": asset_classes, "sector_weightings": sectors}
 
+    def get_latest_fund_profiles(self, fund_tickers: List[str]) -> pd.DataFrame:
+        """Latest profile rows (fund_ticker, as_of_date, category, key, weight)
+        for each of `fund_tickers`, from one read of the profile store."""
+        df = pd.read_parquet(self._fund_profiles_path())
+        df = df[df["fund_ticker"].isin(fund_tickers)]
+        if df.empty:
+            return df.reset_index(drop=True)
+        latest = df.groupby("fund_ticker")["as_of_date"].transform("max")
+        return df[df["as_of_date"] == latest].reset_index(drop=True)
+
     def list_fund_profile_dates(self, fund_ticker: str) -> List[str]:
         """Return all profile snapshot dates for a fund, newest first."""
         df = pd.read_parquet(self._fund_profiles_path())
         dates = df[df["fund_ticker"] == fund_ticker]["as_of_date"].unique().tolist()
         return sorted(dates, reverse=True)
 
+    def latest_fund_profile_dates(self) -> dict:
+        """Return {fund_ticker: latest as_of_date} for every profiled fund."""
+        df = pd.read_parquet(self._fund_profiles_path(), columns=["fund_ticker", "as_of_date"])
+        if df.empty:
+            return {}
+        return df.groupby("fund_ticker")["as_of_date"].max().to_dict()
+
     def delete_fund_profile(self, fund_ticker: str, as_of_date: str) -> None:
         """Remove a specific profile snapshot."""
         df = pd.read_parquet(self._fund_profiles_path())
@@ -563,6 +850,62 @@ class Database:
         df = pd.read_parquet(self._sector_betas_path())
         return sorted(df["as_of_date"].unique().tolist(), reverse=True)
 
+    def save_sector_beta_stats(self, stats: pd.DataFrame) -> None:
+        """Replace the running sufficient statistics behind the sector betas.
+
+        One row per (sector_a, sector_b) with n, sum_x, sum_y, sum_xy, sum_xx
+        (x = sector_b returns, y = sector_a returns) plus the window the sums
+        cover: returns dated in (window_start, last_date].
+        """
+        cols = ["sector_a", "sector_b", "n", "sum_x", "sum_y", "sum_xy", "sum_xx",
+                "window_start", "last_date"]
+        stats[cols].to_parquet(self._sector_beta_stats_path(), index=False)
+
+    def get_sector_beta_stats(self) -> pd.DataFrame:
+        """Return the stored sector-beta sufficient statistics (empty if none)."""
+        return pd.read_parquet(self._sector_beta_stats_path())
+
+    # ── EWMA covariance ───────────────────────────────────────────────────────
+
+    def save_ewma_covariance(self, cov: pd.DataFrame, as_of_date: str, keep: Optional[int] = None) -> None:
+        """Store a covariance snapshot (ticker_a, ticker_b, covariance; upper
+        triangle incl. the diagonal) for `as_of_date`, replacing any snapshot
+        of the same date. `keep` prunes all but the newest `keep` dates."""
+        existing = pd.read_parquet(self._ewma_covariance_path())
+        existing = existing[existing["as_of_date"] != as_of_date]
+        new_rows = cov[["ticker_a", "ticker_b", "covariance"]].copy()
+        new_rows.insert(0, "as_of_date", as_of_date)
+        df = pd.concat([existing, new_rows], ignore_index=True) if not existing.empty else new_rows
+        if keep is not None:
+            dates = sorted(df["as_of_date"].unique(), reverse=True)[:keep]
+            df = df[df["as_of_date"].isin(dates)]
+        df.to_parquet(self._ewma_covariance_path(), index=False)
+
+    def get_ewma_covariance(self, as_of_date: Optional[str] = None) -> pd.DataFrame:
+        """Long covariance snapshot for `as_of_date` (latest if None). Empty if none."""
+        df = pd.read_parquet(self._ewma_covariance_path())
+        if df.empty:
+            return df
+        if as_of_date is None:
+            as_of_date = df["as_of_date"].max()
+        return df[df["as_of_date"] == as_of_date].reset_index(drop=True)
+
+    def list_ewma_covariance_dates(self) -> List[str]:
+        """Return all EWMA covariance snapshot dates, newest first."""
+        df = pd.read_parquet(self._ewma_covariance_path(), columns=["as_of_date"])
+        return sorted(df["as_of_date"].unique().tolist(), reverse=True)
+
+    def save_ewma_covariance_state(self, state: pd.DataFrame) -> None:
+        """Replace the running EWMA sums: per (ticker_a, ticker_b) the decayed
+        Σ rᵢrⱼ (`sum_rr`) and Σ weight (`sum_w`) over days both had a return,
+        plus the `decay` they were built with and the `last_date` folded in."""
+        cols = ["ticker_a", "ticker_b", "sum_rr", "sum_w", "decay", "last_date"]
+        state[cols].to_parquet(self._ewma_covariance_state_path(), index=False)
+
+    def get_ewma_covariance_state(self) -> pd.DataFrame:
+        """Return the stored EWMA covariance sums (empty if none)."""
+        return pd.read_parquet(self._ewma_covariance_state_path())
+
     # ── Daily metrics (returns, risk, attribution) ─────────────────────────────
 
     @staticmethod
@@ -602,8 +945,18 @@ class Database:
             return None
         return pd.to_datetime(df["date"]).max()
 
-    def save_daily_portfolio_metrics(self, df: pd.DataFrame) -> None:
-        """Upsert daily per-portfolio metrics keyed on (date, portfolio_name)."""
+    def get_security_metric_dates(self) -> pd.DatetimeIndex:
+        """Sorted distinct dates in daily_security_metrics — the calendar
+        every stored security series was computed on."""
+        df = pd.read_parquet(self._daily_security_metrics_path(), columns=["date"])
+        return pd.DatetimeIndex(pd.to_datetime(df["date"]).unique()).sort_values()
+
+    def save_daily_portfolio_metrics(self, df: pd.DataFrame, starts: Optional[dict] = None) -> None:
+        """Upsert daily per-portfolio metrics keyed on (date, portfolio_name).
+        Portfolios in `starts` are recomputed: their rows from that date on
+        (all of them when None) are dropped first."""
+        if starts:
+            self._replace_portfolio_rows(self._daily_portfolio_metrics_path(), None, starts, date_col="date")
         self._upsert_parquet(
             self._daily_portfolio_metrics_path(), df, ["date", "portfolio_name"],
         )
@@ -625,8 +978,57 @@ class Database:
             return None
         return pd.to_datetime(df["date"]).max()
 
-    def save_daily_attribution(self, df: pd.DataFrame) -> None:
-        """Upsert daily attribution keyed on (date, portfolio_name, ticker)."""
+    def window_returns(
+        self, start, end=None,
+        scope: str = "portfolio",
+        keys: Optional[List[str]] = None,
+    ) -> pd.Series:
+        """Compounded return over [start, end] for every portfolio
+        (scope="portfolio") or ticker (scope="security"), indexed by name.
+
+        Two lookups per entity in the stored `cum_log_return` index (log of
+        the growth of $1 since inception): its last value on or before `end`
+        minus its last value before `start`, exponentiated. Rows written
+        before the column existed fall back to log1p(cum_return)."""
+        if scope == "portfolio":
+            path, key = self._daily_portfolio_metrics_path(), "portfolio_name"
+        elif scope == "security":
+            path, key = self._daily_security_metrics_path(), "ticker"
+        else:
+            raise ValueError(f"Unknown scope: {scope!r} (expected 'portfolio' or 'security')")
+        df = pd.read_parquet(path, columns=["date", key, "cum_return", "cum_log_return"])
+        if keys is not None and not df.empty:
+            df = df[df[key].isin(keys)]
+        if df.empty:
+            return pd.Series(dtype=float, name="window_return")
+
+        dates = pd.to_datetime(df["date"])
+        level = pd.to_numeric(df["cum_log_return"], errors="coerce").astype(float)
+        level = level.fillna(np.log1p(pd.to_numeric(df["cum_return"], errors="coerce").astype(float)))
+        df = pd.DataFrame({"date": dates, key: df[key], "level": level}).sort_values([key, "date"])
+
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end) if end is not None else df["date"].max()
+        at_end = df[df["date"] <= end].groupby(key)["level"].last()
+        before = df[df["date"] < start].groupby(key)["level"].last()
+        # No row before `start`: the window opens at inception (level 0).
+        base = before.reindex(at_end.index).fillna(0.0)
+        return np.expm1(at_end - base).rename("window_return")
+
+    def window_return(self, entity: str, start, end=None, scope: str = "portfolio") -> Optional[float]:
+        """Compounded return of one portfolio (or ticker) over [start, end];
+        None if it has no stored metrics by `end`."""
+        r = self.window_returns(start, end, scope=scope, keys=[entity])
+        if entity not in r.index or pd.isna(r[entity]):
+            return None
+        return float(r[entity])
+
+    def save_daily_attribution(self, df: pd.DataFrame, starts: Optional[dict] = None) -> None:
+        """Upsert daily attribution keyed on (date, portfolio_name, ticker).
+        Portfolios in `starts` are replaced from that date on (all rows when
+        None), so tickers they no longer hold drop out."""
+        if starts:
+            self._replace_portfolio_rows(self._daily_attribution_path(), None, starts, date_col="date")
         self._upsert_parquet(
             self._daily_attribution_path(), df, ["date", "portfolio_name", "ticker"],
         )
@@ -642,6 +1044,236 @@ class Database:
             df = df[pd.to_datetime(df["date"]) >= pd.to_datetime(start_date)]
         return df.reset_index(drop=True)
 
+    def get_attribution_state(self, scope: Optional[str] = None) -> pd.DataFrame:
+        """Carry state behind incremental attribution refreshes.
+
+        One row per (scope, key): scope is "portfolio" (key = portfolio name)
+        or "security" (key = ticker). `return_tail` is a JSON list of the
+        trailing daily returns needed to continue the rolling-vol window.
+        """
+        df = pd.read_parquet(self._attribution_state_path())
+        if scope is not None and not df.empty:
+            df = df[df["scope"] == scope]
+        if not df.empty:
+            df["last_date"] = pd.to_datetime(df["last_date"])
+        return df.reset_index(drop=True)
+
+    def save_attribution_state(self, df: pd.DataFrame) -> None:
+        """Upsert carry-state rows keyed on (scope, key)."""
+        self._upsert_parquet(self._attribution_state_path(), df, ["scope", "key"])
+
+    def delete_attribution_state(self, scope: str, keys: Optional[List[str]] = None) -> None:
+        """Drop carry state for `keys` (or the whole scope) — the next
+        incremental refresh then rebuilds those series from scratch."""
+        df = pd.read_parquet(self._attribution_state_path())
+        if df.empty:
+            return
+        mask = df["scope"] == scope
+        if keys is not None:
+            mask &= df["key"].isin(keys)
+        df[~mask].to_parquet(self._attribution_state_path(), index=False)
+
+    def _attribution_rollup_path(self, by: str) -> str:
+        if by == "sector":
+            return self._attribution_by_sector_path()
+        if by == "asset_type":
+            return self._attribution_by_asset_type_path()
+        raise ValueError(f"Unknown attribution rollup: {by!r} (expected 'sector' or 'asset_type')")
+
+    def save_attribution_rollup(self, by: str, df: pd.DataFrame, starts: Optional[dict] = None) -> None:
+        """Upsert a daily attribution rollup keyed on (date, portfolio_name, by),
+        where `by` is "sector" or "asset_type". Portfolios in `starts` are
+        replaced as in `save_daily_attribution`."""
+        if starts:
+            self._replace_portfolio_rows(self._attribution_rollup_path(by), None, starts, date_col="date")
+        self._upsert_parquet(self._attribution_rollup_path(by), df, ["date", "portfolio_name", by])
+
+    def get_attribution_rollup(
+        self, by: str,
+        portfolio_name: Optional[str] = None,
+        start_date: Optional[str] = None,
+    ) -> pd.DataFrame:
+        df = pd.read_parquet(self._attribution_rollup_path(by))
+        if portfolio_name is not None and not df.empty:
+            df = df[df["portfolio_name"] == portfolio_name]
+        if start_date is not None and not df.empty:
+            df = df[pd.to_datetime(df["date"]) >= pd.to_datetime(start_date)]
+        return df.reset_index(drop=True)
+
+    def save_attribution_contributors(self, df: pd.DataFrame, portfolio_names: List[str]) -> None:
+        """Replace the per-period contributor totals of `portfolio_names`.
+
+        Each refresh recomputes every period window for the portfolios it
+        touched, so their old rows are dropped wholesale — tickers that fell
+        out of a window don't linger."""
+        existing = pd.read_parquet(self._attribution_contributors_path())
+        if not existing.empty:
+            existing = existing[~existing["portfolio_name"].isin(portfolio_names)]
+        if df is not None and not df.empty:
+            existing = pd.concat([existing, df], ignore_index=True) if not existing.empty else df
+        existing.to_parquet(self._attribution_contributors_path(), index=False)
+
+    def get_attribution_contributors(
+        self, period: Optional[str] = None,
+        portfolio_name: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """Per-period linked contribution_to_return per (portfolio, ticker),
+        with `rank` 1 = largest contributor — top/bottom N is a head/tail away."""
+        df = pd.read_parquet(self._attribution_contributors_path())
+        if period is not None and not df.empty:
+            df = df[df["period"] == period]
+        if portfolio_name is not None and not df.empty:
+            df = df[df["portfolio_name"] == portfolio_name]
+        return df.reset_index(drop=True)
+
+    # ── Tax lots ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _replace_portfolio_rows(
+        path: str, df: Optional[pd.DataFrame], starts: dict, date_col: Optional[str] = None,
+    ) -> None:
+        """Drop the rows of every portfolio in `starts` — from its start date
+        on, or all of them when the start is None — and append `df`."""
+        existing = pd.read_parquet(path)
+        if not existing.empty:
+            drop = existing["portfolio_name"].isin(list(starts))
+            if date_col is not None:
+                start = pd.to_datetime(existing["portfolio_name"].map(starts))
+                drop &= start.isna() | (pd.to_datetime(existing[date_col]) >= start)
+            existing = existing[~drop]
+        if df is not None and not df.empty:
+            existing = pd.concat([existing, df], ignore_index=True) if not existing.empty else df
+        existing.to_parquet(path, index=False)
+
+    def save_tax_lots(self, df: pd.DataFrame, portfolio_names: List[str]) -> None:
+        """Replace the lots of `portfolio_names` (open and closed)."""
+        self._replace_portfolio_rows(self._tax_lots_path(), df, dict.fromkeys(portfolio_names))
+
+    def get_tax_lots(
+        self, portfolio_name: Optional[str] = None, open_only: bool = False,
+    ) -> pd.DataFrame:
+        """One row per tax lot. `lot_id` is the opening BUY's trade_id, or 0
+        for the undated legacy lot backing holdings with no trade history."""
+        df = pd.read_parquet(self._tax_lots_path())
+        if portfolio_name is not None and not df.empty:
+            df = df[df["portfolio_name"] == portfolio_name]
+        if open_only and not df.empty:
+            df = df[df["remaining_quantity"] > 1e-9]
+        if not df.empty:
+            df["open_date"] = pd.to_datetime(df["open_date"])
+        return df.reset_index(drop=True)
+
+    def save_realized_gains(self, df: pd.DataFrame, replace_portfolios: List[str]) -> None:
+        """Append lot closes; the rows of `replace_portfolios` are dropped first
+        (a rebuild), everything else is kept."""
+        self._replace_portfolio_rows(self._realized_gains_path(), df, dict.fromkeys(replace_portfolios))
+
+    def get_realized_gains(
+        self, portfolio_name: Optional[str] = None, start_date: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """One row per (SELL trade, lot) match, with `term` "short", "long"
+        or "unknown" (legacy lots have no open date)."""
+        df = pd.read_parquet(self._realized_gains_path())
+        if portfolio_name is not None and not df.empty:
+            df = df[df["portfolio_name"] == portfolio_name]
+        if start_date is not None and not df.empty:
+            df = df[pd.to_datetime(df["close_date"]) >= pd.to_datetime(start_date)]
+        return df.reset_index(drop=True)
+
+    def save_daily_pnl(self, df: pd.DataFrame, starts: dict) -> None:
+        """Replace each portfolio's daily P&L rows from its date in `starts`
+        on (all of them when None) — tickers sold out of the window drop out."""
+        self._replace_portfolio_rows(self._daily_pnl_path(), df, starts, date_col="date")
+
+    def get_daily_pnl(
+        self, portfolio_name: Optional[str] = None, start_date: Optional[str] = None,
+    ) -> pd.DataFrame:
+        df = pd.read_parquet(self._daily_pnl_path())
+        if portfolio_name is not None and not df.empty:
+            df = df[df["portfolio_name"] == portfolio_name]
+        if start_date is not None and not df.empty:
+            df = df[pd.to_datetime(df["date"]) >= pd.to_datetime(start_date)]
+        return df.reset_index(drop=True)
+
+    def get_tax_lot_state(self) -> pd.DataFrame:
+        """How far each portfolio's ledger has been matched into lots."""
+        df = pd.read_parquet(self._tax_lot_state_path())
+        if not df.empty:
+            df["last_trade_date"] = pd.to_datetime(df["last_trade_date"])
+        return df.reset_index(drop=True)
+
+    def save_tax_lot_state(self, df: pd.DataFrame) -> None:
+        """Upsert lot-matching state keyed on portfolio_name."""
+        self._upsert_parquet(self._tax_lot_state_path(), df, ["portfolio_name"])
+
+    # ── Change journal (dirty tracking for derived tables) ────────────────────
+
+    def _journal_change(self, entity: str, key: str, changed_from, source: str) -> None:
+        """Append one change: `entity` is "ticker" (prices) or "portfolio"
+        (positions / trades); `changed_from` is the earliest affected date,
+        or None when the whole history is affected."""
+        row = pd.DataFrame([{
+            "entity":       entity,
+            "key":          key,
+            "changed_from": pd.Timestamp(changed_from) if changed_from is not None else pd.NaT,
+            "source":       source,
+            "recorded_at":  pd.Timestamp.now(),
+        }])
+        with _JOURNAL_LOCK:
+            journal = pd.read_parquet(self._change_journal_path())
+            # Cursors remember ids whose rows were already pruned, so ids
+            # keep increasing across prunes.
+            row.insert(0, "change_id", self.latest_change_id() + 1)
+            journal = pd.concat([journal, row], ignore_index=True) if not journal.empty else row
+            journal.to_parquet(self._change_journal_path(), index=False)
+
+    def get_change_journal(self, since_id: Optional[int] = None) -> pd.DataFrame:
+        """Journal rows with change_id > `since_id` (all rows if None)."""
+        df = pd.read_parquet(self._change_journal_path())
+        if since_id is not None and not df.empty:
+            df = df[df["change_id"] > since_id]
+        if not df.empty:
+            df["changed_from"] = pd.to_datetime(df["changed_from"])
+        return df.reset_index(drop=True)
+
+    def latest_change_id(self) -> int:
+        """Highest change_id ever issued (0 if none)."""
+        journal = pd.read_parquet(self._change_journal_path(), columns=["change_id"])
+        cursors = pd.read_parquet(self._journal_cursors_path(), columns=["last_change_id"])
+        ids = [0]
+        if not journal.empty:
+            ids.append(int(journal["change_id"].max()))
+        if not cursors.empty:
+            ids.append(int(cursors["last_change_id"].max()))
+        return max(ids)
+
+    def get_journal_cursor(self, consumer: str) -> Optional[int]:
+        """Last change_id `consumer` has processed, or None if it never has."""
+        cursors = pd.read_parquet(self._journal_cursors_path())
+        row = cursors[cursors["consumer"] == consumer] if not cursors.empty else cursors
+        return None if row.empty else int(row["last_change_id"].iloc[0])
+
+    def advance_journal_cursor(self, consumer: str, change_id: int) -> None:
+        """Mark everything up to `change_id` as processed by `consumer`, then
+        drop journal rows every consumer has processed."""
+        with _JOURNAL_LOCK:
+            cursors = pd.read_parquet(self._journal_cursors_path())
+            if not cursors.empty:
+                cursors = cursors[cursors["consumer"] != consumer]
+            row = pd.DataFrame([{
+                "consumer": consumer, "last_change_id": int(change_id),
+                "updated_at": pd.Timestamp.now(),
+            }])
+            cursors = pd.concat([cursors, row], ignore_index=True) if not cursors.empty else row
+            cursors.to_parquet(self._journal_cursors_path(), index=False)
+
+            journal = pd.read_parquet(self._change_journal_path())
+            if not journal.empty:
+                done = int(cursors["last_change_id"].min())
+                journal[journal["change_id"] > done].to_parquet(
+                    self._change_journal_path(), index=False,
+                )
+
     # ── Production: scheduled job state + run log ─────────────────────────────
 
     def get_production_jobs(self) -> pd.DataFrame:
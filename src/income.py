@@ -0,0 +1,129 @@
+"""Vectorized income projection across portfolios.
+
+Holdings for the whole book are joined to the assets' income rate and
+payment frequency, and annual income is one column expression: quantity ×
+rate × frequency for Stock / ETF / Fund (rate in $ per share per payment),
+base value × rate / 100 for everything else (rate in annual %). A positions
+× 12 payment mask summed into portfolios with one indicator-matrix product
+gives the portfolio × month cash-flow calendar; each position's annual
+income is spread evenly over its payment months, so every row sums to the
+portfolio's annual income.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.models import Portfolio
+
+# income_rate is $ per share per payment for these types, annual % otherwise.
+RATE_IN_DOLLARS_TYPES = ("Stock", "ETF", "Fund")
+MONTHS = list(range(1, 13))
+
+POSITION_COLUMNS = [
+    "Portfolio", "Ticker", "Type", "Base Value", "Income Rate", "Income Rate Unit",
+    "Annual Income", "Monthly Income", "Payment Frequency", "Yield on Base (%)",
+]
+
+
+@dataclass(frozen=True)
+class IncomeProjection:
+    """`positions`: one row per position (POSITION_COLUMNS);
+    `annual`: annual income per portfolio; `calendar`: portfolios × months
+    (1–12) cash flow."""
+    positions: pd.DataFrame
+    annual: pd.Series
+    calendar: pd.DataFrame
+
+
+def payment_mask(frequency: np.ndarray) -> np.ndarray:
+    """Positions × 12 boolean mask of the calendar months each position pays
+    in: every (12 // frequency)-th month, ending in December."""
+    step = np.maximum(1, 12 // np.maximum(np.asarray(frequency, dtype=int), 1))
+    return (np.asarray(MONTHS)[None, :] % step[:, None]) == 0
+
+
+def project_income(
+    holdings: pd.DataFrame,
+    assets: pd.DataFrame,
+    latest_prices: Optional[Mapping[str, float]] = None,
+    portfolios: Optional[list[str]] = None,
+) -> IncomeProjection:
+    """Income for every holding in one pass.
+
+    `holdings`: portfolio_name, ticker, quantity, cost_basis.
+    `assets`: ticker, asset_type, income_rate, payment_frequency (tickers
+    missing from it earn nothing). Base value is quantity × latest price,
+    else × cost basis. `portfolios` fixes the row order of `annual` /
+    `calendar` (default: order of first appearance).
+    """
+    latest_prices = latest_prices or {}
+    names = portfolios if portfolios is not None else list(dict.fromkeys(holdings["portfolio_name"]))
+    attrs = assets.drop_duplicates("ticker", keep="last").set_index("ticker")
+    tickers = holdings["ticker"]
+
+    qty = holdings["quantity"].to_numpy(dtype=float)
+    price = pd.to_numeric(tickers.map(latest_prices), errors="coerce").to_numpy(dtype=float)
+    base = qty * np.where(np.isfinite(price), price, holdings["cost_basis"].to_numpy(dtype=float))
+    asset_type = tickers.map(attrs["asset_type"]).fillna("").astype(str).to_numpy()
+    rate = pd.to_numeric(tickers.map(attrs["income_rate"]), errors="coerce").fillna(0.0).to_numpy()
+    freq = pd.to_numeric(tickers.map(attrs["payment_frequency"]), errors="coerce").fillna(1).to_numpy()
+    freq = np.where(freq > 0, freq, 1).astype(int)
+
+    in_dollars = np.isin(asset_type, RATE_IN_DOLLARS_TYPES)
+    annual = np.where(in_dollars, qty * rate * freq, base * rate / 100.0)
+
+    positions = pd.DataFrame({
+        "Portfolio":         holdings["portfolio_name"].to_numpy(),
+        "Ticker":            tickers.to_numpy(),
+        "Type":              asset_type,
+        "Base Value":        base,
+        "Income Rate":       rate,
+        "Income Rate Unit":  np.where(in_dollars, "$/share/payment", "%"),
+        "Annual Income":     annual,
+        "Monthly Income":    annual / 12.0,
+        "Payment Frequency": freq,
+        "Yield on Base (%)": np.divide(annual * 100.0, base, out=np.zeros_like(base), where=base != 0),
+    }, columns=POSITION_COLUMNS)
+
+    # Positions × months cash flow, then portfolios × positions indicator.
+    mask = payment_mask(freq)
+    paying = np.where(annual > 0, annual, 0.0)
+    flows = mask * (paying / mask.sum(axis=1))[:, None]
+    row = pd.Index(names).get_indexer(holdings["portfolio_name"])
+    indicator = np.zeros((len(names), len(holdings)))
+    indicator[row[row >= 0], np.flatnonzero(row >= 0)] = 1.0
+    calendar = pd.DataFrame(indicator @ flows, index=pd.Index(names, name="portfolio_name"), columns=MONTHS)
+    return IncomeProjection(
+        positions=positions,
+        annual=pd.Series(indicator @ annual, index=calendar.index, name="annual_income"),
+        calendar=calendar,
+    )
+
+
+def portfolio_income(
+    portfolios: Iterable[Portfolio],
+    latest_prices: Optional[Mapping[str, float]] = None,
+) -> IncomeProjection:
+    """`project_income` for in-memory portfolios (saved, or synthesised like
+    a group's combined view), with the assets table taken from their
+    positions."""
+    portfolios = list(portfolios)
+    holdings = pd.DataFrame(
+        [(pf.name, p.asset.ticker, float(p.quantity), float(p.cost_basis))
+         for pf in portfolios for p in pf.positions],
+        columns=["portfolio_name", "ticker", "quantity", "cost_basis"],
+    )
+    # Compare on .value rather than the enum member — Streamlit hot-reload can
+    # re-import AssetType under a different class identity.
+    assets = pd.DataFrame(
+        [(p.asset.ticker, p.asset.asset_type.value,
+          float(getattr(p.asset, "income_rate", 0.0) or 0.0),
+          int(getattr(p.asset, "payment_frequency", 1) or 1))
+         for pf in portfolios for p in pf.positions],
+        columns=["ticker", "asset_type", "income_rate", "payment_frequency"],
+    )
+    return project_income(holdings, assets, latest_prices, portfolios=[pf.name for pf in portfolios])
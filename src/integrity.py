@@ -0,0 +1,305 @@
+"""Price-store integrity scanner and targeted gap repair.
+
+`PriceIntegrityScanner.scan()` loads the price store once as a dates ×
+tickers matrix and flags gaps (missing business days most other tickers
+traded), stale tickers, and return outliers (split-like jumps labelled as
+such). `repair()` saves the open issues, queues one re-fetch per affected
+range and drains the queue with `Collector.fetch_price_range`, so only the
+broken ranges are downloaded.
+
+Issues are keyed on (ticker, issue_type, issue_date); once re-fetched or
+acknowledged they are recorded in `price_issue_resolutions.parquet` and not
+reported again, and outlier checks only look at price dates the change
+journal shows as new since the previous scan.
+"""
+from __future__ import annotations
+
+from typing import Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.database import Database
+
+ISSUE_COLUMNS = ["ticker", "issue_type", "start_date", "end_date", "n_days", "detail"]
+RANGE_COLUMNS = ["ticker", "start_date", "end_date", "reason", "issue_type", "issue_date"]
+ISSUE_KEY = ["ticker", "issue_type", "start_date"]
+
+# Name this scanner's cursor is stored under in the change journal.
+JOURNAL_CONSUMER = "price_integrity"
+
+# Price ratios (new / old) that look like a split or reverse split.
+_SPLIT_RATIOS = np.array([1 / 10, 1 / 5, 1 / 4, 1 / 3, 1 / 2, 2, 3, 4, 5, 10], dtype=float)
+
+
+class PriceIntegrityScanner:
+    def __init__(
+        self,
+        db: Database,
+        stale_days: int = 5,
+        outlier_return: float = 0.25,
+        outlier_zscore: float = 12.0,
+        holiday_coverage: float = 0.2,
+        outlier_padding_days: int = 5,
+    ):
+        self.db = db
+        self.stale_days = stale_days
+        self.outlier_return = outlier_return
+        self.outlier_zscore = outlier_zscore
+        self.holiday_coverage = holiday_coverage
+        self.outlier_padding_days = outlier_padding_days
+
+    # ── Scan ──────────────────────────────────────────────────────────────────
+
+    def scan(
+        self,
+        tickers: Optional[list[str]] = None,
+        since: Optional[Mapping[str, pd.Timestamp]] = None,
+        include_resolved: bool = False,
+    ) -> pd.DataFrame:
+        """Return one row per detected issue (columns: ISSUE_COLUMNS).
+
+        `since` limits the outlier check to {ticker: first changed date};
+        tickers missing from it get none (None → every date). Issues already
+        resolved are dropped unless `include_resolved`.
+        """
+        stored = self.db.list_price_tickers()
+        tickers = [t for t in (tickers or stored) if t in set(stored)]
+        if not tickers:
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+
+        prices = self.db.get_historical_prices(tickers).sort_index()
+        prices = prices[~prices.index.duplicated(keep="last")]
+        if prices.empty:
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+
+        calendar = pd.bdate_range(prices.index.min(), prices.index.max())
+        wide = prices.reindex(calendar)
+        P = wide.to_numpy(dtype=float)
+        valid = np.isfinite(P)
+
+        # Each ticker is "live" from its first to its last stored price.
+        has_any = valid.any(axis=0)
+        first = np.where(has_any, valid.argmax(axis=0), len(calendar))
+        last = np.where(has_any, len(calendar) - 1 - valid[::-1].argmax(axis=0), -1)
+        rows = np.arange(len(calendar))[:, None]
+        live = (rows >= first) & (rows <= last)
+
+        # A business day most live tickers skipped is an exchange holiday.
+        live_count = live.sum(axis=1)
+        coverage = np.divide(
+            (valid & live).sum(axis=1), live_count,
+            out=np.zeros(len(calendar)), where=live_count > 0,
+        )
+        trading_day = coverage >= self.holiday_coverage
+
+        frames = [
+            self._gaps(live & ~valid & trading_day[:, None], calendar, wide.columns),
+            self._stale(last, calendar, trading_day, wide.columns),
+            self._outliers(prices, prices.columns, since),
+        ]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+        issues = pd.concat(frames, ignore_index=True)
+        if not include_resolved:
+            issues = self._unresolved(issues)
+        return issues[ISSUE_COLUMNS].sort_values(["ticker", "start_date"]).reset_index(drop=True)
+
+    def _unresolved(self, issues: pd.DataFrame) -> pd.DataFrame:
+        """Drop issues recorded in the resolutions store."""
+        resolved = self.db.get_resolved_price_issues()
+        if resolved.empty or issues.empty:
+            return issues
+        done = pd.MultiIndex.from_frame(resolved[["ticker", "issue_type", "issue_date"]])
+        keys = pd.MultiIndex.from_frame(
+            issues[ISSUE_KEY].assign(start_date=pd.to_datetime(issues["start_date"]))
+        )
+        return issues[~keys.isin(done)]
+
+    @staticmethod
+    def _gaps(missing: np.ndarray, calendar: pd.DatetimeIndex, columns) -> pd.DataFrame:
+        """Collapse a dates × tickers missing-mask into (start, end) runs."""
+        if not missing.any():
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+        padded = np.vstack([
+            np.zeros((1, missing.shape[1]), dtype=np.int8),
+            missing.astype(np.int8),
+            np.zeros((1, missing.shape[1]), dtype=np.int8),
+        ])
+        edges = np.diff(padded, axis=0)
+        # np.nonzero on the transpose walks ticker-major, so starts and ends
+        # pair up run by run.
+        start_col, start_row = np.nonzero(edges.T == 1)
+        _, end_row = np.nonzero(edges.T == -1)
+        end_row = end_row - 1
+        n_days = end_row - start_row + 1
+        return pd.DataFrame({
+            "ticker":     np.asarray(columns)[start_col],
+            "issue_type": "gap",
+            "start_date": calendar[start_row],
+            "end_date":   calendar[end_row],
+            "n_days":     n_days,
+            "detail":     [f"{n} missing business day(s)" for n in n_days],
+        })
+
+    def _stale(
+        self,
+        last: np.ndarray,
+        calendar: pd.DatetimeIndex,
+        trading_day: np.ndarray,
+        columns,
+    ) -> pd.DataFrame:
+        """Tickers whose last price lags the store's last trading day."""
+        trading_idx = np.cumsum(trading_day)  # trading-day ordinal per calendar row
+        end_ord = trading_idx[-1]
+        has_any = last >= 0
+        lag = np.where(has_any, end_ord - trading_idx[np.maximum(last, 0)], 0)
+        hit = has_any & (lag > self.stale_days)
+        if not hit.any():
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+        cols = np.asarray(columns)[hit]
+        last_dates = calendar[last[hit]]
+        return pd.DataFrame({
+            "ticker":     cols,
+            "issue_type": "stale",
+            "start_date": last_dates + pd.offsets.BDay(1),
+            "end_date":   pd.Timestamp.today().normalize(),
+            "n_days":     lag[hit],
+            "detail":     [f"last price {d.date()} ({n} trading days behind)"
+                           for d, n in zip(last_dates, lag[hit])],
+        })
+
+    def _outliers(
+        self,
+        prices: pd.DataFrame,
+        columns,
+        since: Optional[Mapping[str, pd.Timestamp]] = None,
+    ) -> pd.DataFrame:
+        """Returns beyond the absolute or robust-z threshold (per ticker),
+        on dates at or after `since[ticker]` when `since` is given. The
+        median / MAD still use the ticker's full history."""
+        # Return against the previous *stored* price, so the day after a gap
+        # is measured across the gap instead of vanishing.
+        rets = (prices / prices.ffill().shift(1) - 1.0).where(prices.notna())
+        med = rets.median()
+        mad = (rets - med).abs().median() * 1.4826
+        R = rets.to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.abs(R - med.to_numpy()) / np.where(mad.to_numpy() > 0, mad.to_numpy(), np.nan)
+        hit = np.isfinite(R) & ((np.abs(R) > self.outlier_return) | (z > self.outlier_zscore))
+        if since is not None:
+            cutoff = pd.to_datetime(pd.Series(columns, index=columns).map(since))
+            cutoff = cutoff.fillna(pd.Timestamp.max).to_numpy(dtype="datetime64[ns]")
+            hit &= prices.index.to_numpy(dtype="datetime64[ns]")[:, None] >= cutoff[None, :]
+        if not hit.any():
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+
+        row, col = np.nonzero(hit)
+        r = R[row, col]
+        ratio = 1.0 + r
+        split_like = (np.abs(ratio[:, None] / _SPLIT_RATIOS[None, :] - 1.0) < 0.03).any(axis=1)
+        dates = prices.index[row]
+        return pd.DataFrame({
+            "ticker":     np.asarray(columns)[col],
+            "issue_type": "outlier",
+            "start_date": dates,
+            "end_date":   dates,
+            "n_days":     1,
+            "detail":     [
+                f"{v:+.1%} daily return" + (" (split-like)" if s else "")
+                for v, s in zip(r, split_like)
+            ],
+        })
+
+    # ── Repair ────────────────────────────────────────────────────────────────
+
+    def refetch_ranges(self, issues: pd.DataFrame) -> pd.DataFrame:
+        """Turn issues into (ticker, start_date, end_date, reason) download
+        ranges. Split-like jumps re-pull everything up to the jump (the
+        whole pre-split history needs re-adjusting); other outliers re-pull
+        a few days either side; gaps and staleness re-pull exactly the hole."""
+        if issues.empty:
+            return pd.DataFrame(columns=RANGE_COLUMNS)
+        df = issues.copy()
+        df["start_date"] = pd.to_datetime(df["start_date"])
+        df["issue_date"] = df["start_date"]
+        df["end_date"] = pd.to_datetime(df["end_date"])
+        outlier = df["issue_type"] == "outlier"
+        split = outlier & df["detail"].str.contains("split-like", regex=False)
+        pad = pd.offsets.BDay(self.outlier_padding_days)
+        df.loc[outlier & ~split, "start_date"] = df.loc[outlier & ~split, "start_date"] - pad
+        df.loc[outlier, "end_date"] = df.loc[outlier, "end_date"] + pad
+        if split.any():
+            first_dates = self._first_price_dates(df.loc[split, "ticker"].unique().tolist())
+            df.loc[split, "start_date"] = df.loc[split, "ticker"].map(first_dates)
+        df["reason"] = df["issue_type"] + ": " + df["detail"]
+        return df[RANGE_COLUMNS].reset_index(drop=True)
+
+    def changed_since_last_scan(self) -> Optional[dict]:
+        """{ticker: earliest changed price date} journaled since the last
+        `repair`, or None if it never ran (scan every date)."""
+        cursor = self.db.get_journal_cursor(JOURNAL_CONSUMER)
+        if cursor is None:
+            return None
+        journal = self.db.get_change_journal(since_id=cursor)
+        if journal.empty:
+            return {}
+        prices = journal[journal["entity"] == "ticker"]
+        # NaT (whole history rewritten) sorts as "from the beginning".
+        return prices["changed_from"].fillna(pd.Timestamp.min).groupby(prices["key"]).min().to_dict()
+
+    def repair(self, fetch: bool = True) -> dict:
+        """Scan, persist issues, enqueue re-fetches, then drain the queue.
+
+        Outliers are only looked for on dates changed since the previous
+        run; completed re-fetches mark their issue resolved."""
+        journal_head = self.db.latest_change_id()
+        issues = self.scan(since=self.changed_since_last_scan())
+        # Outliers flagged earlier whose re-fetch hasn't succeeded yet stay open.
+        prior = self.db.get_price_issues("outlier")
+        if not prior.empty:
+            prior = self._unresolved(prior.reindex(columns=ISSUE_COLUMNS))
+            issues = (pd.concat([issues, prior], ignore_index=True)
+                      .assign(start_date=lambda d: pd.to_datetime(d["start_date"]),
+                              end_date=lambda d: pd.to_datetime(d["end_date"]))
+                      .drop_duplicates(ISSUE_KEY)
+                      .sort_values(["ticker", "start_date"]).reset_index(drop=True))
+        self.db.save_price_issues(issues)
+        enqueued = self.db.enqueue_price_refetch(self.refetch_ranges(issues))
+
+        repaired: list[str] = []
+        failed: list[str] = []
+        if fetch:
+            from src.collector import Collector  # local import to avoid circulars
+
+            collector = Collector(self.db)
+            pending = self.db.get_price_refetch_queue(status="pending")
+            for _, req in pending.iterrows():
+                label = f"{req['ticker']} {pd.Timestamp(req['start_date']).date()}→{pd.Timestamp(req['end_date']).date()}"
+                try:
+                    rows = collector.fetch_price_range(req["ticker"], req["start_date"], req["end_date"])
+                    status = "done" if rows else "empty"
+                    self.db.mark_price_refetch(int(req["request_id"]), status)
+                    if pd.notna(req.get("issue_type")):
+                        self.db.resolve_price_issues(
+                            req.to_frame().T, "repaired" if rows else "empty",
+                        )
+                    repaired.append(label)
+                except Exception as exc:
+                    self.db.mark_price_refetch(int(req["request_id"]), "failed", error=str(exc))
+                    failed.append(f"{label}: {exc}")
+
+        self.db.advance_journal_cursor(JOURNAL_CONSUMER, journal_head)
+        counts = issues["issue_type"].value_counts().to_dict() if not issues.empty else {}
+        return {
+            "issues":    {k: int(v) for k, v in counts.items()},
+            "enqueued":  enqueued,
+            "refetched": repaired,
+            "failed":    failed,
+        }
+
+    def _first_price_dates(self, tickers: list[str]) -> dict:
+        prices = self.db.get_historical_prices(tickers)
+        return {t: prices[t].first_valid_index() for t in tickers if t in prices.columns}
+
@@ -0,0 +1,142 @@
+"""Multi-period attribution linking.
+
+Summed daily `contribution_to_return` values don't reconcile with a
+window's compounded return; linking rescales them so per-ticker (or
+per-sector / asset-type) totals add up exactly, Σᵢ linkedᵢ = Π(1 + rₜ) − 1.
+
+* **Carino** — linkedᵢ = Σₜ cᵢₜ · kₜ / K with kₜ = ln(1 + rₜ) / rₜ and
+  K = ln(1 + R) / R. cᵢₜ · kₜ is stored per row as `log_contribution`, so
+  any window is a group-by sum.
+* **Frongello** — linkedᵢ = Σₜ cᵢₜ · Πₛ<ₜ (1 + rₛ).
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.database import Database
+
+LINK_METHODS = ("carino", "frongello")
+_LINK_KEYS = ("ticker", "sector", "asset_type")
+
+
+def carino_coefficients(returns) -> np.ndarray:
+    """kₜ = ln(1 + rₜ) / rₜ, with the limit k = 1 at rₜ = 0."""
+    r = np.asarray(returns, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = np.log1p(r) / r
+    return np.where(np.abs(r) < 1e-12, 1.0, k)
+
+
+def log_contributions(attr: pd.DataFrame) -> pd.Series:
+    """cᵢₜ · kₜ for every attribution row, where rₜ is the sum of that
+    portfolio's contributions on the row's date. The rows of one
+    (portfolio, date) must all be present. A missing contribution (a
+    security's first day) contributes 0."""
+    contrib = attr["contribution_to_return"].astype(float).fillna(0.0)
+    daily = contrib.groupby([attr["portfolio_name"], attr["date"]]).transform("sum")
+    return pd.Series(contrib.to_numpy() * carino_coefficients(daily), index=attr.index)
+
+
+def _frongello(attr: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """(per-row Πₛ<ₜ (1 + rₛ) within the window, compounded return per portfolio)."""
+    names = attr["portfolio_name"].to_numpy()
+    dates = pd.to_datetime(attr["date"]).to_numpy()
+    pairs = pd.MultiIndex.from_arrays([names, dates])
+    daily = (
+        pd.Series(attr["contribution_to_return"].to_numpy(dtype=float))
+        .groupby([names, dates]).sum().sort_index()
+    )
+    log_daily = np.log1p(daily)
+    cum_log = log_daily.groupby(level=0).cumsum()
+    growth_before = np.exp(cum_log - log_daily)
+    factors = pd.Series(growth_before.reindex(pairs).to_numpy(), index=attr.index)
+    return factors, np.expm1(cum_log.groupby(level=0).last())
+
+
+def frongello_contributions(attr: pd.DataFrame) -> pd.Series:
+    """Each row's contribution grown by its portfolio's compounded return
+    earlier in the window. Cumulative sums of these, per portfolio, track
+    the compounded return at every date — what a stacked cumulative
+    contribution chart should plot."""
+    if attr.empty:
+        return pd.Series(dtype=float, index=attr.index)
+    factors, _ = _frongello(attr)
+    return attr["contribution_to_return"].astype(float) * factors
+
+
+def link_contributions(
+    attr: pd.DataFrame, by: str = "ticker", method: str = "carino",
+) -> pd.DataFrame:
+    """Link the daily contributions in `attr` (already restricted to the
+    window) into one row per (portfolio_name, `by`).
+
+    Columns: portfolio_name, `by`, contribution_to_return (linked),
+    arithmetic_contribution (plain Σ), portfolio_return (compounded).
+    """
+    if method not in LINK_METHODS:
+        raise ValueError(f"Unknown linking method: {method!r} (expected one of {LINK_METHODS})")
+    cols = ["portfolio_name", by, "contribution_to_return", "arithmetic_contribution", "portfolio_return"]
+    if attr.empty:
+        return pd.DataFrame(columns=cols)
+
+    contrib = attr["contribution_to_return"].astype(float)
+    keys = [attr["portfolio_name"], attr[by]]
+
+    if method == "carino":
+        if "log_contribution" in attr.columns:
+            log_c = attr["log_contribution"].astype(float)
+            # Rows written before the column existed were migrated as null;
+            # a null next to a missing contribution is just a first day.
+            legacy = log_c.isna() & contrib.notna()
+            if legacy.any():
+                log_c = log_c.where(~legacy, log_contributions(attr))
+            log_c = log_c.fillna(0.0)
+        else:
+            log_c = log_contributions(attr)
+        log_growth = log_c.groupby(attr["portfolio_name"]).sum()
+        port_return = np.expm1(log_growth)
+        # R / ln(1 + R) = 1 / K, → 1 as R → 0.
+        scale = pd.Series(1.0 / carino_coefficients(port_return), index=log_growth.index)
+        linked = log_c.groupby(keys).sum()
+        linked = linked * scale.reindex(linked.index.get_level_values(0)).to_numpy()
+    else:
+        factors, port_return = _frongello(attr)
+        linked = (contrib * factors).groupby(keys).sum()
+
+    out = pd.DataFrame({"contribution_to_return": linked})
+    out["arithmetic_contribution"] = contrib.groupby(keys).sum()
+    out = out.reset_index()
+    out.columns = cols[:4]
+    out["portfolio_return"] = out["portfolio_name"].map(port_return)
+    return out[cols]
+
+
+def linked_attribution(
+    db: Database,
+    start,
+    end=None,
+    by: str = "ticker",
+    method: str = "carino",
+    portfolio_names: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """Exactly-additive contributions over [start, end] per (portfolio, `by`).
+
+    `by="ticker"` reads `daily_attribution`; `"sector"` and `"asset_type"`
+    read the much smaller daily rollup tables, which carry the same
+    `log_contribution` sums.
+    """
+    if by not in _LINK_KEYS:
+        raise ValueError(f"Unknown grouping: {by!r} (expected one of {_LINK_KEYS})")
+    start = pd.Timestamp(start)
+    if by == "ticker":
+        attr = db.get_daily_attribution(start_date=start.strftime("%Y-%m-%d"))
+    else:
+        attr = db.get_attribution_rollup(by, start_date=start.strftime("%Y-%m-%d"))
+    if portfolio_names is not None and not attr.empty:
+        attr = attr[attr["portfolio_name"].isin(portfolio_names)]
+    if end is not None and not attr.empty:
+        attr = attr[pd.to_datetime(attr["date"]) <= pd.Timestamp(end)]
+    return link_contributions(attr.reset_index(drop=True), by=by, method=method)
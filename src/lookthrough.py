@@ -0,0 +1,351 @@
+"""Sparse lookthrough engine shared by reporting, the app, agents and stress.
+
+`LookthroughEngine.operator()` builds one sparse matrix L (instruments ×
+underlying lines), resolving each instrument from its best source:
+
+1. `fund_holdings` (latest snapshot per fund) — vendor, ticker-level;
+2. `constituents` — user-defined composites, ticker-level;
+3. `fund_profiles` (latest snapshot per fund) — yfinance sector weightings
+   for the equity share plus Bond and Cash lines, negative components
+   clipped and the rest renormalised.
+
+L is cached per data version (the stores' file mtimes), so any portfolio's
+exposure is a sparse product of its value vector with L. Vendor and profile
+rows apply to ETF / Fund positions, constituents to any position.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.database import Database
+from src.models import Portfolio
+from src.scenarios import SECTOR_DISPLAY, normalize_sector
+
+FUND_TYPES = ("ETF", "Fund")
+LINE_COLUMNS = ["Ticker", "Name", "Type", "Sector", "sector_key", "Via", "Source"]
+ROW_COLUMNS = [
+    "Portfolio", "Ticker", "Name", "Type", "Sector", "Quantity", "Cost Basis", "Current Price",
+    "Total Cost", "Current Value", "P&L", "P&L %", "Via", "Source", "_synthetic",
+]
+
+# (data_dir, store mtimes, use_profiles) → LookthroughOperator
+_OPERATOR_CACHE: dict[tuple, "LookthroughOperator"] = {}
+OPERATOR_CACHE_SIZE = 8
+
+# yfinance asset-class keys → clipped component; everything but bond / cash is equity.
+_ASSET_CLASS_KEYS = {
+    "stockPosition": "equity", "preferredPosition": "equity", "convertiblePosition": "equity",
+    "otherPosition": "equity", "bondPosition": "bond", "cashPosition": "cash",
+}
+
+
+@dataclass(frozen=True)
+class LookthroughOperator:
+    """`matrix` is instruments × lines (CSR); row i holds instrument i's
+    weights on the `lines` it decomposes into. `source` maps each
+    instrument to vendor / constituents / yfinance."""
+    instruments: pd.Index
+    lines: pd.DataFrame
+    matrix: sparse.csr_matrix
+    source: pd.Series
+
+    def rows(self, tickers: Iterable[str], asset_types: Iterable[str]) -> np.ndarray:
+        """Operator row for each (ticker, asset type) position, or −1 where
+        it stays native: vendor / profile rows only apply to ETF / Fund
+        positions, constituents to any."""
+        tickers, asset_types = list(tickers), np.asarray(list(asset_types), dtype=object)
+        row = self.instruments.get_indexer(tickers)
+        if not len(self.instruments):
+            return row
+        source = self.source.to_numpy()[np.maximum(row, 0)]
+        applies = np.isin(asset_types, FUND_TYPES) | (source == "constituents")
+        return np.where((row >= 0) & applies, row, -1)
+
+
+def _clean(values: pd.Series, default: str) -> pd.Series:
+    out = values.astype("string").str.strip()
+    return out.mask(out.isna() | (out == ""), default).astype(object)
+
+
+def _sector_key(sectors: pd.Series) -> pd.Series:
+    return sectors.map(lambda s: normalize_sector(s) if isinstance(s, str) else None)
+
+
+class LookthroughEngine:
+    def __init__(self, db: Database):
+        self.db = db
+
+    # ── Operator ──────────────────────────────────────────────────────────────
+
+    def version(self, use_profiles: bool = True) -> tuple:
+        """Cache key of the current data version: the four stores' mtimes."""
+        paths = (self.db._assets_path(), self.db._constituents_path(),
+                 self.db._fund_holdings_path(), self.db._fund_profiles_path())
+        return (self.db.data_dir, tuple(os.stat(p).st_mtime_ns for p in paths), use_profiles)
+
+    def operator(self, use_profiles: bool = True) -> LookthroughOperator:
+        """The instruments × lines operator for the current data version.
+        `use_profiles=False` leaves profile-only funds as native rows."""
+        key = self.version(use_profiles)
+        hit = _OPERATOR_CACHE.get(key)
+        if hit is None:
+            hit = self._build(use_profiles)
+            _OPERATOR_CACHE[key] = hit
+            while len(_OPERATOR_CACHE) > OPERATOR_CACHE_SIZE:
+                _OPERATOR_CACHE.pop(next(iter(_OPERATOR_CACHE)))
+        return hit
+
+    def _build(self, use_profiles: bool) -> LookthroughOperator:
+        assets = self.db.get_all_assets().drop_duplicates("ticker", keep="last").set_index("ticker")
+        parts = [self._vendor_lines(), self._constituent_lines(assets)]
+        if use_profiles:
+            parts.append(self._profile_lines())
+
+        # Each instrument keeps only its highest-fidelity source.
+        taken: set[str] = set()
+        kept = []
+        for part in parts:
+            part = part[~part["Via"].isin(taken)]
+            taken.update(part["Via"])
+            kept.append(part)
+        lines = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame()
+        if lines.empty:
+            lines = pd.DataFrame(columns=LINE_COLUMNS + ["weight"])
+
+        instruments = pd.Index(pd.unique(lines["Via"]), name="instrument")
+        rows = instruments.get_indexer(lines["Via"])
+        matrix = sparse.csr_matrix(
+            (lines["weight"].to_numpy(dtype=float), (rows, np.arange(len(lines)))),
+            shape=(len(instruments), len(lines)),
+        )
+        source = lines.groupby("Via", sort=False)["Source"].first().reindex(instruments)
+        return LookthroughOperator(
+            instruments=instruments,
+            lines=lines[LINE_COLUMNS].reset_index(drop=True),
+            matrix=matrix,
+            source=source,
+        )
+
+    def _vendor_lines(self) -> pd.DataFrame:
+        df = pd.read_parquet(self.db._fund_holdings_path())
+        if df.empty:
+            return pd.DataFrame(columns=LINE_COLUMNS + ["weight"])
+        df = df[df["as_of_date"] == df.groupby("fund_ticker")["as_of_date"].transform("max")]
+        ticker = _clean(df["holding_ticker"], "—")
+        sector = _clean(df["sector"], "Unknown")
+        return pd.DataFrame({
+            "Ticker":     ticker,
+            "Name":       _clean(df["holding_name"], "").mask(lambda s: s == "", ticker),
+            "Type":       _clean(df["asset_type"], "Stock"),
+            "Sector":     sector,
+            "sector_key": _sector_key(sector),
+            "Via":        df["fund_ticker"],
+            "Source":     "vendor",
+            "weight":     pd.to_numeric(df["weight"], errors="coerce").fillna(0.0),
+        }).reset_index(drop=True)
+
+    def _constituent_lines(self, assets: pd.DataFrame) -> pd.DataFrame:
+        df = pd.read_parquet(self.db._constituents_path())
+        if df.empty:
+            return pd.DataFrame(columns=LINE_COLUMNS + ["weight"])
+        ticker = df["constituent_ticker"].astype(str)
+        known = ticker.isin(assets.index)
+        sector = _clean(ticker.map(assets["sector"]).where(known), "Unknown")
+        return pd.DataFrame({
+            "Ticker":     ticker,
+            "Name":       _clean(ticker.map(assets["name"]).where(known), "").mask(lambda s: s == "", ticker),
+            "Type":       _clean(ticker.map(assets["asset_type"]).where(known), "Stock"),
+            "Sector":     sector,
+            "sector_key": _sector_key(sector),
+            "Via":        df["parent_ticker"],
+            "Source":     "constituents",
+            "weight":     pd.to_numeric(df["weight"], errors="coerce").fillna(0.0),
+        }).reset_index(drop=True)
+
+    def _profile_lines(self) -> pd.DataFrame:
+        df = pd.read_parquet(self.db._fund_profiles_path())
+        if df.empty:
+            return pd.DataFrame(columns=LINE_COLUMNS + ["weight"])
+        df = df[df["as_of_date"] == df.groupby("fund_ticker")["as_of_date"].transform("max")]
+        funds = pd.Index(pd.unique(df["fund_ticker"]))
+
+        classes = df[df["category"] == "asset_class"]
+        comp = (
+            classes["weight"].clip(lower=0.0)
+            .groupby([classes["fund_ticker"], classes["key"].map(_ASSET_CLASS_KEYS).fillna("equity")]).sum()
+            .unstack().reindex(index=funds, columns=["equity", "bond", "cash"]).fillna(0.0)
+        )
+        total = comp.sum(axis=1)
+        comp = comp.div(total.where(total > 0), axis=0)
+        sectors = df[(df["category"] == "sector") & (df["weight"] > 0)]
+        has_sectors = funds.isin(sectors["fund_ticker"])
+        # Sector weights but no asset classes → all equity.
+        comp.loc[(total <= 0).to_numpy() & has_sectors, "equity"] = 1.0
+        comp = comp.fillna(0.0)
+
+        sw_total = sectors.groupby("fund_ticker")["weight"].transform("sum")
+        key = _sector_key(sectors["key"])
+        label = [SECTOR_DISPLAY[k] if k else str(raw).replace("_", " ").title()
+                 for k, raw in zip(key, sectors["key"])]
+        via = sectors["fund_ticker"].to_numpy()
+        sector_lines = pd.DataFrame({
+            "Ticker":     [f"{f} → {l}" for f, l in zip(via, label)],
+            "Name":       [f"{l} (via {f})" for f, l in zip(via, label)],
+            "Type":       "Stock",
+            "Sector":     label,
+            "sector_key": key.to_numpy(),
+            "Via":        via,
+            "weight":     comp["equity"].reindex(via).to_numpy() * (sectors["weight"] / sw_total).to_numpy(),
+        })
+
+        blocks = [sector_lines]
+        no_sectors = funds[~has_sectors]
+        for part, atype, sector, label in (
+            ("equity", "Stock", "Unknown", "Equity"),
+            ("bond", "Bond", "Fixed Income", "Bond"),
+            ("cash", "Cash", "Cash", "Cash"),
+        ):
+            owners = no_sectors if part == "equity" else funds
+            w = comp.loc[owners, part]
+            w = w[w > 0]
+            name = "Equity" if part == "equity" else f"{label} portion"
+            blocks.append(pd.DataFrame({
+                "Ticker":     [f"{f} → {label}" for f in w.index],
+                "Name":       [f"{name} (via {f})" for f in w.index],
+                "Type":       atype,
+                "Sector":     sector,
+                "sector_key": None,
+                "Via":        w.index.to_numpy(),
+                "weight":     w.to_numpy(),
+            }))
+        lines = pd.concat(blocks, ignore_index=True)
+        lines = lines[lines["weight"] > 0]
+        # Keep each fund's lines together, in fund order.
+        lines = lines.iloc[np.argsort(funds.get_indexer(lines["Via"]), kind="stable")]
+        return lines.assign(Source="yfinance").reset_index(drop=True)
+
+    # ── Portfolios ────────────────────────────────────────────────────────────
+
+    def _positions(
+        self,
+        portfolios: Iterable[Portfolio],
+        latest_prices: Optional[Mapping[str, float]],
+    ) -> pd.DataFrame:
+        """One row per position with its native row fields and dollar values."""
+        latest_prices = latest_prices or {}
+        rows = []
+        for pf in portfolios:
+            for pos in pf.positions:
+                price = latest_prices.get(pos.asset.ticker)
+                if price is not None and isinstance(price, float) and np.isnan(price):
+                    price = None
+                rows.append((
+                    pf.name, pos.asset.ticker, pos.asset.name or "", pos.asset.asset_type.value,
+                    pos.asset.sector or "—", pos.quantity, pos.cost_basis,
+                    None if price is None else float(price),
+                ))
+        pos = pd.DataFrame(rows, columns=["Portfolio", "Ticker", "Name", "Type", "Sector",
+                                          "Quantity", "Cost Basis", "Current Price"])
+        pos["Total Cost"] = pos["Quantity"] * pos["Cost Basis"]
+        pos["Current Value"] = np.where(pos["Current Price"].notna(),
+                                        pos["Quantity"] * pos["Current Price"].astype(float),
+                                        pos["Total Cost"])
+        pos["P&L"] = pos["Current Value"] - pos["Total Cost"]
+        return pos
+
+    def expand(
+        self,
+        portfolios: Iterable[Portfolio],
+        latest_prices: Optional[Mapping[str, float]] = None,
+        lookthrough: bool = True,
+        use_profiles: bool = True,
+    ) -> pd.DataFrame:
+        """Display rows (ROW_COLUMNS) for every position, each looked-through
+        position replaced inline by its lines. Dollar columns are split by
+        line weight; share-level fields are None on synthetic rows."""
+        pos = self._positions(portfolios, latest_prices)
+        if pos.empty:
+            return pd.DataFrame(columns=ROW_COLUMNS)
+        pos["P&L %"] = [pnl / cost * 100 if cost else None for pnl, cost in zip(pos["P&L"], pos["Total Cost"])]
+        pos["Via"], pos["Source"], pos["_synthetic"] = "", "native", False
+
+        op = self.operator(use_profiles)
+        row = op.rows(pos["Ticker"], pos["Type"]) if lookthrough else np.full(len(pos), -1)
+        through = np.flatnonzero(row >= 0)
+        native = pos.drop(index=through).assign(_order=np.flatnonzero(row < 0))
+
+        # Gather each looked-through position's CSR row: positions repeated by nnz.
+        M = op.matrix[row[through]].tocoo()
+        k = through[M.row]
+        lines = op.lines.iloc[M.col].reset_index(drop=True)
+        w = M.data
+        synth = pd.DataFrame({
+            "Portfolio":     pos["Portfolio"].to_numpy()[k],
+            "Ticker":        lines["Ticker"], "Name": lines["Name"],
+            "Type":          lines["Type"], "Sector": lines["Sector"],
+            "Quantity":      None, "Cost Basis": None, "Current Price": None,
+            "Total Cost":    pos["Total Cost"].to_numpy()[k] * w,
+            "Current Value": pos["Current Value"].to_numpy()[k] * w,
+            "P&L":           pos["P&L"].to_numpy()[k] * w,
+            "P&L %":         pos["P&L %"].to_numpy()[k],
+            "Via":           lines["Via"], "Source": lines["Source"],
+            "_synthetic":    True,
+            "_order":        k,
+        })
+        out = pd.concat([native, synth], ignore_index=True) if len(synth) else native
+        out = out.sort_values("_order", kind="stable")
+        return out[ROW_COLUMNS].reset_index(drop=True)
+
+    def exposure(
+        self,
+        portfolios: Iterable[Portfolio],
+        latest_prices: Optional[Mapping[str, float]] = None,
+        by: Iterable[str] = ("Type", "Sector"),
+        value: str = "Current Value",
+        lookthrough: bool = True,
+        use_profiles: bool = True,
+    ) -> pd.DataFrame:
+        """`value` ("Current Value" or "Total Cost") grouped by `by` line
+        attributes, one column per portfolio: V · L for looked-through
+        positions (V = portfolios × instruments, sparse) plus native rows."""
+        portfolios = list(portfolios)
+        by = list(by)
+        names = [pf.name for pf in portfolios]
+        pos = self._positions(portfolios, latest_prices)
+        if pos.empty:
+            return pd.DataFrame(columns=names, index=pd.MultiIndex.from_tuples([], names=by), dtype=float)
+
+        op = self.operator(use_profiles)
+        row = op.rows(pos["Ticker"], pos["Type"]) if lookthrough else np.full(len(pos), -1)
+        through = row >= 0
+        pf_idx = pd.Index(names).get_indexer(pos["Portfolio"])
+        V = sparse.csr_matrix(
+            (pos[value].to_numpy(dtype=float)[through], (pf_idx[through], row[through])),
+            shape=(len(names), len(op.instruments)),
+        )
+        line_values = pd.DataFrame((V @ op.matrix).T.toarray(), columns=names)   # lines × portfolios
+        line_values = pd.concat([op.lines[by], line_values], axis=1)
+        line_values = line_values[line_values[names].to_numpy().any(axis=1)]
+
+        native = pos.loc[~through, by + ["Portfolio", value]]
+        native = native.pivot_table(index=by, columns="Portfolio", values=value, aggfunc="sum")
+        grouped = pd.concat([line_values.groupby(by)[names].sum(), native]).groupby(level=by).sum()
+        return grouped.reindex(columns=names, fill_value=0.0).fillna(0.0)
+
+    def sources(self, portfolios: Iterable[Portfolio], use_profiles: bool = True) -> dict[str, list[str]]:
+        """{source: sorted instrument tickers} for the positions in
+        `portfolios` that lookthrough would decompose."""
+        pos = self._positions(portfolios, None)
+        op = self.operator(use_profiles)
+        row = op.rows(pos["Ticker"], pos["Type"])
+        held = pos["Ticker"].to_numpy()[row >= 0]
+        out: dict[str, list[str]] = {"vendor": [], "constituents": [], "yfinance": []}
+        for ticker in sorted(set(held)):
+            out[op.source[ticker]].append(ticker)
+        return out
@@ -14,15 +14,21 @@ Wiring options:
 from __future__ import annotations
 
 import json
+import os
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Callable, Optional
 
 import pandas as pd
 
 from src.attribution import AttributionEngine
+from src.betas import SectorBetaEngine
 from src.collector import Collector
+from src.covariance import CovarianceEngine
 from src.database import Database
+from src.integrity import PriceIntegrityScanner
+from src.taxlots import TaxLotEngine
 
 
 # ── Built-in jobs ─────────────────────────────────────────────────────────────
@@ -32,32 +38,89 @@ def _collect_prices_job(db: Database) -> dict:
     return {"action": "Pulled trailing-month prices for every asset in the master."}
 
 
-def _refresh_attribution_job(db: Database) -> dict:
-    return AttributionEngine(db).refresh_all()
+# Process-pool size for the nightly attribution refresh (one per core, capped).
+ATTRIBUTION_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+
+def _refresh_attribution_job(db: Database, workers: int = ATTRIBUTION_WORKERS) -> dict:
+    return AttributionEngine(db).refresh_all(workers=workers)
+
+
+def _refresh_tax_lots_job(db: Database) -> dict:
+    # Matches only trades recorded since the last run against the stored
+    # open lots, then extends daily_pnl to the new price dates.
+    return TaxLotEngine(db).refresh()
+
+
+def _refresh_covariance_job(db: Database) -> dict:
+    # Folds only the return days since the last snapshot into the EWMA sums
+    # (full rebuild on a universe change or back-dated price correction).
+    return CovarianceEngine(db).refresh()
 
 
 def _refresh_sector_betas_job(db: Database) -> dict:
-    betas = Collector.fetch_sector_betas(years=20)
-    db.save_sector_betas(betas)
-    return {"betas_rows": len(betas), "as_of": pd.Timestamp.today().date().isoformat()}
+    # Folds only the new return days into the stored running sums (and drops
+    # the days that left the 20y window) — see SectorBetaEngine.
+    return SectorBetaEngine(db).refresh(years=20)
 
 
-def _refresh_fund_profiles_job(db: Database) -> dict:
+# Profiles younger than this are left alone by the weekly refresh (e.g. one
+# just fetched by hand from the Lookthrough tab).
+FUND_PROFILE_MAX_AGE_DAYS = 7
+FUND_PROFILE_WORKERS = 8
+
+
+def _refresh_fund_profiles_job(
+    db: Database,
+    max_age_days: float = FUND_PROFILE_MAX_AGE_DAYS,
+    max_workers: int = FUND_PROFILE_WORKERS,
+) -> dict:
     assets = db.get_all_assets()
     if assets.empty:
-        return {"refreshed": [], "failed": [], "note": "No assets in the master."}
+        return {"refreshed": [], "skipped": [], "failed": [], "note": "No assets in the master."}
     fund_tickers = assets.loc[assets["asset_type"].isin(["ETF", "Fund"]), "ticker"].tolist()
-    today = pd.Timestamp.today().date().isoformat()
-    refreshed: list[str] = []
-    failed: list[str] = []
+    today = pd.Timestamp.today().normalize()
+
+    latest = db.latest_fund_profile_dates()
+    skipped: list[str] = []
+    due: list[str] = []
     for t in fund_tickers:
-        try:
-            prof = Collector(db).fetch_fund_profile(t)
-            db.save_fund_profile(t, today, prof["asset_classes"], prof["sector_weightings"])
-            refreshed.append(t)
-        except Exception as exc:
-            failed.append(f"{t}: {exc}")
-    return {"refreshed": refreshed, "failed": failed}
+        as_of = latest.get(t)
+        if as_of is not None and (today - pd.Timestamp(as_of)).days < max_age_days:
+            skipped.append(t)
+        else:
+            due.append(t)
+
+    # yfinance calls are network-bound, so threads overlap the waits.
+    collector = Collector(db)
+    profiles: dict[str, dict] = {}
+    failed: list[str] = []
+    if due:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(due)))) as pool:
+            futures = {pool.submit(collector.fetch_fund_profile, t): t for t in due}
+            for fut in as_completed(futures):
+                t = futures[fut]
+                try:
+                    profiles[t] = fut.result()
+                except Exception as exc:
+                    failed.append(f"{t}: {exc}")
+
+    # One read-modify-write of fund_profiles.parquet for the whole batch.
+    db.save_fund_profiles(profiles, today.date().isoformat())
+    refreshed = [t for t in due if t in profiles]
+    return {
+        "refreshed": refreshed,
+        "skipped":   skipped,
+        "failed":    sorted(failed),
+        "counts":    {"refreshed": len(refreshed), "skipped": len(skipped), "failed": len(failed)},
+    }
+
+
+def _scan_price_integrity_job(db: Database) -> dict:
+    # Flags gaps / stale tickers across the price store and outlier returns
+    # on dates changed since the last run, then re-fetches only the affected
+    # date ranges that haven't already been re-fetched.
+    return PriceIntegrityScanner(db).repair()
 
 
 JobCallable = Callable[[Database], dict]
@@ -69,15 +132,30 @@ JOB_REGISTRY: dict[str, dict[str, Any]] = {
         "interval_minutes": 60 * 24,           # daily
         "description":      "Fetch latest yfinance prices for every tracked ticker.",
     },
+    "scan_price_integrity": {
+        "callable":         _scan_price_integrity_job,
+        "interval_minutes": 60 * 24,           # daily
+        "description":      "Scan the price store for gaps, stale tickers and outliers; re-fetch affected ranges.",
+    },
     "refresh_attribution": {
         "callable":         _refresh_attribution_job,
         "interval_minutes": 60 * 24,           # daily
         "description":      "Recompute daily security / portfolio / attribution metrics.",
     },
+    "refresh_tax_lots": {
+        "callable":         _refresh_tax_lots_job,
+        "interval_minutes": 60 * 24,           # daily
+        "description":      "Match new trades into FIFO / specific-ID tax lots; update daily realized / unrealized P&L.",
+    },
+    "refresh_covariance": {
+        "callable":         _refresh_covariance_job,
+        "interval_minutes": 60 * 24,           # daily
+        "description":      "Fold the new return days into the EWMA covariance and write a dated snapshot.",
+    },
     "refresh_sector_betas": {
         "callable":         _refresh_sector_betas_job,
         "interval_minutes": 60 * 24 * 7,       # weekly
-        "description":      "Rebuild the 20-year SPDR sector-ETF beta matrix.",
+        "description":      "Roll the 20-year SPDR sector-ETF beta matrix forward from stored running sums.",
     },
     "refresh_fund_profiles": {
         "callable":         _refresh_fund_profiles_job,
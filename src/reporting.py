@@ -1,39 +1,24 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict
-from src.models import Portfolio, AssetType
+from src.models import Portfolio
 from src.database import Database
+from src.covariance import CovarianceEngine
+from src.income import portfolio_income
+from src.lookthrough import LookthroughEngine
+from src.risk import RiskEngine
+from src.stress import StressEngine, scenario_matrix
 
 class ReportingEngine:
     def __init__(self, db: Database):
         self.db = db
 
-    def get_portfolio_exposure(self, portfolio: Portfolio) -> pd.DataFrame:
-        """Returns exposure by AssetType, Sector, and Currency."""
-        data = []
-        for pos in portfolio.positions:
-            base_value = pos.quantity * pos.cost_basis  # For exposure we might want current price, but cost basis is a start
-            
-            # Aggregate based on asset properties
-            # If look-through is needed, this would expand the constituents here
-            if pos.asset.is_composite():
-                for c in pos.asset.constituents:
-                    data.append({
-                        "Ticker": c.ticker,
-                        "Type": "Constituent",
-                        "Sector": "Look-through",
-                        "Weight": c.weight * base_value
-                    })
-            else:
-                data.append({
-                    "Ticker": pos.asset.ticker,
-                    "Type": pos.asset.asset_type.value,
-                    "Sector": pos.asset.sector,
-                    "Weight": base_value
-                })
-        
-        df = pd.DataFrame(data)
-        return df.groupby(["Type", "Sector"]).sum()
+    def get_portfolio_exposure(self, portfolio: Portfolio, latest_prices: Dict[str, float] = None) -> pd.DataFrame:
+        """Exposure by (Type, Sector) after lookthrough, in a "Weight" column of
+        dollar values — quantity × latest price, else × cost basis. See
+        `LookthroughEngine` for how funds and composites are decomposed."""
+        exposure = LookthroughEngine(self.db).exposure([portfolio], latest_prices)
+        return exposure.iloc[:, 0].rename("Weight").to_frame()
 
     def calculate_returns(self, tickers: List[str], start_date: str = None) -> pd.DataFrame:
         prices = self.db.get_historical_prices(tickers, start_date)
@@ -62,28 +47,31 @@ class ReportingEngine:
         return np.percentile(sim_returns, (1 - confidence_level) * 100)
 
     def get_portfolio_risk_metrics(self, portfolio: Portfolio) -> Dict:
-        tickers = [p.asset.ticker for p in portfolio.positions]
-        returns = self.calculate_returns(tickers)
-
-        # Portfolio returns (weighted)
-        weights = np.array([p.quantity * p.cost_basis for p in portfolio.positions])
-        weights /= weights.sum()
-
-        port_returns = returns.dot(weights)
-
-        volatility = port_returns.std() * np.sqrt(252)  # Annualized
-        hist_var = self.calculate_historical_var(port_returns)
-        mc_var = self.calculate_monte_carlo_var(port_returns)
+        """Volatility, VaR and CVaR of `portfolio` on market-value weights.
 
-        cov_matrix = returns.cov() * 252  # Annualized covariance
+        A one-portfolio call into `RiskEngine.portfolio_risk`; for many
+        portfolios call that directly so they share one returns load. The
+        covariance matrix is the shared EWMA snapshot, annualised.
+        """
+        risk = RiskEngine(self.db)
+        tickers = [p.asset.ticker for p in portfolio.positions]
+        row = risk.portfolio_risk([portfolio], (0.95,)).iloc[0]
 
         return {
-            "Volatility": volatility,
-            "Historical VaR (95%)": hist_var,
-            "Monte Carlo VaR (95%)": mc_var,
-            "Covariance Matrix": cov_matrix
+            "Volatility": row["volatility"],
+            "Historical VaR (95%)": row["var_95"],
+            "Parametric VaR (95%)": row["parametric_var_95"],
+            "CVaR (95%)": row["cvar_95"],
+            "Covariance Matrix": CovarianceEngine(self.db).covariance(sorted(set(tickers)), annualize=True),
         }
 
+    def get_var_decomposition(self, portfolio: Portfolio, confidence: float = 0.95) -> pd.DataFrame:
+        """Per-position marginal / component VaR and % contribution to risk
+        (parametric and historical), indexed by ticker. See
+        `RiskEngine.var_contributions`."""
+        contrib = RiskEngine(self.db).var_contributions([portfolio], confidence)
+        return contrib.drop(columns="portfolio_name").set_index("ticker")
+
     def compute_portfolio_income(
         self,
         portfolio: Portfolio,
@@ -103,40 +91,7 @@ class ReportingEngine:
           Ticker, Type, Base Value, Income Rate, Income Rate Unit,
           Annual Income, Monthly Income, Payment Frequency, Yield on Base (%).
         """
-        latest_prices = latest_prices or {}
-        # Compare on .value rather than the enum member — Streamlit hot-reload
-        # can re-import AssetType under a different class identity, which makes
-        # `enum_member in (AssetType.X, …)` return False for genuine matches.
-        rate_in_dollars_vals = {"Stock", "ETF", "Fund"}
-        rows = []
-        for pos in portfolio.positions:
-            price = latest_prices.get(pos.asset.ticker)
-            if price is None or (isinstance(price, float) and np.isnan(price)):
-                base_value = pos.quantity * pos.cost_basis
-            else:
-                base_value = pos.quantity * float(price)
-            rate = float(getattr(pos.asset, "income_rate", 0.0) or 0.0)
-            freq = int(getattr(pos.asset, "payment_frequency", 1) or 1)
-
-            if pos.asset.asset_type.value in rate_in_dollars_vals:
-                annual = pos.quantity * rate * freq
-                unit = "$/share/payment"
-            else:
-                annual = base_value * rate / 100.0
-                unit = "%"
-
-            rows.append({
-                "Ticker": pos.asset.ticker,
-                "Type": pos.asset.asset_type.value,
-                "Base Value": base_value,
-                "Income Rate": rate,
-                "Income Rate Unit": unit,
-                "Annual Income": annual,
-                "Monthly Income": annual / 12.0,
-                "Payment Frequency": freq,
-                "Yield on Base (%)": (annual / base_value * 100.0) if base_value else 0.0,
-            })
-        return pd.DataFrame(rows)
+        return portfolio_income([portfolio], latest_prices).positions.drop(columns="Portfolio")
 
     def compute_sector_stress(
         self,
@@ -154,83 +109,21 @@ class ReportingEngine:
             for the bond portion (asset_classes also from fund_profiles)
           - Bond / Cash / Crypto: non_equity_shocks[asset_type]
 
+        A one-column run of `StressEngine` — use `StressEngine.scenario_pnl`
+        to evaluate many shock sets at once.
+
         Returns a DataFrame with one row per position:
           Ticker, Type, Base Value, Shock %, New Value, Change $, Source
         """
-        from src.scenarios import normalize_sector
-
-        latest_prices = latest_prices or {}
-        avg_sector = (sum(sector_shocks.values()) / len(sector_shocks)) if sector_shocks else 0.0
-        rows = []
-
-        for pos in portfolio.positions:
-            ticker = pos.asset.ticker
-            at = pos.asset.asset_type
-            at_val = at.value
-            price = latest_prices.get(ticker)
-            if price is None or (isinstance(price, float) and np.isnan(price)):
-                base_value = pos.quantity * pos.cost_basis
-            else:
-                base_value = pos.quantity * float(price)
-
-            if at_val in ("ETF", "Fund"):
-                profile = self.db.get_fund_profile(ticker)
-                asset_classes = profile.get("asset_classes") or {}
-                sector_weights = profile.get("sector_weightings") or {}
-
-                stock_w = float(asset_classes.get("stockPosition", 0.0) or 0.0)
-                bond_w  = float(asset_classes.get("bondPosition",  0.0) or 0.0)
-                cash_w  = float(asset_classes.get("cashPosition",  0.0) or 0.0)
-                # Treat preferred/convertible/other as equity-like.
-                other_w = max(0.0, 1.0 - stock_w - bond_w - cash_w)
-                if stock_w + bond_w + cash_w + other_w == 0:
-                    stock_w = 1.0  # no profile data at all → assume 100% equity
-
-                if sector_weights:
-                    tot_sw = sum(sector_weights.values())
-                    if tot_sw > 0:
-                        eq_shock = sum(
-                            (w / tot_sw) * sector_shocks.get(normalize_sector(sec) or sec, 0.0)
-                            for sec, w in sector_weights.items()
-                        )
-                        source = f"yfinance: {len(sector_weights)} sectors"
-                    else:
-                        eq_shock = avg_sector
-                        source = "Avg sector (empty weightings)"
-                else:
-                    eq_shock = avg_sector
-                    source = "Avg sector (no profile)"
-
-                bond_shock = non_equity_shocks.get("Bond", 0.0)
-                shock_pct = (
-                    (stock_w + other_w) * eq_shock
-                    + bond_w * bond_shock
-                    + cash_w * 0.0
-                )
-
-            elif at_val == "Stock":
-                sec = normalize_sector(pos.asset.sector)
-                if sec and sec in sector_shocks:
-                    shock_pct = sector_shocks[sec]
-                    source = f"Sector: {sec}"
-                else:
-                    shock_pct = avg_sector
-                    source = f"Avg sector (unknown: {pos.asset.sector or '—'})"
-
-            else:
-                # Bond / Cash / CD / Crypto
-                shock_pct = non_equity_shocks.get(at.value, 0.0)
-                source = at.value
-
-            new_value = base_value * (1 + shock_pct)
-            rows.append({
-                "Ticker": ticker,
-                "Type": at.value,
-                "Base Value": base_value,
-                "Shock %": shock_pct * 100,
-                "New Value": new_value,
-                "Change $": new_value - base_value,
-                "Source": source,
-            })
-
-        return pd.DataFrame(rows)
+        engine = StressEngine(self.db)
+        exposures = engine.exposures(portfolio, latest_prices)
+        shock = engine.shocks(
+            exposures, scenario_matrix({"custom": (sector_shocks, non_equity_shocks)}),
+        )["custom"].to_numpy()
+
+        out = exposures.positions.copy()
+        base = out["Base Value"].to_numpy(dtype=float)
+        out.insert(3, "Shock %", shock * 100)
+        out.insert(4, "New Value", base * (1 + shock))
+        out.insert(5, "Change $", base * shock)
+        return out
@@ -0,0 +1,246 @@
+"""Vectorized multi-portfolio risk engine.
+
+`RiskEngine` loads prices once for the whole book and turns positions into
+a portfolios × tickers matrix of market-value weights (cost basis only
+where a ticker has no price), so every portfolio's daily return series is
+one matrix product. Volatility, historical VaR and CVaR are column
+reductions of it; parametric VaR and its Euler decomposition
+(`var_contributions`) use the shared EWMA covariance from
+`CovarianceEngine`. Days where a holding has no return renormalise the
+remaining weights. VaR and CVaR are daily returns (negative = loss).
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from src.covariance import CovarianceEngine
+from src.database import Database
+from src.models import Portfolio
+
+TRADING_DAYS = 252
+CONFIDENCE_LEVELS = (0.95, 0.99)
+
+
+def _level_tag(confidence: float) -> str:
+    """0.95 → "95", 0.975 → "97.5"."""
+    return f"{confidence * 100:g}"
+
+
+class RiskEngine:
+    def __init__(self, db: Database):
+        self.db = db
+
+    # ── Inputs ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def holdings(portfolios: Iterable[Portfolio]) -> pd.DataFrame:
+        """Long (portfolio_name, ticker, quantity, cost_basis) frame."""
+        rows = [
+            (pf.name, pos.asset.ticker, float(pos.quantity), float(pos.cost_basis))
+            for pf in portfolios for pos in pf.positions
+        ]
+        return pd.DataFrame(rows, columns=["portfolio_name", "ticker", "quantity", "cost_basis"])
+
+    def load_returns(self, tickers: list[str], start_date: Optional[str] = None) -> tuple[pd.DataFrame, pd.Series]:
+        """(daily simple returns, latest price per ticker) from one price load.
+
+        Returns are NaN where a ticker has no price on that day or the day
+        before. Tickers with no price file come back from the store as a
+        constant 1.0 (cash at par): zero return, and no latest price so
+        their value falls back to cost basis.
+        """
+        prices = self.db.get_historical_prices(sorted(set(tickers)), start_date)
+        if prices.empty:
+            return pd.DataFrame(), pd.Series(dtype=float)
+        prices = prices.sort_index()
+        prices = prices[~prices.index.duplicated(keep="last")]
+        returns = prices.pct_change(fill_method=None).iloc[1:]
+        latest = prices.ffill().iloc[-1]
+        return returns, latest.where(latest.index.isin(self.db.list_price_tickers()))
+
+    @staticmethod
+    def weight_matrix(holdings: pd.DataFrame, latest: pd.Series) -> pd.DataFrame:
+        """Portfolios × tickers market-value weights (rows sum to 1).
+
+        Value = quantity × latest price, falling back to quantity × cost
+        basis for tickers with no price. Repeated tickers in a portfolio add up.
+        """
+        price = holdings["ticker"].map(latest).astype(float)
+        value = holdings["quantity"] * price.fillna(holdings["cost_basis"])
+        mv = value.groupby([holdings["portfolio_name"], holdings["ticker"]]).sum().unstack(fill_value=0.0)
+        total = mv.sum(axis=1)
+        return mv.div(total.where(total > 0), axis=0)
+
+    def moments(self, weights: pd.DataFrame, returns: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """(μ, Σ) for `weights`' tickers, in column order: each ticker's
+        sample mean daily return over the days it has one, and the shared
+        daily EWMA covariance (0 for unpriced tickers)."""
+        tickers = list(weights.columns)
+        mu = returns.reindex(columns=tickers).mean().fillna(0.0).to_numpy()
+        cov = CovarianceEngine(self.db).covariance(tickers).to_numpy(dtype=float)
+        return mu, cov
+
+    @staticmethod
+    def parametric_var(
+        weights: pd.DataFrame,
+        mu: np.ndarray,
+        cov: np.ndarray,
+        confidence_levels: Iterable[float] = CONFIDENCE_LEVELS,
+    ) -> pd.DataFrame:
+        """Portfolios × `parametric_var_c`: wᵀμ + z_c·√(wᵀΣw), daily."""
+        W = weights.fillna(0.0).to_numpy()
+        mu_p = W @ mu
+        sigma_p = np.sqrt(np.maximum(np.einsum("pi,ij,pj->p", W, cov, W), 0.0))
+        out = pd.DataFrame(index=weights.index)
+        for c in confidence_levels:
+            out[f"parametric_var_{_level_tag(c)}"] = mu_p + norm.ppf(1 - c) * sigma_p
+        return out
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    def portfolio_returns(self, weights: pd.DataFrame, returns: pd.DataFrame) -> pd.DataFrame:
+        """Dates × portfolios daily returns, P = R · Wᵀ with per-day
+        renormalisation over the holdings that have a return that day."""
+        R = returns.reindex(columns=weights.columns).to_numpy(dtype=float)
+        valid = np.isfinite(R)
+        W = weights.fillna(0.0).to_numpy()
+        stacked = np.concatenate([np.where(valid, R, 0.0), valid.astype(float)]) @ W.T
+        contrib, covered = stacked[: len(R)], stacked[len(R):]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            P = np.where(covered > 1e-12, contrib / covered, np.nan)
+        return pd.DataFrame(P, index=returns.index, columns=weights.index)
+
+    @staticmethod
+    def summarize(
+        port_returns: pd.DataFrame,
+        confidence_levels: Iterable[float] = CONFIDENCE_LEVELS,
+    ) -> pd.DataFrame:
+        """One row per portfolio: n_obs, volatility (annualised) and, per
+        confidence level c, var_c / cvar_c (historical), as daily returns.
+        Parametric VaR needs the covariance — see `parametric_var`."""
+        P = port_returns.to_numpy(dtype=float)
+        valid = np.isfinite(P)
+        n = valid.sum(axis=0)
+        enough = n >= 2
+        P_safe = np.where(valid, P, 0.0)
+        mu = np.divide(P_safe.sum(axis=0), n, out=np.full(P.shape[1], np.nan), where=enough)
+        dev = np.where(valid, P - mu, 0.0)
+        sigma = np.sqrt(np.divide((dev ** 2).sum(axis=0), n - 1, out=np.full(P.shape[1], np.nan), where=enough))
+
+        out = pd.DataFrame({"n_obs": n, "volatility": sigma * np.sqrt(TRADING_DAYS)}, index=port_returns.columns)
+        for c in confidence_levels:
+            tag = _level_tag(c)
+            with np.errstate(all="ignore"):
+                var = np.nanpercentile(np.where(valid, P, np.nan), (1 - c) * 100, axis=0) if len(P) else np.full(P.shape[1], np.nan)
+            tail = valid & (P <= var)
+            cvar = np.divide(np.where(tail, P, 0.0).sum(axis=0), tail.sum(axis=0),
+                             out=np.full(P.shape[1], np.nan), where=tail.any(axis=0))
+            out[f"var_{tag}"] = np.where(enough, var, np.nan)
+            out[f"cvar_{tag}"] = np.where(enough, cvar, np.nan)
+        return out
+
+    def portfolio_risk(
+        self,
+        portfolios: Iterable[Portfolio],
+        confidence_levels: Iterable[float] = CONFIDENCE_LEVELS,
+        start_date: Optional[str] = None,
+        returns: Optional[pd.DataFrame] = None,
+        latest: Optional[pd.Series] = None,
+    ) -> pd.DataFrame:
+        """Risk metrics for every portfolio in one pass (see `summarize` and
+        `parametric_var`), plus `market_value`. Portfolios without positions
+        or prices get NaN.
+
+        Pass `returns` / `latest` from `load_returns` to reuse one load
+        across calls.
+        """
+        portfolios = list(portfolios)
+        names = [pf.name for pf in portfolios]
+        holdings = self.holdings(portfolios)
+        if holdings.empty:
+            return pd.DataFrame(index=pd.Index(names, name="portfolio_name"))
+        if returns is None or latest is None:
+            returns, latest = self.load_returns(holdings["ticker"].tolist(), start_date)
+        weights = self.weight_matrix(holdings, latest)
+        confidence_levels = tuple(confidence_levels)
+        summary = self.summarize(self.portfolio_returns(weights, returns), confidence_levels)
+        mu, cov = self.moments(weights, returns)
+        parametric = self.parametric_var(weights, mu, cov, confidence_levels)
+        for c in confidence_levels:
+            col = f"parametric_var_{_level_tag(c)}"
+            summary.insert(summary.columns.get_loc(f"cvar_{_level_tag(c)}") + 1, col,
+                           parametric[col].where(summary["n_obs"] >= 2))
+        price = holdings["ticker"].map(latest).astype(float).fillna(holdings["cost_basis"])
+        summary.insert(0, "market_value", (holdings["quantity"] * price).groupby(holdings["portfolio_name"]).sum())
+        return summary.reindex(pd.Index(names, name="portfolio_name"))
+
+    def var_contributions(
+        self,
+        portfolios: Iterable[Portfolio],
+        confidence: float = 0.95,
+        start_date: Optional[str] = None,
+        returns: Optional[pd.DataFrame] = None,
+        latest: Optional[pd.Series] = None,
+    ) -> pd.DataFrame:
+        """Per-position VaR decomposition, one row per (portfolio, ticker).
+
+        Columns: weight; parametric `marginal_var`, `component_var`,
+        `pct_contribution`; historical `hist_component_var`,
+        `hist_pct_contribution`. Components are daily returns (negative =
+        loss) and sum to the portfolio's parametric / historical VaR.
+
+        Parametric is the Euler split of μ_p + z·σ_p: marginal VaRᵢ =
+        μᵢ + z·(Σw)ᵢ / σ_p, component = wᵢ · marginal. Historical spreads the
+        historical VaR by each position's share of the mean portfolio return
+        on the tail days (portfolio return at or below its VaR).
+        """
+        columns = ["portfolio_name", "ticker", "weight", "marginal_var", "component_var",
+                   "pct_contribution", "hist_component_var", "hist_pct_contribution"]
+        holdings = self.holdings(portfolios)
+        if holdings.empty:
+            return pd.DataFrame(columns=columns)
+        if returns is None or latest is None:
+            returns, latest = self.load_returns(holdings["ticker"].tolist(), start_date)
+        weights = self.weight_matrix(holdings, latest)
+        port_returns = self.portfolio_returns(weights, returns)
+        tag = _level_tag(confidence)
+        hist_var = self.summarize(port_returns, (confidence,))[f"var_{tag}"].to_numpy()
+
+        R = returns.reindex(columns=weights.columns)
+        W = weights.fillna(0.0).to_numpy()                                # portfolios × tickers
+        mu, cov = self.moments(weights, returns)
+        z = norm.ppf(1 - confidence)
+        sigma_w = (cov @ W.T).T                                           # (Σw)ᵢ per portfolio
+        sigma_p = np.sqrt(np.maximum(np.einsum("pi,pi->p", W, sigma_w), 0.0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            marginal = mu + z * sigma_w / sigma_p[:, None]
+            component = W * marginal
+            pct = component / component.sum(axis=1, keepdims=True)
+
+        # Tail-scenario average: E[wᵢ·rᵢ / covered | P ≤ VaR] per portfolio.
+        P = port_returns.to_numpy(dtype=float)
+        R0 = R.to_numpy(dtype=float)
+        valid = np.isfinite(R0)
+        covered = valid.astype(float) @ W.T                               # dates × portfolios
+        tail = np.isfinite(P) & (P <= hist_var)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scale = np.where(tail, 1.0 / covered, 0.0)
+            tail_contrib = W * (scale.T @ np.where(valid, R0, 0.0)) / tail.sum(axis=0)[:, None]
+            hist_pct = tail_contrib / tail_contrib.sum(axis=1, keepdims=True)
+        hist_component = hist_pct * hist_var[:, None]
+
+        out = pd.DataFrame({
+            "portfolio_name":        np.repeat(weights.index.to_numpy(), W.shape[1]),
+            "ticker":                np.tile(weights.columns.to_numpy(), W.shape[0]),
+            "weight":                W.ravel(),
+            "marginal_var":          marginal.ravel(),
+            "component_var":         component.ravel(),
+            "pct_contribution":      pct.ravel(),
+            "hist_component_var":    hist_component.ravel(),
+            "hist_pct_contribution": hist_pct.ravel(),
+        })
+        return out[out["weight"] > 0].reset_index(drop=True)[columns]
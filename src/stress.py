@@ -0,0 +1,530 @@
+"""Sector stress engine: scenario, historical, reverse and implied shocks.
+
+A position's shock is linear in the factor shocks, so each portfolio gets
+one positions × factors exposure matrix E (sector keys plus Bond / Cash /
+CD / Crypto; ETFs and funds through the shared lookthrough operator) and
+any number of scenarios stack into a factors × scenarios matrix S — E · S
+is every position's shock under every scenario.
+
+`historical_replay` applies every stored N-day window to today's holdings
+(sector-ETF proxies before listing and across long gaps), `reverse_stress`
+finds the most plausible sector shock that loses a target amount, and
+`implied_projection` prices driver-sector shocks through the sector
+covariance.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from src.database import Database
+from src.lookthrough import LookthroughEngine
+from src.models import Portfolio
+from src.scenarios import (
+    NON_EQUITY_SHOCKS, SECTOR_ETF_TICKERS, SECTOR_KEYS, SECTOR_STRESS_SCENARIOS, normalize_sector,
+)
+
+NON_EQUITY_TYPES: list[str] = ["Bond", "Cash", "CD", "Crypto"]
+FACTORS: list[str] = SECTOR_KEYS + NON_EQUITY_TYPES
+
+# A scenario: (sector_key → shock, non-equity asset type → shock), fractions.
+ShockSet = tuple[Mapping[str, float], Mapping[str, float]]
+
+
+IMPLIED_CACHE_SIZE = 64
+# Exposure source of an ETF / Fund with no lookthrough data at all.
+NO_PROFILE_SOURCE = "Avg sector (no profile)"
+# Historical replay carries a price across at most this many missing
+# weekdays (exchange holidays); longer gaps fall back to the sector proxy.
+HOLIDAY_FILL_DAYS = 3
+
+# sector_betas path → ((betas, beta stats) file mtime_ns, ImpliedShockOperator)
+_OPERATOR_CACHE: dict[str, tuple[tuple[int, int], "ImpliedShockOperator"]] = {}
+# (data_dir, operator mtimes, lookthrough version, portfolio name, holdings) → ImpliedProjection
+_PROJECTION_CACHE: dict[tuple, "ImpliedProjection"] = {}
+
+
+def _conditional(cov: np.ndarray, drivers: list[int]) -> np.ndarray:
+    """C_D = Σ[:, D] · Σ_DD⁺ with the driver rows pinned to the identity:
+    sector shock per unit driver shock, all drivers regressed jointly (the
+    conditional mean E[s | s_D = d]). One driver reduces to its betas;
+    correlated drivers share the move instead of each adding a full beta."""
+    op = cov[:, drivers] @ np.linalg.pinv(cov[np.ix_(drivers, drivers)])
+    op[drivers, :] = np.eye(len(drivers))
+    return op
+
+
+@dataclass(frozen=True)
+class ImpliedShockOperator:
+    """One beta snapshot: `matrix[a, b]` = β(a, b) (1.0 on the diagonal,
+    0.0 for missing pairs) and `cov`, the sector covariance from the same
+    running sums (`StressEngine.sector_covariance`)."""
+    as_of: str
+    matrix: np.ndarray
+    cov: np.ndarray
+
+    def coefficients(self, drivers: list[str]) -> np.ndarray:
+        """SECTOR_KEYS × drivers: each sector's shock per unit driver shock."""
+        return _conditional(self.cov, [SECTOR_KEYS.index(k) for k in drivers])
+
+    def implied(self, drivers: Mapping[str, float]) -> pd.Series:
+        """Sector shocks implied by driver shocks {sector_key: shock}."""
+        shocks = self.coefficients(list(drivers)) @ np.fromiter(drivers.values(), float, len(drivers))
+        return pd.Series(shocks, index=SECTOR_KEYS)
+
+
+@dataclass(frozen=True)
+class ImpliedProjection:
+    """One portfolio's sector exposure, pre-multiplied by the sector
+    covariance.
+
+    `exposure` is positions × SECTOR_KEYS in dollars (base value × E);
+    `projected` = exposure · Σ for the operator's Σ (`cov`). Non-sector
+    factors are not included.
+    """
+    tickers: list[str]
+    base_value: np.ndarray
+    exposure: np.ndarray
+    projected: np.ndarray
+    cov: np.ndarray
+
+    def operator(self, drivers: list[str]) -> np.ndarray:
+        """Positions × drivers: dollar P&L per unit shock of each driver.
+
+        X · C_D = X · Σ[:, D] · Σ_DD⁺ − X[:, D] · (Σ_DD · Σ_DD⁺) + X[:, D] —
+        the cached projection with the driver rows swapped for the identity."""
+        idx = [SECTOR_KEYS.index(k) for k in drivers]
+        X_D = self.exposure[:, idx]
+        inv = np.linalg.pinv(self.cov[np.ix_(idx, idx)])
+        return self.projected[:, idx] @ inv - X_D @ (self.cov[np.ix_(idx, idx)] @ inv) + X_D
+
+    def pnl(self, drivers: Mapping[str, float]) -> np.ndarray:
+        """Position P&L ($) under driver shocks {sector_key: shock}."""
+        return self.operator(list(drivers)) @ np.fromiter(drivers.values(), float, len(drivers))
+
+    def sweep(self, drivers: Mapping[str, float], scales: Iterable[float]) -> np.ndarray:
+        """len(scales) × positions P&L with the driver shocks scaled by each
+        of `scales` — an outer product of the scales with `pnl(drivers)`."""
+        return np.outer(np.asarray(list(scales), dtype=float), self.pnl(drivers))
+
+
+@dataclass(frozen=True)
+class Exposures:
+    """`positions`: Ticker, Type, Base Value, Source (one row per position);
+    `loadings`: the matching positions × FACTORS matrix."""
+    positions: pd.DataFrame
+    loadings: pd.DataFrame
+
+
+def named_scenarios() -> dict[str, ShockSet]:
+    """The built-in `SECTOR_STRESS_SCENARIOS` with their non-equity shocks."""
+    return {
+        name: (sector, NON_EQUITY_SHOCKS.get(name, {}))
+        for name, sector in SECTOR_STRESS_SCENARIOS.items()
+    }
+
+
+def shock_grid(
+    levels: Iterable[float],
+    non_equity: Optional[Mapping[str, float]] = None,
+) -> dict[str, ShockSet]:
+    """Uniform equity shocks: one scenario per level, every sector shocked
+    by that level (non-equity types by `non_equity`, default 0)."""
+    return {
+        f"All sectors {level:+.0%}": ({k: level for k in SECTOR_KEYS}, dict(non_equity or {}))
+        for level in levels
+    }
+
+
+def _fill_short_gaps(prices: pd.DataFrame, limit: int) -> pd.DataFrame:
+    """Forward-fill each ticker's runs of at most `limit` missing rows.
+
+    Longer runs (a suspension, a delisting) stay missing in full rather than
+    being filled for their first `limit` rows, so no stale price books 0%."""
+    missing = prices.isna().to_numpy()
+    rows = np.arange(len(prices))[:, None]
+    prev = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    nxt = np.minimum.accumulate(np.where(missing, len(prices), rows)[::-1], axis=0)[::-1]
+    fill = missing & (prev >= 0) & (nxt - prev - 1 <= limit)
+    return prices.ffill().where(~missing | fill)
+
+
+def scenario_matrix(scenarios: Mapping[str, ShockSet]) -> pd.DataFrame:
+    """FACTORS × scenarios shock matrix. Sectors a scenario omits take the
+    average of the sector shocks it does give (so the evenly-spread
+    "average sector" row takes exactly that average); omitted non-equity
+    types shock 0."""
+    columns = {}
+    for name, (sector, other) in scenarios.items():
+        sector = {k: float(v) for k, v in dict(sector).items() if k in SECTOR_KEYS}
+        avg = sum(sector.values()) / len(sector) if sector else 0.0
+        columns[name] = pd.Series({**{k: avg for k in SECTOR_KEYS}, **sector, **dict(other)}, dtype=float)
+    return pd.DataFrame(columns, index=FACTORS, dtype=float).fillna(0.0)
+
+
+class StressEngine:
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def line_loadings(lines: pd.DataFrame) -> np.ndarray:
+        """Lookthrough lines × factors: Bond / Cash / CD / Crypto lines load
+        1.0 on their own type, lines with a canonical sector on that sector,
+        and any other line (unknown sector, nested fund) evenly on every
+        sector."""
+        F = np.zeros((len(lines), len(FACTORS)))
+        col = {f: i for i, f in enumerate(FACTORS)}
+        n_sectors = len(SECTOR_KEYS)
+        for r, (at, key) in enumerate(zip(lines["Type"], lines["sector_key"])):
+            if at in col and at not in SECTOR_KEYS:
+                F[r, col[at]] = 1.0
+            elif isinstance(key, str) and key in col:
+                F[r, col[key]] = 1.0
+            else:
+                F[r, :n_sectors] = 1.0 / n_sectors
+        return F
+
+    def latest_prices(self, portfolio: Portfolio) -> dict[str, float]:
+        """Last stored price of each of `portfolio`'s priced tickers."""
+        stored = set(self.db.list_price_tickers())
+        held = sorted({p.asset.ticker for p in portfolio.positions} & stored)
+        if not held:
+            return {}
+        prices = self.db.get_historical_prices(held).sort_index()
+        return prices.ffill().iloc[-1].dropna().to_dict() if not prices.empty else {}
+
+    def exposures(self, portfolio: Portfolio, latest_prices: Optional[Mapping[str, float]] = None) -> Exposures:
+        """Build the positions × factors exposure matrix (see module doc).
+        Base value is quantity × latest price, else × cost basis; prices
+        default to the last stored ones (`latest_prices`)."""
+        if latest_prices is None:
+            latest_prices = self.latest_prices(portfolio)
+        positions = portfolio.positions
+        E = np.zeros((len(positions), len(FACTORS)))
+        col = {f: i for i, f in enumerate(FACTORS)}
+        n_sectors = len(SECTOR_KEYS)
+
+        op = LookthroughEngine(self.db).operator()
+        op_rows = op.rows([p.asset.ticker for p in positions],
+                          [p.asset.asset_type.value for p in positions])
+        looked = op_rows >= 0
+        if looked.any():
+            E[looked] = op.matrix[op_rows[looked]] @ self.line_loadings(op.lines)
+
+        rows = []
+        for r, pos in enumerate(positions):
+            ticker = pos.asset.ticker
+            at = pos.asset.asset_type.value
+            price = latest_prices.get(ticker)
+            if price is None or (isinstance(price, float) and np.isnan(price)):
+                base_value = pos.quantity * pos.cost_basis
+            else:
+                base_value = pos.quantity * float(price)
+
+            if looked[r]:
+                via = op.source.iloc[op_rows[r]]
+                n_lines = op.matrix[op_rows[r]].nnz
+                if via == "vendor":
+                    source = f"vendor: {n_lines} holdings"
+                elif via == "constituents":
+                    source = f"constituents: {n_lines}"
+                else:
+                    own = op.lines.iloc[op.matrix[op_rows[r]].indices]
+                    n_sec = int(((own["Type"] == "Stock") & own["sector_key"].notna()).sum())
+                    source = f"yfinance: {n_sec} sectors" if n_sec else "Avg sector (empty weightings)"
+
+            elif at in ("ETF", "Fund"):
+                # No lookthrough data at all → assume 100% equity.
+                E[r, :n_sectors] = 1.0 / n_sectors
+                source = NO_PROFILE_SOURCE
+
+            elif at == "Stock":
+                sec = normalize_sector(pos.asset.sector)
+                if sec:
+                    E[r, col[sec]] = 1.0
+                    source = f"Sector: {sec}"
+                else:
+                    E[r, :n_sectors] = 1.0 / n_sectors
+                    source = f"Avg sector (unknown: {pos.asset.sector or '—'})"
+
+            else:
+                # Bond / Cash / CD / Crypto
+                if at in col:
+                    E[r, col[at]] = 1.0
+                source = at
+
+            rows.append({"Ticker": ticker, "Type": at, "Base Value": base_value, "Source": source})
+
+        info = pd.DataFrame(rows, columns=["Ticker", "Type", "Base Value", "Source"])
+        return Exposures(positions=info, loadings=pd.DataFrame(E, columns=FACTORS))
+
+    @staticmethod
+    def shocks(exposures: Exposures, scenarios: pd.DataFrame) -> pd.DataFrame:
+        """Positions × scenarios fractional shocks: E · S."""
+        S = scenarios.reindex(index=FACTORS, fill_value=0.0).to_numpy(dtype=float)
+        return pd.DataFrame(
+            exposures.loadings.to_numpy() @ S,
+            index=exposures.positions["Ticker"], columns=scenarios.columns,
+        )
+
+    def scenario_pnl(
+        self,
+        portfolio: Portfolio,
+        scenarios: Optional[Mapping[str, ShockSet]] = None,
+        latest_prices: Optional[Mapping[str, float]] = None,
+    ) -> pd.DataFrame:
+        """Positions × scenarios P&L ($) for every scenario in one product.
+        `scenarios` defaults to `named_scenarios()`."""
+        exposures = self.exposures(portfolio, latest_prices)
+        matrix = scenario_matrix(scenarios if scenarios is not None else named_scenarios())
+        shocks = self.shocks(exposures, matrix)
+        return shocks.mul(exposures.positions["Base Value"].to_numpy(), axis=0)
+
+    def historical_replay(
+        self,
+        portfolio: Portfolio,
+        window: int = 21,
+        top: int = 5,
+        latest_prices: Optional[Mapping[str, float]] = None,
+        start_date: Optional[str] = None,
+    ) -> dict[str, pd.DataFrame]:
+        """Replay every `window`-trading-day stretch of stored history on the
+        current holdings and return the `top` worst non-overlapping ones.
+
+        Returns {"windows": rank, start_date, end_date, pnl, return_pct,
+        coverage; "positions": rank, ticker, base_value, window_return, pnl;
+        "sources": ticker, source, history_from}. `coverage` is the share of
+        base value with own or proxy returns on every day of the window.
+        """
+        empty = {
+            "windows":   pd.DataFrame(columns=["rank", "start_date", "end_date", "pnl", "return_pct", "coverage"]),
+            "positions": pd.DataFrame(columns=["rank", "ticker", "base_value", "window_return", "pnl"]),
+            "sources":   pd.DataFrame(columns=["ticker", "source", "history_from"]),
+        }
+        exposures = self.exposures(portfolio, latest_prices)
+        tickers = exposures.positions["Ticker"].tolist()
+        base = exposures.positions["Base Value"].to_numpy(dtype=float)
+        proxies = [SECTOR_ETF_TICKERS[k] for k in SECTOR_KEYS]
+        stored = set(self.db.list_price_tickers())
+        load = sorted({t for t in tickers + proxies if t in stored})
+        if not load:
+            return empty
+
+        prices = self.db.get_historical_prices(load, start_date).sort_index()
+        prices = prices[~prices.index.duplicated(keep="last")]
+        prices = _fill_short_gaps(prices[prices.index.dayofweek < 5], HOLIDAY_FILL_DAYS)
+        if len(prices) <= window:
+            return empty
+        rets = prices.pct_change(fill_method=None).iloc[1:]
+
+        own = rets.reindex(columns=tickers).to_numpy(dtype=float)           # days × positions
+        sector = rets.reindex(columns=proxies).to_numpy(dtype=float)        # days × sectors
+        sector_ok = np.isfinite(sector)
+        E_sector = exposures.loadings[SECTOR_KEYS].to_numpy()
+        proxy = np.where(sector_ok, sector, 0.0) @ E_sector.T
+        has_proxy = (E_sector > 0).any(axis=1)
+        proxy_ok = (sector_ok.astype(float) @ (E_sector > 0).T.astype(float)) > 0
+        # Cash / CD hold their value; bonds and crypto without prices have no proxy.
+        proxy_ok |= exposures.positions["Type"].isin(["Cash", "CD"]).to_numpy()
+        own_ok = np.isfinite(own)
+        R = np.where(own_ok, own, np.where(proxy_ok, proxy, 0.0))
+        ok = own_ok | proxy_ok
+
+        # Window j covers return rows j … j+window−1 (closes j → j+window).
+        L = np.vstack([np.zeros((1, len(tickers))), np.cumsum(np.log1p(R), axis=0)])
+        win = np.expm1(L[window:] - L[:-window])                             # windows × positions
+        C = np.vstack([np.zeros((1, len(tickers))), np.cumsum(ok, axis=0)])
+        covered = (C[window:] - C[:-window]) == window
+        pnl = win * base
+        total = pnl.sum(axis=1)
+        base_total = base.sum()
+
+        picked: list[int] = []
+        for j in np.argsort(total, kind="stable"):
+            if len(picked) == top or total[j] >= 0:
+                break
+            if all(abs(j - k) >= window for k in picked):
+                picked.append(int(j))
+
+        dates = prices.index
+        windows = pd.DataFrame({
+            "rank":       np.arange(1, len(picked) + 1),
+            "start_date": dates[picked],
+            "end_date":   dates[[j + window for j in picked]],
+            "pnl":        total[picked],
+            "return_pct": total[picked] / base_total * 100 if base_total else 0.0,
+            "coverage":   (covered[picked] * base).sum(axis=1) / base_total if base_total else 0.0,
+        })
+        positions = pd.DataFrame({
+            "rank":          np.repeat(windows["rank"].to_numpy(), len(tickers)),
+            "ticker":        np.tile(tickers, len(picked)),
+            "base_value":    np.tile(base, len(picked)),
+            "window_return": win[picked].ravel(),
+            "pnl":           pnl[picked].ravel(),
+        }).sort_values(["rank", "pnl"], kind="stable").reset_index(drop=True)
+
+        sources = []
+        for i, ticker in enumerate(tickers):
+            if own_ok[:, i].all():
+                source = "history"
+            elif own_ok[:, i].any():
+                if has_proxy[i]:
+                    source = "history + sector proxy"
+                else:
+                    source = "history (0% in gaps)" if own_ok[0, i] else "history (0% before)"
+            elif has_proxy[i]:
+                source = "sector proxy"
+            else:
+                source = "cash (0%)" if exposures.positions.at[i, "Type"] in ("Cash", "CD") else "none (0%)"
+            first = rets.index[int(np.argmax(own_ok[:, i]))] if own_ok[:, i].any() else pd.NaT
+            sources.append({"ticker": ticker, "source": source, "history_from": first})
+        sources = pd.DataFrame(sources, columns=["ticker", "source", "history_from"])
+        return {"windows": windows, "positions": positions, "sources": sources}
+
+    # ── Reverse stress ────────────────────────────────────────────────────────
+
+    def sector_covariance(self) -> pd.DataFrame:
+        """SECTOR_KEYS × SECTOR_KEYS daily covariance of the sector ETFs,
+        from the running sums behind the sector betas (same window,
+        pairwise-complete). Clipped to the nearest PSD matrix; sectors
+        with fewer than two observations get zero variance."""
+        stats = self.db.get_sector_beta_stats()
+        if stats.empty:
+            raise ValueError("No sector betas saved yet. Run the refresh_sector_betas job first.")
+        n, sx, sy, sxy = (
+            stats.pivot(index="sector_a", columns="sector_b", values=field)
+            .reindex(index=SECTOR_KEYS, columns=SECTOR_KEYS).fillna(0.0).to_numpy(dtype=float)
+            for field in ("n", "sum_x", "sum_y", "sum_xy")
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = (sxy - sx * sy / n) / (n - 1)
+        cov = np.where((n >= 2) & np.isfinite(cov), cov, 0.0)
+        vals, vecs = np.linalg.eigh((cov + cov.T) / 2)
+        cov = (vecs * np.clip(vals, 0.0, None)) @ vecs.T
+        return pd.DataFrame(cov, index=SECTOR_KEYS, columns=SECTOR_KEYS)
+
+    def reverse_stress(
+        self,
+        portfolios: Iterable[Portfolio],
+        loss: float = 0.10,
+        horizon_days: int = 1,
+        non_equity: Optional[Mapping[str, float]] = None,
+        latest_prices: Optional[Mapping[str, float]] = None,
+        covariance: Optional[pd.DataFrame] = None,
+    ) -> pd.DataFrame:
+        """Most plausible sector shocks that lose `loss` (a fraction of base
+        value) in each portfolio, all portfolios solved together.
+
+        Non-equity types take the fixed `non_equity` shocks (default 0);
+        the sectors make up the rest of the loss. Σ is the daily
+        `sector_covariance()` × `horizon_days`.
+
+        One row per portfolio: base_value, equity_exposure, target_pnl,
+        distance (Mahalanobis, in σ), probability (Gaussian chance of a
+        loss at least this large over the horizon), then one shock column
+        per sector key. Portfolios with no sector exposure that can't reach
+        the target get NaN.
+        """
+        portfolios = list(portfolios)
+        cov = covariance if covariance is not None else self.sector_covariance()
+        sigma = cov.reindex(index=SECTOR_KEYS, columns=SECTOR_KEYS).fillna(0.0).to_numpy() * horizon_days
+        fixed = scenario_matrix({"fixed": ({}, dict(non_equity or {}))})["fixed"]
+
+        A = np.zeros((len(portfolios), len(SECTOR_KEYS)))   # $ exposure per sector
+        base = np.zeros(len(portfolios))
+        fixed_pnl = np.zeros(len(portfolios))
+        for p, portfolio in enumerate(portfolios):
+            exposures = self.exposures(portfolio, latest_prices)
+            values = exposures.positions["Base Value"].to_numpy(dtype=float)
+            A[p] = values @ exposures.loadings[SECTOR_KEYS].to_numpy()
+            base[p] = values.sum()
+            fixed_pnl[p] = values @ (exposures.loadings.to_numpy() @ fixed.to_numpy())
+
+        target = -loss * base
+        residual = np.minimum(target - fixed_pnl, 0.0)      # what the sectors still have to lose
+        sigma_a = A @ sigma                                   # portfolios × sectors (Σ symmetric)
+        variance = np.einsum("ps,ps->p", A, sigma_a)
+        reachable = (variance > 0) | (residual == 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shocks = np.where(variance[:, None] > 0, sigma_a * (residual / variance)[:, None], 0.0)
+            distance = np.where(variance > 0, -residual / np.sqrt(variance), 0.0)
+        shocks[~reachable] = np.nan
+        distance[~reachable] = np.nan
+
+        out = pd.DataFrame({
+            "base_value":      base,
+            "equity_exposure": A.sum(axis=1),
+            "target_pnl":      target,
+            "distance":        distance,
+            "probability":     norm.sf(distance),
+        }, index=pd.Index([pf.name for pf in portfolios], name="portfolio_name"))
+        return pd.concat([out, pd.DataFrame(shocks, index=out.index, columns=SECTOR_KEYS)], axis=1)
+
+    # ── Implied shocks ────────────────────────────────────────────────────────
+
+    def implied_operator(self) -> ImpliedShockOperator:
+        """The latest sector-beta snapshot and sector covariance as dense
+        operators, parsed once per version of their files."""
+        path = self.db._sector_betas_path()
+        mtime = (os.stat(path).st_mtime_ns, os.stat(self.db._sector_beta_stats_path()).st_mtime_ns)
+        cached = _OPERATOR_CACHE.get(path)
+        if cached is None or cached[0] != mtime:
+            long = self.db.get_sector_betas()
+            if long.empty:
+                raise ValueError("No sector betas saved yet. Run the refresh_sector_betas job first.")
+            wide = long.pivot(index="sector_a", columns="sector_b", values="beta")
+            B = wide.reindex(index=SECTOR_KEYS, columns=SECTOR_KEYS).fillna(0.0).to_numpy(dtype=float, copy=True)
+            np.fill_diagonal(B, 1.0)
+            cached = (mtime, ImpliedShockOperator(
+                as_of=str(long["as_of_date"].iloc[0]), matrix=B,
+                cov=self.sector_covariance().to_numpy(),
+            ))
+            _OPERATOR_CACHE[path] = cached
+        return cached[1]
+
+    def implied_projection(
+        self,
+        portfolio: Portfolio,
+        latest_prices: Optional[Mapping[str, float]] = None,
+    ) -> ImpliedProjection:
+        """`portfolio`'s exposure projected through `implied_operator()`.
+        Cached until the holdings, their prices, the lookthrough data or the
+        beta snapshot change."""
+        operator = self.implied_operator()
+        if latest_prices is None:
+            latest_prices = self.latest_prices(portfolio)
+        holdings = tuple(
+            (p.asset.ticker, p.asset.asset_type.value, p.asset.sector, float(p.quantity),
+             float(p.cost_basis), latest_prices.get(p.asset.ticker))
+            for p in portfolio.positions
+        )
+        key = (
+            self.db.data_dir,
+            _OPERATOR_CACHE[self.db._sector_betas_path()][0],
+            LookthroughEngine(self.db).version(),
+            portfolio.name,
+            holdings,
+        )
+        hit = _PROJECTION_CACHE.get(key)
+        if hit is not None:
+            return hit
+
+        exposures = self.exposures(portfolio, latest_prices)
+        base = exposures.positions["Base Value"].to_numpy(dtype=float)
+        X = exposures.loadings[SECTOR_KEYS].to_numpy() * base[:, None]
+        result = ImpliedProjection(
+            tickers=exposures.positions["Ticker"].tolist(),
+            base_value=base,
+            exposure=X,
+            projected=X @ operator.cov,
+            cov=operator.cov,
+        )
+        _PROJECTION_CACHE[key] = result
+        while len(_PROJECTION_CACHE) > IMPLIED_CACHE_SIZE:
+            _PROJECTION_CACHE.pop(next(iter(_PROJECTION_CACHE)))
+        return result
@@ -0,0 +1,499 @@
+"""Tax-lot engine: FIFO / specific-ID lots and realized + unrealized P&L.
+
+`TaxLotEngine.refresh()` replays the trade ledger into lots: every BUY opens
+a lot (`lot_id` = its trade_id), holdings the ledger can't explain become
+one undated legacy lot per ticker (`lot_id` 0), and a SELL closes lots
+FIFO — or the lot it names first (specific identification). Matching is
+array-based: each (lot, SELL) match is an overlap of cumulative bought and
+sold quantity intervals, found with a grouped searchsorted.
+
+Results persist to `tax_lots`, `realized_gains` and `daily_pnl`; a refresh
+matches only new trades against the stored open lots and rebuilds a
+portfolio whose earlier trades or legacy holdings changed.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.database import Database
+
+# Holding period beyond which a realized gain is long-term.
+LONG_TERM_DAYS = 365
+
+# Name this engine's cursor is stored under in the change journal.
+JOURNAL_CONSUMER = "tax_lots"
+
+LOT_COLUMNS = [
+    "portfolio_name", "ticker", "lot_id", "open_date", "quantity",
+    "cost_per_share", "remaining_quantity",
+]
+GAIN_COLUMNS = [
+    "portfolio_name", "ticker", "trade_id", "lot_id", "open_date", "close_date",
+    "quantity", "cost_basis", "proceeds", "realized_gain", "term",
+]
+PNL_COLUMNS = [
+    "date", "portfolio_name", "ticker", "quantity", "cost_basis", "market_value",
+    "unrealized_pnl", "realized_pnl", "cum_realized_pnl",
+]
+
+_KEYS = ["portfolio_name", "ticker"]
+_EPS = 1e-9
+
+
+def _grouped_searchsorted(group_a, a, group_v, v, side: str = "left") -> np.ndarray:
+    """np.searchsorted(a, v, side) within each group, as a global index into
+    `a`. `a` must be sorted by (group, value); groups are integer codes."""
+    n = len(a)
+    group = np.concatenate([group_a, group_v])
+    values = np.concatenate([a, v])
+    # On ties, queries sort before (left) or after (right) equal elements.
+    is_query = np.concatenate([np.zeros(n, dtype=np.int8), np.ones(len(v), dtype=np.int8)])
+    tie = -is_query if side == "left" else is_query
+    order = np.lexsort((tie, values, group))
+    from_a = order < n
+    before = np.cumsum(from_a) - from_a
+    out = np.empty(len(v), dtype=np.int64)
+    out[order[~from_a] - n] = before[~from_a]
+    return out
+
+
+def _term(open_date: pd.Series, close_date: pd.Series) -> np.ndarray:
+    held = (pd.to_datetime(close_date) - pd.to_datetime(open_date)).dt.days
+    return np.where(held.isna(), "unknown", np.where(held > LONG_TERM_DAYS, "long", "short"))
+
+
+def _gain_rows(lots: pd.DataFrame, sells: pd.DataFrame, qty: np.ndarray) -> pd.DataFrame:
+    """Realized-gain rows for `qty` of each `lots` row closed by the
+    matching `sells` row (both aligned positionally)."""
+    cost = qty * lots["cost_per_share"].to_numpy(dtype=float)
+    proceeds = qty * sells["trade_price"].to_numpy(dtype=float)
+    out = pd.DataFrame({
+        "portfolio_name": sells["portfolio_name"].to_numpy(),
+        "ticker":         sells["ticker"].to_numpy(),
+        "trade_id":       sells["trade_id"].to_numpy(dtype=np.int64),
+        "lot_id":         lots["lot_id"].to_numpy(dtype=np.int64),
+        "open_date":      pd.to_datetime(lots["open_date"]).to_numpy(),
+        "close_date":     pd.to_datetime(sells["trade_date"]).to_numpy(),
+        "quantity":       qty,
+        "cost_basis":     cost,
+        "proceeds":       proceeds,
+        "realized_gain":  proceeds - cost,
+    })
+    out["term"] = _term(out["open_date"], out["close_date"])
+    return out
+
+
+def fifo_match(
+    lots: pd.DataFrame, trades: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.Series]:
+    """Close the SELLs in `trades` FIFO against the open `lots` plus the
+    BUYs in `trades`.
+
+    `lots` (LOT_COLUMNS) must be in queue order per (portfolio, ticker);
+    `trades` sorted by (trade_date, trade_id). Returns (every lot with its
+    updated remaining_quantity, realized-gain rows, the quantity of each
+    SELL that found nothing to close, indexed like `trades`).
+    """
+    side = trades["side"].str.upper()
+    buys = trades[side == "BUY"]
+    new_lots = pd.DataFrame({
+        "portfolio_name":     buys["portfolio_name"],
+        "ticker":             buys["ticker"],
+        "lot_id":             buys["trade_id"].astype(np.int64),
+        "open_date":          pd.to_datetime(buys["trade_date"]),
+        "quantity":           buys["quantity"].astype(float),
+        "cost_per_share":     buys["trade_price"].astype(float),
+        "remaining_quantity": buys["quantity"].astype(float),
+    })
+
+    # One event stream per (portfolio, ticker): carried lots first, then the
+    # trades in ledger order. The stable sort keeps that order per group.
+    events = pd.concat([
+        lots[_KEYS].assign(buy=lots["remaining_quantity"].astype(float), sell=0.0, lot=np.arange(len(lots)), trade=-1),
+        trades[_KEYS].assign(
+            buy=np.where(side == "BUY", trades["quantity"].astype(float), 0.0),
+            sell=np.where(side == "BUY", 0.0, trades["quantity"].astype(float)),
+            # BUY trades become lots len(lots) … in ledger order.
+            lot=np.where(side == "BUY", len(lots) + (side == "BUY").cumsum() - 1, -1),
+            trade=np.arange(len(trades)),
+        ),
+    ], ignore_index=True)
+    events = events.sort_values(_KEYS, kind="stable").reset_index(drop=True)
+    group = events.groupby(_KEYS, sort=False).ngroup().to_numpy()
+
+    by_group = [events["portfolio_name"], events["ticker"]]
+    B = events["buy"].groupby(by_group, sort=False).cumsum().to_numpy()
+    Q = events["sell"].groupby(by_group, sort=False).cumsum()
+    # Clamp cumulative sells at cumulative buys *as of each event*: a SELL
+    # beyond the position closes only what was held then.
+    slack = (events["buy"].groupby(by_group, sort=False).cumsum() - Q).groupby(by_group, sort=False).cummin()
+    S = (Q + slack.clip(upper=0.0)).to_numpy()
+    S_prev = pd.Series(S).groupby(group).shift(1, fill_value=0.0).to_numpy()
+
+    all_lots = pd.concat([lots[LOT_COLUMNS], new_lots[LOT_COLUMNS]], ignore_index=True)
+    lot_rows = np.flatnonzero(events["lot"].to_numpy() >= 0)
+    lot_rows = lot_rows[events["buy"].to_numpy()[lot_rows] > _EPS]
+    lot_end = B[lot_rows]
+    lot_start = lot_end - events["buy"].to_numpy()[lot_rows]
+
+    sell_rows = np.flatnonzero(events["sell"].to_numpy() > 0)
+    filled = S[sell_rows] - S_prev[sell_rows]
+    unfilled = pd.Series(0.0, index=trades.index)
+    unfilled.iloc[events["trade"].to_numpy()[sell_rows]] = events["sell"].to_numpy()[sell_rows] - filled
+    sell_rows = sell_rows[filled > _EPS]
+    s0, s1 = S_prev[sell_rows], S[sell_rows]
+
+    # Lots overlapping each SELL's interval: the first lot ending after s0
+    # through the last lot starting before s1, within the same group.
+    lo = _grouped_searchsorted(group[lot_rows], lot_end, group[sell_rows], s0, side="right")
+    hi = _grouped_searchsorted(group[lot_rows], lot_start, group[sell_rows], s1, side="left")
+    counts = np.maximum(hi - lo, 0)
+    pair_sell = np.repeat(np.arange(len(sell_rows)), counts)
+    pair_lot = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    qty = np.minimum(lot_end[pair_lot], s1[pair_sell]) - np.maximum(lot_start[pair_lot], s0[pair_sell])
+    keep = qty > _EPS
+    pair_sell, pair_lot, qty = pair_sell[keep], pair_lot[keep], qty[keep]
+
+    lot_idx = events["lot"].to_numpy()[lot_rows][pair_lot]
+    trade_idx = events["trade"].to_numpy()[sell_rows][pair_sell]
+    gains = _gain_rows(all_lots.iloc[lot_idx], trades.iloc[trade_idx], qty)
+
+    closed = np.bincount(lot_idx, weights=qty, minlength=len(all_lots))
+    all_lots["remaining_quantity"] = (all_lots["remaining_quantity"] - closed).clip(lower=0.0)
+    return all_lots, gains, unfilled
+
+
+def match_trades(lots: pd.DataFrame, trades: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, float]:
+    """`fifo_match`, honouring SELLs that name a `lot_id` (specific ID).
+
+    Each such SELL splits the ledger: the trades before it are matched FIFO
+    in one pass, then it closes its named lot — if that lot is open and was
+    opened by then — and anything left over closes FIFO.
+    Returns (lots, realized-gain rows, total unfilled SELL quantity).
+    """
+    trades = trades.sort_values(["trade_date", "trade_id"], kind="stable").reset_index(drop=True)
+    lot_ref = trades["lot_id"] if "lot_id" in trades.columns else pd.Series(np.nan, index=trades.index)
+    specific = (trades["side"].str.upper() == "SELL") & pd.to_numeric(lot_ref, errors="coerce").notna()
+    gains: list[pd.DataFrame] = []
+    unfilled = 0.0
+
+    def _fifo(lots, chunk):
+        nonlocal unfilled
+        if chunk.empty:
+            return lots
+        lots, g, u = fifo_match(lots, chunk)
+        gains.append(g)
+        unfilled += float(u.sum())
+        return lots
+
+    start = 0
+    for i in np.flatnonzero(specific.to_numpy()):
+        lots = _fifo(lots, trades.iloc[start:i])
+        start = i + 1
+        sell = trades.iloc[i]
+        lots = lots.reset_index(drop=True)
+        named = lots.index[
+            (lots["portfolio_name"] == sell["portfolio_name"])
+            & (lots["ticker"] == sell["ticker"])
+            & (lots["lot_id"] == int(sell["lot_id"]))
+            & (lots["remaining_quantity"] > _EPS)
+            & ~(pd.to_datetime(lots["open_date"]) > pd.Timestamp(sell["trade_date"]))
+        ]
+        remainder = float(sell["quantity"])
+        if len(named):
+            j = named[0]
+            qty = min(remainder, float(lots.at[j, "remaining_quantity"]))
+            gains.append(_gain_rows(lots.loc[[j]], trades.iloc[[i]], np.array([qty])))
+            lots.at[j, "remaining_quantity"] -= qty
+            remainder -= qty
+        if remainder > _EPS:
+            lots = _fifo(lots, trades.iloc[[i]].assign(quantity=remainder))
+    lots = _fifo(lots, trades.iloc[start:])
+
+    gains = [g for g in gains if not g.empty]
+    realized = pd.concat(gains, ignore_index=True) if gains else pd.DataFrame(columns=GAIN_COLUMNS)
+    return lots.reset_index(drop=True), realized, unfilled
+
+
+def _legacy_cost(legacy_qty: float, total_cost: float, trades: pd.DataFrame) -> float:
+    """Per-share cost of the legacy holding, backed out of the position's
+    blended cost.
+
+    `record_trade` applies trades in trade_id order: a BUY adds q·price to
+    the position's total cost, a SELL scales it by (quantity after) /
+    (quantity before). Unwinding both from today's total gives the cost the
+    position had before the ledger started. If the chain breaks (the
+    position was flattened, or edited by hand) the blended cost is used.
+    """
+    trades = trades.sort_values("trade_id")
+    qty = trades["quantity"].to_numpy(dtype=float)
+    is_buy = (trades["side"].str.upper() == "BUY").to_numpy()
+    after = legacy_qty + np.cumsum(np.where(is_buy, qty, -qty))
+    before = after - np.where(is_buy, qty, -qty)
+    blended = total_cost / after[-1] if after[-1] > 0 else 0.0
+    if (after <= 1e-8).any():
+        return blended
+    scale = np.where(is_buy, 1.0, after / before)
+    # Π of the SELL scalings after each trade.
+    later = np.append(np.cumprod(scale[::-1])[::-1][1:], 1.0)
+    added = np.where(is_buy, qty * trades["trade_price"].to_numpy(dtype=float), 0.0)
+    opening = (total_cost - (added * later).sum()) / np.prod(scale)
+    return opening / legacy_qty if opening > 0 else blended
+
+
+def _queue_order(lots: pd.DataFrame) -> pd.DataFrame:
+    """FIFO queue order: undated legacy lots first, then by open date and id."""
+    return lots.sort_values(["open_date", "lot_id"], na_position="first", kind="stable")
+
+
+class TaxLotEngine:
+    def __init__(self, db: Database):
+        self.db = db
+
+    # ── Inputs ────────────────────────────────────────────────────────────────
+
+    def _legacy_lots(self, name: str, trades: pd.DataFrame) -> pd.DataFrame:
+        """Undated lots for the part of each position the ledger doesn't
+        explain (current quantity − net traded quantity)."""
+        try:
+            positions = self.db.get_portfolio(name).positions
+        except ValueError:
+            positions = []
+        if not positions:
+            return pd.DataFrame(columns=LOT_COLUMNS)
+        current = pd.DataFrame(
+            [(p.asset.ticker, float(p.quantity), float(p.cost_basis)) for p in positions],
+            columns=["ticker", "quantity", "cost_per_share"],
+        ).groupby("ticker").agg(quantity=("quantity", "sum"), cost_per_share=("cost_per_share", "last"))
+        signed = trades["quantity"].astype(float).where(trades["side"].str.upper() == "BUY", -trades["quantity"].astype(float))
+        net = signed.groupby(trades["ticker"]).sum().reindex(current.index, fill_value=0.0)
+        legacy = current[current["quantity"] - net > 1e-6].assign(
+            quantity=lambda d: d["quantity"] - net.reindex(d.index),
+        )
+        for ticker in legacy.index.intersection(trades["ticker"].unique()):
+            legacy.at[ticker, "cost_per_share"] = _legacy_cost(
+                legacy.at[ticker, "quantity"],
+                current.at[ticker, "quantity"] * current.at[ticker, "cost_per_share"],
+                trades[trades["ticker"] == ticker],
+            )
+        return pd.DataFrame({
+            "portfolio_name":     name,
+            "ticker":             legacy.index,
+            "lot_id":             0,
+            "open_date":          pd.NaT,
+            "quantity":           legacy["quantity"].to_numpy(),
+            "cost_per_share":     legacy["cost_per_share"].to_numpy(),
+            "remaining_quantity": legacy["quantity"].to_numpy(),
+        })
+
+    @staticmethod
+    def _fingerprint(legacy: pd.DataFrame, trades: pd.DataFrame) -> str:
+        """Hash of what the stored lots were matched from: the legacy
+        quantities and every trade matched so far."""
+        cols = ["trade_id", "ticker", "side", "quantity", "trade_price", "trade_date", "lot_id"]
+        parts = {
+            "legacy": sorted((t, round(float(q), 6)) for t, q in zip(legacy["ticker"], legacy["quantity"])),
+            "trades": (
+                trades.reindex(columns=cols).astype(str).sort_values("trade_id").values.tolist()
+                if not trades.empty else []
+            ),
+        }
+        return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+    # ── Refresh ───────────────────────────────────────────────────────────────
+
+    def refresh(self, portfolio_name: Optional[str] = None, full: bool = False) -> dict:
+        """Match new trades into lots and bring daily_pnl up to date.
+
+        Incremental per portfolio: only trades after the last matched one
+        are matched, against the stored open lots, and daily P&L is
+        recomputed from the earliest new trade, price correction or stored
+        P&L date. `full=True` rebuilds every selected portfolio.
+        """
+        names = [portfolio_name] if portfolio_name else self.db.list_portfolios()
+        all_trades = self.db.list_trades()
+        all_trades["trade_date"] = pd.to_datetime(all_trades["trade_date"])
+        state = self.db.get_tax_lot_state().set_index("portfolio_name")
+        stored_lots = self.db.get_tax_lots()
+
+        cursor = self.db.get_journal_cursor(JOURNAL_CONSUMER)
+        journal_head = self.db.latest_change_id()
+        journal = self.db.get_change_journal(since_id=cursor) if cursor is not None else pd.DataFrame()
+        repriced: dict = {}
+        if not journal.empty:
+            journal = journal[(journal["change_id"] <= journal_head) & (journal["entity"] == "ticker")]
+            changed_from = pd.to_datetime(journal["changed_from"]).fillna(pd.Timestamp.min)
+            repriced = changed_from.groupby(journal["key"]).min().to_dict()
+
+        carried, to_match, rebuilt, kept = [], [], [], []
+        starts: dict = {}
+        new_state = []
+        for name in names:
+            trades = all_trades[all_trades["portfolio_name"] == name]
+            legacy = self._legacy_lots(name, trades)
+            last_id = int(state.at[name, "last_trade_id"]) if name in state.index else None
+            rebuild = full or last_id is None
+            if not rebuild:
+                seen, new = trades[trades["trade_id"] <= last_id], trades[trades["trade_id"] > last_id]
+                rebuild = (
+                    self._fingerprint(legacy, seen) != state.at[name, "fingerprint"]
+                    or (not new.empty and new["trade_date"].min() < state.at[name, "last_trade_date"])
+                )
+            own = stored_lots[stored_lots["portfolio_name"] == name] if not stored_lots.empty else stored_lots
+            if rebuild:
+                rebuilt.append(name)
+                carried.append(legacy)
+                to_match.append(trades)
+                starts[name] = None
+            else:
+                is_open = own["remaining_quantity"] > _EPS
+                carried.append(own[is_open])
+                kept.append(own[~is_open])
+                to_match.append(new)
+                if not new.empty:
+                    starts[name] = new["trade_date"].min()
+            new_state.append({
+                "portfolio_name":  name,
+                "last_trade_id":   int(trades["trade_id"].max()) if not trades.empty else -1,
+                "last_trade_date": trades["trade_date"].max() if not trades.empty else pd.NaT,
+                "fingerprint":     self._fingerprint(legacy, trades),
+                "updated_at":      pd.Timestamp.now(),
+            })
+
+        frames = [f for f in carried if not f.empty]
+        lots_in = _queue_order(pd.concat(frames, ignore_index=True)) if frames else pd.DataFrame(columns=LOT_COLUMNS)
+        frames = [f for f in to_match if not f.empty]
+        trades_in = pd.concat(frames, ignore_index=True) if frames else all_trades.iloc[0:0]
+        lots, gains, unfilled = match_trades(lots_in, trades_in)
+
+        frames = [f for f in kept if not f.empty] + ([lots] if not lots.empty else [])
+        lots = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LOT_COLUMNS)
+        self.db.save_tax_lots(lots[LOT_COLUMNS], names)
+        self.db.save_realized_gains(gains[GAIN_COLUMNS], rebuilt)
+
+        # Daily P&L: rebuilt portfolios from scratch, the rest from their
+        # earliest new trade, repriced holding, or last stored day.
+        pnl = self.db.get_daily_pnl()
+        last_pnl = (
+            pd.to_datetime(pnl["date"]).groupby(pnl["portfolio_name"]).max()
+            if not pnl.empty else pd.Series(dtype="datetime64[ns]")
+        )
+        held = lots.groupby("portfolio_name")["ticker"].agg(set) if not lots.empty else pd.Series(dtype=object)
+        for name in names:
+            if name in rebuilt:
+                continue
+            candidates = [starts.get(name), last_pnl.get(name)]
+            candidates += [d for t, d in repriced.items() if t in held.get(name, set())]
+            candidates = [pd.Timestamp(d) for d in candidates if d is not None and not pd.isna(d)]
+            starts[name] = min(candidates) if name in last_pnl.index and candidates else None
+            if starts[name] == pd.Timestamp.min:
+                starts[name] = None
+
+        realized = self.db.get_realized_gains()
+        realized = realized[realized["portfolio_name"].isin(names)] if not realized.empty else realized
+        daily = self._daily_pnl(lots, realized)
+        if not daily.empty:
+            start = pd.to_datetime(daily["portfolio_name"].map(starts))
+            daily = daily[start.isna() | (daily["date"] >= start)].reset_index(drop=True)
+        self.db.save_daily_pnl(daily, starts)
+        self.db.save_tax_lot_state(pd.DataFrame(new_state))
+        if portfolio_name is None:
+            self.db.advance_journal_cursor(JOURNAL_CONSUMER, journal_head)
+
+        return {
+            "portfolios":     names,
+            "rebuilt":        rebuilt,
+            "trades_matched": len(trades_in),
+            "open_lots":      int((lots["remaining_quantity"] > _EPS).sum()) if not lots.empty else 0,
+            "realized_rows":  len(gains),
+            "pnl_rows":       len(daily),
+            "unfilled_sells": round(unfilled, 6),
+        }
+
+    def _daily_pnl(self, lots: pd.DataFrame, realized: pd.DataFrame) -> pd.DataFrame:
+        """Quantity, cost basis, market value and P&L per (date, portfolio,
+        ticker) on the price calendar, from lot opens and closes."""
+        if lots.empty:
+            return pd.DataFrame(columns=PNL_COLUMNS)
+        tickers = sorted(lots["ticker"].unique())
+        prices = self.db.get_historical_prices(tickers)
+        if prices.empty:
+            return pd.DataFrame(columns=PNL_COLUMNS)
+        prices = prices.sort_index()
+        prices = prices[~prices.index.duplicated(keep="last")].ffill()
+        calendar = prices.index
+
+        opens = pd.DataFrame({
+            "portfolio_name": lots["portfolio_name"],
+            "ticker":         lots["ticker"],
+            "date":           pd.to_datetime(lots["open_date"]).fillna(calendar[0]),
+            "qty":            lots["quantity"].astype(float),
+            "cost":           lots["quantity"].astype(float) * lots["cost_per_share"].astype(float),
+            "realized":       0.0,
+        })
+        closes = pd.DataFrame({
+            "portfolio_name": realized["portfolio_name"],
+            "ticker":         realized["ticker"],
+            "date":           pd.to_datetime(realized["close_date"]),
+            "qty":            -realized["quantity"].astype(float),
+            "cost":           -realized["cost_basis"].astype(float),
+            "realized":       realized["realized_gain"].astype(float),
+        })
+        events = pd.concat([opens, closes], ignore_index=True) if not closes.empty else opens
+
+        # Snap each event to the first calendar date on or after it (events
+        # before the calendar land on its first day, later ones wait).
+        slot = calendar.searchsorted(events["date"].to_numpy(), side="left")
+        events = events[slot < len(calendar)]
+        slot = slot[slot < len(calendar)]
+        col, keys = pd.MultiIndex.from_frame(events[_KEYS]).factorize()
+        shape = (len(calendar), len(keys))
+        cube = {}
+        for field in ("qty", "cost", "realized"):
+            m = np.zeros(shape)
+            np.add.at(m, (slot, col), events[field].to_numpy(dtype=float))
+            cube[field] = m
+        qty = np.cumsum(cube["qty"], axis=0)
+        cost = np.cumsum(cube["cost"], axis=0)
+        cum_realized = np.cumsum(cube["realized"], axis=0)
+        px = prices.reindex(columns=keys.get_level_values(1)).to_numpy(dtype=float)
+        value = qty * px
+
+        # A row per day the ticker is held or realizes a gain.
+        rows, cols = np.nonzero((qty > _EPS) | (cube["realized"] != 0))
+        clean = lambda m: np.where(np.abs(m) < _EPS, 0.0, m)[rows, cols]
+        out = pd.DataFrame({
+            "date":             calendar[rows],
+            "portfolio_name":   keys.get_level_values(0)[cols],
+            "ticker":           keys.get_level_values(1)[cols],
+            "quantity":         clean(qty),
+            "cost_basis":       clean(cost),
+            "market_value":     clean(value),
+            "unrealized_pnl":   clean(value - cost),
+            "realized_pnl":     cube["realized"][rows, cols],
+            "cum_realized_pnl": cum_realized[rows, cols],
+        })
+        return out.sort_values(["portfolio_name", "date", "ticker"]).reset_index(drop=True)
+
+    # ── Reads ─────────────────────────────────────────────────────────────────
+
+    def open_lots(self, portfolio_name: str, prices: Optional[dict] = None) -> pd.DataFrame:
+        """Open lots with unrealized P&L at `prices` (ticker → price; latest
+        stored price by default) and their current short/long-term status."""
+        lots = self.db.get_tax_lots(portfolio_name, open_only=True)
+        if lots.empty:
+            return lots
+        if prices is None:
+            latest = self.db.get_historical_prices(sorted(lots["ticker"].unique())).ffill()
+            prices = latest.iloc[-1].to_dict() if not latest.empty else {}
+        price = lots["ticker"].map(prices).astype(float).fillna(lots["cost_per_share"])
+        lots["cost_basis"] = lots["remaining_quantity"] * lots["cost_per_share"]
+        lots["market_value"] = lots["remaining_quantity"] * price
+        lots["unrealized_pnl"] = lots["market_value"] - lots["cost_basis"]
+        lots["term"] = _term(lots["open_date"], pd.Series(pd.Timestamp.today().normalize(), index=lots.index))
+        return lots
@@ -0,0 +1,396 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.attribution import AttributionEngine
+from src.database.database import Database
+from src.linking import link_contributions, linked_attribution
+from src.models import Asset, AssetType, Portfolio, Position
+
+TICKERS = ["AAA", "BBB", "CCC"]
+DATES = pd.bdate_range("2023-01-02", periods=200)
+
+
+def _prices() -> pd.DataFrame:
+    rng = np.random.default_rng(11)
+    rets = rng.normal(0.0002, 0.015, size=(len(DATES), len(TICKERS)))
+    px = pd.DataFrame(100 * np.cumprod(1 + rets, axis=0), index=DATES, columns=TICKERS)
+    px.iloc[:30, 2] = np.nan     # CCC lists later
+    px.iloc[90:93, 1] = np.nan   # BBB gap
+    return px
+
+
+def _seed(db: Database, through: int) -> None:
+    px = _prices().iloc[:through]
+    for t in TICKERS:
+        db.save_prices(t, px[[t]].dropna().rename(columns={t: "Close"}))
+
+
+def _build(tmp_path, name: str, through: int) -> Database:
+    db = Database(str(tmp_path / name))
+    for t in TICKERS:
+        db.add_asset(Asset(ticker=t, name=t, asset_type=AssetType.STOCK,
+                           currency="USD", sector="Technology"))
+    assets = {a: Asset(ticker=a, name=a, asset_type=AssetType.STOCK, currency="USD",
+                       sector="Technology") for a in TICKERS}
+    db.save_portfolio(Portfolio(name="Static", positions=[
+        Position(asset=assets["AAA"], quantity=10, cost_basis=100),
+        Position(asset=assets["BBB"], quantity=5, cost_basis=100),
+        Position(asset=assets["CCC"], quantity=8, cost_basis=100),
+    ]))
+    db.save_portfolio(Portfolio(name="Traded", positions=[]))
+    db.record_trade("Traded", "AAA", "BUY", 10, 100.0, str(DATES[20].date()))
+    db.record_trade("Traded", "CCC", "BUY", 4, 100.0, str(DATES[40].date()))
+    db.record_trade("Traded", "AAA", "SELL", 3, 100.0, str(DATES[100].date()))
+    _seed(db, through)
+    return db
+
+
+def _sorted(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    return df.sort_values(keys).reset_index(drop=True)
+
+
+def _assert_same(inc: Database, ref: Database) -> None:
+    pd.testing.assert_frame_equal(
+        _sorted(inc.get_daily_portfolio_metrics(), ["portfolio_name", "date"]),
+        _sorted(ref.get_daily_portfolio_metrics(), ["portfolio_name", "date"]),
+        check_dtype=False, rtol=1e-10,
+    )
+    pd.testing.assert_frame_equal(
+        _sorted(inc.get_daily_attribution(), ["portfolio_name", "ticker", "date"]),
+        _sorted(ref.get_daily_attribution(), ["portfolio_name", "ticker", "date"]),
+        check_dtype=False, rtol=1e-10,
+    )
+    pd.testing.assert_frame_equal(
+        _sorted(inc.get_daily_security_metrics(), ["ticker", "date"]),
+        _sorted(ref.get_daily_security_metrics(), ["ticker", "date"]),
+        check_dtype=False, rtol=1e-10,
+    )
+
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path):
+    inc = _build(tmp_path, "inc", through=150)
+    first = AttributionEngine(inc).refresh_all()
+    assert first["incremental"] == []
+
+    _seed(inc, through=200)
+    second = AttributionEngine(inc).refresh_all()
+    assert sorted(second["incremental"]) == ["Static", "Traded"]
+    assert second["modes"] == {"Static": "static_current", "Traded": "trade_replay"}
+    # Only the 50 new dates were computed.
+    assert second["portfolio_rows"] == 2 * 50
+
+    ref = _build(tmp_path, "ref", through=200)
+    AttributionEngine(ref).refresh_all(full=True)
+    _assert_same(inc, ref)
+
+
+def test_incremental_refresh_inside_price_gap_matches_full_rebuild(tmp_path):
+    # The first refresh ends inside BBB's gap; its next price arrives later.
+    inc = _build(tmp_path, "inc", through=92)
+    AttributionEngine(inc).refresh_all()
+    _seed(inc, through=200)
+    AttributionEngine(inc).refresh_all()
+
+    ref = _build(tmp_path, "ref", through=200)
+    AttributionEngine(ref).refresh_all(full=True)
+    _assert_same(inc, ref)
+
+
+def test_no_new_dates_is_a_noop(tmp_path):
+    db = _build(tmp_path, "db", through=120)
+    AttributionEngine(db).refresh_all()
+    before = db.get_attribution_state()
+    again = AttributionEngine(db).refresh_all()
+    assert again["portfolio_rows"] == 0
+    assert again["security_rows"] == 0
+    pd.testing.assert_frame_equal(db.get_attribution_state(), before)
+
+
+def test_new_trade_forces_rebuild_of_that_portfolio(tmp_path):
+    inc = _build(tmp_path, "inc", through=150)
+    AttributionEngine(inc).refresh_all()
+    _seed(inc, through=200)
+    inc.record_trade("Traded", "BBB", "BUY", 6, 100.0, str(DATES[60].date()))
+    result = AttributionEngine(inc).refresh_all()
+    assert result["incremental"] == ["Static"]
+
+    ref = _build(tmp_path, "ref", through=200)
+    ref.record_trade("Traded", "BBB", "BUY", 6, 100.0, str(DATES[60].date()))
+    AttributionEngine(ref).refresh_all(full=True)
+    _assert_same(inc, ref)
+
+
+def _mixed_book(tmp_path, name: str) -> Database:
+    db = _build(tmp_path, name, through=200)
+    cash = Asset(ticker="CASHX", name="Cash", asset_type=AssetType.CASH, currency="USD")
+    db.add_asset(cash)
+    aaa = Asset(ticker="AAA", name="AAA", asset_type=AssetType.STOCK, currency="USD",
+                sector="Technology")
+    bbb = Asset(ticker="BBB", name="BBB", asset_type=AssetType.STOCK, currency="USD",
+                sector="Technology")
+    db.save_portfolio(Portfolio(name="WithCash", positions=[
+        Position(asset=aaa, quantity=3, cost_basis=100),
+        Position(asset=cash, quantity=500, cost_basis=1),
+    ]))
+    # Legacy holding (imported, no trades) plus a later weekend trade.
+    db.save_portfolio(Portfolio(name="Legacy", positions=[
+        Position(asset=bbb, quantity=7, cost_basis=100),
+    ]))
+    db.record_trade("Legacy", "AAA", "BUY", 2, 100.0, "2023-04-08")  # a Saturday
+    return db
+
+
+@pytest.mark.parametrize("start_date", [None, "2023-05-01"])
+def test_batched_matches_serial(tmp_path, start_date):
+    batched = _mixed_book(tmp_path, "batched")
+    serial = _mixed_book(tmp_path, "serial")
+    a = AttributionEngine(batched).refresh_all(start_date=start_date, batched=True)
+    b = AttributionEngine(serial).refresh_all(start_date=start_date, batched=False)
+    assert a["modes"] == b["modes"]
+    assert a["portfolio_rows"] == b["portfolio_rows"] > 0
+    _assert_same(batched, serial)
+
+
+def test_process_pool_matches_single_process(tmp_path):
+    pooled = _mixed_book(tmp_path, "pooled")
+    single = _mixed_book(tmp_path, "single")
+    a = AttributionEngine(pooled).refresh_all(workers=2)
+    b = AttributionEngine(single).refresh_all()
+    assert a["modes"] == b["modes"]
+    assert a["portfolio_rows"] == b["portfolio_rows"] > 0
+    _assert_same(pooled, single)
+
+
+def test_trade_snapping_and_legacy_openings():
+    trades = pd.DataFrame({
+        "ticker":     ["AAA", "AAA", "BBB", "AAA", "BBB", "AAA"],
+        "side":       ["BUY", "BUY", "BUY", "SELL", "sell", "BUY"],
+        "quantity":   [5.0, 2.0, 4.0, 3.0, 10.0, 7.0],
+        "trade_date": ["2023-12-29", "2024-01-06", "2024-01-07", "2024-01-08",
+                       "2024-01-09", "2024-02-01"],
+    })
+    qty_changes, legacy = AttributionEngine._trade_ledger(trades, {"AAA": 15.0, "CCC": 3.0})
+    assert legacy == {"AAA": 4.0, "CCC": 3.0}
+    assert qty_changes.columns.tolist() == ["AAA", "BBB", "CCC"]
+
+    calendar = pd.bdate_range("2024-01-03", "2024-01-10")
+    held = AttributionEngine._quantities_on_calendar(qty_changes, legacy, calendar)
+    # The pre-window BUY lands on the first date alongside the legacy
+    # opening; the weekend trades snap to Monday; the SELL past zero floors
+    # at 0; the trade after the last date is dropped.
+    expected = pd.DataFrame({
+        "AAA": [9.0, 9.0, 9.0, 8.0, 8.0, 8.0],
+        "BBB": [0.0, 0.0, 0.0, 4.0, 0.0, 0.0],
+        "CCC": [3.0] * 6,
+    }, index=calendar)
+    pd.testing.assert_frame_equal(held, expected, check_names=False)
+
+
+def test_rollups_and_contributors_match_raw_attribution(tmp_path):
+    db = _mixed_book(tmp_path, "db")
+    AttributionEngine(db).refresh_all()
+    raw = db.get_daily_attribution()
+
+    by_at = db.get_attribution_rollup("asset_type")
+    expected = raw.groupby(["date", "portfolio_name", "asset_type"])["contribution_to_return"].sum()
+    got = by_at.set_index(["date", "portfolio_name", "asset_type"])["contribution_to_return"]
+    pd.testing.assert_series_equal(got.sort_index(), expected.sort_index(), check_dtype=False)
+    assert set(db.get_attribution_rollup("sector")["sector"]) == {"Technology", "Unknown"}
+
+    contrib = db.get_attribution_contributors(period="3M", portfolio_name="Static")
+    end = pd.to_datetime(raw["date"]).max()
+    start = end - pd.Timedelta(days=90)
+    # Linked contributions reconcile with the compounded period return.
+    assert contrib["contribution_to_return"].sum() == pytest.approx(
+        db.window_return("Static", start, end), rel=1e-10)
+    expected = linked_attribution(db, start, end, portfolio_names=["Static"])
+    expected = expected.sort_values("contribution_to_return", ascending=False)
+    assert contrib.sort_values("rank")["ticker"].tolist() == expected["ticker"].tolist()
+    assert set(db.get_attribution_contributors()["period"]) == {"1M", "3M", "6M", "1Y", "YTD", "All"}
+
+
+def test_incremental_refresh_keeps_rollups_in_sync(tmp_path):
+    inc = _build(tmp_path, "inc", through=150)
+    AttributionEngine(inc).refresh_all()
+    _seed(inc, through=200)
+    AttributionEngine(inc).refresh_all()
+
+    ref = _build(tmp_path, "ref", through=200)
+    AttributionEngine(ref).refresh_all(full=True)
+    for by in ("sector", "asset_type"):
+        pd.testing.assert_frame_equal(
+            _sorted(inc.get_attribution_rollup(by), ["portfolio_name", by, "date"]),
+            _sorted(ref.get_attribution_rollup(by), ["portfolio_name", by, "date"]),
+            check_dtype=False, rtol=1e-10,
+        )
+    keys = ["portfolio_name", "period", "rank"]
+    pd.testing.assert_frame_equal(
+        inc.get_attribution_contributors().sort_values(keys).reset_index(drop=True),
+        ref.get_attribution_contributors().sort_values(keys).reset_index(drop=True),
+        check_dtype=False, rtol=1e-10,
+    )
+
+
+def test_dropped_position_leaves_no_stale_rows(tmp_path):
+    db = _build(tmp_path, "db", through=200)
+    AttributionEngine(db).refresh_all()
+    db.update_positions_direct("Static", [
+        {"ticker": "AAA", "quantity": 10, "cost_basis": 100},
+        {"ticker": "BBB", "quantity": 5, "cost_basis": 100},
+    ])
+    AttributionEngine(db).refresh_all()
+
+    static = db.get_daily_attribution(portfolio_name="Static")
+    assert set(static["ticker"]) == {"AAA", "BBB"}
+    rollup = db.get_attribution_rollup("sector", portfolio_name="Static")
+    assert len(rollup) == static["date"].nunique()
+    contrib = db.get_attribution_contributors(period="All", portfolio_name="Static")
+    assert set(contrib["ticker"]) == {"AAA", "BBB"}
+    assert contrib["contribution_to_return"].sum() == pytest.approx(
+        db.window_return("Static", contrib["start_date"].iloc[0], contrib["end_date"].iloc[0]), rel=1e-10)
+
+    ref = _build(tmp_path, "ref", through=200)
+    ref.update_positions_direct("Static", [
+        {"ticker": "AAA", "quantity": 10, "cost_basis": 100},
+        {"ticker": "BBB", "quantity": 5, "cost_basis": 100},
+    ])
+    AttributionEngine(ref).refresh_all()
+    _assert_same(db, ref)
+
+
+def _compounded(metrics: pd.DataFrame, key: str, name: str, start, end) -> float:
+    rows = metrics[metrics[key] == name].copy()
+    rows["date"] = pd.to_datetime(rows["date"])
+    window = rows[(rows["date"] >= start) & (rows["date"] <= end)]
+    return float((1.0 + window["daily_return"].fillna(0.0)).prod() - 1.0)
+
+
+def test_window_return_matches_compounded_daily_returns(tmp_path):
+    db = _build(tmp_path, "db", through=150)
+    AttributionEngine(db).refresh_all()
+    _seed(db, through=200)
+    AttributionEngine(db).refresh_all()
+
+    start, end = DATES[60], DATES[170]
+    port = db.get_daily_portfolio_metrics()
+    for name in ["Static", "Traded"]:
+        assert db.window_return(name, start, end) == pytest.approx(
+            _compounded(port, "portfolio_name", name, start, end), rel=1e-10)
+    sec = db.get_daily_security_metrics()
+    got = db.window_returns(start, end, scope="security")
+    for t in TICKERS:
+        assert got[t] == pytest.approx(_compounded(sec, "ticker", t, start, end), rel=1e-10)
+    assert db.window_return("Nope", start, end) is None
+
+
+def test_windowed_recompute_keeps_log_index_from_inception(tmp_path):
+    db = _build(tmp_path, "db", through=200)
+    AttributionEngine(db).refresh_all()
+    before = db.window_returns(DATES[10], DATES[190])
+    AttributionEngine(db).refresh_all(start_date=str(DATES[120].date()))
+    after = db.window_returns(DATES[10], DATES[190])
+    pd.testing.assert_series_equal(after, before, rtol=1e-10)
+
+
+@pytest.mark.parametrize("method", ["carino", "frongello"])
+@pytest.mark.parametrize("by", ["ticker", "sector", "asset_type"])
+def test_linked_contributions_add_up_to_compounded_return(tmp_path, method, by):
+    db = _mixed_book(tmp_path, "db")
+    AttributionEngine(db).refresh_all()
+    start, end = DATES[35], DATES[180]
+
+    linked = linked_attribution(db, start, end, by=by, method=method)
+    totals = linked.groupby("portfolio_name")["contribution_to_return"].sum()
+    expected = db.window_returns(start, end).reindex(totals.index)
+    np.testing.assert_allclose(totals.to_numpy(), expected.to_numpy(), rtol=1e-10)
+    # Arithmetic sums are kept alongside and do not reconcile.
+    arithmetic = linked.groupby("portfolio_name")["arithmetic_contribution"].sum()
+    assert not np.allclose(arithmetic.to_numpy(), expected.to_numpy(), rtol=1e-6)
+
+
+def test_carino_falls_back_for_rows_without_log_contribution(tmp_path):
+    db = _build(tmp_path, "db", through=200)
+    AttributionEngine(db).refresh_all()
+    attr = db.get_daily_attribution()
+    stored = link_contributions(attr)
+    legacy = link_contributions(attr.drop(columns=["log_contribution"]))
+    pd.testing.assert_frame_equal(stored, legacy, rtol=1e-12)
+    # Rows migrated with a null column are recomputed too.
+    migrated = attr.assign(log_contribution=attr["log_contribution"].where(attr.index % 2 == 0))
+    pd.testing.assert_frame_equal(link_contributions(migrated), stored, rtol=1e-12)
+
+
+def test_carino_reads_stored_log_contributions(tmp_path, monkeypatch):
+    db = _build(tmp_path, "db", through=200)
+    AttributionEngine(db).refresh_all()
+    attr = db.get_daily_attribution()
+    # First days have no contribution; their stored log contribution is 0.
+    assert attr["contribution_to_return"].isna().any()
+    assert attr["log_contribution"].notna().all()
+
+    def recompute(_):
+        raise AssertionError("stored log contributions should be used as-is")
+
+    monkeypatch.setattr("src.linking.log_contributions", recompute)
+    link_contributions(attr)
+
+
+def _correct_prices(db: Database, fixes: dict) -> None:
+    for ticker, (day, factor) in fixes.items():
+        px = _prices()[ticker].iloc[[day]] * factor
+        db.save_prices(ticker, px.to_frame("Close"))
+
+
+def test_journal_records_only_real_changes(tmp_path):
+    db = _build(tmp_path, "db", through=120)
+    AttributionEngine(db).refresh_all()
+    head = db.latest_change_id()
+    assert db.get_change_journal().empty  # consumed and pruned
+
+    _seed(db, through=120)                 # same prices again
+    assert db.latest_change_id() == head
+    _seed(db, through=125)
+    changes = db.get_change_journal()
+    assert set(changes["key"]) == set(TICKERS)
+    assert (changes["changed_from"] == DATES[120]).all()
+
+    db.record_trade("Traded", "BBB", "BUY", 1, 100.0, str(DATES[110].date()))
+    last = db.get_change_journal().iloc[-1]
+    assert (last["entity"], last["key"], last["changed_from"]) == ("portfolio", "Traded", DATES[110])
+
+
+def test_refresh_skips_portfolios_without_changed_inputs(tmp_path):
+    inc = _build(tmp_path, "inc", through=150)
+    bbb = Asset(ticker="BBB", name="BBB", asset_type=AssetType.STOCK, currency="USD",
+                sector="Technology")
+    inc.save_portfolio(Portfolio(name="OnlyBBB", positions=[
+        Position(asset=bbb, quantity=4, cost_basis=100),
+    ]))
+    AttributionEngine(inc).refresh_all()
+
+    aaa = _prices()[["AAA"]].iloc[150:160].rename(columns={"AAA": "Close"})
+    inc.save_prices("AAA", aaa)
+    result = AttributionEngine(inc).refresh_all()
+    assert result["skipped"] == ["OnlyBBB"]
+    assert result["modes"]["OnlyBBB"] == "static_current"
+    assert set(result["incremental"]) == {"Static", "Traded"}
+    assert result["security_rows"] == 10
+
+
+def test_price_correction_rewinds_from_changed_date(tmp_path):
+    inc = _build(tmp_path, "inc", through=200)
+    AttributionEngine(inc).refresh_all()
+    fixes = {"AAA": (120, 1.05), "BBB": (80, 0.97)}
+    _correct_prices(inc, fixes)
+    result = AttributionEngine(inc).refresh_all()
+    assert sorted(result["incremental"]) == ["Static", "Traded"]
+    # Static holds BBB, so it resumes at the BBB fix; nothing earlier is redone.
+    assert result["portfolio_rows"] < 2 * 200
+
+    ref = _build(tmp_path, "ref", through=200)
+    _correct_prices(ref, fixes)
+    AttributionEngine(ref).refresh_all(full=True)
+    _assert_same(inc, ref)
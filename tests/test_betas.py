@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.betas import SectorBetaEngine, betas_to_long, pairwise_betas
+from src.database.database import Database
+from src.scenarios import SECTOR_ETF_TICKERS
+
+
+def _loop_betas(y: pd.DataFrame, x: pd.DataFrame) -> pd.DataFrame:
+    """Reference: the original per-pair dropna/var/cov loop."""
+    out = pd.DataFrame(index=y.columns, columns=x.columns, dtype=float)
+    for a in y.columns:
+        for b in x.columns:
+            pair = pd.concat([y[a], x[b]], axis=1, keys=["a", "b"]).dropna()
+            if len(pair) < 2:
+                out.loc[a, b] = 0.0
+                continue
+            var_b = float(pair["b"].var())
+            out.loc[a, b] = float(pair["a"].cov(pair["b"]) / var_b) if var_b > 0 else 0.0
+    return out
+
+
+@pytest.fixture
+def rets():
+    rng = np.random.default_rng(7)
+    idx = pd.bdate_range("2020-01-01", periods=300)
+    base = rng.normal(0, 0.01, size=(300, 1))
+    df = pd.DataFrame(
+        base * np.array([1.0, 0.5, 1.5, -0.3]) + rng.normal(0, 0.005, size=(300, 4)),
+        index=idx, columns=["A", "B", "C", "D"],
+    )
+    df.iloc[:120, 2] = np.nan    # short history
+    df.iloc[50:60, 1] = np.nan   # gap
+    return df
+
+
+def test_square_matches_pairwise_loop(rets):
+    got = pairwise_betas(rets)
+    ref = _loop_betas(rets, rets).to_numpy(copy=True)
+    np.fill_diagonal(ref, 1.0)
+    np.testing.assert_allclose(got.values, ref, rtol=1e-9, atol=1e-12)
+
+
+def test_cross_set_matches_pairwise_loop(rets):
+    y = rets[["A", "C"]]
+    x = rets[["B", "D"]]
+    got = pairwise_betas(y, x)
+    assert list(got.index) == ["A", "C"]
+    assert list(got.columns) == ["B", "D"]
+    np.testing.assert_allclose(got.values, _loop_betas(y, x).values, rtol=1e-9, atol=1e-12)
+
+
+def test_insufficient_overlap_and_zero_variance_give_zero():
+    idx = pd.bdate_range("2024-01-01", periods=5)
+    df = pd.DataFrame({
+        "A": [0.01, 0.02, np.nan, np.nan, np.nan],
+        "B": [np.nan, np.nan, 0.01, 0.03, -0.01],
+        "C": [0.0, 0.0, 0.0, 0.0, 0.0],
+    }, index=idx)
+    got = pairwise_betas(df)
+    assert got.loc["A", "B"] == 0.0
+    assert got.loc["B", "C"] == 0.0
+    assert got.loc["C", "C"] == 1.0
+
+
+def test_betas_to_long_layout(rets):
+    long = betas_to_long(pairwise_betas(rets))
+    assert list(long.columns) == ["sector_a", "sector_b", "beta"]
+    assert len(long) == 16
+
+
+# --- SectorBetaEngine (incremental sufficient statistics) ---
+
+
+@pytest.fixture
+def sector_db(tmp_path):
+    db = Database(data_dir=str(tmp_path))
+    rng = np.random.default_rng(11)
+    idx = pd.bdate_range("2022-01-03", "2024-06-28")
+    market = rng.normal(0, 0.01, size=len(idx))
+    for i, t in enumerate(SECTOR_ETF_TICKERS.values()):
+        rets = market * (0.5 + 0.1 * i) + rng.normal(0, 0.004, size=len(idx))
+        close = 100.0 * np.cumprod(1.0 + rets)
+        df = pd.DataFrame({"Close": close}, index=idx)
+        if t == "XLC":
+            df = df.iloc[200:]  # shorter history
+        db.save_prices(t, df)
+    return db
+
+
+def _betas(db):
+    return db.get_sector_betas().set_index(["sector_a", "sector_b"])["beta"].sort_index()
+
+
+def test_incremental_rolling_matches_full_rebuild(sector_db):
+    engine = SectorBetaEngine(sector_db)
+    first = engine.refresh(years=1, fetch=False, as_of=pd.Timestamp("2024-03-29"))
+    assert first["mode"] == "full"
+
+    second = engine.refresh(years=1, fetch=False, as_of=pd.Timestamp("2024-06-28"))
+    assert second["mode"] == "incremental"
+    assert second["new_days"] > 0 and second["expired_days"] > 0
+    incremental = _betas(sector_db)
+
+    engine.refresh(years=1, fetch=False, full=True, as_of=pd.Timestamp("2024-06-28"))
+    np.testing.assert_allclose(incremental.values, _betas(sector_db).values, rtol=1e-8, atol=1e-10)
+
+
+def test_full_refresh_matches_pairwise_betas(sector_db):
+    SectorBetaEngine(sector_db).refresh(years=1, fetch=False, as_of=pd.Timestamp("2024-06-28"))
+    tickers = list(SECTOR_ETF_TICKERS.values())
+    prices = sector_db.get_historical_prices(tickers).sort_index()
+    prices = prices.rename(columns={v: k for k, v in SECTOR_ETF_TICKERS.items()})
+    rets = prices.pct_change()
+    rets = rets[rets.index > pd.Timestamp("2023-06-28")]
+    expected = betas_to_long(pairwise_betas(rets)).set_index(["sector_a", "sector_b"])["beta"].sort_index()
+    np.testing.assert_allclose(_betas(sector_db).values, expected.values, rtol=1e-8, atol=1e-10)
+
+
+def test_rewritten_prices_or_wider_window_rebuild(sector_db):
+    engine = SectorBetaEngine(sector_db)
+    engine.refresh(years=1, fetch=False, as_of=pd.Timestamp("2024-03-29"))
+
+    # A dividend re-adjustment rewrites XLK's history inside the window.
+    px = sector_db.get_historical_prices(["XLK"])["XLK"]
+    sector_db.save_prices("XLK", pd.DataFrame({"Close": px * 0.99}))
+    second = engine.refresh(years=1, fetch=False, as_of=pd.Timestamp("2024-06-28"))
+    assert second["mode"] == "full"
+    rebuilt = _betas(sector_db)
+    engine.refresh(years=1, fetch=False, full=True, as_of=pd.Timestamp("2024-06-28"))
+    np.testing.assert_allclose(rebuilt.values, _betas(sector_db).values, rtol=1e-8, atol=1e-10)
+
+    # Nothing changed since: incremental. Asking for two years: rebuilt.
+    assert engine.refresh(years=1, fetch=False, as_of=pd.Timestamp("2024-06-28"))["mode"] == "incremental"
+    wider = engine.refresh(years=2, fetch=False, as_of=pd.Timestamp("2024-06-28"))
+    assert wider["mode"] == "full" and wider["window_start"] == "2022-06-28"
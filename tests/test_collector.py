@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+import src.collector as collector_mod
+from src.collector import Collector
+from src.database.database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(data_dir=str(tmp_path))
+
+
+@pytest.fixture
+def fake_download(monkeypatch):
+    def _download(ticker, period="1y", progress=False, auto_adjust=None):
+        assert auto_adjust is True
+        time.sleep(0.05)
+        if ticker == "EMPTY":
+            return pd.DataFrame()
+        if ticker == "BAD":
+            raise ValueError("boom")
+        idx = pd.to_datetime(["2024-01-02", "2024-01-03"])
+        return pd.DataFrame({"Close": [10.0, 11.0]}, index=idx)
+
+    monkeypatch.setattr(collector_mod.yf, "download", _download)
+
+
+def test_collect_prices_sync_wrapper_returns_per_ticker_status(db, fake_download, caplog):
+    with caplog.at_level("WARNING", logger="src.collector"):
+        res = Collector(db).collect_prices(["AAA", "EMPTY", "BAD", "AAA"])
+    assert "Error fetching prices for BAD: boom" in caplog.text
+    assert list(res) == ["AAA", "EMPTY", "BAD"]
+    assert res["AAA"] == {"status": "ok", "rows": 2}
+    assert res["EMPTY"]["status"] == "empty"
+    assert res["BAD"]["status"] == "error"
+    assert db.get_historical_prices(["AAA"])["AAA"].tolist() == [10.0, 11.0]
+
+
+def test_collect_prices_works_inside_running_loop(db, fake_download):
+    async def _inner():
+        return Collector(db).collect_prices(["AAA"])
+
+    assert asyncio.run(_inner())["AAA"]["status"] == "ok"
+
+
+def test_acollect_prices_reports_progress(db, fake_download):
+    seen = []
+    asyncio.run(Collector(db).acollect_prices(
+        ["A", "B", "C"], on_progress=lambda done, total, t: seen.append((done, total)),
+    ))
+    assert seen[-1] == (3, 3)
+
+
+def test_background_fetch_cancel_stops_pending_tickers(db, fake_download):
+    handle = Collector(db).start_background_fetch([f"T{i}" for i in range(40)])
+    time.sleep(0.08)
+    handle.cancel()
+    handle.wait(timeout=5)
+    assert handle.done
+    assert handle.cancelled
+    assert handle.completed < 40
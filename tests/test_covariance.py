@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.covariance import EWMA_DECAY, CovarianceEngine, ledoit_wolf_constant_correlation
+from src.database.database import Database
+
+DATES = pd.bdate_range("2023-01-02", periods=260)
+TICKERS = ["AAA", "BBB", "CCC"]
+
+
+def _prices(seed: int = 3) -> dict[str, pd.Series]:
+    rng = np.random.default_rng(seed)
+    out = {t: pd.Series(100 * np.cumprod(1 + rng.normal(0, 0.01, len(DATES))), index=DATES) for t in TICKERS}
+    out["CCC"] = out["CCC"].iloc[60:]   # lists late
+    out["BBB"] = out["BBB"].drop(DATES[[100, 101, 150]])  # gaps
+    return out
+
+
+def _build(tmp_path, name: str, through: int = len(DATES)) -> Database:
+    db = Database(str(tmp_path / name))
+    for t, px in _prices().items():
+        db.save_prices(t, pd.DataFrame({"Close": px[px.index <= DATES[through - 1]]}))
+    return db
+
+
+def test_full_build_matches_recursion(tmp_path):
+    db = _build(tmp_path, "db")
+    CovarianceEngine(db).refresh()
+    cov = CovarianceEngine(db).covariance(["AAA", "BBB"])
+
+    # AAA's variance: plain RiskMetrics recursion from 0, bias-corrected.
+    r = db.get_historical_prices(["AAA"])["AAA"].pct_change().dropna().to_numpy()
+    var = 0.0
+    for x in r:
+        var = EWMA_DECAY * var + (1 - EWMA_DECAY) * x * x
+    assert cov.loc["AAA", "AAA"] == pytest.approx(var / (1 - EWMA_DECAY ** len(r)))
+    assert cov.loc["AAA", "BBB"] == cov.loc["BBB", "AAA"]
+
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path):
+    inc = _build(tmp_path, "inc", through=200)
+    engine = CovarianceEngine(inc)
+    assert engine.refresh()["mode"] == "full"
+    for t, px in _prices().items():
+        inc.save_prices(t, pd.DataFrame({"Close": px}))
+    result = engine.refresh()
+    assert result["mode"] == "incremental"
+    assert result["new_days"] == 60
+    assert result["as_of"] == str(DATES[-1].date())
+
+    ref = _build(tmp_path, "ref")
+    CovarianceEngine(ref).refresh()
+    pd.testing.assert_frame_equal(engine.covariance(), CovarianceEngine(ref).covariance(), rtol=1e-10)
+    assert inc.list_ewma_covariance_dates() == [str(DATES[-1].date()), str(DATES[199].date())]
+
+
+def test_backdated_price_correction_rebuilds(tmp_path):
+    db = _build(tmp_path, "db")
+    engine = CovarianceEngine(db)
+    engine.refresh()
+    before = engine.covariance()
+    px = _prices()["AAA"].copy()
+    px.iloc[10] *= 1.05
+    db.save_prices("AAA", pd.DataFrame({"Close": px}))
+    assert engine.refresh()["mode"] == "full"
+    after = engine.covariance()
+    assert after.loc["AAA", "AAA"] != before.loc["AAA", "AAA"]
+    assert after.loc["CCC", "CCC"] == pytest.approx(before.loc["CCC", "CCC"])
+
+
+def test_accessor_fills_unpriced_and_annualises(tmp_path):
+    db = _build(tmp_path, "db")
+    engine = CovarianceEngine(db)   # no snapshot yet → computed, not saved
+    cov = engine.covariance(["CASH", "AAA"], annualize=True)
+    assert db.list_ewma_covariance_dates() == []
+    assert db.get_journal_cursor("covariance") is None
+    assert list(cov.index) == ["CASH", "AAA"]
+    assert (cov.loc["CASH"] == 0).all()
+    assert cov.loc["AAA", "AAA"] == pytest.approx(engine.covariance(["AAA"]).iloc[0, 0] * 252)
+    corr = engine.correlation(TICKERS)
+    assert np.allclose(np.diag(corr), 1.0)
+    # Same numbers as the snapshot the refresh job writes.
+    engine.refresh()
+    pd.testing.assert_frame_equal(engine.correlation(TICKERS), corr, rtol=1e-10)
+    assert np.isnan(engine.correlation(["CASH", "AAA"]).loc["CASH", "AAA"])
+
+
+def test_shrunk_covariance_is_factored_and_cached(tmp_path):
+    db = _build(tmp_path, "db")
+    engine = CovarianceEngine(db)
+    engine.refresh()
+    est = engine.shrunk(["AAA", "CASH", "BBB", "CCC"])
+    assert 0.0 <= est.shrinkage <= 1.0
+    assert est.window_end == str(DATES[-1].date())
+    cov = est.covariance.to_numpy()
+    assert np.allclose(est.cholesky @ est.cholesky.T, cov)
+    assert (cov[1] == 0).all()                      # cash factored out
+    live = np.ix_([0, 2, 3], [0, 2, 3])
+    assert np.linalg.eigvalsh(cov[live]).min() > 0
+    assert engine.shrunk(["AAA", "CASH", "BBB", "CCC"]) is est
+
+    # A new snapshot date moves the window and invalidates the entry.
+    extra = pd.bdate_range(DATES[-1] + pd.offsets.BDay(), periods=5)
+    for t in TICKERS:
+        db.save_prices(t, pd.DataFrame({"Close": np.linspace(100, 101, 5)}, index=extra))
+    engine.refresh()
+    assert engine.shrunk(["AAA", "CASH", "BBB", "CCC"]).window_end == str(extra[-1].date())
+
+
+def test_shrunk_window_survives_a_late_listing(tmp_path):
+    db = _build(tmp_path, "db")
+    engine = CovarianceEngine(db)
+    engine.refresh()
+    # NEW listed 70 days ago: AAA's variance still uses its whole window.
+    db.save_prices("NEW", pd.DataFrame({"Close": np.linspace(50, 60, 70)}, index=DATES[-70:]))
+    est = engine.shrunk(["AAA", "NEW"], window=200)
+    aaa = db.get_historical_prices(["AAA"])["AAA"].pct_change().iloc[-200:]
+    assert est.covariance.loc["AAA", "AAA"] == pytest.approx(aaa.var(ddof=1))
+    assert est.covariance.loc["NEW", "NEW"] > 0
+
+    db.save_prices("TINY", pd.DataFrame({"Close": [10.0, 10.5, 10.2]}, index=DATES[-3:]))
+    with pytest.raises(ValueError, match="TINY"):
+        engine.shrunk(["AAA", "TINY"])
+
+
+def test_shrinkage_rescues_a_wide_sample():
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 0.01, (20, 40))               # fewer days than tickers
+    cov, delta = ledoit_wolf_constant_correlation(X)
+    assert delta > 0
+    np.linalg.cholesky(cov)
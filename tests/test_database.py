@@ -166,6 +166,26 @@ def test_get_historical_prices_all_missing_returns_empty(db):
     assert result.empty
 
 
+# --- fund profiles ---
+
+def test_save_fund_profiles_bulk_writes_every_fund(db):
+    db.save_fund_profiles({
+        "VTI": {"asset_classes": {"stockPosition": 0.99}, "sector_weightings": {"technology": 0.3}},
+        "BND": {"asset_classes": {"bondPosition": 0.98}, "sector_weightings": {}},
+    }, "2024-01-05")
+    assert db.get_fund_profile("VTI")["sector_weightings"] == {"technology": 0.3}
+    assert db.get_fund_profile("BND")["asset_classes"] == {"bondPosition": 0.98}
+
+
+def test_save_fund_profiles_replaces_same_date_only(db):
+    db.save_fund_profile("VTI", "2024-01-01", {"stockPosition": 0.9}, {})
+    db.save_fund_profile("VTI", "2024-01-05", {"stockPosition": 0.8}, {})
+    db.save_fund_profiles({"VTI": {"asset_classes": {"stockPosition": 0.7}}}, "2024-01-05")
+    assert db.list_fund_profile_dates("VTI") == ["2024-01-05", "2024-01-01"]
+    assert db.get_fund_profile("VTI")["asset_classes"] == {"stockPosition": 0.7}
+    assert db.latest_fund_profile_dates() == {"VTI": "2024-01-05"}
+
+
 # --- No sqlite3 references remain ---
 
 def test_no_sqlite3_in_database_module():
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.income import payment_mask, portfolio_income, project_income
+from src.models import Asset, AssetType, Portfolio, Position
+
+
+def _pos(ticker, asset_type, qty, cost, rate, freq):
+    return Position(
+        asset=Asset(ticker=ticker, name=ticker, asset_type=asset_type, currency="USD",
+                    income_rate=rate, payment_frequency=freq),
+        quantity=qty, cost_basis=cost,
+    )
+
+
+BOOK = [
+    Portfolio(name="Income", positions=[
+        _pos("BLK", AssetType.STOCK, 10, 800.0, 5.72, 4),      # $/share/payment, quarterly
+        _pos("TBOND", AssetType.BOND, 100, 95.0, 4.0, 2),      # 4% on value, semi-annual
+        _pos("USD", AssetType.CASH, 5000, 1.0, 3.0, 12),       # 3% monthly
+    ]),
+    Portfolio(name="Growth", positions=[
+        _pos("NVDA", AssetType.STOCK, 5, 400.0, 0.0, 4),
+        _pos("BLK", AssetType.STOCK, 2, 800.0, 5.72, 4),
+    ]),
+    Portfolio(name="Empty", positions=[]),
+]
+
+
+def test_annual_income_units_and_prices():
+    proj = portfolio_income(BOOK, latest_prices={"TBOND": 100.0})
+    pos = proj.positions.set_index(["Portfolio", "Ticker"])
+    assert pos.loc[("Income", "BLK"), "Annual Income"] == pytest.approx(10 * 5.72 * 4)
+    assert pos.loc[("Income", "TBOND"), "Annual Income"] == pytest.approx(100 * 100.0 * 0.04)
+    assert pos.loc[("Income", "USD"), "Yield on Base (%)"] == pytest.approx(3.0)
+    assert pos.loc[("Income", "BLK"), "Income Rate Unit"] == "$/share/payment"
+    assert proj.annual.to_dict() == pytest.approx({"Income": 228.8 + 400.0 + 150.0, "Growth": 45.76, "Empty": 0.0})
+
+
+def test_calendar_follows_payment_frequency_and_sums_to_annual():
+    proj = portfolio_income(BOOK)
+    cal = proj.calendar
+    assert list(cal.columns) == list(range(1, 13))
+    np.testing.assert_allclose(cal.sum(axis=1), proj.annual)
+    income = cal.loc["Income"]
+    # Monthly cash every month; quarterly BLK in Mar/Jun/Sep/Dec; semi-annual bond in Jun/Dec.
+    assert income[1] == pytest.approx(12.5)
+    assert income[3] == pytest.approx(12.5 + 57.2)
+    assert income[6] == pytest.approx(12.5 + 57.2 + 190.0)
+    assert (cal.loc["Empty"] == 0).all()
+
+
+def test_payment_mask_odd_frequencies():
+    mask = payment_mask(np.array([1, 5, 52]))
+    assert mask[0].tolist() == [False] * 11 + [True]
+    assert mask[1].sum() == 6          # every other month
+    assert mask[2].all()               # more often than monthly → every month
+
+
+def test_project_income_from_assets_table():
+    holdings = pd.DataFrame({
+        "portfolio_name": ["A", "B", "A"],
+        "ticker": ["X", "X", "UNKNOWN"],
+        "quantity": [10.0, 1.0, 3.0],
+        "cost_basis": [50.0, 50.0, 10.0],
+    })
+    assets = pd.DataFrame({
+        "ticker": ["X"], "asset_type": ["ETF"], "income_rate": [0.5], "payment_frequency": [4],
+    })
+    proj = project_income(holdings, assets)
+    assert proj.annual.to_dict() == pytest.approx({"A": 20.0, "B": 2.0})
+    assert proj.positions["Annual Income"].iloc[2] == 0.0
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.database.database import Database
+from src.integrity import PriceIntegrityScanner
+
+
+def _save(db: Database, ticker: str, s: pd.Series) -> None:
+    db.save_prices(ticker, s.dropna().to_frame("Close"))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "data"))
+    rng = np.random.default_rng(3)
+    idx = pd.bdate_range("2024-01-01", periods=120)
+    for t in ["AAA", "BBB", "CCC", "DDD"]:
+        px = pd.Series(100 * np.cumprod(1 + rng.normal(0, 0.005, len(idx))), index=idx)
+        if t == "AAA":
+            px.iloc[40:43] = np.nan       # 3-day gap
+        if t == "BBB":
+            px.iloc[80:] /= 2             # unadjusted 2:1 split
+        if t == "CCC":
+            px = px.iloc[:100]            # stopped updating
+        _save(db, t, px)
+    # A day nobody traded is a holiday, not a gap.
+    for t in ["AAA", "BBB", "CCC", "DDD"]:
+        path = db._prices_path(t)
+        df = pd.read_parquet(path)
+        df.drop(index=idx[10]).to_parquet(path)
+    return db
+
+
+def test_scan_flags_gap_stale_and_split(db):
+    issues = PriceIntegrityScanner(db).scan()
+
+    gaps = issues[issues["issue_type"] == "gap"]
+    assert gaps["ticker"].tolist() == ["AAA"]
+    assert gaps.iloc[0]["n_days"] == 3
+    assert gaps.iloc[0]["start_date"] == pd.bdate_range("2024-01-01", periods=120)[40]
+
+    stale = issues[issues["issue_type"] == "stale"]
+    assert stale["ticker"].tolist() == ["CCC"]
+    assert stale.iloc[0]["n_days"] == 20
+
+    outliers = issues[issues["issue_type"] == "outlier"]
+    assert outliers["ticker"].tolist() == ["BBB"]
+    assert "split-like" in outliers.iloc[0]["detail"]
+
+
+def test_refetch_ranges_are_targeted(db):
+    scanner = PriceIntegrityScanner(db)
+    ranges = scanner.refetch_ranges(scanner.scan()).set_index("ticker")
+    idx = pd.bdate_range("2024-01-01", periods=120)
+
+    assert ranges.loc["AAA", "start_date"] == idx[40]
+    assert ranges.loc["AAA", "end_date"] == idx[42]
+    # Split-like jumps re-pull everything up to (and just past) the jump.
+    assert ranges.loc["BBB", "start_date"] == idx[0]
+    assert ranges.loc["CCC", "start_date"] == idx[100]
+
+
+def test_repair_persists_issues_and_drains_queue(db, monkeypatch):
+    calls = []
+
+    def fake_fetch(self, ticker, start, end):
+        calls.append((ticker, pd.Timestamp(start), pd.Timestamp(end)))
+        return 0 if ticker == "CCC" else 3
+
+    monkeypatch.setattr("src.collector.Collector.fetch_price_range", fake_fetch)
+    result = PriceIntegrityScanner(db).repair()
+
+    assert result["issues"] == {"gap": 1, "outlier": 1, "stale": 1}
+    assert result["enqueued"] == 3
+    assert sorted(c[0] for c in calls) == ["AAA", "BBB", "CCC"]
+    assert len(db.get_price_issues()) == 3
+
+    queue = db.get_price_refetch_queue()
+    assert dict(zip(queue["ticker"], queue["status"])) == {
+        "AAA": "done", "BBB": "done", "CCC": "empty",
+    }
+    assert db.get_price_refetch_queue(status="pending").empty
+
+
+def test_enqueue_skips_ranges_already_pending(db):
+    scanner = PriceIntegrityScanner(db)
+    ranges = scanner.refetch_ranges(scanner.scan())
+    assert db.enqueue_price_refetch(ranges) == 3
+    assert db.enqueue_price_refetch(ranges) == 0
+    assert len(db.get_price_refetch_queue(status="pending")) == 3
+
+
+def test_second_repair_refetches_nothing(db, monkeypatch):
+    calls = []
+
+    def fake_fetch(self, ticker, start, end):
+        calls.append(ticker)
+        return 0 if ticker == "CCC" else 3
+
+    monkeypatch.setattr("src.collector.Collector.fetch_price_range", fake_fetch)
+    scanner = PriceIntegrityScanner(db)
+    scanner.repair()
+    assert len(db.get_resolved_price_issues()) == 3
+
+    # The fake fetch wrote nothing, so every issue is still in the data —
+    # but each was already re-fetched once and is not pulled again.
+    calls.clear()
+    result = scanner.repair()
+    assert calls == [] and result["enqueued"] == 0
+    assert result["issues"] == {}
+    assert scanner.scan(include_resolved=True)["ticker"].tolist() == ["AAA", "BBB", "CCC"]
+
+
+def test_outliers_only_checked_on_new_dates(db, monkeypatch):
+    monkeypatch.setattr("src.collector.Collector.fetch_price_range", lambda self, t, s, e: 1)
+    scanner = PriceIntegrityScanner(db)
+    db.resolve_price_issues(scanner.scan(), "acknowledged")
+    scanner.repair()
+
+    # A new jump on DDD is found; BBB's acknowledged split is not re-flagged.
+    px = db.get_historical_prices(["DDD"])["DDD"]
+    new_day = px.index[-1] + pd.offsets.BDay(1)
+    _save(db, "DDD", pd.Series([px.iloc[-1] * 1.6], index=[new_day]))
+    assert scanner.changed_since_last_scan() == {"DDD": new_day}
+    result = scanner.repair(fetch=False)
+    assert result["issues"] == {"outlier": 1}
+    assert db.get_price_issues()["ticker"].tolist() == ["DDD"]
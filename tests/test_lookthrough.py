@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.database.database import Database
+from src.lookthrough import LookthroughEngine
+from src.models import Asset, AssetType, Constituent, Portfolio, Position
+from src.reporting import ReportingEngine
+from src.stress import StressEngine
+
+
+def _pos(ticker, asset_type, qty, cost, sector=None, constituents=None):
+    return Position(
+        asset=Asset(ticker=ticker, name=ticker, asset_type=asset_type, currency="USD",
+                    sector=sector, constituents=constituents or []),
+        quantity=qty, cost_basis=cost,
+    )
+
+
+def _holdings(rows):
+    return pd.DataFrame(rows, columns=["holding_ticker", "holding_name", "weight", "sector", "asset_type"])
+
+
+@pytest.fixture
+def setup(tmp_path):
+    db = Database(str(tmp_path / "db"))
+    # VTI has both vendor holdings and a profile: vendor wins.
+    db.save_fund_holdings("VTI", "2024-06-30", _holdings([
+        ("AAPL", "Apple", 0.6, "Technology", "Stock"),
+        ("JNJ", "Johnson & Johnson", 0.4, "Health Care", "Stock"),
+    ]))
+    db.save_fund_profile("VTI", "2024-06-01", {"stockPosition": 1.0}, {"energy": 1.0})
+    db.save_fund_profile("AGG", "2024-06-01", {"stockPosition": 0.25, "bondPosition": 0.75},
+                         {"technology": 1.0})
+    basket = _pos("BSKT", AssetType.STOCK, 10, 10.0,
+                  constituents=[Constituent("AAPL", 0.5), Constituent("XOM", 0.5)])
+    for t, sector in (("AAPL", "Technology"), ("XOM", "Energy")):
+        db.add_asset(_pos(t, AssetType.STOCK, 0, 0.0, sector=sector).asset)
+    db.add_asset(basket.asset)
+    portfolios = [
+        Portfolio(name="Core", positions=[
+            _pos("VTI", AssetType.ETF, 10, 200.0),
+            _pos("AGG", AssetType.ETF, 20, 100.0),
+            _pos("AAPL", AssetType.STOCK, 5, 150.0, sector="Technology"),
+        ]),
+        Portfolio(name="Other", positions=[basket, _pos("QQQ", AssetType.ETF, 2, 300.0)]),
+    ]
+    return db, portfolios
+
+
+def test_operator_resolves_best_source_per_instrument(setup):
+    db, portfolios = setup
+    engine = LookthroughEngine(db)
+    op = engine.operator()
+    assert op.source.to_dict() == {"VTI": "vendor", "BSKT": "constituents", "AGG": "yfinance"}
+    assert np.allclose(np.asarray(op.matrix.sum(axis=1)).ravel(), 1.0)
+    vti = op.lines.iloc[op.matrix[op.instruments.get_loc("VTI")].indices]
+    assert vti["Ticker"].tolist() == ["AAPL", "JNJ"]
+    # Constituents apply to any type; vendor / profile rows only to ETF / Fund.
+    assert op.rows(["BSKT", "VTI", "VTI", "QQQ"], ["Stock", "ETF", "Stock", "ETF"])[2:].tolist() == [-1, -1]
+    assert engine.operator() is op
+    assert engine.sources(portfolios) == {
+        "vendor": ["VTI"], "constituents": ["BSKT"], "yfinance": ["AGG"],
+    }
+
+
+def test_expand_preserves_dollars_and_exposure_matches_rows(setup):
+    db, portfolios = setup
+    engine = LookthroughEngine(db)
+    prices = {"VTI": 250.0, "AAPL": 180.0}
+    rows = engine.expand(portfolios, prices)
+    native = engine.expand(portfolios, prices, lookthrough=False)
+    pd.testing.assert_series_equal(
+        rows.groupby("Portfolio")["Current Value"].sum(), native.groupby("Portfolio")["Current Value"].sum(),
+    )
+    core = rows[rows["Portfolio"] == "Core"].set_index("Ticker")
+    assert core.loc["JNJ", "Current Value"] == pytest.approx(0.4 * 2500.0)
+    assert core.loc["AGG → Bond", "Current Value"] == pytest.approx(0.75 * 2000.0)
+    assert core.loc["AGG → Bond", "Quantity"] is None
+
+    exposure = engine.exposure(portfolios, prices)
+    expected = rows.groupby(["Portfolio", "Type", "Sector"])["Current Value"].sum().unstack("Portfolio", fill_value=0.0)
+    pd.testing.assert_frame_equal(
+        exposure.reindex(expected.index), expected, check_names=False, check_column_type=False,
+    )
+
+
+def test_new_snapshot_invalidates_operator(setup):
+    db, portfolios = setup
+    engine = LookthroughEngine(db)
+    before = engine.operator()
+    db.save_fund_holdings("QQQ", "2024-06-30", _holdings([("MSFT", "Microsoft", 1.0, "Technology", "Stock")]))
+    after = engine.operator()
+    assert after is not before and after.source["QQQ"] == "vendor"
+
+    # Reporting, stress and the operator agree on the new snapshot.
+    weight = ReportingEngine(db).get_portfolio_exposure(portfolios[1])["Weight"]
+    assert weight.loc[("Stock", "Technology")] == pytest.approx(600.0 + 50.0)
+    ex = StressEngine(db).exposures(portfolios[1])
+    E = ex.loadings.set_index(ex.positions["Ticker"])
+    assert E.loc["QQQ", "technology"] == pytest.approx(1.0)
+    assert E.loc["BSKT", ["technology", "energy"]].tolist() == pytest.approx([0.5, 0.5])
+    assert ex.positions.set_index("Ticker").loc["QQQ", "Source"] == "vendor: 1 holdings"
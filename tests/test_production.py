@@ -0,0 +1,57 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from src.database.database import Database
+from src.models import Asset, AssetType
+from src.production import FUND_PROFILE_MAX_AGE_DAYS, _refresh_fund_profiles_job
+
+
+class StubCollector:
+    instances = []
+
+    def __init__(self, db):
+        self.calls = []
+        self.lock = threading.Lock()
+        StubCollector.instances.append(self)
+
+    def fetch_fund_profile(self, ticker):
+        with self.lock:
+            self.calls.append(ticker)
+        if ticker == "BAD":
+            raise ValueError(f"No fund profile data available for {ticker}")
+        return {"asset_classes": {"stockPosition": 1.0}, "sector_weightings": {"technology": 1.0}}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = Database(str(tmp_path / "db"))
+    for t, at in [("FRESH", AssetType.ETF), ("STALE", AssetType.ETF), ("NEW", AssetType.FUND),
+                  ("BAD", AssetType.ETF), ("AAPL", AssetType.STOCK)]:
+        db.add_asset(Asset(ticker=t, name=t, asset_type=at, currency="USD"))
+    today = pd.Timestamp.today().normalize()
+    db.save_fund_profile("FRESH", (today - pd.Timedelta(days=1)).date().isoformat(), {"stockPosition": 1.0}, {})
+    old = today - pd.Timedelta(days=FUND_PROFILE_MAX_AGE_DAYS + 3)
+    db.save_fund_profile("STALE", old.date().isoformat(), {"stockPosition": 0.5}, {})
+    StubCollector.instances = []
+    monkeypatch.setattr("src.production.Collector", StubCollector)
+    return db
+
+
+def test_fund_profile_job_skips_fresh_and_isolates_failures(db):
+    result = _refresh_fund_profiles_job(db, max_workers=3)
+
+    assert result["skipped"] == ["FRESH"]
+    assert sorted(result["refreshed"]) == ["NEW", "STALE"]
+    assert len(result["failed"]) == 1 and result["failed"][0].startswith("BAD:")
+    assert result["counts"] == {"refreshed": 2, "skipped": 1, "failed": 1}
+
+    # One collector shared by every worker; stocks and fresh funds untouched.
+    assert len(StubCollector.instances) == 1
+    assert sorted(StubCollector.instances[0].calls) == ["BAD", "NEW", "STALE"]
+
+    today = pd.Timestamp.today().normalize().date().isoformat()
+    assert db.latest_fund_profile_dates()["STALE"] == today
+    assert db.get_fund_profile("STALE")["asset_classes"] == {"stockPosition": 1.0}
+    assert "BAD" not in db.latest_fund_profile_dates()
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import norm
+
+from src.covariance import CovarianceEngine
+from src.database.database import Database
+from src.models import Asset, AssetType, Portfolio, Position
+from src.reporting import ReportingEngine
+from src.risk import RiskEngine
+
+DATES = pd.bdate_range("2023-01-02", periods=300)
+
+
+def _asset(t: str) -> Asset:
+    return Asset(ticker=t, name=t, asset_type=AssetType.STOCK, currency="USD")
+
+
+def _pf(name: str, holdings: dict) -> Portfolio:
+    return Portfolio(name=name, positions=[
+        Position(asset=_asset(t), quantity=q, cost_basis=c) for t, (q, c) in holdings.items()
+    ])
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "db"))
+    rng = np.random.default_rng(11)
+    for t in ["AAA", "BBB", "CCC"]:
+        db.add_asset(_asset(t))
+        px = 50 * np.cumprod(1 + rng.normal(0.0002, 0.012, len(DATES)))
+        db.save_prices(t, pd.DataFrame({"Close": px}, index=DATES))
+    return db
+
+
+BOOK = [
+    _pf("Growth", {"AAA": (10, 40.0), "BBB": (5, 80.0)}),
+    _pf("Income", {"BBB": (20, 45.0), "CCC": (30, 60.0)}),
+    _pf("Solo", {"CCC": (1, 10.0)}),
+]
+
+
+def test_market_value_weights_match_manual(db):
+    result = RiskEngine(db).portfolio_risk(BOOK)
+    prices = db.get_historical_prices(["AAA", "BBB"])
+    mv = np.array([10, 5]) * prices.iloc[-1].to_numpy()
+    port = prices.pct_change().dropna().to_numpy() @ (mv / mv.sum())
+
+    row = result.loc["Growth"]
+    assert row["market_value"] == pytest.approx(mv.sum())
+    assert row["volatility"] == pytest.approx(port.std(ddof=1) * np.sqrt(252))
+    assert row["var_95"] == pytest.approx(np.percentile(port, 5))
+    assert row["cvar_95"] == pytest.approx(port[port <= np.percentile(port, 5)].mean())
+    # Parametric VaR reads the shared EWMA covariance, not the sample σ of P.
+    w = mv / mv.sum()
+    cov = CovarianceEngine(db).covariance(["AAA", "BBB"]).to_numpy()
+    mu = prices.pct_change().mean().to_numpy()
+    assert row["parametric_var_99"] == pytest.approx(w @ mu + norm.ppf(0.01) * np.sqrt(w @ cov @ w))
+    assert row["cvar_99"] <= row["var_99"] <= row["var_95"]
+
+
+def test_batch_matches_one_at_a_time(db):
+    engine = RiskEngine(db)
+    batch = engine.portfolio_risk(BOOK)
+    for pf in BOOK:
+        single = engine.portfolio_risk([pf])
+        pd.testing.assert_series_equal(batch.loc[pf.name], single.loc[pf.name])
+
+
+def test_missing_days_renormalise_weights(db):
+    # NEW lists late: before that, the portfolio is all BBB rather than NaN.
+    px = db.get_historical_prices(["CCC"])["CCC"]
+    db.add_asset(_asset("NEW"))
+    db.save_prices("NEW", pd.DataFrame({"Close": px.iloc[100:]}))
+    engine = RiskEngine(db)
+    returns, latest = engine.load_returns(["BBB", "NEW"])
+    weights = engine.weight_matrix(engine.holdings([_pf("Late", {"BBB": (20, 45.0), "NEW": (30, 60.0)})]), latest)
+    series = engine.portfolio_returns(weights, returns)["Late"]
+    assert series.notna().all()
+    pd.testing.assert_series_equal(series.iloc[:99], returns["BBB"].iloc[:99], check_names=False)
+    assert not np.allclose(series.iloc[100:], returns["BBB"].iloc[100:])
+
+
+def test_reporting_delegates_to_engine(db):
+    metrics = ReportingEngine(db).get_portfolio_risk_metrics(BOOK[1])
+    row = RiskEngine(db).portfolio_risk([BOOK[1]]).iloc[0]
+    assert metrics["Volatility"] == pytest.approx(row["volatility"])
+    assert metrics["CVaR (95%)"] == pytest.approx(row["cvar_95"])
+    assert list(metrics["Covariance Matrix"].columns) == ["BBB", "CCC"]
+
+
+def test_unpriced_and_empty_portfolios(db):
+    cash = _pf("Cash", {"USD-CASH": (1000, 1.0)})
+    # No price file: valued at cost, constant 1.0 on the other tickers' calendar.
+    result = RiskEngine(db).portfolio_risk([BOOK[0], cash, Portfolio(name="Empty", positions=[])])
+    assert result.loc["Cash", "market_value"] == pytest.approx(1000.0)
+    assert result.loc["Cash", "volatility"] == pytest.approx(0.0)
+    assert result.loc["Empty"].isna().all()
+
+
+def test_var_contributions_sum_to_portfolio_var(db):
+    engine = RiskEngine(db)
+    contrib = engine.var_contributions(BOOK)
+    risk = engine.portfolio_risk(BOOK)
+    totals = contrib.groupby("portfolio_name")[["component_var", "hist_component_var", "pct_contribution"]].sum()
+    # Complete data: the Euler sum equals the series' μ + z·σ exactly.
+    assert np.allclose(totals["component_var"], risk.loc[totals.index, "parametric_var_95"])
+    assert np.allclose(totals["hist_component_var"], risk.loc[totals.index, "var_95"])
+    assert np.allclose(totals["pct_contribution"], 1.0)
+    growth = contrib[contrib["portfolio_name"] == "Growth"].set_index("ticker")
+    assert np.allclose(growth["component_var"], growth["weight"] * growth["marginal_var"])
+
+    # One portfolio alone gives the same rows.
+    solo = engine.var_contributions([BOOK[1]]).set_index("ticker")
+    pd.testing.assert_frame_equal(
+        solo, contrib[contrib["portfolio_name"] == "Income"].set_index("ticker"), check_names=False,
+    )
+    assert list(ReportingEngine(db).get_var_decomposition(BOOK[1]).index) == ["BBB", "CCC"]
+
+
+def test_var_components_sum_to_reported_var_with_gaps(db):
+    # BBB misses a stretch of days: P renormalises over them, but the
+    # decomposition and the headline parametric VaR share one μ and Σ.
+    px = db.get_historical_prices(["BBB"])["BBB"]
+    db.save_prices("GAP", pd.DataFrame({"Close": px.drop(px.index[50:90])}))
+    book = [_pf("Gappy", {"AAA": (10, 40.0), "GAP": (5, 80.0)})]
+    engine = RiskEngine(db)
+    contrib = engine.var_contributions(book)
+    metrics = ReportingEngine(db).get_portfolio_risk_metrics(book[0])
+    assert contrib["component_var"].sum() == pytest.approx(metrics["Parametric VaR (95%)"])
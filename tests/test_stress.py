@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.database.database import Database
+from src.models import Asset, AssetType, Portfolio, Position
+from src.reporting import ReportingEngine
+from src.scenarios import NON_EQUITY_SHOCKS, SECTOR_KEYS, SECTOR_STRESS_SCENARIOS
+from src.stress import StressEngine, named_scenarios, shock_grid
+
+
+def _pos(ticker, asset_type, qty, cost, sector=None):
+    return Position(
+        asset=Asset(ticker=ticker, name=ticker, asset_type=asset_type, currency="USD", sector=sector),
+        quantity=qty, cost_basis=cost,
+    )
+
+
+@pytest.fixture
+def setup(tmp_path):
+    db = Database(str(tmp_path / "db"))
+    db.save_fund_profile("SPY", "2024-01-01", {"stockPosition": 0.9, "bondPosition": 0.1}, {"technology": 1.0})
+    db.save_fund_profile("SPY", "2024-06-01",
+                         {"stockPosition": 0.8, "bondPosition": 0.1, "cashPosition": 0.1},
+                         {"technology": 0.3, "Health Care": 0.1})
+    portfolio = Portfolio(name="Mixed", positions=[
+        _pos("AAPL", AssetType.STOCK, 10, 100.0, sector="Technology"),
+        _pos("ODD", AssetType.STOCK, 5, 20.0, sector="Widgets"),
+        _pos("SPY", AssetType.ETF, 2, 400.0),
+        _pos("QQQ", AssetType.ETF, 1, 300.0),
+        _pos("TLT", AssetType.BOND, 4, 90.0),
+    ])
+    return db, portfolio
+
+
+def test_exposure_rows_follow_asset_type_rules(setup):
+    db, portfolio = setup
+    ex = StressEngine(db).exposures(portfolio, latest_prices={"AAPL": 150.0})
+    E = ex.loadings.set_index(ex.positions["Ticker"])
+    assert E.loc["AAPL", "technology"] == 1.0
+    assert np.allclose(E.loc["ODD", SECTOR_KEYS], 1 / len(SECTOR_KEYS))
+    # Latest SPY profile: 80% stock + 0% other, split 3:1 tech / healthcare; 10% bond.
+    assert E.loc["SPY", "technology"] == pytest.approx(0.8 * 0.75)
+    assert E.loc["SPY", "healthcare"] == pytest.approx(0.8 * 0.25)
+    assert E.loc["SPY", "Bond"] == pytest.approx(0.1)
+    assert np.allclose(E.loc["QQQ", SECTOR_KEYS], 1 / len(SECTOR_KEYS))
+    assert E.loc["TLT", "Bond"] == 1.0 and E.loc["TLT"].sum() == 1.0
+    assert ex.positions.set_index("Ticker").loc["AAPL", "Base Value"] == 1500.0
+    assert ex.positions.set_index("Ticker").loc["QQQ", "Source"] == "Avg sector (no profile)"
+
+
+def test_scenario_matrix_matches_one_at_a_time(setup):
+    db, portfolio = setup
+    reporting = ReportingEngine(db)
+    scenarios = {**named_scenarios(), **shock_grid([-0.2, 0.1], {"Bond": 0.02})}
+    table = StressEngine(db).scenario_pnl(portfolio, scenarios)
+    assert table.shape == (5, len(SECTOR_STRESS_SCENARIOS) + 2)
+
+    for name, (sector, other) in scenarios.items():
+        single = reporting.compute_sector_stress(portfolio, dict(sector), dict(other))
+        assert np.allclose(table[name].to_numpy(), single["Change $"].to_numpy())
+
+    crisis = reporting.compute_sector_stress(
+        portfolio, SECTOR_STRESS_SCENARIOS["2008 Financial Crisis"], NON_EQUITY_SHOCKS["2008 Financial Crisis"],
+    ).set_index("Ticker")
+    assert crisis.loc["AAPL", "Shock %"] == pytest.approx(-32.0)
+    assert crisis.loc["TLT", "Shock %"] == pytest.approx(8.0)
+    assert crisis.loc["SPY", "Shock %"] == pytest.approx((0.6 * -0.32 + 0.2 * -0.20 + 0.1 * 0.08) * 100)
+    assert list(crisis.columns) == ["Type", "Base Value", "Shock %", "New Value", "Change $", "Source"]
+
+
+def test_partial_scenario_falls_back_to_average_of_given_shocks(setup):
+    db, portfolio = setup
+    engine = StressEngine(db)
+    prices = {"AAPL": 150.0, "ODD": 20.0, "SPY": 400.0, "QQQ": 300.0, "TLT": 90.0}
+    table = engine.scenario_pnl(portfolio, {"x": ({"technology": -0.30, "energy": 0.10}, {})}, prices)["x"]
+    pnl = dict(zip(engine.exposures(portfolio, prices).positions["Ticker"], table))
+    # Unclassified stock / fund without a profile take the mean of the
+    # supplied sector shocks, not a mean over every sector.
+    assert pnl["ODD"] == pytest.approx(100.0 * -0.10)
+    assert pnl["QQQ"] == pytest.approx(300.0 * -0.10)
+    # SPY's healthcare sleeve is unshocked by name, so it also takes the mean.
+    assert pnl["SPY"] == pytest.approx(800.0 * (0.6 * -0.30 + 0.2 * -0.10))
+    assert pnl["TLT"] == 0.0
+
+
+def test_exposures_default_to_stored_prices(setup):
+    db, portfolio = setup
+    dates = pd.bdate_range("2024-01-01", periods=3)
+    db.save_prices("AAPL", pd.DataFrame({"Close": [140.0, 150.0, np.nan]}, index=dates))
+    db.save_prices("TLT", pd.DataFrame({"Close": [95.0, 96.0, 97.0]}, index=dates))
+    base = StressEngine(db).exposures(portfolio).positions.set_index("Ticker")["Base Value"]
+    assert base["AAPL"] == pytest.approx(10 * 150.0)
+    assert base["TLT"] == pytest.approx(4 * 97.0)
+    assert base["ODD"] == pytest.approx(5 * 20.0)  # unpriced: cost basis
+
+
+def test_historical_replay_finds_worst_window_with_proxy(tmp_path):
+    db = Database(str(tmp_path / "db"))
+    dates = pd.bdate_range("2020-01-01", periods=300)
+    flat = np.full(len(dates), 100.0)
+    crash = flat.copy()
+    crash[101:111] = np.linspace(95, 70, 10)     # tech ETF: −30% over 10 days, then recovers
+    crash[111:] = 70.0
+    db.save_prices("XLK", pd.DataFrame({"Close": crash}, index=dates))
+    db.save_prices("XLF", pd.DataFrame({"Close": flat}, index=dates))
+    # NEWCO lists after the crash; OLDCO has full (flat) history.
+    db.save_prices("NEWCO", pd.DataFrame({"Close": flat[200:]}, index=dates[200:]))
+    db.save_prices("OLDCO", pd.DataFrame({"Close": flat}, index=dates))
+    # GAPCO stops trading through the crash; HOLCO misses two days in it.
+    gap = np.r_[0:95, 130:300]
+    db.save_prices("GAPCO", pd.DataFrame({"Close": flat[gap]}, index=dates[gap]))
+    hol = np.r_[0:104, 106:300]
+    db.save_prices("HOLCO", pd.DataFrame({"Close": crash[hol]}, index=dates[hol]))
+    portfolio = Portfolio(name="P", positions=[
+        _pos("NEWCO", AssetType.STOCK, 10, 100.0, sector="Technology"),
+        _pos("OLDCO", AssetType.STOCK, 10, 100.0, sector="Technology"),
+        _pos("GAPCO", AssetType.STOCK, 10, 100.0, sector="Technology"),
+        _pos("HOLCO", AssetType.STOCK, 10, 100.0, sector="Technology"),
+        _pos("USD", AssetType.CASH, 1000, 1.0),
+    ])
+
+    result = StressEngine(db).historical_replay(portfolio, window=10, top=3)
+    worst = result["windows"].iloc[0]
+    assert worst["start_date"] == dates[100] and worst["end_date"] == dates[110]
+    # NEWCO, GAPCO via the XLK proxy; HOLCO on its own returns, valued at 70.
+    assert worst["pnl"] == pytest.approx(-300.0 - 300.0 - 0.30 * 700.0)
+    assert worst["coverage"] == 1.0
+    pos = result["positions"][result["positions"]["rank"] == 1].set_index("ticker")
+    assert pos.loc["NEWCO", "window_return"] == pytest.approx(-0.30)
+    assert pos.loc["GAPCO", "window_return"] == pytest.approx(-0.30)
+    assert pos.loc["HOLCO", "window_return"] == pytest.approx(-0.30)
+    assert pos.loc["OLDCO", "pnl"] == 0.0
+    # Windows don't overlap, and only losing windows are reported.
+    starts = result["windows"]["start_date"].map(dates.get_loc).to_numpy()
+    assert (np.diff(np.sort(starts)) >= 10).all()
+    assert (result["windows"]["pnl"] < 0).all()
+    sources = result["sources"].set_index("ticker")["source"]
+    assert sources.to_dict() == {
+        "NEWCO": "history + sector proxy", "OLDCO": "history", "GAPCO": "history + sector proxy",
+        "HOLCO": "history", "USD": "cash (0%)",
+    }
+
+
+def test_reverse_stress_closed_form_hits_target(tmp_path):
+    db = Database(str(tmp_path / "db"))
+    engine = StressEngine(db)
+    rng = np.random.default_rng(3)
+    X = rng.normal(size=(len(SECTOR_KEYS), len(SECTOR_KEYS)))
+    cov = pd.DataFrame(X @ X.T * 1e-4, index=SECTOR_KEYS, columns=SECTOR_KEYS)
+    book = [
+        Portfolio(name="Tilted", positions=[
+            _pos("AAPL", AssetType.STOCK, 10, 100.0, sector="Technology"),
+            _pos("JPM", AssetType.STOCK, 5, 100.0, sector="Financial Services"),
+            _pos("BND", AssetType.BOND, 10, 100.0),
+        ]),
+        Portfolio(name="Cash", positions=[_pos("USD", AssetType.CASH, 1000, 1.0)]),
+    ]
+    result = engine.reverse_stress(book, loss=0.10, non_equity={"Bond": -0.02}, covariance=cov)
+
+    tilted = result.loc["Tilted"]
+    s = tilted[SECTOR_KEYS].to_numpy(dtype=float)
+    # The shocks reproduce the target through the ordinary scenario engine…
+    pnl = engine.scenario_pnl(book[0], {"rev": (dict(zip(SECTOR_KEYS, s)), {"Bond": -0.02})})
+    assert pnl["rev"].sum() == pytest.approx(tilted["target_pnl"]) == pytest.approx(-250.0)
+    # …at the reported Mahalanobis distance, and no cheaper vector does.
+    inv = np.linalg.inv(cov.to_numpy())
+    assert np.sqrt(s @ inv @ s) == pytest.approx(tilted["distance"])
+    a = np.zeros(len(SECTOR_KEYS))
+    a[SECTOR_KEYS.index("technology")], a[SECTOR_KEYS.index("financial_services")] = 1000.0, 500.0
+    for _ in range(20):
+        d = rng.normal(size=len(a))
+        d -= a * (a @ d) / (a @ a)                       # stay on the constraint aᵀs = L
+        alt = s + 0.01 * d
+        assert np.sqrt(alt @ inv @ alt) >= tilted["distance"]
+    assert result.loc["Cash", SECTOR_KEYS].isna().all()
+
+    # A longer horizon scales Σ, so the same loss is √h times more plausible.
+    monthly = engine.reverse_stress(book[:1], loss=0.10, horizon_days=25, non_equity={"Bond": -0.02}, covariance=cov)
+    assert monthly.loc["Tilted", "distance"] == pytest.approx(tilted["distance"] / 5)
+
+
+def test_sector_covariance_from_beta_sums(tmp_path):
+    from src.betas import SectorBetaEngine
+    from src.scenarios import SECTOR_ETF_TICKERS
+
+    db = Database(str(tmp_path / "db"))
+    with pytest.raises(ValueError):
+        StressEngine(db).sector_covariance()
+    dates = pd.bdate_range("2022-01-03", periods=200)
+    rng = np.random.default_rng(5)
+    for t in ["XLK", "XLF", "XLE"]:
+        db.save_prices(t, pd.DataFrame({"Close": 100 * np.cumprod(1 + rng.normal(0, 0.01, 200))}, index=dates))
+    SectorBetaEngine(db).refresh(years=5, fetch=False, as_of=dates[-1])
+
+    cov = StressEngine(db).sector_covariance()
+    rets = db.get_historical_prices(["XLK", "XLF", "XLE"]).pct_change().dropna()
+    reverse = {v: k for k, v in SECTOR_ETF_TICKERS.items()}
+    expected = rets.rename(columns=reverse).cov()
+    pd.testing.assert_frame_equal(cov.loc[expected.index, expected.columns], expected, check_names=False, rtol=1e-6)
+    assert cov.loc["utilities"].abs().sum() == 0.0
+
+
+def test_implied_operator_matches_scenario_engine(tmp_path):
+    from src.betas import SectorBetaEngine
+
+    db = Database(str(tmp_path / "db"))
+    # One common factor: every sector ETF correlates with every other.
+    dates = pd.bdate_range("2022-01-03", periods=250)
+    rng = np.random.default_rng(7)
+    market = rng.normal(0, 0.01, len(dates))
+    for t in ["XLK", "XLF", "XLE", "XLV", "XLY"]:
+        rets = market + rng.normal(0, 0.006, len(dates))
+        db.save_prices(t, pd.DataFrame({"Close": 100 * np.cumprod(1 + rets)}, index=dates))
+    SectorBetaEngine(db).refresh(years=5, fetch=False, as_of=dates[-1])
+    engine = StressEngine(db)
+    portfolio = Portfolio(name="P", positions=[
+        _pos("AAPL", AssetType.STOCK, 10, 100.0, sector="Technology"),
+        _pos("XOM", AssetType.STOCK, 4, 50.0, sector="Energy"),
+        _pos("JPM", AssetType.STOCK, 2, 100.0, sector="Financial Services"),
+        _pos("BND", AssetType.BOND, 5, 100.0),
+    ])
+    operator = engine.implied_operator()
+
+    # One driver: the pairwise beta.
+    single = operator.implied({"technology": -0.20})
+    assert single["financial_services"] == pytest.approx(
+        -0.20 * operator.matrix[SECTOR_KEYS.index("financial_services"), SECTOR_KEYS.index("technology")],
+        rel=1e-6)
+
+    # Several drivers: the conditional mean Σ_SD Σ_DD⁻¹ d, not a sum of betas.
+    drivers = {"technology": -0.20, "energy": -0.20, "healthcare": -0.20}
+    shocks = operator.implied(drivers)
+    cov = engine.sector_covariance()
+    D = list(drivers)
+    expected_fin = cov.loc[["financial_services"], D].to_numpy() @ np.linalg.solve(
+        cov.loc[D, D].to_numpy(), np.fromiter(drivers.values(), float))
+    assert shocks["financial_services"] == pytest.approx(expected_fin[0])
+    assert all(shocks[k] == pytest.approx(v) for k, v in drivers.items())
+    assert -0.20 < shocks["financial_services"] < 0.0
+    assert shocks["consumer_cyclical"] > -0.20
+    assert shocks["utilities"] == 0.0                      # no prices: no covariance
+
+    projection = engine.implied_projection(portfolio)
+    expected = engine.scenario_pnl(portfolio, {"x": (shocks.to_dict(), {})})["x"].to_numpy()
+    np.testing.assert_allclose(projection.pnl(drivers), expected, atol=1e-9)
+    np.testing.assert_allclose(projection.sweep(drivers, [0.0, 2.0]), [0 * expected, 2 * expected], atol=1e-9)
+    assert engine.implied_projection(portfolio) is projection
+
+    # A new snapshot invalidates both caches.
+    db.save_prices("XLF", pd.DataFrame({"Close": 100 * np.cumprod(1 + rng.normal(0, 0.01, len(dates)))},
+                                       index=dates))
+    SectorBetaEngine(db).refresh(years=5, full=True, fetch=False, as_of=dates[-1])
+    assert engine.implied_operator() is not operator
+    assert abs(engine.implied_operator().implied(drivers)["financial_services"]) < abs(shocks["financial_services"])
+    assert engine.implied_projection(portfolio) is not projection
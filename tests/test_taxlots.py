@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.database.database import Database
+from src.models import Asset, AssetType, Portfolio, Position
+from src.taxlots import TaxLotEngine
+
+DATES = pd.bdate_range("2022-01-03", periods=400)
+
+
+def _asset(t: str) -> Asset:
+    return Asset(ticker=t, name=t, asset_type=AssetType.STOCK, currency="USD")
+
+
+def _build(tmp_path, name: str, through: int = len(DATES)) -> Database:
+    db = Database(str(tmp_path / name))
+    rng = np.random.default_rng(7)
+    for t in ["AAA", "BBB"]:
+        db.add_asset(_asset(t))
+        px = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, len(DATES)))
+        db.save_prices(t, pd.DataFrame({"Close": px[:through]}, index=DATES[:through]))
+    # 4 AAA held before the ledger starts (CSV import).
+    db.save_portfolio(Portfolio(name="Taxable", positions=[
+        Position(asset=_asset("AAA"), quantity=4, cost_basis=80.0),
+    ]))
+    return db
+
+
+def _ledger(db: Database) -> None:
+    day = lambda i: str(DATES[i].date())
+    db.record_trade("Taxable", "AAA", "BUY", 10, 100.0, day(5))    # trade 1
+    db.record_trade("Taxable", "AAA", "BUY", 5, 110.0, day(20))    # trade 2
+    db.record_trade("Taxable", "BBB", "BUY", 8, 50.0, "2022-01-15")  # trade 3, a Saturday
+    db.record_trade("Taxable", "AAA", "SELL", 6, 120.0, day(100))  # trade 4: legacy 4 + lot 1 × 2
+
+
+def _sorted(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    return df.sort_values(keys).reset_index(drop=True)
+
+
+def test_fifo_closes_legacy_then_oldest_lot(tmp_path):
+    db = _build(tmp_path, "db")
+    _ledger(db)
+    TaxLotEngine(db).refresh()
+
+    gains = _sorted(db.get_realized_gains(), ["lot_id"])
+    assert gains["lot_id"].tolist() == [0, 1]
+    assert gains["quantity"].tolist() == [4.0, 2.0]
+    assert gains["realized_gain"].tolist() == pytest.approx([4 * 40.0, 2 * 20.0])
+    assert gains["term"].tolist() == ["unknown", "short"]
+
+    lots = db.get_tax_lots("Taxable").set_index("lot_id")
+    assert lots.loc[1, "remaining_quantity"] == 8.0
+    assert lots.loc[2, "remaining_quantity"] == 5.0
+    assert lots.loc[0, "remaining_quantity"] == 0.0
+
+
+def test_specific_id_sell_closes_named_lot_then_fifo(tmp_path):
+    db = _build(tmp_path, "db")
+    _ledger(db)
+    db.record_trade("Taxable", "AAA", "SELL", 7, 130.0, str(DATES[380].date()), lot_id=2)
+    TaxLotEngine(db).refresh()
+
+    gains = db.get_realized_gains()
+    sale = _sorted(gains[gains["trade_id"] == 5], ["lot_id"])
+    # Lot 2 (5 @ 110) first, then 2 more from the oldest open lot (lot 1).
+    assert sale["lot_id"].tolist() == [1, 2]
+    assert sale["quantity"].tolist() == [2.0, 5.0]
+    assert sale["term"].tolist() == ["long", "long"]
+    assert sale["realized_gain"].sum() == pytest.approx(2 * 30.0 + 5 * 20.0)
+
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path):
+    inc = _build(tmp_path, "inc", through=250)
+    _ledger(inc)
+    engine = TaxLotEngine(inc)
+    engine.refresh()
+
+    rng = np.random.default_rng(7)
+    for t in ["AAA", "BBB"]:
+        px = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, len(DATES)))
+        inc.save_prices(t, pd.DataFrame({"Close": px}, index=DATES))
+    inc.record_trade("Taxable", "BBB", "SELL", 3, 55.0, str(DATES[300].date()))
+    inc.record_trade("Taxable", "AAA", "SELL", 9, 125.0, str(DATES[320].date()))
+    result = engine.refresh()
+    assert result["rebuilt"] == []
+    assert result["trades_matched"] == 2
+
+    ref = _build(tmp_path, "ref")
+    _ledger(ref)
+    ref.record_trade("Taxable", "BBB", "SELL", 3, 55.0, str(DATES[300].date()))
+    ref.record_trade("Taxable", "AAA", "SELL", 9, 125.0, str(DATES[320].date()))
+    TaxLotEngine(ref).refresh()
+
+    keys = ["portfolio_name", "date", "ticker"]
+    pd.testing.assert_frame_equal(_sorted(inc.get_daily_pnl(), keys), _sorted(ref.get_daily_pnl(), keys))
+    keys = ["trade_id", "lot_id"]
+    pd.testing.assert_frame_equal(_sorted(inc.get_realized_gains(), keys), _sorted(ref.get_realized_gains(), keys))
+    keys = ["lot_id"]
+    pd.testing.assert_frame_equal(_sorted(inc.get_tax_lots(), keys), _sorted(ref.get_tax_lots(), keys))
+
+
+def test_backdated_trade_rebuilds_portfolio(tmp_path):
+    db = _build(tmp_path, "db")
+    _ledger(db)
+    engine = TaxLotEngine(db)
+    engine.refresh()
+    # Dated before the SELL already matched → FIFO order changes.
+    db.record_trade("Taxable", "AAA", "BUY", 3, 90.0, str(DATES[2].date()))
+    assert engine.refresh()["rebuilt"] == ["Taxable"]
+    gains = db.get_realized_gains()
+    assert sorted(gains["lot_id"].tolist()) == [0, 5]
+
+
+def test_daily_pnl_ties_out(tmp_path):
+    db = _build(tmp_path, "db")
+    _ledger(db)
+    TaxLotEngine(db).refresh()
+    pnl = db.get_daily_pnl("Taxable")
+
+    assert np.allclose(pnl["unrealized_pnl"], pnl["market_value"] - pnl["cost_basis"])
+    aaa = pnl[pnl["ticker"] == "AAA"].set_index("date")
+    assert aaa.loc[DATES[99], "quantity"] == 19.0
+    assert aaa.loc[DATES[100], "quantity"] == 13.0
+    assert aaa.loc[DATES[100], "cost_basis"] == pytest.approx(8 * 100.0 + 5 * 110.0)
+    assert aaa["realized_pnl"].sum() == pytest.approx(db.get_realized_gains()["realized_gain"].sum())
+    # The Saturday BUY lands on Monday.
+    bbb = pnl[pnl["ticker"] == "BBB"]
+    assert bbb["date"].min() == pd.Timestamp("2022-01-17")